@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поиска опечаток в бизнес-словах: попарный SequenceMatcher против индекса
+
+Сравнивает прежний шаг fuzzy в has_business_signals (каждое слово × каждое из
+CRITICAL_BUSINESS_KEYWORDS через fuzzy_match_word) с FuzzyKeywordIndex на:
+    fixtures — все реплики из tests/*.json и tests/personas/*.json
+    long     — длинные сообщения (реплики склеены по --long-words слов)
+
+Меряется именно шаг fuzzy (до него regex-проверка часто отвечает сама) — это худший
+случай, когда бизнес-маркеров нет и нужно просмотреть все слова. Индекс показан
+дважды: с пустой памятью слов (cold) и с прогретой (warm, как в работающем сервере).
+
+Запуск:
+    python scripts/bench_fuzzy_keywords.py --rounds 5 --long-words 300
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "scripts"))
+
+from benchmark_router import load_dialogues  # noqa: E402
+from social_intents import (  # noqa: E402
+    _FUZZY_BUSINESS,
+    CRITICAL_BUSINESS_KEYWORDS,
+    _has_fuzzy_business_word,
+    fuzzy_match_word,
+)
+
+
+def pairwise(text: str) -> bool:
+    """Прежний шаг fuzzy: каждое слово против каждого ключевого слова"""
+    for word in text.lower().split():
+        word_clean = word.strip('.,!?;:')
+        if len(word_clean) < 3:
+            continue
+        for keyword in CRITICAL_BUSINESS_KEYWORDS:
+            if fuzzy_match_word(word_clean, keyword, threshold=0.85):
+                return True
+    return False
+
+
+def long_messages(messages: List[str], words_per_message: int) -> List[str]:
+    """Склеивает реплики без бизнес-слов в длинные сообщения (все слова придётся проверить)"""
+    plain = [text for text in messages if not pairwise(text)]
+    words = " ".join(plain).split()
+    return [" ".join(words[i:i + words_per_message]) for i in range(0, len(words) - words_per_message + 1, words_per_message)]
+
+
+def measure(fn: Callable[[str], bool], texts: List[str], rounds: int, cold: bool = False) -> float:
+    """Лучшее время на сообщение, мкс"""
+    best = float("inf")
+    for _ in range(rounds):
+        if cold:
+            _FUZZY_BUSINESS._memo.clear()
+        started = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best / len(texts) * 1e6
+
+
+def main(rounds: int, long_words: int) -> None:
+    messages = [text for _, dialogue in load_dialogues() for text in dialogue]
+    corpora = {"fixtures": messages, "long": long_messages(messages, long_words)}
+    for name, texts in corpora.items():
+        assert [pairwise(text) for text in texts] == [_has_fuzzy_business_word(text) for text in texts]
+        words = sum(len(text.split()) for text in texts) / len(texts)
+        before = measure(pairwise, texts, rounds)
+        cold = measure(_has_fuzzy_business_word, texts, rounds, cold=True)
+        warm = measure(_has_fuzzy_business_word, texts, rounds)
+        print(f"{name:9s} сообщений: {len(texts):4d}, слов в среднем: {words:6.1f} | "
+              f"SequenceMatcher: {before:8.1f} мкс | индекс cold: {cold:7.1f} мкс (x{before / cold:.1f}) | "
+              f"warm: {warm:6.1f} мкс (x{before / warm:.1f})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3, help="Повторов, берётся лучший")
+    parser.add_argument("--long-words", type=int, default=300, help="Слов в длинном сообщении")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.rounds, args.long_words)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк эвристик по ключевым словам: циклы any() против общего автомата
+
+Для каждого сообщения из диалогов tests/*.json и tests/personas/*.json имитирует
+проверки одного /chat запроса: словари, которые смотрят сообщение пользователя
+(CTA-блокер, обработчик действий, генератор, SafetyChecker, роутер), и словари,
+которые смотрят ответ ассистента (прощание, благодарность, контакты, offtopic).
+
+    loops   — как раньше: каждый детектор делает lower() и свой any(word in text ...)
+    matcher — один проход автомата по каждому тексту (кэш сброшен), дальше hits.any()
+    cached  — повторные проверки того же текста (другие детекторы в том же запросе)
+
+Запуск:
+    python scripts/bench_keyword_matcher.py --rounds 20
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "scripts"))
+os.environ.setdefault("OPENROUTER_API_KEY", "bench-offline")  # main.py требует ключ при импорте; сеть не используется
+
+from event_log import configure_logging  # noqa: E402
+
+configure_logging("WARNING")
+
+import main  # noqa: E402,F401  регистрирует словари всех детекторов
+from completed_actions_handler import CompletedActionsHandler  # noqa: E402
+from keyword_matcher import get_keyword_matcher  # noqa: E402
+from simple_cta_blocker import SimpleCTABlocker  # noqa: E402
+from zhvanetsky_safety import SafetyChecker  # noqa: E402
+
+from benchmark_router import load_dialogues  # noqa: E402
+
+# Словари, которые проверяют ответ ассистента, а не сообщение пользователя
+RESPONSE_LEXICONS = ("main.", "generator.greeting", "generator.contacts", "safety.negative_content")
+# Проверяются по исходному тексту (с учётом регистра)
+RAW_LEXICONS = ("main.offtopic_history",)
+
+RESPONSES = [
+    "Для 9-летнего ребёнка подойдёт Юный Оратор: группы до 6 детей, занятия дважды в неделю по 90 минут "
+    "онлайн через Zoom. Стоимость — 6000 грн в месяц, для второго ребёнка скидка 15%. "
+    "Записаться на бесплатное пробное занятие можно на ukido.com.ua/trial.",
+    "Понимаю ваши сомнения. Наши преподаватели — практикующие психологи с опытом работы с детьми от 7 лет. "
+    "После каждого модуля родители получают отчёт о прогрессе ребёнка, а если курс не подошёл, "
+    "мы вернём деньги за оставшиеся занятия. Всего доброго!",
+    "Давайте сосредоточимся на наших курсах. У нас парковка не нужна — занятия проходят онлайн.",
+]
+
+
+def _texts() -> List[Tuple[str, str]]:
+    """(сообщение пользователя, ответ) для каждой реплики корпуса"""
+    messages = [text for _, dialogue in load_dialogues() for text in dialogue]
+    return [(message, RESPONSES[i % len(RESPONSES)]) for i, message in enumerate(messages)]
+
+
+def _split_lexicons() -> Tuple[List[str], List[str]]:
+    matcher = get_keyword_matcher()
+    names = sorted(matcher._lexicons)
+    response = [name for name in names if name.startswith(RESPONSE_LEXICONS)]
+    return [name for name in names if name not in response], response
+
+
+def request_with_loops(message: str, response: str, user_lexicons, response_lexicons) -> int:
+    """Проверки одного запроса в старом стиле: lower() и any() в каждом детекторе"""
+    found = 0
+    for words in user_lexicons:
+        found += any(word in message.lower() for word in words)
+    for raw, words in response_lexicons:
+        text = response if raw else response.lower()
+        found += any(word in text for word in words)
+    return found
+
+
+def request_with_matcher(message: str, response: str, user_lexicons, response_lexicons) -> int:
+    """Те же проверки через общий автомат: по одному проходу на текст"""
+    matcher = get_keyword_matcher()
+    found = 0
+    for name in user_lexicons:
+        found += matcher.scan(message.lower()).any(name)
+    for raw, name in response_lexicons:
+        found += matcher.scan(response if raw else response.lower()).any(name)
+    return found
+
+
+def measure(fn: Callable[[], None], rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main_bench(rounds: int) -> Dict[str, float]:
+    CompletedActionsHandler(), SimpleCTABlocker(), SafetyChecker()  # словари из конструкторов
+    matcher = get_keyword_matcher()
+    texts = _texts()
+    user_names, response_names = _split_lexicons()
+    user_words = [matcher.patterns(name) for name in user_names]
+    response_words = [(name in RAW_LEXICONS, matcher.patterns(name)) for name in response_names]
+    response_pairs = [(name in RAW_LEXICONS, name) for name in response_names]
+
+    # Корректность: оба способа находят одно и то же
+    for message, response in texts:
+        assert request_with_loops(message, response, user_words, response_words) == \
+            request_with_matcher(message, response, user_names, response_pairs)
+
+    def loops():
+        for message, response in texts:
+            request_with_loops(message, response, user_words, response_words)
+
+    def cold():
+        for message, response in texts:
+            matcher._cache.clear()
+            request_with_matcher(message, response, user_names, response_pairs)
+
+    def warm():
+        for message, response in texts:
+            request_with_matcher(message, response, user_names, response_pairs)
+
+    results = {name: measure(fn, rounds) / len(texts) * 1e6 for name, fn in
+               (("loops", loops), ("matcher", cold), ("cached", warm))}
+    stats = matcher.get_stats()
+    print(f"Реплик: {len(texts)}, словарей: {stats['lexicons']} ({len(user_names)} по сообщению, "
+          f"{len(response_names)} по ответу), шаблонов: {stats['patterns']}, состояний автомата: {stats['states']}")
+    for name, micros in results.items():
+        print(f"  {name:8s} {micros:8.1f} мкс/запрос")
+    print(f"  экономия: {results['loops'] - results['matcher']:.1f} мкс/запрос "
+          f"({(1 - results['matcher'] / results['loops']) * 100:.0f}%)")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=10, help="Повторов, берётся лучший")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main_bench(parse_args().rounds)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк логирования: время в потоке event loop на один запрос, print() против event_log
+
+Имитирует события одного /chat запроса (~60 штук: INFO-строки, DEBUG-дампы результата
+роутера, запросы/ответы LLM) и меряет, сколько времени вызывающий поток тратит на
+логирование при разных приёмниках stdout:
+    devnull — запись почти бесплатна
+    file    — обычный файл
+    slow    — медленный приёмник (заполненный pipe, лог-драйвер контейнера)
+
+Для event_log отдельно показано время дописывания очереди фоновым потоком — оно уходит
+из event loop, но не исчезает.
+
+Запуск:
+    python scripts/bench_logging.py --requests 200 --sink slow
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from event_log import configure_logging, get_logger, shutdown_logging  # noqa: E402
+
+ROUTE_RESULT = {
+    "status": "success",
+    "documents": ["pricing.md", "courses_detailed.md", "faq.md"],
+    "decomposed_questions": ["Сколько стоит курс?", "Есть ли скидки для двоих детей?"] * 4,
+    "user_signal": "price_sensitive",
+    "detected_language": "ru",
+    "social_context": None,
+    "fuzzy_matched": False,
+    "summaries": {f"doc_{i}.md": "Краткое описание документа " * 6 for i in range(8)},
+}
+
+
+class SlowSink:
+    """Приёмник с задержкой на каждую запись (имитация backpressure stdout)"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.closed = False
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def open_sink(kind: str, delay: float):
+    if kind == "devnull":
+        return open(os.devnull, "w", encoding="utf-8")
+    if kind == "file":
+        return tempfile.TemporaryFile("w+", encoding="utf-8")
+    return SlowSink(delay)
+
+
+def request_with_print(user_id: str) -> None:
+    """События одного запроса в старом стиле: f-строки и print()"""
+    print(f"ℹ️ Routing message (len={42}, hash={user_id[:8]})")
+    for i in range(2):
+        print(f"🔍 Отправляю запрос к OpenRouter: google/gemini-2.5-flash (router)")
+        print(f"🔍 Размер промпта: {len(str(ROUTE_RESULT))} символов")
+        print(f"🔍 HTTP статус: 200")
+        print(f"✅ Получен ответ длиной {812 + i} символов")
+    for i in range(15):
+        print(f"🔍 DEBUG Router result: {ROUTE_RESULT}")
+    for i in range(36):
+        print(f"✅ Статус: {ROUTE_RESULT['status']}, документы: {ROUTE_RESULT['documents']} #{i}")
+    print(f"⏱️ Latency: {1.234:.2f}s | Signal: {ROUTE_RESULT['user_signal']}")
+
+
+log = get_logger("bench")
+
+
+def request_with_event_log(user_id: str) -> None:
+    """Те же события через event_log: проверка уровня и сэмплирование до форматирования"""
+    log.info("main.process_chat", "ℹ️ Routing message (len=%s, hash=%s)", 42, user_id[:8])
+    for i in range(2):
+        log.info("llm.request", "🔍 Отправляю запрос к OpenRouter: %s (%s)", "google/gemini-2.5-flash", "router")
+        log.debug("openrouter.send_chain", "🔍 Размер промпта: %s символов", ROUTE_RESULT)
+        log.debug("openrouter.attempt", "🔍 HTTP статус: %s", 200)
+        log.info("llm.response", "✅ Получен ответ длиной %s символов", 812 + i)
+    for i in range(15):
+        log.debug("main.process_chat", "🔍 DEBUG Router result: %s", ROUTE_RESULT)
+    for i in range(36):
+        log.info("router.route", "✅ Статус: %s, документы: %s #%s", ROUTE_RESULT["status"], ROUTE_RESULT["documents"], i)
+    log.info("main.latency", "⏱️ Latency: %.2fs | Signal: %s", 1.234, ROUTE_RESULT["user_signal"], latency=1.234)
+
+
+def measure(fn: Callable[[str], None], requests: int) -> List[float]:
+    samples = []
+    for index in range(requests):
+        started = time.perf_counter()
+        fn(f"user_{index:08d}")
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summary(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "avg_ms": 1000 * sum(ordered) / len(ordered),
+        "p95_ms": 1000 * ordered[int(0.95 * (len(ordered) - 1))],
+    }
+
+
+def run(sink_kind: str, requests: int, delay: float) -> None:
+    sink = open_sink(sink_kind, delay)
+    original_stdout = sys.stdout
+    sys.stdout = sink
+    try:
+        print_stats = summary(measure(request_with_print, requests))
+    finally:
+        sys.stdout = original_stdout
+
+    configure_logging(level="INFO", fmt="json", stream=sink)
+    log_stats = summary(measure(request_with_event_log, requests))
+    drain_started = time.perf_counter()
+    shutdown_logging()
+    drain = time.perf_counter() - drain_started
+
+    print(f"Приёмник: {sink_kind}, запросов: {requests}")
+    print(f"  print()    : {print_stats['avg_ms']:.3f} мс/запрос (p95 {print_stats['p95_ms']:.3f})")
+    print(f"  event_log  : {log_stats['avg_ms']:.3f} мс/запрос (p95 {log_stats['p95_ms']:.3f})")
+    saved = print_stats["avg_ms"] - log_stats["avg_ms"]
+    print(f"  Экономия event loop: {saved:.3f} мс/запрос ({saved / print_stats['avg_ms'] * 100:.0f}%)")
+    print(f"  Фоновое дописывание очереди: {drain * 1000:.1f} мс на все запросы")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк логирования на горячем пути")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--sink", choices=["devnull", "file", "slow", "all"], default="all")
+    parser.add_argument("--slow-delay", type=float, default=0.0002, help="Задержка slow-приёмника на запись, сек")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    sinks = ["devnull", "file", "slow"] if arguments.sink == "all" else [arguments.sink]
+    for kind in sinks:
+        run(kind, arguments.requests, arguments.slow_delay)
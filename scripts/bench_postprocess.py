@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк постобработки ответа: побайтная сверка с эталонами и CPU-время по шагам
+
+Берёт из tests/golden_responses.json записи с metadata.raw (ответ модели до
+постобработки) и проверяет, что PostProcessor.process() и поток (куски по 8 символов)
+дают ровно сохранённый response. Затем меряет CPU-время каждого шага собранной
+цепочки (compile_passes) на тех входах, которые шаг получает в process().
+
+    stage   — шаг цепочки (слитые LiteralPass показаны как "a+b")
+    process — вся цепочка целиком
+    stream  — та же цепочка через StreamingPostProcessor
+
+Запуск:
+    python scripts/bench_postprocess.py --rounds 50
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from event_log import configure_logging  # noqa: E402
+
+configure_logging("WARNING")
+
+from postprocess import PostProcessor, cleanup_passes  # noqa: E402
+
+GOLDEN = ROOT / "tests" / "golden_responses.json"
+CHUNK = 8
+
+
+def load_golden(path: Path = GOLDEN) -> List[Tuple[str, str]]:
+    """(ответ модели, эталон после постобработки) для записей с metadata.raw"""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return [(entry["metadata"]["raw"], entry["response"]) for entry in data.values() if entry.get("metadata", {}).get("raw")]
+
+
+def stream_text(processor: PostProcessor, raw: str) -> str:
+    stream = processor.stream()
+    shown = "".join(stream.feed(raw[i:i + CHUNK]) for i in range(0, len(raw), CHUNK))
+    return shown + stream.finish()
+
+
+def measure(fn: Callable[[], None], rounds: int) -> float:
+    """Лучшее CPU-время из rounds запусков"""
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.process_time()
+        fn()
+        best = min(best, time.process_time() - started)
+    return best
+
+
+def main_bench(rounds: int) -> Dict[str, float]:
+    processor = PostProcessor(cleanup_passes())
+    golden = load_golden()
+    if not golden:
+        raise SystemExit(f"В {GOLDEN} нет записей с metadata.raw")
+
+    # Корректность: и целиком, и потоком — байт в байт как эталон
+    for raw, expected in golden:
+        assert processor.process(raw) == expected, raw[:80]
+        assert stream_text(processor, raw) == expected, raw[:80]
+
+    # Вход каждого шага — выход предыдущего, как в process()
+    inputs: List[List[str]] = []
+    texts = [raw for raw, _ in golden]
+    for text_pass in processor.compiled:
+        inputs.append(texts)
+        texts = [text_pass.apply(text) for text in texts]
+
+    def stage(index: int) -> Callable[[], None]:
+        text_pass, stage_inputs = processor.compiled[index], inputs[index]
+        return lambda: [text_pass.apply(text) for text in stage_inputs]
+
+    results = {
+        text_pass.name: measure(stage(index), rounds) / len(golden) * 1e6
+        for index, text_pass in enumerate(processor.compiled)
+    }
+    total = measure(lambda: [processor.process(raw) for raw, _ in golden], rounds) / len(golden) * 1e6
+    streamed = measure(lambda: [stream_text(processor, raw) for raw, _ in golden], rounds) / len(golden) * 1e6
+
+    print(f"Эталонов: {len(golden)} (совпадают побайтно), проходов: {len(processor.passes)}, "
+          f"шагов после сборки: {len(processor.compiled)}")
+    for name, micros in results.items():
+        print(f"  {name:30s} {micros:8.1f} мкс/ответ ({micros / total * 100:4.0f}%)")
+    print(f"  {'process':30s} {total:8.1f} мкс/ответ")
+    print(f"  {'stream':30s} {streamed:8.1f} мкс/ответ")
+    return {**results, "process": total, "stream": streamed}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20, help="Повторов, берётся лучший")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main_bench(parse_args().rounds)
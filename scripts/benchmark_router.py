@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк роутера: прогон всех диалогов tests/*.json и tests/personas/*.json через Router.route
+
+Источник ответов Gemini:
+    mock   — локальная заглушка scripts/mock_openrouter.py (по умолчанию, без сети)
+    replay — записанные ответы из --store (ключ: файл, сценарий, шаг)
+    record — живой OpenRouter (нужен OPENROUTER_API_KEY), ответы сохраняются в --store
+
+На каждый вызов пишется путь решения (social/cache/gemini/fallback), размер промпта
+в символах и оценочных токенах, время разбора ответа, число повторов запроса и
+задержка route() целиком. Итог — JSON-файл с вызовами и сводкой (перцентили задержки,
+доля повторов и фолбэков); --compare печатает разницу с прошлым прогоном.
+
+Запуск:
+    python scripts/benchmark_router.py
+    python scripts/benchmark_router.py --mock-latency lognormal:0.8,0.3 --output reports/router_bench_new.json
+    python scripts/benchmark_router.py --mode record --store reports/router_replay.json
+    python scripts/benchmark_router.py --mode replay --store reports/router_replay.json --compare reports/router_bench_old.json
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import http_pool  # noqa: E402
+from config import Config  # noqa: E402
+from event_log import configure_logging  # noqa: E402
+from llm_resilience import get_resilience_executor  # noqa: E402
+from mock_openrouter import LatencySpec, MockSettings, create_app  # noqa: E402
+
+DIALOGUE_GLOBS = ("tests/*.json", "tests/personas/*.json")
+DEFAULT_STORE = ROOT / "reports" / "router_replay.json"
+
+Dialogue = Tuple[str, List[str]]  # (идентификатор «файл#сценарий», реплики пользователя)
+
+
+# === Диалоги ===
+
+def _step_text(step: Any) -> str:
+    if isinstance(step, str):
+        return step
+    if isinstance(step, dict):
+        for key in ("user_input", "user", "message", "text", "content"):
+            if isinstance(step.get(key), str):
+                return step[key]
+    return ""
+
+
+def _scenarios(data: Any) -> List[Dict[str, Any]]:
+    """Сценарии во всех форматах файлов тестов: список, {"scenarios": ...}, один сценарий, словарь сценариев"""
+    if isinstance(data, list):
+        return [item for item in data if isinstance(item, dict)]
+    if not isinstance(data, dict):
+        return []
+    if "scenarios" in data:
+        return _scenarios(data["scenarios"] if isinstance(data["scenarios"], list) else list(data["scenarios"].values()))
+    if any(key in data for key in ("steps", "messages", "message")):
+        return [data]
+    return [value for value in data.values() if isinstance(value, dict) and any(key in value for key in ("steps", "messages"))]
+
+
+def load_dialogues(patterns=DIALOGUE_GLOBS) -> List[Dialogue]:
+    dialogues: List[Dialogue] = []
+    for pattern in patterns:
+        for path in sorted(ROOT.glob(pattern)):
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                continue
+            for index, scenario in enumerate(_scenarios(data)):
+                steps = scenario.get("steps") or scenario.get("messages") or [scenario.get("message")]
+                texts = [text for text in (_step_text(step) for step in steps) if text]
+                if texts:
+                    dialogues.append((f"{path.relative_to(ROOT)}#{index}", texts))
+    return dialogues
+
+
+# === Источник ответов ===
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Записанные ответы OpenRouter по ключу текущего шага
+
+    В режиме записи запросы уходят в настоящий транспорт, ответы сохраняются по порядку
+    (повторы тоже). При воспроизведении отсутствующая запись — 404: роутер уходит в фолбэк,
+    а прогон считает промах.
+    """
+
+    def __init__(self, records: Optional[Dict[str, List[Dict[str, Any]]]] = None, upstream: Optional[httpx.AsyncBaseTransport] = None):
+        self.records = records or {}
+        self.upstream = upstream
+        self.key = ""
+        self.misses = 0
+        self._cursors: Dict[str, int] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.upstream is not None:
+            response = await self.upstream.handle_async_request(request)
+            body = await response.aread()
+            self.records.setdefault(self.key, []).append({"status": response.status_code, "body": body.decode("utf-8")})
+            return httpx.Response(response.status_code, headers=response.headers, content=body)
+
+        cursor = self._cursors.get(self.key, 0)
+        recorded = self.records.get(self.key, [])
+        if cursor >= len(recorded):
+            self.misses += 1
+            return httpx.Response(404, json={"error": {"message": f"no recording for {self.key}"}})
+        self._cursors[self.key] = cursor + 1
+        item = recorded[cursor]
+        content_type = "text/event-stream" if item["body"].startswith("data:") else "application/json"
+        return httpx.Response(item["status"], headers={"content-type": content_type}, content=item["body"].encode("utf-8"))
+
+    async def aclose(self) -> None:
+        if self.upstream is not None:
+            await self.upstream.aclose()
+
+
+def make_transport(args: argparse.Namespace) -> httpx.AsyncBaseTransport:
+    if args.mode == "mock":
+        settings = MockSettings(seed=args.seed, error_rate=args.mock_error_rate)
+        settings.latency["router"] = LatencySpec.parse(args.mock_latency)
+        return httpx.ASGITransport(app=create_app(settings))
+    if args.mode == "record":
+        if not Config.OPENROUTER_API_KEY:
+            sys.exit("❌ Для записи нужен OPENROUTER_API_KEY")
+        return ReplayTransport(upstream=httpx.AsyncHTTPTransport())
+    if not args.store.exists():
+        sys.exit(f"❌ Нет файла записей {args.store} (сначала --mode record)")
+    return ReplayTransport(records=json.loads(args.store.read_text(encoding="utf-8")))
+
+
+# === Прогон ===
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def run(dialogues: List[Dialogue], transport: httpx.AsyncBaseTransport, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    from history_manager import HistoryManager
+    from router import Router, last_call_trace
+
+    http_pool.set_http_pool(http_pool.HttpPool(transport=transport))
+    router = Router(use_cache=True)
+    executor = get_resilience_executor()
+    history_manager = HistoryManager()
+    calls: List[Dict[str, Any]] = []
+    for dialogue_id, messages in dialogues:
+        history_manager.clear_user_history(dialogue_id)
+        for step, message in enumerate(messages):
+            history = list(history_manager.get_history(dialogue_id))
+            memory = history_manager.get_memory_prompt(dialogue_id)
+            if isinstance(transport, ReplayTransport):
+                transport.key = f"{dialogue_id}#{step}"
+            retries_before = executor.stats["router"]["retries"]
+            started = time.perf_counter()
+            if args.streaming:
+                result = await router.route_streaming(message, history, dialogue_id, memory=memory)
+            else:
+                result = await router.route(message, history, dialogue_id, memory=memory)
+            latency = time.perf_counter() - started
+            trace = last_call_trace() or {}
+            calls.append({
+                "dialogue": dialogue_id,
+                "step": step,
+                "path": trace.get("path"),
+                "status": result.get("status"),
+                "documents": result.get("documents", []),
+                "prompt_chars": trace.get("prompt_chars", 0),
+                "estimated_tokens": trace.get("estimated_tokens", 0),
+                "parse_ms": round(trace.get("parse_seconds", 0.0) * 1000, 3),
+                "retries": executor.stats["router"]["retries"] - retries_before,
+                "latency_ms": round(latency * 1000, 3),
+            })
+            # Ответ ассистента не генерируется — в историю идёт заглушка с решением роутера
+            reply = result.get("message") or f"Ответ по документам: {', '.join(result.get('documents', []))}."
+            history_manager.add_message(dialogue_id, "user", message)
+            history_manager.add_message(dialogue_id, "assistant", reply)
+            history_manager.update_memory(dialogue_id)
+    await http_pool.get_http_pool().aclose()
+    return calls
+
+
+def summarize(calls: List[Dict[str, Any]]) -> Dict[str, Any]:
+    gemini = [call for call in calls if call["path"] in ("gemini", "fallback") and call["prompt_chars"]]
+    latencies = [call["latency_ms"] for call in calls]
+    paths: Dict[str, int] = {}
+    for call in calls:
+        paths[str(call["path"])] = paths.get(str(call["path"]), 0) + 1
+    total = len(calls) or 1
+    return {
+        "calls": len(calls),
+        "paths": paths,
+        "gemini_requests": len(gemini),
+        "fallback_rate": round(paths.get("fallback", 0) / total, 4),
+        "retry_rate": round(sum(1 for call in calls if call["retries"]) / total, 4),
+        "retries": sum(call["retries"] for call in calls),
+        "avg_prompt_chars": round(sum(call["prompt_chars"] for call in gemini) / len(gemini), 1) if gemini else 0.0,
+        "avg_estimated_tokens": round(sum(call["estimated_tokens"] for call in gemini) / len(gemini), 1) if gemini else 0.0,
+        "avg_parse_ms": round(sum(call["parse_ms"] for call in gemini) / len(gemini), 3) if gemini else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p90": round(percentile(latencies, 0.9), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(max(latencies), 3) if latencies else 0.0,
+        },
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def print_summary(summary: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> None:
+    rows = [
+        ("вызовов", summary["calls"], None),
+        ("запросов к Gemini", summary["gemini_requests"], "gemini_requests"),
+        ("фолбэки", f"{summary['fallback_rate']:.1%}", "fallback_rate"),
+        ("вызовы с повторами", f"{summary['retry_rate']:.1%}", "retry_rate"),
+        ("промпт, символов", summary["avg_prompt_chars"], "avg_prompt_chars"),
+        ("промпт, ~токенов", summary["avg_estimated_tokens"], "avg_estimated_tokens"),
+        ("разбор ответа, мс", summary["avg_parse_ms"], "avg_parse_ms"),
+    ] + [(f"задержка {name}, мс", value, f"latency_ms.{name}") for name, value in summary["latency_ms"].items()]
+
+    print(f"Пути решений: {summary['paths']}")
+    for label, value, key in rows:
+        line = f"  {label:<22} {value}"
+        if previous and key:
+            old = previous
+            for part in key.split("."):
+                old = old.get(part, {}) if isinstance(old, dict) else {}
+            new = summary
+            for part in key.split("."):
+                new = new[part]
+            if isinstance(old, (int, float)) and old:
+                line += f"   (было {old}, {(new - old) / old:+.1%})"
+        print(line)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк Router.route на записанных диалогах")
+    parser.add_argument("--mode", choices=("mock", "replay", "record"), default="mock")
+    parser.add_argument("--store", type=Path, default=DEFAULT_STORE, help="Файл записанных ответов (replay/record)")
+    parser.add_argument("--output", type=Path, help="Куда писать результат (по умолчанию reports/router_benchmark_<время>.json)")
+    parser.add_argument("--compare", type=Path, help="Прошлый результат для сравнения сводки")
+    parser.add_argument("--limit", type=int, default=0, help="Ограничить число диалогов")
+    parser.add_argument("--streaming", action="store_true", help="Через route_streaming вместо route")
+    parser.add_argument("--no-route-cache", action="store_true", help="Отключить кеш решений роутера")
+    parser.add_argument("--mock-latency", default="fixed:0", help="Задержка заглушки для роутера: fixed:0.5 | uniform:0.2,1.0 | lognormal:mu,sigma")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    configure_logging(level="WARNING")
+    if args.no_route_cache:
+        Config.ROUTE_CACHE_ENABLED = False
+
+    dialogues = load_dialogues()
+    if args.limit:
+        dialogues = dialogues[: args.limit]
+    transport = make_transport(args)
+    calls = asyncio.run(run(dialogues, transport, args))
+    summary = summarize(calls)
+
+    if args.mode == "record":
+        args.store.parent.mkdir(parents=True, exist_ok=True)
+        args.store.write_text(json.dumps(transport.records, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Записано ответов: {sum(len(items) for items in transport.records.values())} → {args.store}")
+    if isinstance(transport, ReplayTransport) and args.mode == "replay":
+        summary["replay_misses"] = transport.misses
+
+    result = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "mode": args.mode,
+        "streaming": args.streaming,
+        "config": {
+            "route_cache": Config.ROUTE_CACHE_ENABLED,
+            "social_fast_path": Config.SOCIAL_FAST_PATH,
+            "router_preselect": Config.ROUTER_PRESELECT,
+            "conversation_memory": Config.CONVERSATION_MEMORY,
+            "mock_latency": args.mock_latency if args.mode == "mock" else None,
+        },
+        "dialogues": len(dialogues),
+        "summary": summary,
+        "calls": calls,
+    }
+    output = args.output or ROOT / "reports" / f"router_benchmark_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    previous = json.loads(args.compare.read_text(encoding="utf-8"))["summary"] if args.compare else None
+    print(f"Диалогов: {len(dialogues)}, режим: {args.mode}, ревизия: {result['revision'] or '—'}")
+    print_summary(summary, previous)
+    print(f"Результат: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Оценка BM25-предотбора саммари для роутера: согласие с выбором документов против
+экономии токенов промпта
+
+Три части:
+    1. typical_questions из summaries.json как размеченные запросы (leave-one-out:
+       вопрос убирается из индекса своего документа) — recall документа среди кандидатов.
+    2. Реплики из диалогов tests/*.json и tests/data/*.json — доля запросов с предотбором,
+       среднее число кандидатов и оценка токенов промпта: полный раздел против кандидатов.
+    3. С --reference: доля реплик, где все документы, выбранные роутером с полным
+       промптом, попали в кандидатов. Файл-эталон пишет --record (нужен OPENROUTER_API_KEY).
+
+Запуск:
+    python scripts/eval_summary_selector.py
+    python scripts/eval_summary_selector.py --top-k 5 --min-coverage 0.7
+    python scripts/eval_summary_selector.py --record reports/router_reference.json --limit 50
+    python scripts/eval_summary_selector.py --reference reports/router_reference.json
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from prompt_segments import estimate_tokens  # noqa: E402
+from summary_selector import NUMPY_AVAILABLE, SummarySelector  # noqa: E402
+
+SUMMARIES_PATH = ROOT / "data" / "summaries.json"
+DOCUMENTS_DIR = ROOT / "data" / "documents_compressed"
+
+Turn = Tuple[str, List[Dict[str, str]]]  # (сообщение, предыдущие реплики пользователя)
+
+
+def _step_text(step) -> str:
+    if isinstance(step, str):
+        return step
+    if isinstance(step, dict):
+        for key in ("user_input", "message", "text", "content"):
+            if isinstance(step.get(key), str):
+                return step[key]
+    return ""
+
+
+def load_dialogue_turns() -> List[Turn]:
+    """Реплики пользователя из всех json-диалогов тестов вместе с предыдущими репликами"""
+    turns: List[Turn] = []
+    paths = sorted((ROOT / "tests").glob("*.json")) + sorted((ROOT / "tests" / "data").glob("*.json"))
+    for path in paths:
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            continue
+        scenarios = data.get("scenarios", []) if isinstance(data, dict) else data
+        if not isinstance(scenarios, list):
+            continue
+        for scenario in scenarios:
+            if not isinstance(scenario, dict):
+                continue
+            steps = scenario.get("steps") or scenario.get("messages") or []
+            history: List[Dict[str, str]] = []
+            for step in steps:
+                text = _step_text(step)
+                if not text:
+                    continue
+                turns.append((text, list(history)))
+                history.append({"role": "user", "content": text})
+    return turns
+
+
+def make_selector(summaries: Dict, args: argparse.Namespace) -> SummarySelector:
+    return SummarySelector(
+        summaries, DOCUMENTS_DIR, top_k=args.top_k, min_score=args.min_score, min_coverage=args.min_coverage
+    )
+
+
+def summaries_tokens(summaries: Dict, documents=None) -> int:
+    subset = summaries if documents is None else {name: summaries[name] for name in documents}
+    return estimate_tokens(json.dumps(subset, ensure_ascii=False, indent=2))
+
+
+def evaluate_typical_questions(summaries: Dict, args: argparse.Namespace) -> None:
+    hits = fallbacks = total = 0
+    for name, summary in summaries.items():
+        for index, question in enumerate(summary.get("typical_questions", [])):
+            held_out = copy.deepcopy(summaries)
+            del held_out[name]["typical_questions"][index]
+            selection = make_selector(held_out, args).select(question)
+            total += 1
+            if selection is None:
+                fallbacks += 1
+            elif name in selection.documents:
+                hits += 1
+    selected = total - fallbacks
+    print(f"1) typical_questions (leave-one-out): {total} вопросов")
+    print(f"   предотбор: {selected / total:.1%}, полный раздел: {fallbacks / total:.1%}")
+    print(f"   recall документа среди кандидатов: {hits / selected:.1%}" if selected else "   предотбор ни разу не сработал")
+
+
+def evaluate_dialogues(summaries: Dict, turns: List[Turn], args: argparse.Namespace) -> None:
+    selector = make_selector(summaries, args)
+    full_tokens = summaries_tokens(summaries)
+    sent_tokens = 0
+    candidates = 0
+    selected = 0
+    for message, history in turns:
+        selection = selector.select(message, history)
+        if selection is None:
+            sent_tokens += full_tokens
+            continue
+        selected += 1
+        candidates += len(selection.documents)
+        sent_tokens += summaries_tokens(summaries, selection.documents)
+
+    baseline = full_tokens * len(turns)
+    print(f"2) реплики диалогов: {len(turns)}")
+    print(f"   предотбор: {selected / len(turns):.1%}, в среднем кандидатов: {candidates / selected:.1f}" if selected else "   предотбор ни разу не сработал")
+    print(f"   раздел базы знаний: {full_tokens} ток. полностью, в среднем отправлено {sent_tokens / len(turns):.0f} ток.")
+    print(f"   экономия токенов раздела: {1 - sent_tokens / baseline:.1%}")
+
+
+def evaluate_reference(summaries: Dict, reference: List[Dict], args: argparse.Namespace) -> None:
+    selector = make_selector(summaries, args)
+    compared = agreed = fallbacks = 0
+    misses: Dict[str, int] = {}
+    for item in reference:
+        documents = item.get("documents") or []
+        if item.get("status") != "success" or not documents:
+            continue
+        compared += 1
+        history = [{"role": "user", "content": text} for text in item.get("history", [])]
+        selection = selector.select(item["message"], history)
+        if selection is None:
+            # Полный раздел — решение роутера не меняется
+            fallbacks += 1
+            agreed += 1
+            continue
+        missing = [name for name in documents if name not in selection.documents]
+        if not missing:
+            agreed += 1
+        for name in missing:
+            misses[name] = misses.get(name, 0) + 1
+    print(f"3) эталон роутера: {compared} решений success")
+    if compared:
+        print(f"   согласие (все документы роутера среди кандидатов или полный раздел): {agreed / compared:.1%}")
+        print(f"   из них с полным разделом: {fallbacks}")
+        if misses:
+            print(f"   чаще всего теряются: {sorted(misses.items(), key=lambda kv: -kv[1])[:5]}")
+
+
+async def record_reference(turns: List[Turn], path: Path, limit: int) -> None:
+    """Решения роутера с полным промптом (живой Gemini через OpenRouter)"""
+    from config import Config
+    Config.ROUTER_PRESELECT = False
+    Config.ROUTE_CACHE_ENABLED = False
+    Config.SOCIAL_FAST_PATH = False
+    from router import Router
+
+    router = Router(use_cache=True)
+    records = []
+    for message, history in turns[:limit]:
+        result = await router.route(message, history, "eval_selector")
+        records.append({
+            "message": message,
+            "history": [msg["content"] for msg in history],
+            "status": result.get("status"),
+            "documents": result.get("documents", []),
+        })
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(records, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Записано {len(records)} решений в {path}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Оценка BM25-предотбора саммари для роутера")
+    parser.add_argument("--top-k", type=int, default=6)
+    parser.add_argument("--min-score", type=float, default=2.0)
+    parser.add_argument("--min-coverage", type=float, default=0.75)
+    parser.add_argument("--skip-leave-one-out", action="store_true", help="Пропустить часть 1 (самая долгая)")
+    parser.add_argument("--reference", type=Path, help="Эталонные решения роутера (JSON из --record)")
+    parser.add_argument("--record", type=Path, help="Записать эталон с полным промптом (живой API)")
+    parser.add_argument("--limit", type=int, default=100, help="Сколько реплик записывать в эталон")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    summaries = json.loads(SUMMARIES_PATH.read_text(encoding="utf-8"))
+    turns = load_dialogue_turns()
+
+    if arguments.record:
+        asyncio.run(record_reference(turns, arguments.record, arguments.limit))
+        sys.exit(0)
+
+    print(f"top_k={arguments.top_k} min_score={arguments.min_score} min_coverage={arguments.min_coverage} numpy={NUMPY_AVAILABLE}")
+    if not arguments.skip_leave_one_out:
+        evaluate_typical_questions(summaries, arguments)
+    evaluate_dialogues(summaries, turns, arguments)
+    if arguments.reference:
+        evaluate_reference(summaries, json.loads(arguments.reference.read_text(encoding="utf-8")), arguments)
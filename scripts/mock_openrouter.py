@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка OpenRouter (/api/v1/chat/completions) для офлайн-бенчмарков
+
+Поддерживает JSON и SSE-стриминг, распределения задержек, скорость выдачи токенов,
+долю ошибок и сценарные ответы: JSON роутера по шаблонам сообщений, заготовленная
+проза генератора, перевод и юмор. Стадия определяется по маркерам промпта.
+
+Запуск:
+    python scripts/mock_openrouter.py --port 8001 --latency router=lognormal:0.8,0.3 --error-rate 0.02
+    OPENROUTER_API_URL=http://127.0.0.1:8001/api/v1/chat/completions python src/main.py
+
+В тестах и бенчмарках приложение можно подключить без сети:
+    pool = HttpPool(transport=httpx.ASGITransport(app=create_app(MockSettings())))
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STAGES = ("router", "generator", "translator", "humor")
+
+
+@dataclass
+class LatencySpec:
+    """Распределение задержки до первого токена: fixed:0.5 | uniform:0.2,1.0 | lognormal:mu,sigma"""
+    kind: str = "fixed"
+    params: List[float] = field(default_factory=lambda: [0.0])
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencySpec":
+        kind, _, raw = spec.partition(":")
+        params = [float(value) for value in raw.split(",") if value.strip()] if raw else [0.0]
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Неизвестное распределение задержки: {spec}")
+        return cls(kind, params)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.params[0], self.params[1])
+        if self.kind == "lognormal":
+            # mu задаётся как медиана в секундах, sigma — разброс в логарифмах
+            return rng.lognormvariate(math.log(max(self.params[0], 1e-6)), self.params[1])
+        return self.params[0]
+
+
+@dataclass
+class MockSettings:
+    """Параметры поведения заглушки"""
+    latency: Dict[str, LatencySpec] = field(default_factory=lambda: {stage: LatencySpec() for stage in STAGES})
+    tokens_per_second: float = 0.0        # 0 — весь ответ сразу, иначе время ~ completion_tokens / tps
+    error_rate: float = 0.0
+    error_statuses: List[int] = field(default_factory=lambda: [429, 500, 502, 503])
+    scenario: Dict[str, Any] = field(default_factory=dict)
+    seed: Optional[int] = None
+
+
+# === Определение стадии и ответы по умолчанию ===
+
+def detect_stage(messages: List[Dict[str, Any]]) -> str:
+    """Стадия пайплайна по маркерам промптов Router/Generator/Translator/Жванецкий"""
+    text = "\n".join(str(message.get("content", "")) for message in messages)
+    if "=== ТЕКУЩИЙ ЗАПРОС ===" in text:
+        return "router"
+    if "Жванецк" in text:
+        return "humor"
+    last = str(messages[-1].get("content", "")) if messages else ""
+    if last.startswith("Translate to") or last.startswith("Rewrite as"):
+        return "translator"
+    return "generator"
+
+
+def extract_user_message(messages: List[Dict[str, Any]]) -> str:
+    """Текущее сообщение пользователя из промпта роутера"""
+    text = str(messages[-1].get("content", "")) if messages else ""
+    match = re.search(r"=== ТЕКУЩИЙ ЗАПРОС ===\s*User:\s*(.*?)(?:\n\n|\Z)", text, re.S)
+    return match.group(1).strip() if match else text.strip()
+
+
+DOC_KEYWORDS = [
+    (r"цен|стои|скидк|оплат|рассрочк|дорог|грн|price|cost|ціна|вартість", "pricing.md"),
+    (r"курс|програм|возраст|лет|занят|course", "courses_detailed.md"),
+    (r"преподав|учител|тренер|teacher|викладач", "teachers_team.md"),
+    (r"безопас|гарант|возврат|safety", "safety_and_trust.md"),
+    (r"расписан|онлайн|zoom|формат|услови|condition", "conditions.md"),
+    (r"методик|подход|method", "methodology.md"),
+    (r"результат|эффект|достижен|result", "results_achievements.md"),
+    (r"блогер|реклам|сотруднич|партн", "partners.md"),
+]
+
+SIGNAL_KEYWORDS = [
+    (r"запис|хочу начать|готов|sign up|записати", "ready_to_buy"),
+    (r"дорог|скидк|цен|стои|бюджет", "price_sensitive"),
+    (r"застенчив|боит|тревож|проблем|стесня|не может", "anxiety_about_child"),
+]
+
+GREETING_RE = re.compile(r"^\s*(привет|здравствуй|добрый|hello|hi|вітаю|доброго)\b", re.I)
+FAREWELL_RE = re.compile(r"(до свидания|пока|всего доброго|bye|до побачення)", re.I)
+THANKS_RE = re.compile(r"(спасибо|благодар|thank|дякую)", re.I)
+
+
+def detect_language(message: str) -> str:
+    if re.search(r"[іїєґІЇЄҐ]", message):
+        return "uk"
+    if re.search(r"[a-zA-Z]", message) and not re.search(r"[а-яА-ЯёЁ]", message):
+        return "en"
+    return "ru"
+
+
+def default_router_answer(message: str) -> Dict[str, Any]:
+    """Эвристический JSON роутера, когда сценарий не задал ответ явно"""
+    lowered = message.lower()
+    questions = [part.strip() + "?" for part in re.split(r"\?", message) if part.strip()]
+    documents = []
+    for pattern, document in DOC_KEYWORDS:
+        if re.search(pattern, lowered) and document not in documents:
+            documents.append(document)
+    signal = "exploring_only"
+    for pattern, candidate in SIGNAL_KEYWORDS:
+        if re.search(pattern, lowered):
+            signal = candidate
+            break
+
+    answer: Dict[str, Any] = {
+        "detected_language": detect_language(message),
+        "user_signal": signal,
+    }
+    social = None
+    if GREETING_RE.search(message):
+        social = "greeting"
+    elif FAREWELL_RE.search(message):
+        social = "farewell"
+    elif THANKS_RE.search(message):
+        social = "thanks"
+    if social:
+        answer["social_context"] = social
+
+    if len(questions) > 3:
+        answer.update({
+            "status": "need_simplification",
+            "message": "Пожалуйста, задавайте не более трёх вопросов за раз.",
+            "decomposed_questions": questions,
+        })
+    elif documents:
+        answer.update({"status": "success", "documents": documents[:4], "decomposed_questions": questions or [message]})
+    else:
+        answer.update({"status": "offtopic", "decomposed_questions": []})
+    return answer
+
+
+DEFAULT_GENERATOR_TEXT = (
+    "В Ukido мы развиваем у детей soft skills через живую практику в небольших группах. "
+    "Занятия проходят онлайн в Zoom, а каждый ребёнок получает внимание преподавателя.\n\n"
+    "Курсы рассчитаны на разные возрасты, программа подбирается под задачи семьи. "
+    "Родители получают регулярную обратную связь о прогрессе.\n\n"
+    "Первое пробное занятие бесплатное, на нём можно познакомиться с форматом и преподавателем."
+)
+
+DEFAULT_HUMOR_TEXT = "Погода у нас как родительское собрание: все обсуждают, но никто не может повлиять."
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class MockOpenRouter:
+    """Состояние заглушки: ГСЧ, кеш префиксов и счётчики"""
+
+    def __init__(self, settings: MockSettings):
+        self.settings = settings
+        self.rng = random.Random(settings.seed)
+        self.seen_prefixes = set()
+        self.stats: Dict[str, int] = {"requests": 0, "errors": 0, **{stage: 0 for stage in STAGES}}
+
+    def scripted(self, stage: str, message: str) -> Optional[Any]:
+        """Первый сценарный ответ стадии, чей pattern совпал с сообщением"""
+        for rule in self.settings.scenario.get(stage, []):
+            if re.search(rule.get("pattern", ""), message, re.I | re.S):
+                return rule.get("response", rule.get("text"))
+        return None
+
+    def completion_text(self, stage: str, messages: List[Dict[str, Any]]) -> str:
+        if stage == "router":
+            message = extract_user_message(messages)
+            answer = self.scripted("router", message) or default_router_answer(message)
+            return answer if isinstance(answer, str) else json.dumps(answer, ensure_ascii=False)
+        last = str(messages[-1].get("content", "")) if messages else ""
+        if stage == "translator":
+            source = last.split("\n\n", 1)[-1].split("\n\nUser's original question:", 1)[0]
+            return self.scripted("translator", source) or source
+        if stage == "humor":
+            return self.scripted("humor", last) or DEFAULT_HUMOR_TEXT
+        return self.scripted("generator", last) or DEFAULT_GENERATOR_TEXT
+
+    def usage(self, messages: List[Dict[str, Any]], completion: str, stage: str) -> Dict[str, Any]:
+        prompt = "\n".join(str(message.get("content", "")) for message in messages)
+        prompt_tokens = estimate_tokens(prompt)
+        cached_tokens = 0
+        if stage == "router" and "=== ТЕКУЩИЙ ЗАПРОС ===" in prompt:
+            # Имитация кеша префикса: повторный статичный префикс считается кешированным
+            prefix = prompt.split("=== ТЕКУЩИЙ ЗАПРОС ===", 1)[0]
+            key = hashlib.sha256(prefix.encode()).hexdigest()
+            if key in self.seen_prefixes:
+                cached_tokens = estimate_tokens(prefix)
+            self.seen_prefixes.add(key)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": estimate_tokens(completion),
+            "total_tokens": prompt_tokens + estimate_tokens(completion),
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+
+    def first_token_delay(self, stage: str) -> float:
+        spec = self.settings.latency.get(stage) or LatencySpec()
+        return max(0.0, spec.sample(self.rng))
+
+    def maybe_error(self) -> Optional[JSONResponse]:
+        if self.settings.error_rate and self.rng.random() < self.settings.error_rate:
+            status = self.rng.choice(self.settings.error_statuses)
+            headers = {"Retry-After": "1"} if status == 429 else None
+            self.stats["errors"] += 1
+            return JSONResponse({"error": {"code": status, "message": "mock upstream error"}}, status_code=status, headers=headers)
+        return None
+
+
+def create_app(settings: Optional[MockSettings] = None) -> FastAPI:
+    """ASGI-приложение заглушки"""
+    mock = MockOpenRouter(settings or MockSettings())
+    app = FastAPI(title="Mock OpenRouter")
+    app.state.mock = mock
+
+    @app.post("/api/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "mock/model")
+        stage = detect_stage(messages)
+        mock.stats["requests"] += 1
+        mock.stats[stage] += 1
+
+        error = mock.maybe_error()
+        delay = mock.first_token_delay(stage)
+        if error is not None:
+            await asyncio.sleep(delay)
+            return error
+
+        text = mock.completion_text(stage, messages)
+        usage = mock.usage(messages, text, stage)
+        tps = mock.settings.tokens_per_second
+        created = int(time.time())
+
+        if not body.get("stream"):
+            generation_time = usage["completion_tokens"] / tps if tps else 0.0
+            await asyncio.sleep(delay + generation_time)
+            return {
+                "id": f"mock-{mock.stats['requests']}",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        async def events():
+            await asyncio.sleep(delay)
+            words = re.findall(r"\S+\s*", text) or [text]
+            for word in words:
+                if tps:
+                    await asyncio.sleep(estimate_tokens(word) / tps)
+                chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": word}}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield f"data: {json.dumps({'model': model, 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return mock.stats
+
+    return app
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Локальная заглушка OpenRouter")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", action="append", default=[],
+                        help="stage=spec, например router=lognormal:0.8,0.3 или generator=uniform:1,3")
+    parser.add_argument("--tps", type=float, default=0.0, help="Скорость выдачи токенов (0 — мгновенно)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--scenario", help="JSON со сценарными ответами {stage: [{pattern, response|text}]}")
+    parser.add_argument("--seed", type=int)
+    return parser.parse_args(argv)
+
+
+def settings_from_args(args: argparse.Namespace) -> MockSettings:
+    settings = MockSettings(tokens_per_second=args.tps, error_rate=args.error_rate, seed=args.seed)
+    for item in args.latency:
+        stage, _, spec = item.partition("=")
+        targets = STAGES if stage == "all" else (stage,)
+        for target in targets:
+            settings.latency[target] = LatencySpec.parse(spec)
+    if args.scenario:
+        with open(args.scenario, "r", encoding="utf-8") as f:
+            settings.scenario = json.load(f)
+    return settings
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    arguments = parse_args()
+    uvicorn.run(create_app(settings_from_args(arguments)), host=arguments.host, port=arguments.port, log_level="warning")
@@ -0,0 +1,148 @@
+"""
+answer_cache.py - Кеш ответов генератора с фоновым обновлением (stale-while-revalidate)
+
+Большая часть успешных запросов — небольшой набор вопросов («цена Юного Оратора»,
+«сколько детей в группе», «как проходит пробное»), и каждый стоил полного вызова
+Claude с теми же документами. Кеш хранит очищенный текст ответа до персонализации
+(приветствие, контакты, CTA-фолбэк, перевод и ссылки генератор накладывает при
+каждом попадании) по ключу: нормализованные вопросы + документы с хешами содержимого
++ user_signal + состояние CTA + язык + прочий контекст промпта (социальный контекст,
+отпечаток короткой истории). Изменился документ — изменился его хеш, и
+старые ответы больше не находятся (их вытеснит LRU).
+
+Свежий ответ (моложе ttl_seconds) отдаётся как есть. Устаревший, но не старше
+ещё stale_seconds, тоже отдаётся сразу, а генератор в фоне запрашивает новый
+(не больше одного обновления на ключ). Дальше — промах.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from route_cache import normalize_message
+
+
+@dataclass(frozen=True)
+class CachedAnswer:
+    """Ответ из кеша"""
+    text: str
+    stale: bool  # Срок свежести прошёл: ответ отдаётся, но его пора обновить
+
+
+class AnswerCache:
+    """Ограниченный по размеру кеш ответов со сроком свежести и окном устаревания"""
+
+    def __init__(self, max_size: int = 512, ttl_seconds: float = 900.0, stale_seconds: float = 3600.0):
+        """
+        Args:
+            max_size: Максимум ответов в кеше (самые давно использованные вытесняются)
+            ttl_seconds: Сколько ответ считается свежим
+            stale_seconds: Сколько ещё после этого устаревший ответ отдаётся с фоновым обновлением
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        # key → (текст, свежий до, отдаётся до, сколько секунд стоил запрос к Claude)
+        self._entries: "OrderedDict[str, Tuple[str, float, float, float]]" = OrderedDict()
+        self._refreshing: Set[str] = set()
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,    # из них — устаревшие ответы с фоновым обновлением
+            "misses": 0,
+            "bypassed": 0,      # ответ зависит от диалога — кеш не спрашивали
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "refreshes": 0,     # запущенных фоновых обновлений
+        }
+        self.latency_saved = 0.0
+
+    def get(self, key: str) -> Optional[CachedAnswer]:
+        """Ответ или None (промах / прошло и окно устаревания)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        text, fresh_until, stale_until, cost = entry
+        now = time.monotonic()
+        if now >= stale_until:
+            del self._entries[key]
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        stale = now >= fresh_until
+        self.stats["hits"] += 1
+        self.stats["stale_hits"] += stale
+        self.latency_saved += cost
+        return CachedAnswer(text, stale)
+
+    def put(self, key: str, text: str, cost_seconds: float = 0.0) -> None:
+        """
+        Сохраняет ответ
+
+        Args:
+            key: Ключ из make_key
+            text: Очищенный ответ до персонализации
+            cost_seconds: Время запроса к Claude (для оценки сэкономленной задержки)
+        """
+        fresh_until = time.monotonic() + self.ttl_seconds
+        self._entries[key] = (text, fresh_until, fresh_until + self.stale_seconds, cost_seconds)
+        self._entries.move_to_end(key)
+        self.stats["stores"] += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def begin_refresh(self, key: str) -> bool:
+        """Отмечает фоновое обновление ключа; False — оно уже идёт"""
+        if key in self._refreshing:
+            return False
+        self._refreshing.add(key)
+        self.stats["refreshes"] += 1
+        return True
+
+    def end_refresh(self, key: str) -> None:
+        self._refreshing.discard(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    @staticmethod
+    def make_key(
+        questions: List[str],
+        document_hashes: Dict[str, str],
+        user_signal: str,
+        cta_text: Optional[str],
+        language: str,
+        context: str = "",
+    ) -> Optional[str]:
+        """
+        Ключ кеша; None — без вопросов или документов ответ не кешируется
+
+        Args:
+            questions: decomposed_questions роутера
+            document_hashes: Имя документа → sha256 его содержимого
+            cta_text: Вариант CTA, который просим встроить (None — без CTA)
+            context: Прочие признаки, меняющие промпт (социальный контекст и т.п.)
+        """
+        normalized = [normalize_message(question) for question in questions]
+        if not any(normalized) or not document_hashes:
+            return None
+        documents = ",".join(f"{name}:{digest[:16]}" for name, digest in sorted(document_hashes.items()))
+        cta = hashlib.sha1(cta_text.encode("utf-8")).hexdigest()[:12] if cta_text else "-"
+        return f"{language}|{user_signal}|{cta}|{context}|{documents}|{' / '.join(normalized)}"
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            **self.stats,
+            "refreshing": len(self._refreshing),
+            "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+        }
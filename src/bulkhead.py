@@ -0,0 +1,172 @@
+"""
+bulkhead.py - Ограничение параллельных LLM-вызовов по стадиям пайплайна
+
+У каждой стадии свой лимит одновременных вызовов и ограниченная очередь ожидания.
+Если очередь заполнена или оценка ожидания превышает допустимую, вызов сразу
+отклоняется (BulkheadRejected) — API отвечает 503 с Retry-After.
+Юмор и перевод получают маленькие квоты и деградируют первыми.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from config import Config
+
+
+class BulkheadRejected(Exception):
+    """Вызов отклонён: стадия перегружена"""
+
+    def __init__(self, stage: str, reason: str, retry_after: float):
+        super().__init__(f"{stage}: {reason}")
+        self.stage = stage
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class Bulkhead:
+    """Семафор стадии с ограниченной очередью и оценкой времени ожидания"""
+
+    def __init__(self, stage: str, max_concurrent: int, max_queue: int, max_wait: float):
+        self.stage = stage
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._avg_hold = 0.0  # EWMA длительности вызова, для оценки ожидания
+        self._queue_times: Deque[float] = deque(maxlen=200)
+        self.stats = {"acquired": 0, "queued": 0, "rejected_queue_full": 0, "rejected_wait": 0, "timed_out": 0}
+
+    def estimated_wait(self, position: Optional[int] = None) -> float:
+        """Оценка ожидания для нового вызова в хвосте очереди"""
+        if self.active < self.max_concurrent and not self._waiters:
+            return 0.0
+        ahead = len(self._waiters) if position is None else position
+        return self._avg_hold * (ahead // self.max_concurrent + 1)
+
+    def would_reject(self) -> Optional[BulkheadRejected]:
+        """Проверка допуска без занятия слота (для предварительного 503)"""
+        if self.active < self.max_concurrent and not self._waiters:
+            return None
+        if len(self._waiters) >= self.max_queue:
+            return BulkheadRejected(self.stage, "queue full", self.estimated_wait() or 1.0)
+        wait = self.estimated_wait()
+        if wait > self.max_wait:
+            return BulkheadRejected(self.stage, "estimated wait exceeds deadline", wait)
+        return None
+
+    async def acquire(self) -> float:
+        """Занимает слот; возвращает время ожидания в очереди (сек)"""
+        rejection = self.would_reject()
+        if rejection is not None:
+            key = "rejected_queue_full" if rejection.reason == "queue full" else "rejected_wait"
+            self.stats[key] += 1
+            raise rejection
+
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.stats["acquired"] += 1
+            self._queue_times.append(0.0)
+            return 0.0
+
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            if waiter.done() and not waiter.cancelled():
+                # Слот успели передать в момент таймаута — возвращаем его
+                self.release_slot()
+            else:
+                waiter.cancel()
+            raise BulkheadRejected(self.stage, "queue wait timeout", self.estimated_wait() or self.max_wait)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release_slot()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+        queued_for = time.perf_counter() - started
+        self._queue_times.append(queued_for)
+        self.stats["acquired"] += 1
+        return queued_for
+
+    def release_slot(self) -> None:
+        """Освобождает слот: передаёт его первому живому ожидающему"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # слот переходит ожидающему, active не меняется
+                return
+        self.active -= 1
+
+    def _observe_hold(self, seconds: float) -> None:
+        self._avg_hold = seconds if self._avg_hold == 0.0 else 0.8 * self._avg_hold + 0.2 * seconds
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[float]:
+        """async with bulkhead.slot(): ... — слот на время вызова"""
+        queued_for = await self.acquire()
+        started = time.perf_counter()
+        try:
+            yield queued_for
+        finally:
+            self._observe_hold(time.perf_counter() - started)
+            self.release_slot()
+
+    def get_stats(self) -> Dict[str, Any]:
+        ordered = sorted(self._queue_times)
+        return {
+            **self.stats,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "avg_call_seconds": round(self._avg_hold, 3),
+            "queue_time_avg": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+            "queue_time_p95": round(ordered[int(0.95 * (len(ordered) - 1))], 3) if ordered else 0.0,
+        }
+
+
+class BulkheadRegistry:
+    """Bulkhead на каждую стадию по настройкам Config.BULKHEADS"""
+
+    def __init__(self):
+        self._bulkheads: Dict[str, Bulkhead] = {}
+
+    def for_stage(self, stage: str) -> Bulkhead:
+        if stage not in self._bulkheads:
+            limits = Config.BULKHEADS.get(stage, Config.BULKHEADS["default"])
+            self._bulkheads[stage] = Bulkhead(stage, **limits)
+        return self._bulkheads[stage]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        return {stage: bulkhead.get_stats() for stage, bulkhead in self._bulkheads.items()}
+
+
+_registry: Optional[BulkheadRegistry] = None
+
+
+def get_bulkheads() -> BulkheadRegistry:
+    """Общий реестр процесса"""
+    global _registry
+    if _registry is None:
+        _registry = BulkheadRegistry()
+    return _registry
@@ -6,6 +6,10 @@ MVP версия для Ukido AI Assistant.
 
 import random
 from typing import Dict, List, Optional
+from event_log import get_logger
+from keyword_matcher import get_keyword_matcher
+
+log = get_logger(__name__)
 
 
 class CompletedActionsHandler:
@@ -103,6 +107,27 @@ class CompletedActionsHandler:
             }
         }
         
+        # Все словари детектора в общем автомате: сообщение проверяется одним проходом
+        self.matcher = get_keyword_matcher()
+        for action_type, patterns in self.ACTION_PATTERNS.items():
+            self.matcher.register(f"actions.{action_type}.keywords", patterns['keywords'])
+            self.matcher.register(f"actions.{action_type}.school_context", patterns['school_context'])
+            if 'exclusion_words' in patterns:
+                self.matcher.register(f"actions.{action_type}.exclusion", patterns['exclusion_words'])
+        self.matcher.register("actions.question", [
+            '?', 'как', 'что', 'когда', 'где', 'почему', 'зачем',
+            'сколько', 'какой', 'какая', 'какие', 'куда', 'откуда'
+        ])
+        self.matcher.register("actions.payment_only", ['оплатил', 'оплатила', 'перевел', 'перевела', 'перевод'])
+        self.matcher.register("actions.school_mention", ['курс', 'занят', 'обучен', 'школ', 'ukido'])
+        # Ключевые слова, указывающие на контекст школы в истории
+        self.matcher.register("actions.history_school", [
+            'курс', 'занятие', 'обучение', 'ребенок', 'ребёнок', 'дети', 'детей',
+            'программа', 'учитель', 'преподаватель', 'урок', 'группа', 'запись',
+            'цена', 'стоимость', 'оплата', 'расписание', 'zoom', 'онлайн',
+            'методика', 'навык', 'skill', 'ukido', 'укидо', 'школа'
+        ])
+        
         # Фразы для неопределённых случаев
         self.UNCERTAIN_RESPONSES = [
             "Спасибо за информацию! Чем могу помочь дальше?",
@@ -128,12 +153,10 @@ class CompletedActionsHandler:
             return route_result
         
         # 2. Быстрые проверки для исключения
-        message_lower = message.lower()
+        hits = self.matcher.scan(message.lower())
         
         # Исключаем вопросы
-        question_markers = ['?', 'как', 'что', 'когда', 'где', 'почему', 'зачем', 
-                           'сколько', 'какой', 'какая', 'какие', 'куда', 'откуда']
-        if any(word in message_lower for word in question_markers):
+        if hits.any("actions.question"):
             return route_result
         
         # Исключаем длинные сообщения (вероятно не действия)
@@ -146,12 +169,12 @@ class CompletedActionsHandler:
         
         for action_type, patterns in self.ACTION_PATTERNS.items():
             # Проверяем ключевые слова действия
-            if any(keyword in message_lower for keyword in patterns['keywords']):
+            if hits.any(f"actions.{action_type}.keywords"):
                 detected_action = action_type
                 
                 # Проверяем слова-исключения (если есть)
                 if 'exclusion_words' in patterns:
-                    if any(excl in message_lower for excl in patterns['exclusion_words']):
+                    if hits.any(f"actions.{action_type}.exclusion"):
                         # Найдено исключающее слово - это НЕ про школу
                         detected_action = None
                         continue
@@ -159,9 +182,8 @@ class CompletedActionsHandler:
                 # Специальная проверка для слов "перевод" и "оплатил" - требуют явный контекст
                 if detected_action == 'payment':
                     # Проверяем, есть ли в сообщении только общие слова оплаты без контекста
-                    payment_only_words = ['оплатил', 'оплатила', 'перевел', 'перевела', 'перевод']
-                    has_only_payment = any(word in message_lower for word in payment_only_words)
-                    has_school_context = any(word in message_lower for word in ['курс', 'занят', 'обучен', 'школ', 'ukido'])
+                    has_only_payment = hits.any("actions.payment_only")
+                    has_school_context = hits.any("actions.school_mention")
                     
                     if has_only_payment and not has_school_context:
                         # Проверяем историю на наличие контекста школы
@@ -171,7 +193,7 @@ class CompletedActionsHandler:
                             continue
                 
                 # Проверяем контекст школы в самом сообщении
-                if any(context in message_lower for context in patterns['school_context']):
+                if hits.any(f"actions.{action_type}.school_context"):
                     is_school_related = True
                     break
                 
@@ -210,8 +232,7 @@ class CompletedActionsHandler:
             corrected_result['documents'] = ['faq.md']
         
         # Логируем для отладки
-        print(f"🔧 Completed action detected: '{detected_action}' for message: '{message[:50]}...'")
-        print(f"   School context: {is_school_related}, Documents: {corrected_result['documents']}")
+        log.info("completed_actions.detect_completed_action", "🔧 Completed action detected: '%s' for message: '%s...' (school context: %s, documents: %s)", detected_action, message[:50], is_school_related, corrected_result['documents'])
         
         return corrected_result
     
@@ -228,20 +249,12 @@ class CompletedActionsHandler:
         if not history:
             return False
         
-        # Ключевые слова, указывающие на контекст школы
-        school_keywords = [
-            'курс', 'занятие', 'обучение', 'ребенок', 'ребёнок', 'дети', 'детей',
-            'программа', 'учитель', 'преподаватель', 'урок', 'группа', 'запись',
-            'цена', 'стоимость', 'оплата', 'расписание', 'zoom', 'онлайн', 
-            'методика', 'навык', 'skill', 'ukido', 'укидо', 'школа'
-        ]
-        
         # Проверяем последние 6 сообщений (3 пары user-assistant)
         recent_messages = history[-6:] if len(history) >= 6 else history
         
         for msg in recent_messages:
             content = msg.get('content', '').lower()
-            if any(keyword in content for keyword in school_keywords):
+            if self.matcher.scan(content).any("actions.history_school"):
                 return True
         
         return False
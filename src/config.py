@@ -17,7 +17,66 @@ class Config:
     MODEL = ROUTER_MODEL  # Backward-compatible alias for router model
     MODEL_ANSWER = os.getenv("MODEL_ANSWER", os.getenv("ANSWER_MODEL", "anthropic/claude-3.5-haiku"))
     ANSWER_MODEL = MODEL_ANSWER  # Backward-compatible alias for answer generation
-    API_URL = "https://openrouter.ai/api/v1/chat/completions"
+    # Можно направить на локальную заглушку: scripts/mock_openrouter.py
+    API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+    # Общий пул HTTP-соединений (OpenRouter, HubSpot)
+    HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+    HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "20"))
+    HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "10"))
+    HTTP_POOL_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "60"))
+
+    # Устойчивость LLM-запросов: бюджет времени на стадию (секунды), повторы и хеджирование
+    LLM_STAGE_BUDGETS = {
+        "router": float(os.getenv("LLM_BUDGET_ROUTER", "12")),
+        "generator": float(os.getenv("LLM_BUDGET_GENERATOR", "30")),
+        "translator": float(os.getenv("LLM_BUDGET_TRANSLATOR", "20")),
+        "humor": float(os.getenv("LLM_BUDGET_HUMOR", "10")),
+        "default": float(os.getenv("LLM_BUDGET_DEFAULT", "30")),
+    }
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.25"))  # Первая задержка до 0.25с, дальше x2
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "2.0"))
+    LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "true").lower() == "true"
+    LLM_HEDGED_STAGES = ["router", "generator", "translator", "humor"]
+    LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))  # Не хеджируем раньше этого порога
+
+    # Bulkheads: лимит параллельных вызовов, длина очереди и максимум ожидания по стадиям.
+    # Юмор и перевод без очереди — при перегрузке они деградируют первыми
+    BULKHEADS = {
+        "router": {"max_concurrent": int(os.getenv("BULKHEAD_ROUTER_CONCURRENCY", "24")), "max_queue": 48, "max_wait": 4.0},
+        "generator": {"max_concurrent": int(os.getenv("BULKHEAD_GENERATOR_CONCURRENCY", "16")), "max_queue": 32, "max_wait": 8.0},
+        "translator": {"max_concurrent": int(os.getenv("BULKHEAD_TRANSLATOR_CONCURRENCY", "6")), "max_queue": 0, "max_wait": 0.0},
+        "humor": {"max_concurrent": int(os.getenv("BULKHEAD_HUMOR_CONCURRENCY", "4")), "max_queue": 0, "max_wait": 0.0},
+        "default": {"max_concurrent": 8, "max_queue": 8, "max_wait": 4.0},
+    }
+
+    # Фолбэк-модели по стадиям (через запятую, в порядке приоритета) и circuit breaker.
+    # По умолчанию фолбэков нет: другая модель — смена качества ответов, включается явно через env
+    MODEL_FALLBACKS = {
+        stage: [model.strip() for model in os.getenv(env_name, "").split(",") if model.strip()]
+        for stage, env_name in (
+            ("router", "ROUTER_FALLBACK_MODELS"),
+            ("generator", "ANSWER_FALLBACK_MODELS"),
+            ("translator", "TRANSLATION_FALLBACK_MODELS"),
+            ("humor", "ZHVANETSKY_FALLBACK_MODELS"),
+        )
+    }
+    MODEL_BUDGET_SHARE = float(os.getenv("MODEL_BUDGET_SHARE", "0.6"))  # Доля остатка бюджета на модель, только если за ней есть фолбэк
+    MODEL_LATENCY_SWITCH_RATIO = float(os.getenv("MODEL_LATENCY_SWITCH_RATIO", "1.5"))  # Фолбэк обгоняет основную модель, если быстрее в 1.5 раза
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))  # Подряд неудач до открытия
+    CIRCUIT_SLOW_CALL_RATIO = float(os.getenv("CIRCUIT_SLOW_CALL_RATIO", "0.5"))  # Доля медленных/неудачных вызовов в окне
+    CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+    CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+    CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+    CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+    CIRCUIT_SLOW_CALL_SECONDS = {
+        "router": 6.0,
+        "generator": 15.0,
+        "translator": 10.0,
+        "humor": 6.0,
+        "default": 15.0,
+    }
     
     # Настройки для оптимальной производительности и классификации Gemini 2.5 Flash
     TEMPERATURE = 0.3  # Низкая температура для более последовательных результатов классификации
@@ -25,6 +84,53 @@ class Config:
     # Отдельный лимит для длинного финального ответа ассистента
     MAX_TOKENS_ANSWER = 1200
     SEED = 42          # Фиксированный seed для воспроизводимости результатов
+
+    # Потоковый роутер: поля JSON разбираются по мере поступления, offtopic возвращается
+    # без ожидания конца ответа, документы для генератора грузятся заранее
+    ROUTER_STREAMING = os.getenv("ROUTER_STREAMING", "false").lower() == "true"
+    # Запускать генерацию до конца ответа роутера (отменяется, если решение изменилось)
+    ROUTER_SPECULATIVE_GENERATION = os.getenv("ROUTER_SPECULATIVE_GENERATION", "true").lower() == "true"
+
+    # Чистые приветствия/благодарности/прощания/извинения/«ок» решаются локально, без Gemini
+    SOCIAL_FAST_PATH = os.getenv("SOCIAL_FAST_PATH", "true").lower() == "true"
+    SOCIAL_FAST_PATH_MIN_CONFIDENCE = float(os.getenv("SOCIAL_FAST_PATH_MIN_CONFIDENCE", "0.8"))
+
+    # Кеш решений роутера: нормализованное сообщение + окно истории + версия саммари
+    ROUTE_CACHE_ENABLED = os.getenv("ROUTE_CACHE_ENABLED", "true").lower() == "true"
+    ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "2048"))
+    ROUTE_CACHE_TTL = float(os.getenv("ROUTE_CACHE_TTL", "3600"))
+    # Сколько последних сообщений истории входит в ключ (Gemini видит до 10)
+    ROUTE_CACHE_HISTORY_WINDOW = int(os.getenv("ROUTE_CACHE_HISTORY_WINDOW", "4"))
+    # Кеш ответов генератора: вопросы + документы с хешами содержимого + сигнал + CTA + язык.
+    # Ответ старше ANSWER_CACHE_TTL ещё ANSWER_CACHE_STALE_SECONDS отдаётся сразу и обновляется в фоне
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+    ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "900"))
+    ANSWER_CACHE_STALE_SECONDS = float(os.getenv("ANSWER_CACHE_STALE_SECONDS", "3600"))
+    # Ответы с памятью диалога или историей длиннее этого числа сообщений не кешируются
+    ANSWER_CACHE_MAX_HISTORY = int(os.getenv("ANSWER_CACHE_MAX_HISTORY", "2"))
+    # Как часто проверять mtime summaries.json для пересборки статичного промпта роутера, сек
+    PROMPT_RELOAD_CHECK_SECONDS = float(os.getenv("PROMPT_RELOAD_CHECK_SECONDS", "5"))
+    # Документы генератора держатся в памяти; как часто сверять их mtime с диском, сек (0 — не сверять)
+    DOCUMENT_STORE_REVALIDATE_SECONDS = float(os.getenv("DOCUMENT_STORE_REVALIDATE_SECONDS", "30"))
+    # Генератор получает не полные документы, а разделы, относящиеся к вопросам, в пределах бюджета
+    # токенов; документы из PASSAGE_WHOLE_DOCUMENTS и разделы с таблицами идут целиком всегда.
+    # Выключено, пока нет оценки качества ответов на фрагментах (как ROUTER_PRESELECT)
+    PASSAGE_RETRIEVAL = os.getenv("PASSAGE_RETRIEVAL", "false").lower() == "true"
+    PASSAGE_TOKEN_BUDGET = int(os.getenv("PASSAGE_TOKEN_BUDGET", "3000"))
+    PASSAGE_HEADING_LEVEL = int(os.getenv("PASSAGE_HEADING_LEVEL", "2"))
+    PASSAGE_WHOLE_DOCUMENTS = [
+        name.strip()
+        for name in os.getenv("PASSAGE_WHOLE_DOCUMENTS", "pricing.md,course_comparison.md").split(",")
+        if name.strip()
+    ]
+
+    # BM25-предотбор документов: в промпт роутера идут саммари только top-k кандидатов,
+    # при низкой уверенности — полный раздел (оценка: scripts/eval_summary_selector.py)
+    ROUTER_PRESELECT = os.getenv("ROUTER_PRESELECT", "false").lower() == "true"
+    ROUTER_PRESELECT_TOP_K = int(os.getenv("ROUTER_PRESELECT_TOP_K", "6"))
+    ROUTER_PRESELECT_MIN_SCORE = float(os.getenv("ROUTER_PRESELECT_MIN_SCORE", "2.0"))
+    ROUTER_PRESELECT_MIN_COVERAGE = float(os.getenv("ROUTER_PRESELECT_MIN_COVERAGE", "0.75"))
     
     # Управление детерминированностью (для тестирования vs production)
     # Установите в "false" для production, чтобы юмор работал с истинной случайностью
@@ -32,6 +138,11 @@ class Config:
     
     # Настройки истории диалогов
     HISTORY_LIMIT = 10  # Количество последних сообщений для хранения и использования
+    # Сжатая память диалога: дословно в промпты идут последние MEMORY_RECENT_MESSAGES сообщений,
+    # более ранние — кратким содержанием (не больше MEMORY_SUMMARY_MAX_LINES строк) и фактами
+    CONVERSATION_MEMORY = os.getenv("CONVERSATION_MEMORY", "true").lower() == "true"
+    MEMORY_RECENT_MESSAGES = int(os.getenv("MEMORY_RECENT_MESSAGES", "4"))
+    MEMORY_SUMMARY_MAX_LINES = int(os.getenv("MEMORY_SUMMARY_MAX_LINES", "12"))
     PERSISTENCE_BASE_PATH = os.getenv("PERSISTENCE_BASE_PATH", "data/persistent_states")
 
     # Настройки публичной поверхности API
@@ -50,7 +161,13 @@ class Config:
     ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
     
     # Уровень логирования
-    LOG_LEVEL = "INFO"  # INFO для основных событий, DEBUG для детальной отладки
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # INFO для основных событий, DEBUG для детальной отладки
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json — структурированные строки, text — для локальной отладки
+    # Доля записываемых событий для шумных мест (остальные события пишутся всегда)
+    LOG_SAMPLING = {
+        "llm.request": float(os.getenv("LOG_SAMPLE_LLM_REQUEST", "0.1")),
+        "llm.response": float(os.getenv("LOG_SAMPLE_LLM_RESPONSE", "0.1")),
+    }
     
     # Настройки юмора Жванецкого
     ZHVANETSKY_ENABLED = True  # Включить/выключить функцию юмора
@@ -0,0 +1,125 @@
+"""
+conversation_memory.py - Сжатая память диалога для промптов роутера и генератора
+
+Раньше в промпты шла сырая история до HISTORY_LIMIT сообщений вместе с полными
+ответами ассистента — к десятой реплике промпт вырастал в разы. Теперь дословно
+идут только последние MEMORY_RECENT_MESSAGES сообщений, а более ранние сворачиваются
+в короткое содержание (строка на реплику) и извлечённые факты: возраст ребёнка,
+выбранный курс, вопросы о цене, формат, особенности ребёнка.
+
+Память обновляется правилами, без LLM, после ответа пользователю (вне горячего пути)
+и хранится в HistoryManager и в снимках PersistenceManager.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+FACT_LABELS = {
+    "child_age": "Возраст ребёнка",
+    "children": "Детей",
+    "course": "Интересующий курс",
+    "price_concern": "Цена",
+    "format": "Формат",
+    "child_traits": "Особенности ребёнка",
+}
+
+_AGE_RE = re.compile(r"\b(\d{1,2})\s*(?:-?\s*(?:ти|и|ми)?\s*)?(?:лет|год|года|рок|роки|років|рочк|-?летн|-?річн|years?)", re.IGNORECASE)
+_COURSE_PATTERNS = {
+    "Юный Оратор": re.compile(r"оратор|орат[оі]р|speaker", re.IGNORECASE),
+    "Эмоциональный Компас": re.compile(r"компас|compass", re.IGNORECASE),
+    "Капитан Проектов": re.compile(r"капитан|капітан|captain", re.IGNORECASE),
+}
+_CHILDREN_RE = re.compile(r"двое|двоих|двух\s+дет|тро[её]|близнец|двійн|двоє|двох\s+діт|twins", re.IGNORECASE)
+_PRICE_RE = re.compile(r"дорог|скидк|рассрочк|знижк|розстроч|дешевл|expensive|discount|installment", re.IGNORECASE)
+_FORMAT_RE = re.compile(r"\b(онлайн|офлайн|online|offline|в\s+зуме|zoom)\b", re.IGNORECASE)
+_TRAITS_RE = re.compile(
+    r"стеснител\w*|застенчив\w*|интроверт\w*|гиперактив\w*|сдвг|адхд|adhd|тревожн\w*|"
+    r"замкнут\w*|сором.язлив\w*|агресси\w*|неуверен\w*",
+    re.IGNORECASE,
+)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+# Эти факты накапливаются (двое детей, несколько курсов), остальные заменяются последним значением
+_ACCUMULATED_FACTS = ("child_age", "course", "child_traits")
+
+
+def _shorten(text: str, limit: int) -> str:
+    """Первое предложение (или начало текста) не длиннее limit символов"""
+    text = " ".join(text.split())
+    first = _SENTENCE_END_RE.split(text, maxsplit=1)[0]
+    if len(first) <= limit:
+        return first
+    return first[: limit - 1].rstrip() + "…"
+
+
+def extract_facts(text: str) -> Dict[str, str]:
+    """Факты из реплики пользователя (только то, что явно сказано)"""
+    facts: Dict[str, str] = {}
+    ages = [int(age) for age in _AGE_RE.findall(text) if 3 <= int(age) <= 18]
+    if ages:
+        facts["child_age"] = ", ".join(str(age) for age in dict.fromkeys(ages))
+    courses = [name for name, pattern in _COURSE_PATTERNS.items() if pattern.search(text)]
+    if courses:
+        facts["course"] = ", ".join(courses)
+    if _CHILDREN_RE.search(text) or len(set(ages)) > 1:
+        facts["children"] = "несколько"
+    if _PRICE_RE.search(text):
+        facts["price_concern"] = "спрашивали о скидках/стоимости"
+    formats = _FORMAT_RE.findall(text)
+    if formats:
+        facts["format"] = formats[-1].lower()
+    traits = [trait.lower() for trait in _TRAITS_RE.findall(text)]
+    if traits:
+        facts["child_traits"] = ", ".join(dict.fromkeys(traits))
+    return facts
+
+
+@dataclass
+class ConversationMemory:
+    """Содержание ранних реплик и факты о пользователе"""
+    summary: List[str] = field(default_factory=list)  # Строка на свёрнутую реплику, старые вытесняются
+    facts: Dict[str, str] = field(default_factory=dict)
+    folded: int = 0  # Сколько сообщений диалога (с начала) уже свёрнуто
+    seen: int = 0  # Сколько сообщений было в диалоге при последнем обновлении
+
+    def fold(self, messages: List[Dict[str, Any]], max_lines: int, user_chars: int = 160, assistant_chars: int = 100) -> None:
+        """Сворачивает сообщения в содержание и факты"""
+        for message in messages:
+            content = str(message.get("content", ""))
+            if not content.strip():
+                continue
+            if message.get("role") == "user":
+                self.summary.append(f"Родитель: {_shorten(content, user_chars)}")
+                for key, value in extract_facts(content).items():
+                    if key in _ACCUMULATED_FACTS and key in self.facts:
+                        known = self.facts[key].split(", ")
+                        value = ", ".join(known + [item for item in value.split(", ") if item not in known])
+                    self.facts[key] = value
+            else:
+                self.summary.append(f"Мы ответили: {_shorten(content, assistant_chars)}")
+        if len(self.summary) > max_lines:
+            self.summary = self.summary[-max_lines:]
+
+    def render(self) -> str:
+        """Текст для промпта; пустая строка — сворачивать пока нечего"""
+        lines: List[str] = []
+        if self.facts:
+            lines.append("Известно: " + "; ".join(f"{FACT_LABELS.get(key, key)}: {value}" for key, value in self.facts.items()))
+        if self.summary:
+            lines.append("Ранее в диалоге:")
+            lines.extend(f"- {line}" for line in self.summary)
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"summary": list(self.summary), "facts": dict(self.facts), "folded": self.folded, "seen": self.seen}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "ConversationMemory":
+        data = data or {}
+        return cls(
+            summary=[str(line) for line in data.get("summary", [])],
+            facts={str(key): str(value) for key, value in (data.get("facts") or {}).items()},
+            folded=int(data.get("folded", 0)),
+            seen=int(data.get("seen", 0)),
+        )
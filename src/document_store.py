@@ -0,0 +1,230 @@
+"""
+document_store.py - Документы базы знаний в памяти процесса
+
+ResponseGenerator раньше читал каждый документ с диска (open().read()) на каждом
+успешном запросе прямо в event loop. Теперь корпус (*.md из data/documents_compressed)
+загружается один раз — при старте сервера или при первом обращении — и отдаётся
+готовыми неизменяемыми строками. Фоновая задача раз в DOCUMENT_STORE_REVALIDATE_SECONDS
+сверяет mtime и размер файлов и перечитывает только изменённые (в отдельном потоке);
+если содержимое не поменялось (тот же sha256), документ не заменяется.
+
+Для каждого документа хранятся размер, оценка токенов и счётчик обращений —
+это видно в /metrics.
+"""
+
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from event_log import get_logger
+from prompt_segments import estimate_tokens
+
+log = get_logger(__name__)
+
+DEFAULT_DOCS_DIR = Path(__file__).parent.parent / "data" / "documents_compressed"
+
+
+@dataclass(frozen=True)
+class StoredDocument:
+    """Загруженный документ и его метаданные"""
+    name: str
+    text: str
+    size_bytes: int
+    estimated_tokens: int
+    sha256: str
+    mtime: float
+    loaded_at: float
+
+
+def _read_document(path: Path) -> StoredDocument:
+    raw = path.read_bytes()
+    stat = path.stat()
+    text = raw.decode("utf-8")
+    return StoredDocument(
+        name=path.name,
+        text=text,
+        size_bytes=len(raw),
+        estimated_tokens=estimate_tokens(text),
+        sha256=hashlib.sha256(raw).hexdigest(),
+        mtime=stat.st_mtime,
+        loaded_at=time.time(),
+    )
+
+
+class DocumentStore:
+    """Корпус документов в памяти с фоновой сверкой по mtime"""
+
+    def __init__(self, docs_dir: Optional[Path] = None, pattern: str = "*.md"):
+        """
+        Args:
+            docs_dir: Папка с документами
+            pattern: Какие файлы входят в корпус
+        """
+        self.docs_dir = Path(docs_dir) if docs_dir else DEFAULT_DOCS_DIR
+        self.pattern = pattern
+        self._documents: Dict[str, StoredDocument] = {}
+        self._file_state: Dict[str, Tuple[float, int]] = {}  # имя -> (mtime, размер) на момент чтения
+        self._hits: Dict[str, int] = {}
+        self._loaded = False
+        self.stats = {
+            "hits": 0,          # документов отдано из памяти
+            "misses": 0,        # запрошенных документов нет в корпусе
+            "loads": 0,         # полных загрузок корпуса
+            "revalidations": 0,
+            "reloaded": 0,      # перечитано из-за изменения файла
+            "unchanged": 0,     # mtime изменился, содержимое нет
+            "removed": 0,
+            "errors": 0,
+        }
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load_all(self) -> int:
+        """
+        Загружает весь корпус (блокирующее чтение — вызывать вне event loop)
+
+        Returns:
+            Число документов
+        """
+        documents: Dict[str, StoredDocument] = {}
+        file_state: Dict[str, Tuple[float, int]] = {}
+        for path in sorted(self.docs_dir.glob(self.pattern)):
+            try:
+                document = _read_document(path)
+            except (OSError, UnicodeDecodeError) as e:
+                self.stats["errors"] += 1
+                log.warning("document_store.load_all", "⚠️ Ошибка чтения %s: %s", path.name, e)
+                continue
+            documents[document.name] = document
+            file_state[document.name] = (document.mtime, document.size_bytes)
+        self._documents = documents
+        self._file_state = file_state
+        self._loaded = True
+        self.stats["loads"] += 1
+        log.info("document_store.load_all", "📚 Загружено документов: %s (%s байт, ~%s токенов)",
+                 len(documents), sum(d.size_bytes for d in documents.values()),
+                 sum(d.estimated_tokens for d in documents.values()))
+        return len(documents)
+
+    async def ensure_loaded(self) -> None:
+        """Ленивая загрузка при первом обращении (чтение в отдельном потоке; повторная загрузка безвредна)"""
+        if not self._loaded:
+            await asyncio.to_thread(self.load_all)
+
+    def get(self, name: str) -> Optional[str]:
+        """
+        Текст документа из памяти (диск не читается)
+
+        Args:
+            name: Имя файла, например "pricing.md"
+        Returns:
+            Текст или None, если такого документа нет
+        """
+        document = self._documents.get(name)
+        if document is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self._hits[name] = self._hits.get(name, 0) + 1
+        return document.text
+
+    def get_many(self, names: Iterable[str]) -> Dict[str, str]:
+        """Тексты найденных документов в порядке запроса (без повторов)"""
+        texts: Dict[str, str] = {}
+        for name in dict.fromkeys(names):
+            text = self.get(name)
+            if text:
+                texts[name] = text
+        return texts
+
+    def document(self, name: str) -> Optional[StoredDocument]:
+        """Документ с метаданными (без учёта в счётчиках)"""
+        return self._documents.get(name)
+
+    def revalidate(self) -> int:
+        """
+        Сверяет файлы с загруженными версиями (блокирующее — вызывать вне event loop)
+
+        Returns:
+            Сколько документов добавлено, заменено или удалено
+        """
+        if not self._loaded:
+            self.load_all()
+            return len(self._documents)
+        self.stats["revalidations"] += 1
+        changes = 0
+        documents = dict(self._documents)
+        file_state = dict(self._file_state)
+        seen = set()
+        for path in self.docs_dir.glob(self.pattern):
+            seen.add(path.name)
+            try:
+                stat = path.stat()
+                if file_state.get(path.name) == (stat.st_mtime, stat.st_size):
+                    continue
+                document = _read_document(path)
+            except (OSError, UnicodeDecodeError) as e:
+                self.stats["errors"] += 1
+                log.warning("document_store.revalidate", "⚠️ Ошибка чтения %s: %s", path.name, e)
+                continue
+            file_state[path.name] = (document.mtime, document.size_bytes)
+            previous = documents.get(path.name)
+            if previous is not None and previous.sha256 == document.sha256:
+                self.stats["unchanged"] += 1
+                continue
+            documents[path.name] = document
+            self.stats["reloaded"] += 1
+            changes += 1
+            log.info("document_store.revalidate", "🔄 Документ обновлён: %s (%s байт)", path.name, document.size_bytes)
+        for name in set(documents) - seen:
+            del documents[name]
+            file_state.pop(name, None)
+            self.stats["removed"] += 1
+            changes += 1
+            log.info("document_store.revalidate", "🗑️ Документ удалён: %s", name)
+        # Словари заменяются целиком: читатели в event loop видят либо старую, либо новую версию
+        self._documents = documents
+        self._file_state = file_state
+        return changes
+
+    async def run_revalidation(self, interval: float) -> None:
+        """Фоновая сверка корпуса с диском, пока задачу не отменят"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.revalidate)
+            except Exception as e:
+                self.stats["errors"] += 1
+                log.warning("document_store.run_revalidation", "⚠️ Сверка документов не удалась: %s", e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        stats = dict(self.stats)
+        stats["documents"] = len(self._documents)
+        stats["total_bytes"] = sum(d.size_bytes for d in self._documents.values())
+        stats["total_estimated_tokens"] = sum(d.estimated_tokens for d in self._documents.values())
+        stats["per_document"] = {
+            name: {
+                "bytes": document.size_bytes,
+                "estimated_tokens": document.estimated_tokens,
+                "hits": self._hits.get(name, 0),
+            }
+            for name, document in sorted(self._documents.items())
+        }
+        return stats
+
+
+_document_store: Optional[DocumentStore] = None
+
+
+def get_document_store() -> DocumentStore:
+    """Общий корпус процесса (data/documents_compressed)"""
+    global _document_store
+    if _document_store is None:
+        _document_store = DocumentStore(DEFAULT_DOCS_DIR)
+    return _document_store
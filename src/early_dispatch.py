@@ -0,0 +1,115 @@
+"""
+early_dispatch.py - Ранний запуск следующей стадии по частичному решению роутера
+
+Потоковый роутер (Router.route_streaming) сообщает поля решения по мере разбора.
+Как только известны status=success и documents, документы грузятся в фоне;
+когда пришли ещё decomposed_questions и user_signal, генерация ответа запускается
+спекулятивно. Итоговое решение сравнивается с тем, по которому стартовала генерация:
+совпало — берём готовую задачу, нет — отменяем и генерируем заново.
+"""
+
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import Config
+
+# Аргументы ResponseGenerator.generate: (router_result, history, current_message)
+GeneratorPayload = Tuple[Dict[str, Any], List[Dict[str, str]], str]
+
+_stats = {
+    "doc_prefetches": 0,
+    "doc_prefetch_hits": 0,
+    "speculative_generations": 0,
+    "speculation_hits": 0,
+    "speculation_cancelled": 0,
+}
+
+
+class EarlyDispatch:
+    """Фоновые задачи одного запроса, запущенные до конца ответа роутера"""
+
+    def __init__(self, generator, build_payload: Callable[[Dict[str, Any]], Optional[GeneratorPayload]]):
+        """
+        Args:
+            generator: ResponseGenerator
+            build_payload: Строит аргументы генерации из частичного решения (None — не запускать)
+        """
+        self.generator = generator
+        self.build_payload = build_payload
+        self.documents: Optional[List[str]] = None
+        self.payload: Optional[GeneratorPayload] = None
+        self._doc_task: Optional[asyncio.Task] = None
+        self._generation: Optional[asyncio.Task] = None
+
+    def on_partial(self, fields: Dict[str, Any]) -> None:
+        """Колбэк для Router.route_streaming"""
+        if fields.get("status") != "success":
+            return
+        documents = fields.get("documents")
+        if self._doc_task is None and isinstance(documents, list) and documents:
+            self.documents = list(documents)
+            self._doc_task = asyncio.ensure_future(self.generator.prefetch_documents(self.documents))
+            _stats["doc_prefetches"] += 1
+
+        if (
+            Config.ROUTER_SPECULATIVE_GENERATION
+            and self._generation is None
+            and self._doc_task is not None
+            and "decomposed_questions" in fields
+            and "user_signal" in fields
+        ):
+            payload = self.build_payload(fields)
+            if payload is None:
+                return
+            self.payload = payload
+            self._generation = asyncio.ensure_future(self._generate(payload))
+            _stats["speculative_generations"] += 1
+
+    async def _generate(self, payload: GeneratorPayload) -> Tuple[str, dict]:
+        router_result, history, current_message = payload
+        doc_texts = await self.documents_for(router_result["documents"], count_hit=False)
+        return await self.generator.generate(router_result, history, current_message, doc_texts=doc_texts)
+
+    async def documents_for(self, documents: List[str], count_hit: bool = True) -> Optional[Dict[str, str]]:
+        """Заранее загруженные документы, если итоговый список тот же"""
+        if self._doc_task is None or list(documents) != self.documents:
+            return None
+        try:
+            doc_texts = await self._doc_task
+        except Exception:
+            return None
+        if count_hit:
+            _stats["doc_prefetch_hits"] += 1
+        return doc_texts
+
+    async def take_generation(self, payload: GeneratorPayload) -> Optional[Tuple[str, dict]]:
+        """
+        Результат спекулятивной генерации, если она шла с теми же аргументами
+
+        Returns:
+            (текст, metadata) как у generate() или None — генерировать заново
+        """
+        if self._generation is None:
+            return None
+        if payload != self.payload:
+            self.cancel()
+            return None
+        _stats["speculation_hits"] += 1
+        return await self._generation
+
+    def cancel(self) -> None:
+        """Отменяет спекулятивную генерацию (решение роутера изменилось)"""
+        task = self._generation
+        if task is None:
+            return
+        self._generation = None
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()  # Ошибка отменённой спекуляции не нужна — забираем, чтобы не было предупреждения
+        _stats["speculation_cancelled"] += 1
+
+
+def get_stats() -> Dict[str, Any]:
+    """Статистика для /metrics"""
+    return dict(_stats)
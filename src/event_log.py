@@ -0,0 +1,169 @@
+"""
+event_log.py - Неблокирующее структурированное логирование
+
+Запись в stdout выполняет фоновый поток (QueueHandler → QueueListener), поэтому
+вызов лога в event loop стоит только постановку записи в очередь.
+Уровень проверяется до форматирования: аргументы подставляются в сообщение уже
+в фоновом потоке, а отключённые DEBUG-события не создают даже LogRecord.
+Для шумных событий задаётся доля сэмплирования (Config.LOG_SAMPLING).
+
+Использование:
+    log = get_logger(__name__)
+    log.info("router.result", "✅ Статус: %s", status, documents=docs)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from config import Config
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Стандартный prepare() форматирует сообщение до постановки в очередь —
+        # нам нужно, чтобы это делал фоновый поток
+        return record
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Пишет в текущий sys.stdout (его могут подменить после настройки, например pytest)"""
+
+    def __init__(self, stream=None):
+        super().__init__(stream)
+        self._fixed_stream = stream  # StreamHandler подставил бы sys.stderr вместо None
+
+    @property
+    def stream(self):
+        return self._fixed_stream or sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        self._fixed_stream = value
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна JSON-строка"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": getattr(record, "event", record.name),
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Человекочитаемый формат для локальной разработки"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = record.getMessage()
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None, stream=None) -> None:
+    """
+    Подключает очередь и фоновый поток записи к корневому логгеру (идемпотентно)
+
+    Args:
+        level: Уровень (по умолчанию Config.LOG_LEVEL)
+        fmt: "json" или "text" (по умолчанию Config.LOG_FORMAT)
+        stream: Куда писать (по умолчанию stdout)
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, (level or Config.LOG_LEVEL).upper(), logging.INFO))
+    if _listener is not None:
+        return
+
+    sink = _StdoutHandler(stream)
+    sink.setFormatter(TextFormatter() if (fmt or Config.LOG_FORMAT) == "text" else JsonFormatter())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, sink, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Дописывает очередь и останавливает фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class EventLogger:
+    """Логгер событий: имя события, сообщение с отложенным форматированием, поля"""
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(name)
+
+    def enabled_for(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level: int, event: str, msg: str, args: tuple, fields: Dict[str, Any]) -> None:
+        if not self._logger.isEnabledFor(level):
+            return
+        rate = Config.LOG_SAMPLING.get(event)
+        if rate is not None and random.random() >= rate:
+            return
+        exc_info = fields.pop("exc_info", None)
+        if exc_info is True:
+            exc_info = sys.exc_info()
+        # Запись собирается напрямую: без поиска вызывающего кадра (findCaller), он
+        # не попадает в наши форматы, а на горячем пути это самая дорогая часть вызова
+        record = self._logger.makeRecord(
+            self._logger.name, level, "", 0, msg or event, args, exc_info,
+            extra={"event": event, "fields": fields},
+        )
+        self._logger.handle(record)
+
+    def debug(self, event: str, msg: str = "", *args: Any, **fields: Any) -> None:
+        self._log(logging.DEBUG, event, msg, args, fields)
+
+    def info(self, event: str, msg: str = "", *args: Any, **fields: Any) -> None:
+        self._log(logging.INFO, event, msg, args, fields)
+
+    def warning(self, event: str, msg: str = "", *args: Any, **fields: Any) -> None:
+        self._log(logging.WARNING, event, msg, args, fields)
+
+    def error(self, event: str, msg: str = "", *args: Any, **fields: Any) -> None:
+        self._log(logging.ERROR, event, msg, args, fields)
+
+    def exception(self, event: str, msg: str = "", *args: Any, **fields: Any) -> None:
+        fields.setdefault("exc_info", True)
+        self._log(logging.ERROR, event, msg, args, fields)
+
+
+def get_logger(name: str) -> EventLogger:
+    """Логгер модуля: get_logger(__name__)"""
+    return EventLogger(name)
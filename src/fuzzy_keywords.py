@@ -0,0 +1,124 @@
+"""
+fuzzy_keywords.py - Индекс ключевых слов с поиском по опечаткам (SymSpell-style)
+
+has_business_signals раньше сравнивал каждое слово сообщения с каждым словом
+CRITICAL_BUSINESS_KEYWORDS через difflib.SequenceMatcher. Индекс заранее хранит
+варианты ключевых слов с удалёнными буквами, поэтому для слова сообщения
+SequenceMatcher запускается только на кандидатах с общим вариантом удаления —
+обычно это ноль или одно-два слова.
+
+Решения совпадают с fuzzy_match_word: те же защиты по длине (±max_length_diff) и
+первой букве, тот же порог ratio(). Число удалений выводится из порога: при
+ratio >= threshold общая подпоследовательность не короче минимального числа
+совпадений, значит слово и ключ сводятся к ней не более чем за столько удалений
+каждый — индекс не пропускает ни одного совпадения, а окончательное решение
+принимает сам SequenceMatcher.
+"""
+
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+def _min_matches(total: int, threshold: float) -> int:
+    """Минимальное число совпавших символов, при котором ratio() >= threshold"""
+    matches = 0
+    while 2.0 * matches / total < threshold:  # формула SequenceMatcher.ratio()
+        matches += 1
+    return matches
+
+
+def _deletes(word: str, max_deletes: int) -> Set[str]:
+    """Слово и все его варианты с удалением до max_deletes букв"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_deletes):
+        frontier = {item[:i] + item[i + 1:] for item in frontier for i in range(len(item))}
+        variants |= frontier
+    return variants
+
+
+class FuzzyKeywordIndex:
+    """Поиск ключевого слова, похожего на слово сообщения (с точностью до опечатки)"""
+
+    def __init__(self, keywords: Iterable[str], threshold: float = 0.8, max_length_diff: int = 1, min_length: int = 3,
+                 memo_size: int = 4096):
+        self.keywords: List[str] = list(dict.fromkeys(keyword.lower() for keyword in keywords))
+        self.threshold = threshold
+        self.max_length_diff = max_length_diff
+        self.min_length = min_length
+        self._exact: Set[str] = set(self.keywords)
+        self._order = {keyword: position for position, keyword in enumerate(self.keywords)}
+        self._lengths = {len(keyword) for keyword in self.keywords if len(keyword) >= min_length}
+        self._word_budget: Dict[int, int] = {}
+        # (первая буква, длина слова), при которых вообще возможно совпадение — как защиты fuzzy_match_word
+        self._guards: Set[Tuple[str, int]] = {
+            (keyword[0], length)
+            for keyword in self.keywords if len(keyword) >= min_length
+            for length in self._nearby(len(keyword))
+        }
+        self._memo: Dict[str, Optional[str]] = {}  # Слова сообщений повторяются — результат запоминается
+        self.memo_size = memo_size
+        self._variants: Dict[str, List[str]] = defaultdict(list)
+        for keyword in self.keywords:
+            if len(keyword) < min_length:
+                continue  # Короткие ключи — только точное совпадение
+            budget = self._budget(len(keyword), self._nearby(len(keyword)))
+            for variant in _deletes(keyword, budget):
+                self._variants[variant].append(keyword)
+
+    def _nearby(self, length: int) -> List[int]:
+        return [
+            other for other in range(length - self.max_length_diff, length + self.max_length_diff + 1)
+            if other >= self.min_length
+        ]
+
+    def _budget(self, length: int, other_lengths: Iterable[int]) -> int:
+        """Сколько букв можно удалить из слова длины length, чтобы не потерять совпадение"""
+        budget = -1
+        for other in other_lengths:
+            needed = _min_matches(length + other, self.threshold)
+            if needed <= min(length, other):
+                budget = max(budget, length - needed)
+        return budget
+
+    def match(self, word: str) -> Optional[str]:
+        """
+        Первое (в порядке списка) ключевое слово, похожее на word
+
+        Args:
+            word: Слово сообщения (без пунктуации)
+        Returns:
+            Ключевое слово или None
+        """
+        word = word.lower()
+        if word in self._exact:
+            return word
+        length = len(word)
+        if length < self.min_length or (word[0], length) not in self._guards:
+            return None
+        if word in self._memo:
+            return self._memo[word]
+        if len(self._memo) >= self.memo_size:
+            self._memo.clear()
+        self._memo[word] = found = self._search(word, length)
+        return found
+
+    def _search(self, word: str, length: int) -> Optional[str]:
+        """Кандидаты с общим вариантом удаления, затем проверка SequenceMatcher"""
+        budget = self._word_budget.get(length)
+        if budget is None:
+            nearby = [other for other in self._nearby(length) if other in self._lengths]
+            budget = self._word_budget[length] = self._budget(length, nearby)
+        if budget < 0:
+            return None  # Нет ключей подходящей длины
+
+        candidates: Set[str] = set()
+        for variant in _deletes(word, budget):
+            candidates.update(self._variants.get(variant, ()))
+        for keyword in sorted(candidates, key=self._order.__getitem__):
+            if abs(len(keyword) - length) > self.max_length_diff or keyword[0] != word[0]:
+                continue
+            if SequenceMatcher(None, word, keyword).ratio() >= self.threshold:
+                return keyword
+        return None
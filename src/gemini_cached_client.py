@@ -7,14 +7,17 @@ import hashlib
 import json
 from typing import List, Dict, Optional, Any
 from openrouter_client import OpenRouterClient
+from event_log import get_logger
+
+log = get_logger(__name__)
 
 
 class GeminiCachedClient(OpenRouterClient):
     """Расширенный клиент с поддержкой кеширования контекста для Gemini"""
     
-    def __init__(self, api_key: str, seed: int = None, max_tokens: int = None, temperature: float = 0.3, model: str = "google/gemini-2.5-flash"):
+    def __init__(self, api_key: str, seed: int = None, max_tokens: int = None, temperature: float = 0.3, model: str = "google/gemini-2.5-flash", http_pool=None, stage: str = "router"):
         """Инициализация с настройками для Gemini"""
-        super().__init__(api_key, seed, max_tokens, temperature, model=model)
+        super().__init__(api_key, seed, max_tokens, temperature, model=model, http_pool=http_pool, stage=stage)
         self.cached_context = None
         self.context_hash = None
         
@@ -45,7 +48,7 @@ class GeminiCachedClient(OpenRouterClient):
         # Добавляем системный промпт с пометкой для кеширования
         if self.context_hash != new_hash:
             # Контекст изменился, обновляем кеш
-            print("🔄 Обновляю кешированный контекст Gemini")
+            log.info("gemini_cache.chat_with_cache", "🔄 Обновляю кешированный контекст Gemini")
             self.context_hash = new_hash
             self.cached_context = system_content
             
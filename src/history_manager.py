@@ -3,9 +3,13 @@ history_manager.py - Хранение истории диалогов
 MVP версия: с LRU Cache для предотвращения memory leak
 """
 
-from typing import List, Dict
+from typing import List, Dict, Optional
 from collections import OrderedDict
 from config import Config
+from conversation_memory import ConversationMemory
+from event_log import get_logger
+
+log = get_logger(__name__)
 
 class HistoryManager:
     """Менеджер истории диалогов с ограничением количества пользователей"""
@@ -18,6 +22,11 @@ class HistoryManager:
         self.max_messages = config.HISTORY_LIMIT  # Используем настройку из конфига
         # Максимальное количество пользователей в памяти
         self.max_users = 1000  # Достаточно для MVP, ~10MB памяти
+        # Сжатая память диалога: всё старше последних MEMORY_RECENT_MESSAGES сообщений
+        self.memories: Dict[str, ConversationMemory] = {}
+        self.message_totals: Dict[str, int] = {}  # Сколько сообщений было в диалоге всего (история обрезается)
+        self.recent_messages = Config.MEMORY_RECENT_MESSAGES
+        self.memory_stats = {"updates": 0, "folded_messages": 0}
     
     def add_message(self, user_id: str, role: str, content: str, metadata: dict = None):
         """Добавляет сообщение в историю с LRU механизмом и опциональными метаданными"""
@@ -31,7 +40,9 @@ class HistoryManager:
                 # Удаляем самого старого неактивного пользователя
                 oldest_user = next(iter(self.storage))
                 del self.storage[oldest_user]
-                print(f"⚠️ LRU: Удалена история пользователя {oldest_user[:8]}... (неактивен)")
+                self.memories.pop(oldest_user, None)
+                self.message_totals.pop(oldest_user, None)
+                log.warning("history.add_message", "⚠️ LRU: Удалена история пользователя %s... (неактивен)", oldest_user[:8])
             
             # Создаём список для нового пользователя
             self.storage[user_id] = []
@@ -45,6 +56,7 @@ class HistoryManager:
             message["metadata"] = metadata
         
         self.storage[user_id].append(message)
+        self.message_totals[user_id] = self.message_totals.get(user_id, 0) + 1
         
         # Обрезаем если больше лимита сообщений (HISTORY_LIMIT из конфига)
         if len(self.storage[user_id]) > self.max_messages:
@@ -68,6 +80,54 @@ class HistoryManager:
     
     def clear_user_history(self, user_id: str):
         """Очищает историю конкретного пользователя"""
+        self.memories.pop(user_id, None)
+        self.message_totals.pop(user_id, None)
         if user_id in self.storage:
             del self.storage[user_id]
-            print(f"🧹 История пользователя {user_id} очищена")
\ No newline at end of file
+            log.info("history.clear_user_history", "🧹 История пользователя %s очищена", user_id)
+
+    def update_memory(self, user_id: str) -> Optional[ConversationMemory]:
+        """
+        Сворачивает в память сообщения, которые вышли из окна последних реплик
+
+        Вызывается после ответа пользователю (вне горячего пути). Сообщения, обрезанные
+        историей до свёртки, теряются — поэтому окно памяти меньше HISTORY_LIMIT.
+        """
+        messages = self.storage.get(user_id)
+        if not Config.CONVERSATION_MEMORY or not messages:
+            return None
+        total = self.message_totals.get(user_id, len(messages))
+        memory = self.memories.setdefault(user_id, ConversationMemory())
+        fold_until = total - self.recent_messages
+        if fold_until > memory.folded:
+            first_kept = total - len(messages)  # Номер первого хранимого сообщения в диалоге
+            start = max(memory.folded, first_kept)
+            memory.fold(messages[start - first_kept:fold_until - first_kept], Config.MEMORY_SUMMARY_MAX_LINES)
+            self.memory_stats["folded_messages"] += max(fold_until - start, 0)
+            memory.folded = fold_until
+        memory.seen = total
+        self.memory_stats["updates"] += 1
+        return memory
+
+    def get_memory_prompt(self, user_id: str) -> Optional[str]:
+        """Память диалога для промптов или None, если сворачивать пока нечего"""
+        memory = self.memories.get(user_id)
+        text = memory.render() if memory is not None else ""
+        return text or None
+
+    def restore_memory(self, user_id: str, data: Optional[dict]) -> None:
+        """Восстанавливает память из снимка (после восстановления истории)"""
+        if not data:
+            return
+        memory = ConversationMemory.from_dict(data)
+        self.memories[user_id] = memory
+        self.message_totals[user_id] = max(memory.seen, len(self.storage.get(user_id, [])))
+
+    def get_memory_stats(self) -> dict:
+        """Статистика для /metrics"""
+        return {
+            **self.memory_stats,
+            "enabled": Config.CONVERSATION_MEMORY,
+            "users": len(self.memories),
+            "recent_messages": self.recent_messages,
+        }
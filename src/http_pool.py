@@ -0,0 +1,160 @@
+"""
+http_pool.py - Общий пул HTTP-соединений для исходящих запросов (OpenRouter, HubSpot)
+
+Один долгоживущий httpx.AsyncClient на каждый upstream-хост: keep-alive,
+HTTP/2 (если установлен пакет h2) и лимиты пула из Config.
+Пул поднимается и закрывается в lifespan FastAPI.
+"""
+
+import asyncio
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import Config
+
+try:  # HTTP/2 требует пакет h2 (httpx[http2])
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HttpPool:
+    """Пул httpx-клиентов по хостам со счётчиками переиспользования"""
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        http2: Optional[bool] = None,
+        timeout: float = 30.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+        Args:
+            max_connections: Максимум соединений на хост
+            max_keepalive_connections: Максимум простаивающих keep-alive соединений
+            keepalive_expiry: Сколько секунд держать простаивающее соединение
+            http2: Включить HTTP/2 (игнорируется, если h2 не установлен)
+            timeout: Таймаут запросов по умолчанию
+            transport: Кастомный транспорт (моки и тестовые стенды)
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections or Config.HTTP_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=max_keepalive_connections or Config.HTTP_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=keepalive_expiry if keepalive_expiry is not None else Config.HTTP_POOL_KEEPALIVE_EXPIRY,
+        )
+        wanted_http2 = Config.HTTP2_ENABLED if http2 is None else http2
+        self.http2 = bool(wanted_http2 and HTTP2_AVAILABLE and transport is None)
+        self.timeout = timeout
+        self.transport = transport
+
+        # host -> (client, event loop, к которому привязаны соединения)
+        self._clients: Dict[str, Any] = {}
+
+        self.stats = {
+            "pool_hits": 0,            # запрос получил уже существующий клиент хоста
+            "pool_misses": 0,          # клиент пришлось создать (первый запрос или новый event loop)
+            "requests": 0,
+            "new_connections": 0,      # реальные TCP(+TLS) рукопожатия
+            "reused_connections": 0,   # запросы, ушедшие в уже открытое соединение
+        }
+
+    @staticmethod
+    def _host_key(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        """Возвращает клиент для хоста из url, создавая его при необходимости"""
+        key = self._host_key(url)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        entry = self._clients.get(key)
+        if entry is not None:
+            client, client_loop = entry
+            if client_loop is loop and not client.is_closed:
+                self.stats["pool_hits"] += 1
+                return client
+            # Соединения старого event loop использовать нельзя — просто отпускаем клиент
+
+        client = self._create_client()
+        self._clients[key] = (client, loop)
+        self.stats["pool_misses"] += 1
+        return client
+
+    def _create_client(self) -> httpx.AsyncClient:
+        kwargs: Dict[str, Any] = {
+            "limits": self.limits,
+            "timeout": self.timeout,
+            "event_hooks": {"request": [self._attach_trace]},
+        }
+        if self.transport is not None:
+            kwargs["transport"] = self.transport
+        else:
+            kwargs["http2"] = self.http2
+        return httpx.AsyncClient(**kwargs)
+
+    async def _attach_trace(self, request: httpx.Request) -> None:
+        """Подключает trace-колбэк httpcore для подсчёта новых соединений"""
+        self.stats["requests"] += 1
+        state = {"connected": False}
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                state["connected"] = True
+                self.stats["new_connections"] += 1
+            elif event_name.endswith("send_request_headers.started") and not state["connected"]:
+                state["connected"] = True
+                self.stats["reused_connections"] += 1
+
+        request.extensions["trace"] = trace
+
+    async def warmup(self, urls) -> None:
+        """Заранее создаёт клиенты для известных хостов (вызывается при старте)"""
+        for url in urls:
+            if url:
+                self.get_client(url)
+
+    async def aclose(self) -> None:
+        """Закрывает все клиенты текущего event loop"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        clients, self._clients = self._clients, {}
+        for client, client_loop in clients.values():
+            if client_loop is loop and not client.is_closed:
+                await client.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        stats = dict(self.stats)
+        total = stats["pool_hits"] + stats["pool_misses"]
+        stats["pool_hit_rate"] = f"{(stats['pool_hits'] / total * 100):.1f}%" if total else "0.0%"
+        stats["hosts"] = sorted(self._clients.keys())
+        stats["http2"] = self.http2
+        return stats
+
+
+_http_pool: Optional[HttpPool] = None
+
+
+def get_http_pool() -> HttpPool:
+    """Общий пул процесса"""
+    global _http_pool
+    if _http_pool is None:
+        _http_pool = HttpPool()
+    return _http_pool
+
+
+def set_http_pool(pool: Optional[HttpPool]) -> None:
+    """Подменяет общий пул (тестовые стенды, бенчмарки)"""
+    global _http_pool
+    _http_pool = pool
@@ -8,12 +8,16 @@ from typing import Dict, Optional, List
 from datetime import datetime
 import os
 from config import Config
+from http_pool import HttpPool, get_http_pool
+from event_log import get_logger
+
+log = get_logger(__name__)
 
 
 class HubSpotClient:
     """Клиент для работы с HubSpot API"""
 
-    def __init__(self):
+    def __init__(self, http_pool: Optional[HttpPool] = None):
         self.api_key = Config.HUBSPOT_PRIVATE_APP_TOKEN
         self.portal_id = Config.HUBSPOT_PORTAL_ID
         self.base_url = f"https://api.hubapi.com/crm/v3/objects"
@@ -21,14 +25,17 @@ class HubSpotClient:
         if not self.api_key:
             raise ValueError("HUBSPOT_PRIVATE_APP_TOKEN не установлен в .env файле")
 
-        # HTTP клиент с таймаутом
-        self.client = httpx.AsyncClient(
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            },
-            timeout=30.0
-        )
+        # Соединения берём из общего пула процесса, заголовки передаём в каждом запросе
+        self.http_pool = http_pool or get_http_pool()
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Выполняет запрос через пул соединений"""
+        client = self.http_pool.get_client(url)
+        return await client.request(method, url, headers=self.headers, timeout=30.0, **kwargs)
 
     async def create_or_update_contact(
         self,
@@ -112,7 +119,8 @@ class HubSpotClient:
         }
 
         try:
-            response = await self.client.post(
+            response = await self._request(
+                "POST",
                 f"{self.base_url}/contacts/search",
                 json=search_payload
             )
@@ -127,7 +135,7 @@ class HubSpotClient:
             return None
 
         except Exception as e:
-            print(f"❌ Ошибка поиска контакта в HubSpot: {e}")
+            log.error("hubspot.find_contact_by_email", "❌ Ошибка поиска контакта в HubSpot: %s", e)
             return None
 
     async def create_contact(self, properties: Dict) -> Dict:
@@ -138,21 +146,22 @@ class HubSpotClient:
         }
 
         try:
-            response = await self.client.post(
+            response = await self._request(
+                "POST",
                 f"{self.base_url}/contacts",
                 json=payload
             )
 
             if response.status_code == 201:
                 result = response.json()
-                print("✅ Контакт создан в HubSpot")
+                log.info("hubspot.create_contact", "✅ Контакт создан в HubSpot")
                 return result
             else:
-                print(f"❌ Ошибка создания контакта: {response.status_code} - {response.text}")
+                log.error("hubspot.create_contact", "❌ Ошибка создания контакта: %s - %s", response.status_code, response.text)
                 raise Exception(f"HubSpot API error: {response.status_code}")
 
         except Exception as e:
-            print(f"❌ Ошибка создания контакта в HubSpot: {e}")
+            log.error("hubspot.create_contact", "❌ Ошибка создания контакта в HubSpot: %s", e)
             raise
 
     async def update_contact(self, contact_id: str, properties: Dict) -> Dict:
@@ -163,26 +172,27 @@ class HubSpotClient:
         }
 
         try:
-            response = await self.client.patch(
+            response = await self._request(
+                "PATCH",
                 f"{self.base_url}/contacts/{contact_id}",
                 json=payload
             )
 
             if response.status_code == 200:
                 result = response.json()
-                print("✅ Контакт обновлен в HubSpot")
+                log.info("hubspot.update_contact", "✅ Контакт обновлен в HubSpot")
                 return result
             else:
-                print(f"❌ Ошибка обновления контакта: {response.status_code} - {response.text}")
+                log.error("hubspot.update_contact", "❌ Ошибка обновления контакта: %s - %s", response.status_code, response.text)
                 raise Exception(f"HubSpot API error: {response.status_code}")
 
         except Exception as e:
-            print(f"❌ Ошибка обновления контакта в HubSpot: {e}")
+            log.error("hubspot.update_contact", "❌ Ошибка обновления контакта в HubSpot: %s", e)
             raise
 
     async def close(self):
-        """Закрывает HTTP клиент"""
-        await self.client.aclose()
+        """Соединения принадлежат общему пулу и закрываются в lifespan приложения"""
+        return None
 
 
 # Тестовая функция для проверки работы
@@ -204,13 +214,13 @@ async def test_hubspot_client():
             }
         )
 
-        print(f"🧪 Тест HubSpot клиента: {result}")
+        log.info("hubspot.test_hubspot_client", "🧪 Тест HubSpot клиента: %s", result)
 
         await client.close()
         return result
 
     except Exception as e:
-        print(f"❌ Тест HubSpot клиента провален: {e}")
+        log.error("hubspot.test_hubspot_client", "❌ Тест HubSpot клиента провален: %s", e)
         return None
 
 
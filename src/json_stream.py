@@ -0,0 +1,121 @@
+"""
+json_stream.py - Инкрементальный разбор JSON-ответа роутера
+
+Gemini отдаёт JSON по частям (SSE). JsonFieldStream получает эти части и выдаёт
+поля верхнего уровня по мере того, как их значения полностью пришли:
+status и detected_language становятся известны задолго до конца ответа.
+Всё, что стоит перед первой «{» (например, ```json), пропускается.
+"""
+
+import json
+from typing import Any, Dict
+
+
+class JsonFieldStream:
+    """Потоковый разбор полей верхнего уровня одного JSON-объекта"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.done = False  # Встретили закрывающую скобку объекта
+
+        self._pos = 0
+        self._state = "seek_object"
+        self._key = ""
+        self._start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """
+        Добавляет очередную часть ответа
+
+        Args:
+            chunk: Фрагмент текста из стрима
+        Returns:
+            Поля, значения которых завершились в этом фрагменте
+        """
+        completed: Dict[str, Any] = {}
+        if self.done or not chunk:
+            return completed
+        self.buffer += chunk
+        buffer = self.buffer
+
+        while self._pos < len(buffer) and not self.done:
+            char = buffer[self._pos]
+            state = self._state
+
+            if state == "seek_object":
+                if char == "{":
+                    self._state = "seek_key"
+            elif state == "seek_key":
+                if char == '"':
+                    self._start = self._pos
+                    self._state = "key"
+                elif char == "}":
+                    self.done = True
+            elif state == "key":
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._key = json.loads(buffer[self._start:self._pos + 1])
+                    self._state = "seek_colon"
+            elif state == "seek_colon":
+                if char == ":":
+                    self._state = "seek_value"
+            elif state == "seek_value":
+                if not char.isspace():
+                    self._start = self._pos
+                    if char in "{[":
+                        self._depth = 1
+                        self._in_string = False
+                        self._state = "nested"
+                    elif char == '"':
+                        self._state = "string"
+                    else:
+                        self._state = "scalar"
+            elif state == "string":
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._complete(buffer[self._start:self._pos + 1], completed)
+            elif state == "nested":
+                if self._in_string:
+                    if self._escaped:
+                        self._escaped = False
+                    elif char == "\\":
+                        self._escaped = True
+                    elif char == '"':
+                        self._in_string = False
+                elif char == '"':
+                    self._in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._complete(buffer[self._start:self._pos + 1], completed)
+            elif state == "scalar":
+                if char in ",}" or char.isspace():
+                    self._complete(buffer[self._start:self._pos], completed)
+                    if char == "}":
+                        self.done = True
+
+            self._pos += 1
+
+        return completed
+
+    def _complete(self, raw: str, completed: Dict[str, Any]) -> None:
+        self._state = "seek_key"
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            # Битое значение не выдаём: полный ответ всё равно проверит json.loads
+            return
+        self.fields[self._key] = value
+        completed[self._key] = value
@@ -0,0 +1,152 @@
+"""
+keyword_index.py - Инвертированный индекс «стем/фраза → документы»
+
+Строится из summaries.json (trigger_words, typical_questions, core_topics, key_facts)
+и текстов документов базы знаний (заголовки весомее тела). Роутер использует его:
+    - чтобы детерминированно подобрать документы для 1–3 вопросов, когда Gemini
+      вернул need_simplification (вместо второго запроса к Gemini);
+    - как проверку выбора документов Gemini: неизвестные имена отбрасываются,
+      документы без единого совпадения с вопросами попадают в статистику.
+"""
+
+import math
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from text_tokens import tokenize
+
+# Вес источника терма в документе
+SOURCE_WEIGHTS = {
+    "trigger_words": 3.0,
+    "typical_questions": 1.5,
+    "core_topics": 1.0,
+    "key_facts": 1.0,
+    "headings": 1.5,
+    "body": 0.3,
+}
+
+MAX_PHRASE = 3  # Фразы из trigger_words длиной до трёх слов
+
+_HEADING_RE = re.compile(r"^#{1,6}\s+(.+)$", re.MULTILINE)
+
+
+@dataclass
+class DocumentCheck:
+    """Проверка документов, выбранных Gemini"""
+    documents: List[str]  # Известные документы в исходном порядке
+    unknown: List[str]  # Имена, которых нет в базе знаний
+    unsupported: List[str]  # Ни одного совпадения с вопросами
+    suggested: List[str]  # Сильные кандидаты индекса, которых нет в выборе
+
+
+class KeywordIndex:
+    """Инвертированный индекс по стемам и фразам"""
+
+    def __init__(self, postings: Dict[str, Dict[str, float]], documents: List[str], min_score: float = 1.0):
+        """
+        Args:
+            postings: Терм или фраза (стемы через пробел) → {документ: вес}
+            documents: Все документы базы знаний
+            min_score: Минимальная оценка, с которой документ считается найденным
+        """
+        self.documents = list(documents)
+        self.min_score = min_score
+        doc_count = max(len(self.documents), 1)
+        # Редкие термы значат больше: «рассрочк» важнее «курс»
+        self.postings = {
+            term: {doc: weight * math.log(1 + doc_count / len(docs)) for doc, weight in docs.items()}
+            for term, docs in postings.items()
+        }
+
+    @classmethod
+    def build(cls, summaries: Dict[str, Any], docs_dir: Optional[Path] = None, min_score: float = 1.0) -> "KeywordIndex":
+        """
+        Args:
+            summaries: Содержимое summaries.json
+            docs_dir: Папка с текстами документов
+        """
+        postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+
+        def add(term: str, doc: str, weight: float) -> None:
+            postings[term][doc] = postings[term].get(doc, 0.0) + weight
+
+        for doc, summary in summaries.items():
+            if not isinstance(summary, dict):
+                summary = {"core_topics": str(summary)}
+            for source, weight in SOURCE_WEIGHTS.items():
+                value = summary.get(source)
+                texts = value if isinstance(value, list) else [value] if isinstance(value, str) else []
+                for text in texts:
+                    terms = tokenize(text)
+                    for term in set(terms):
+                        add(term, doc, weight)
+                    if source == "trigger_words" and 1 < len(terms) <= MAX_PHRASE:
+                        add(" ".join(terms), doc, weight)
+
+            path = docs_dir / doc if docs_dir else None
+            if path is not None and path.exists():
+                text = path.read_text(encoding="utf-8")
+                for heading in _HEADING_RE.findall(text):
+                    for term in set(tokenize(heading)):
+                        add(term, doc, SOURCE_WEIGHTS["headings"])
+                counts: Dict[str, int] = defaultdict(int)
+                for term in tokenize(text):
+                    counts[term] += 1
+                for term, count in counts.items():
+                    add(term, doc, SOURCE_WEIGHTS["body"] * (1 + math.log(count)))
+
+        return cls(postings, list(summaries), min_score=min_score)
+
+    def score(self, text: str) -> Dict[str, float]:
+        """Оценки документов для текста (стемы и фразы до MAX_PHRASE слов)"""
+        terms = tokenize(text)
+        keys = list(dict.fromkeys(terms))
+        for size in range(2, MAX_PHRASE + 1):
+            keys.extend(" ".join(terms[i:i + size]) for i in range(len(terms) - size + 1))
+        scores: Dict[str, float] = defaultdict(float)
+        for key in keys:
+            for doc, weight in self.postings.get(key, {}).items():
+                scores[doc] += weight
+        return dict(scores)
+
+    def ranked(self, text: str) -> List[str]:
+        scores = self.score(text)
+        return [doc for doc in sorted(scores, key=scores.get, reverse=True) if scores[doc] >= self.min_score]
+
+    def resolve(self, questions: List[str], max_documents: int = 4) -> List[str]:
+        """
+        Документы для вопросов по правилам промпта роутера: основной документ на каждый
+        вопрос и, если есть место, один общий, который покрывает 2+ вопроса
+
+        Returns:
+            Документы (пустой список — ни один вопрос не нашёлся)
+        """
+        documents: List[str] = []
+        coverage: Dict[str, int] = defaultdict(int)
+        totals: Dict[str, float] = defaultdict(float)
+        for question in questions:
+            scores = self.score(question)
+            ranked = [doc for doc in sorted(scores, key=scores.get, reverse=True) if scores[doc] >= self.min_score]
+            if ranked and ranked[0] not in documents:
+                documents.append(ranked[0])
+            for doc in ranked:
+                coverage[doc] += 1
+                totals[doc] += scores[doc]
+
+        shared = [doc for doc in sorted(totals, key=totals.get, reverse=True) if coverage[doc] >= 2 and doc not in documents]
+        if shared and len(questions) > 1:
+            documents.append(shared[0])
+        return documents[:max_documents]
+
+    def check(self, documents: List[str], questions: List[str]) -> DocumentCheck:
+        """Сверяет выбор Gemini с индексом"""
+        known = [doc for doc in documents if doc in self.documents]
+        unknown = [doc for doc in documents if doc not in self.documents]
+        text = " ".join(questions)
+        scores = self.score(text) if text.strip() else {}
+        unsupported = [doc for doc in known if scores.get(doc, 0.0) <= 0.0] if scores else []
+        suggested = [doc for doc in self.resolve(questions) if doc not in known] if scores else []
+        return DocumentCheck(known, unknown, unsupported, suggested)
@@ -0,0 +1,182 @@
+"""
+keyword_matcher.py - Общий многошаблонный поиск ключевых слов (Aho–Corasick)
+
+Эвристики в main.py, ResponseGenerator, SimpleCTABlocker, CompletedActionsHandler,
+SafetyChecker и Router раньше проверяли каждый свой список отдельным циклом
+`any(word in text for word in words)` по одному и тому же тексту. Теперь словари
+регистрируются под именами в одном автомате, он собирается один раз (лениво, при
+первом поиске после регистрации), а текст проходится за один проход — результат
+содержит все совпадения, сгруппированные по словарям.
+
+Семантика совпадает с `word in text`: поиск подстрок с учётом регистра, поэтому
+вызывающий код сам решает, передавать ли text.lower().
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+
+class KeywordHits:
+    """Совпадения одного текста, сгруппированные по словарям"""
+
+    __slots__ = ("_found", "_prefixes")
+
+    def __init__(self, found: Dict[str, Set[str]], prefixes: Set[str]):
+        self._found = found
+        self._prefixes = prefixes
+
+    def any(self, lexicon: str) -> bool:
+        """Есть ли в тексте хотя бы одно слово словаря (как any(word in text ...))"""
+        return lexicon in self._found
+
+    def matched(self, lexicon: str) -> FrozenSet[str]:
+        """Какие слова словаря встретились в тексте"""
+        return frozenset(self._found.get(lexicon, ()))
+
+    def starts_with(self, lexicon: str) -> bool:
+        """Начинается ли текст с одного из слов словаря (как any(text.startswith(word) ...))"""
+        return lexicon in self._prefixes
+
+    def lexicons(self) -> List[str]:
+        """Имена словарей, давших совпадения"""
+        return sorted(self._found)
+
+
+class KeywordMatcher:
+    """Именованные словари в одном автомате Aho–Corasick с кэшем результатов по тексту"""
+
+    def __init__(self, cache_size: int = 512):
+        self._lexicons: Dict[str, Tuple[str, ...]] = {}
+        self._delta: List[Dict[str, int]] = []  # Полная таблица переходов (с учётом fail-ссылок)
+        self._outputs: List[Tuple[Tuple[str, str, int], ...]] = []  # (словарь, слово, длина) по состояниям
+        self._dirty = True
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, KeywordHits]" = OrderedDict()
+        self.cache_size = cache_size
+        self.stats = {
+            "builds": 0,       # сборок автомата
+            "scans": 0,        # запросов scan()
+            "cache_hits": 0,   # ответов из кэша без прохода по тексту
+            "chars_scanned": 0,
+        }
+
+    def register(self, name: str, patterns: Iterable[str]) -> None:
+        """
+        Регистрирует (или заменяет) словарь
+
+        Args:
+            name: Имя словаря, например "cta.hard_refusal"
+            patterns: Слова и фразы; пустые строки игнорируются
+        """
+        words = tuple(dict.fromkeys(word for word in patterns if word))
+        with self._lock:
+            if self._lexicons.get(name) == words:
+                return  # Повторная регистрация того же словаря (новый экземпляр класса) не пересобирает автомат
+            self._lexicons[name] = words
+            self._dirty = True
+            self._cache.clear()
+
+    def patterns(self, name: str) -> Tuple[str, ...]:
+        """Слова зарегистрированного словаря"""
+        return self._lexicons.get(name, ())
+
+    def _build(self) -> None:
+        """Собирает бор, fail-ссылки и полную таблицу переходов"""
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[Tuple[str, str, int]]] = [[]]
+        for name, words in self._lexicons.items():
+            for word in words:
+                state = 0
+                for ch in word:
+                    nxt = goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(goto)
+                        goto[state][ch] = nxt
+                        goto.append({})
+                        outputs.append([])
+                    state = nxt
+                outputs[state].append((name, word, len(word)))
+
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])]
+        delta.extend({} for _ in range(len(goto) - 1))
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            # Переходы состояния = переходы его fail-состояния + собственные рёбра бора
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            outputs[state].extend(outputs[fail[state]])
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0)
+                queue.append(nxt)
+
+        self._delta = delta
+        self._outputs = [tuple(out) for out in outputs]
+        self._dirty = False
+        self.stats["builds"] += 1
+
+    def scan(self, text: str) -> KeywordHits:
+        """
+        Один проход по тексту по всем словарям
+
+        Args:
+            text: Текст (регистр не меняется)
+        Returns:
+            KeywordHits с совпадениями по словарям
+        """
+        self.stats["scans"] += 1
+        cached = self._cache.get(text)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            self._cache.move_to_end(text)
+            return cached
+
+        if self._dirty:
+            with self._lock:
+                if self._dirty:
+                    self._build()
+        delta, outputs = self._delta, self._outputs
+
+        found: Dict[str, Set[str]] = {}
+        prefixes: Set[str] = set()
+        state = 0
+        for position, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            out = outputs[state]
+            if out:
+                for name, word, length in out:
+                    found.setdefault(name, set()).add(word)
+                    if length == position + 1:
+                        prefixes.add(name)
+        self.stats["chars_scanned"] += len(text)
+
+        hits = KeywordHits(found, prefixes)
+        self._cache[text] = hits
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return hits
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        stats = dict(self.stats)
+        stats["lexicons"] = len(self._lexicons)
+        stats["patterns"] = sum(len(words) for words in self._lexicons.values())
+        stats["states"] = len(self._delta)
+        stats["cache_hit_rate"] = (
+            f"{(stats['cache_hits'] / stats['scans'] * 100):.1f}%" if stats["scans"] else "0.0%"
+        )
+        return stats
+
+
+_keyword_matcher: Optional[KeywordMatcher] = None
+
+
+def get_keyword_matcher() -> KeywordMatcher:
+    """Общий автомат процесса"""
+    global _keyword_matcher
+    if _keyword_matcher is None:
+        _keyword_matcher = KeywordMatcher()
+    return _keyword_matcher
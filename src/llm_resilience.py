@@ -0,0 +1,213 @@
+"""
+llm_resilience.py - Повторы и хеджирование запросов к LLM
+
+- Ограниченные повторы с экспоненциальной задержкой и джиттером на 429/5xx/таймаутах
+- Хедж-запрос: если ответ не пришёл за наблюдаемый p95 для модели, параллельно
+  отправляется дубликат, берётся первый успешный ответ
+- У каждой точки вызова (router, generator, translator, humor) свой бюджет времени
+"""
+
+import asyncio
+import random
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from config import Config
+from event_log import get_logger
+
+log = get_logger(__name__)
+
+T = TypeVar("T")  # Результат попытки (у OpenRouterClient — LLMResult)
+
+
+class LLMAttemptError(Exception):
+    """Неудачная попытка запроса к LLM"""
+
+    def __init__(self, reason: str, retryable: bool = True, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retryable = retryable
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def model_unhealthy(self) -> bool:
+        """Ошибка говорит о проблеме модели/провайдера, а не о самом запросе"""
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных попыток по (stage, model)"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[Tuple[str, str], Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+
+    def record(self, stage: str, model: str, latency: float) -> None:
+        self._samples[(stage, model)].append(latency)
+
+    def percentile(self, stage: str, model: str, q: float = 0.95) -> Optional[float]:
+        """Перцентиль задержки или None, пока данных мало"""
+        samples = self._samples.get((stage, model))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {}
+        for (stage, model), samples in self._samples.items():
+            ordered = sorted(samples)
+            stats[f"{stage}:{model}"] = {
+                "samples": len(ordered),
+                "p50": round(ordered[len(ordered) // 2], 3),
+                "p95": round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))], 3),
+            }
+        return stats
+
+
+class ResilienceExecutor:
+    """Выполняет попытки запроса с повторами, хеджированием и бюджетом стадии"""
+
+    def __init__(self, tracker: Optional[LatencyTracker] = None):
+        self.tracker = tracker or LatencyTracker()
+        self.stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "failures": 0,
+            "budget_exhausted": 0,
+        })
+
+    @staticmethod
+    def budget_for(stage: str) -> float:
+        return Config.LLM_STAGE_BUDGETS.get(stage, Config.LLM_STAGE_BUDGETS.get("default", 30.0))
+
+    @staticmethod
+    def backoff_delay(retry: int) -> float:
+        """Full jitter: случайная задержка от 0 до base * 2^retry (с потолком)"""
+        cap = min(Config.LLM_BACKOFF_MAX, Config.LLM_BACKOFF_BASE * (2 ** retry))
+        return random.uniform(0, cap)
+
+    def hedge_delay(self, stage: str, model: str) -> Optional[float]:
+        """Когда отправлять дубликат: p95 модели на этой стадии (не раньше минимума)"""
+        if not Config.LLM_HEDGING_ENABLED or stage not in Config.LLM_HEDGED_STAGES:
+            return None
+        p95 = self.tracker.percentile(stage, model)
+        if p95 is None:
+            return None
+        return max(Config.LLM_HEDGE_MIN_DELAY, p95)
+
+    async def run(self, attempt: Callable[[float], Awaitable[T]], *, stage: str, model: str, budget: Optional[float] = None) -> T:
+        """
+        Выполняет запрос в рамках бюджета стадии
+
+        Args:
+            attempt: Фабрика одной попытки, принимает таймаут попытки в секундах
+            stage: Точка вызова (router, generator, translator, humor)
+            model: Модель (для статистики задержек)
+            budget: Остаток бюджета в секундах (по умолчанию полный бюджет стадии)
+        Returns:
+            Результат первой успешной попытки (то, что вернула attempt)
+        Raises:
+            LLMAttemptError: Все попытки неудачны или бюджет исчерпан
+        """
+        stats = self.stats[stage]
+        stats["calls"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.budget_for(stage) if budget is None else budget)
+        retry = 0
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                stats["budget_exhausted"] += 1
+                stats["failures"] += 1
+                raise LLMAttemptError("budget exhausted", retryable=False)
+            try:
+                return await self._hedged(attempt, remaining, stage=stage, model=model)
+            except LLMAttemptError as error:
+                if not error.retryable or retry >= Config.LLM_MAX_RETRIES:
+                    stats["failures"] += 1
+                    raise
+                delay = error.retry_after if error.retry_after is not None else self.backoff_delay(retry)
+                if loop.time() + delay >= deadline:
+                    stats["budget_exhausted"] += 1
+                    stats["failures"] += 1
+                    raise
+                retry += 1
+                stats["retries"] += 1
+                log.warning("llm.retry", "🔁 Повтор запроса к %s (%s) #%s через %.2fс: %s", model, stage, retry, delay, error.reason)
+                await asyncio.sleep(delay)
+
+    async def _timed(self, attempt: Callable[[float], Awaitable[T]], timeout: float, stage: str, model: str) -> T:
+        self.stats[stage]["attempts"] += 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(attempt(timeout), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise LLMAttemptError("timeout")
+        self.tracker.record(stage, model, time.perf_counter() - started)
+        return result
+
+    async def _hedged(self, attempt: Callable[[float], Awaitable[T]], timeout: float, *, stage: str, model: str) -> T:
+        """
+        Одна логическая попытка: основной запрос плюс, при задержке, хедж-дубликат
+
+        При любом выходе, в том числе при отмене вызывающего, незавершённые запросы
+        отменяются: иначе они живут после выхода из слота bulkhead и стоят денег.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        primary = asyncio.ensure_future(self._timed(attempt, timeout, stage, model))
+        tasks = [primary]
+        try:
+            delay = self.hedge_delay(stage, model)
+            if delay is None or delay >= timeout:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            self.stats[stage]["hedges"] += 1
+            hedge = asyncio.ensure_future(self._timed(attempt, deadline - loop.time(), stage, model))
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            last_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats[stage]["hedge_wins"] += 1
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        return {
+            "stages": {stage: dict(values) for stage, values in self.stats.items()},
+            "latency": self.tracker.get_stats(),
+        }
+
+
+_executor: Optional[ResilienceExecutor] = None
+
+
+def get_resilience_executor() -> ResilienceExecutor:
+    """Общий исполнитель процесса (одна статистика задержек на все клиенты)"""
+    global _executor
+    if _executor is None:
+        _executor = ResilienceExecutor()
+    return _executor
@@ -8,7 +8,8 @@ import random
 import secrets
 import time
 import re
-from fastapi import FastAPI, HTTPException, Header, Path, Query
+from fastapi import FastAPI, HTTPException, Header, Path, Query, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field, ValidationError, field_validator
@@ -40,30 +41,74 @@ from typing import Dict
 from collections import defaultdict, deque
 from completed_actions_handler import CompletedActionsHandler
 from simple_cta_blocker import SimpleCTABlocker  # Новый импорт для блокировки CTA
+from http_pool import get_http_pool
+from singleflight import get_singleflight
+from llm_resilience import get_resilience_executor
+from model_health import get_model_health
+from usage_accounting import get_usage_ledger, summarize_calls, usage_scope
+from bulkhead import BulkheadRejected, get_bulkheads
 import signal
 import atexit
+from contextlib import asynccontextmanager
+from event_log import configure_logging, get_logger
+from early_dispatch import EarlyDispatch, get_stats as get_early_dispatch_stats
+from keyword_matcher import get_keyword_matcher
+from document_store import get_document_store
+from response_stream import current_stream, stream_scope
 
 # === ДЕТЕРМИНИРОВАННОСТЬ ДЛЯ ВОСПРОИЗВОДИМОСТИ ===
 # Устанавливаем глобальный seed для всех random операций
 config = Config()
 
+# === ЛОГИРОВАНИЕ ===
+# Запись в stdout уходит в фоновый поток, event loop только ставит событие в очередь
+configure_logging()
+log = get_logger(__name__)
+
 # === КРИТИЧЕСКАЯ ПРОВЕРКА API КЛЮЧА ===
 if not config.OPENROUTER_API_KEY:
-    print("❌ КРИТИЧЕСКАЯ ОШИБКА: Не установлен OPENROUTER_API_KEY!")
-    print("📝 Установите переменную окружения или добавьте в .env файл")
+    log.error("main.startup", "❌ КРИТИЧЕСКАЯ ОШИБКА: Не установлен OPENROUTER_API_KEY!")
+    log.info("main.startup", "📝 Установите переменную окружения или добавьте в .env файл")
     sys.exit(1)
 
-print(f"✅ OpenRouter API key загружен (длина: {len(config.OPENROUTER_API_KEY)})")
+log.info("main.startup", "✅ OpenRouter API key загружен (длина: %s)", len(config.OPENROUTER_API_KEY))
 
 if config.DETERMINISTIC_MODE:
     random.seed(config.SEED)  # Теперь все random.choice() будут предсказуемыми
-    print(f"🎲 Random seed установлен: {config.SEED} (детерминированный режим)")
+    log.info("main.startup", "🎲 Random seed установлен: %s (детерминированный режим)", config.SEED)
 else:
     # Используем системную энтропию для настоящей случайности
-    print("🎲 Случайный режим активен (системная энтропия)")
+    log.info("main.startup", "🎲 Случайный режим активен (системная энтропия)")
 
 # === ИНИЦИАЛИЗАЦИЯ ===
-app = FastAPI(title="Ukido Chatbot API", version=config.APP_VERSION)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Поднимает общий пул HTTP-соединений и корпус документов при старте, закрывает при остановке"""
+    http_pool = get_http_pool()
+    warmup_urls = [config.API_URL]
+    if config.HUBSPOT_PRIVATE_APP_TOKEN:
+        warmup_urls.append("https://api.hubapi.com")
+    await http_pool.warmup(warmup_urls)
+    log.info("main.lifespan", "🔌 HTTP пул готов (HTTP/2: %s)", 'да' if http_pool.http2 else 'нет')
+
+    # Документы генератора — в память до первого запроса, дальше фоновая сверка с диском
+    documents = get_document_store()
+    await asyncio.to_thread(documents.load_all)
+    revalidation = None
+    if config.DOCUMENT_STORE_REVALIDATE_SECONDS > 0:
+        revalidation = asyncio.create_task(documents.run_revalidation(config.DOCUMENT_STORE_REVALIDATE_SECONDS))
+    try:
+        yield
+    finally:
+        if revalidation is not None:
+            revalidation.cancel()
+        if _state_writes:
+            await asyncio.gather(*_state_writes.values(), return_exceptions=True)
+        await http_pool.aclose()
+        log.info("main.lifespan", "🔌 HTTP пул закрыт")
+
+
+app = FastAPI(title="Ukido Chatbot API", version=config.APP_VERSION, lifespan=lifespan)
 
 # CORS настройки
 app.add_middleware(
@@ -74,6 +119,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(BulkheadRejected)
+async def bulkhead_rejected_handler(request: Request, exc: BulkheadRejected):
+    """Перегрузка стадии пайплайна: быстрый 503 вместо долгого ожидания"""
+    log.info("main.bulkhead_rejected_handler", "🚦 Load shedding (%s): %s", exc.stage, exc.reason)
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Сервис перегружен, попробуйте чуть позже", "stage": exc.stage},
+        headers={"Retry-After": exc.retry_after_header},
+    )
+
+
 # === ПРОСТЫЕ МЕТРИКИ ===
 signal_stats = {
     "price_sensitive": 0,
@@ -92,27 +149,6 @@ def is_debug_logging() -> bool:
     return config.LOG_LEVEL == "DEBUG"
 
 
-async def stream_response_chunks(response_text: str):
-    """Yield final response text in small chunks while preserving paragraphs."""
-    lines = response_text.split('\n')
-
-    for line_idx, line in enumerate(lines):
-        if line_idx > 0:
-            yield "\n"
-
-        if not line.strip():
-            continue
-
-        words = line.split()
-
-        for i, word in enumerate(words):
-            if i > 0:
-                word = " " + word
-
-            yield word
-            await asyncio.sleep(0.05)
-
-
 def redact_email(email: str) -> str:
     """Mask email for logs while preserving enough shape for operations."""
     local, _, domain = email.partition("@")
@@ -254,19 +290,19 @@ persistence_manager = PersistenceManager(base_path=config.PERSISTENCE_BASE_PATH)
 user_signals_history = {}
 
 # Загружаем сохранённые состояния при старте
-print("📂 Загрузка сохранённых состояний...")
+log.info("main.startup", "📂 Загрузка сохранённых состояний...")
 saved_states = persistence_manager.load_all_states()
 for user_id, state_data in saved_states.items():
     restore_state_snapshot(
         state_data, history, user_signals_history, 
         social_state, user_id
     )
-print(f"✅ Восстановлено {len(saved_states)} диалогов")
+log.info("main.startup", "✅ Восстановлено %s диалогов", len(saved_states))
 
 # === GRACEFUL SHUTDOWN ===
 def save_all_states_on_shutdown():
     """Сохраняет все активные состояния при остановке сервера"""
-    print("\n🛑 Получен сигнал остановки, сохраняю состояния...")
+    log.info("main.save_all_states_on_shutdown", "🛑 Получен сигнал остановки, сохраняю состояния...")
     
     try:
         # Собираем все активные состояния
@@ -281,14 +317,14 @@ def save_all_states_on_shutdown():
                     )
                     all_states[user_id] = state_snapshot
                 except Exception as e:
-                    print(f"⚠️ Ошибка создания снимка для {user_id}: {e}")
+                    log.warning("main.save_all_states_on_shutdown", "⚠️ Ошибка создания снимка для %s: %s", user_id, e)
         
         # Массово сохраняем все состояния
         saved_count = persistence_manager.save_all_states(all_states)
-        print(f"✅ Сохранено {saved_count} состояний перед остановкой")
+        log.info("main.save_all_states_on_shutdown", "✅ Сохранено %s состояний перед остановкой", saved_count)
         
     except Exception as e:
-        print(f"❌ Ошибка при сохранении состояний: {e}")
+        log.error("main.save_all_states_on_shutdown", "❌ Ошибка при сохранении состояний: %s", e)
 
 # Регистрируем обработчики сигналов
 def signal_handler(signum, frame):
@@ -301,7 +337,7 @@ signal.signal(signal.SIGTERM, signal_handler)  # Для graceful shutdown в Doc
 signal.signal(signal.SIGINT, signal_handler)   # Для Ctrl+C
 atexit.register(save_all_states_on_shutdown)   # На всякий случай при нормальном завершении
 
-print("🔐 Обработчики graceful shutdown зарегистрированы")
+log.info("main.startup", "🔐 Обработчики graceful shutdown зарегистрированы")
 
 # === ГЛОБАЛЬНЫЙ СИНГЛТОН ДЛЯ ЮМОРА ЖВАНЕЦКОГО ===
 zhvanetsky_generator = None
@@ -317,7 +353,8 @@ if config.ZHVANETSKY_ENABLED:
         zhvanetsky_client = OpenRouterClient(
             api_key=config.OPENROUTER_API_KEY,
             model=config.ZHVANETSKY_MODEL,
-            temperature=config.ZHVANETSKY_TEMPERATURE
+            temperature=config.ZHVANETSKY_TEMPERATURE,
+            stage="humor"
         )
         
         # Создаём глобальные синглтоны
@@ -327,9 +364,9 @@ if config.ZHVANETSKY_ENABLED:
             config=config
         )
         
-        print(f"🎭 Система юмора Жванецкого инициализирована (вероятность: {config.ZHVANETSKY_PROBABILITY * 100}%)")
+        log.info("main.startup", "🎭 Система юмора Жванецкого инициализирована (вероятность: %s%%)", config.ZHVANETSKY_PROBABILITY * 100)
     except Exception as e:
-        print(f"⚠️ Не удалось инициализировать систему юмора: {e}")
+        log.warning("main.startup", "⚠️ Не удалось инициализировать систему юмора: %s", e)
         config.ZHVANETSKY_ENABLED = False
 
 # === RATE LIMITING ===
@@ -351,7 +388,7 @@ def check_rate_limits(user_id: str) -> None:
     recent_count = sum(1 for t in recent_requests if t > minute_ago)
     
     if recent_count > 10:
-        print(f"⚠️ Rate limit exceeded for user {user_id}: {recent_count} requests/min")
+        log.warning("main.check_rate_limits", "⚠️ Rate limit exceeded for user %s: %s requests/min", user_id, recent_count)
         raise HTTPException(
             status_code=429, 
             detail="Too many requests. Please wait a minute."
@@ -365,17 +402,179 @@ def check_rate_limits(user_id: str) -> None:
     
     daily["count"] += 1
     if daily["count"] > 100:
-        print(f"⚠️ Daily limit exceeded for user {user_id}: {daily['count']} requests")
+        log.warning("main.check_rate_limits", "⚠️ Daily limit exceeded for user %s: %s requests", user_id, daily['count'])
         raise HTTPException(
             status_code=429, 
             detail="Daily limit exceeded. Try again tomorrow."
         )
 
 
+# === ПОДГОТОВКА ГЕНЕРАЦИИ ===
+# Словари эвристик регистрируются в общем автомате (см. keyword_matcher.py)
+get_keyword_matcher().register("main.offtopic_history", [
+    "Давайте сосредоточимся на",
+    "Это не связано с нашими курсами",
+    "футбольной секции",
+    "парковка",
+    "пробки",
+    "погода",
+    "перемена в школе",  # Часть юмора про парковку
+    "У нас парковка",    # Начало шутки про парковку
+])
+get_keyword_matcher().register("main.farewell", ["до свидания", "до встречи", "всего доброго", "удачи", "до связи"])
+get_keyword_matcher().register("main.thanks", ["рад", "пожалуйста", "всегда пожалуйста"])
+
+
+def filter_offtopic_from_history(history_messages):
+    """Убирает пары сообщений (user+assistant), где assistant отвечал на offtopic"""
+    filtered = []
+    matcher = get_keyword_matcher()
+    
+    i = 0
+    while i < len(history_messages):
+        # Проверяем пару user+assistant сообщений
+        if i + 1 < len(history_messages):
+            user_msg = history_messages[i]
+            assistant_msg = history_messages[i + 1]
+            
+            # Если в ответе ассистента есть маркеры offtopic - пропускаем оба сообщения
+            if assistant_msg.get("role") == "assistant":
+                is_offtopic = matcher.scan(assistant_msg.get("content", "")).any("main.offtopic_history")
+                if not is_offtopic:
+                    filtered.append(user_msg)
+                    filtered.append(assistant_msg)
+                else:
+                    log.debug("main.filter_offtopic_from_history", "🔍 Фильтруем offtopic из истории: %s...", user_msg.get('content', '')[:30])
+                i += 2
+            else:
+                # Если структура нарушена, добавляем как есть
+                filtered.append(history_messages[i])
+                i += 1
+        else:
+            # Последнее сообщение без пары
+            filtered.append(history_messages[i])
+            i += 1
+    
+    return filtered
+
+
+def effective_user_signal(user_id: str, status: str, user_signal: str) -> str:
+    """
+    user_signal с учётом инерции из user_signals_history (без записи в историю)
+
+    HOTFIX 1: Gemini 2.5 Flash игнорирует инструкцию сохранять user_signal для offtopic —
+    восстанавливаем последний известный сигнал.
+    HOTFIX 2: при переходе от негативных вопросов о цене к информационным теряется
+    контекст скептицизма — сохраняем инерцию price_sensitive.
+    """
+    last_signal = user_signals_history.get(user_id)
+    if status == "offtopic" and user_signal == "exploring_only" and last_signal and last_signal != "exploring_only":
+        return last_signal
+    if status == "success" and user_signal == "exploring_only" and last_signal == "price_sensitive":
+        return "price_sensitive"
+    return user_signal
+
+
+def generator_payload(
+    request: ChatRequest,
+    history_messages: List[dict],
+    route_fields: dict,
+    user_signal: str,
+    should_block_cta: bool,
+    block_reason: str,
+    cta_frequency_modifier: float,
+    memory: Optional[str] = None,
+) -> tuple:
+    """Аргументы ResponseGenerator.generate: (router_result, отфильтрованная история, сообщение)"""
+    documents = route_fields.get("documents", [])
+    return (
+        {
+            "status": route_fields.get("status", "offtopic"),
+            "documents": documents if isinstance(documents, list) else [],
+            "decomposed_questions": route_fields.get("decomposed_questions", []),
+            "social_context": route_fields.get("social_context"),  # Передаем контекст
+            "user_signal": user_signal,  # Передаем user_signal для персонализации
+            "original_message": request.message,  # Добавляем оригинальное сообщение
+            "cta_blocked": should_block_cta,  # Передаем флаг блокировки CTA
+            "cta_frequency_modifier": cta_frequency_modifier,  # Передаем модификатор частоты
+            "detected_language": route_fields.get("detected_language", "ru"),  # Передаем detected_language для перевода
+            "block_reason": block_reason if should_block_cta else None,  # Причина блокировки
+            "memory": memory,  # Сжатая память диалога (ранние реплики и факты)
+        },
+        filter_offtopic_from_history(history_messages),  # Используем отфильтрованную историю
+        request.message,  # Передаём текущее сообщение отдельно для корректной проверки CTA
+    )
+
+
+# user_id → последняя запись снимка в файл (ждём их при остановке)
+_state_writes: Dict[str, asyncio.Task] = {}
+
+
+def _after_response(user_id: str) -> None:
+    """Сворачивает старые реплики в память диалога и отдаёт запись снимка состояния в поток"""
+    if not history:
+        return
+    history.update_memory(user_id)
+
+    # === СОХРАНЕНИЕ ПЕРСИСТЕНТНОГО СОСТОЯНИЯ ===
+    try:
+        state_snapshot = create_state_snapshot(
+            history, user_signals_history, social_state, user_id
+        )
+    except Exception as e:
+        log.warning("main.process_chat", "⚠️ Ошибка сохранения состояния для %s: %s", user_id, e)
+        return
+    # Снимок собирается на loop, а пишется в потоке: история в нём — копия живого списка
+    state_snapshot["history"] = list(state_snapshot["history"])
+    task = asyncio.get_running_loop().create_task(_write_state(user_id, state_snapshot, _state_writes.get(user_id)))
+    _state_writes[user_id] = task
+    task.add_done_callback(lambda done: _state_writes.pop(user_id) if _state_writes.get(user_id) is done else None)
+
+
+async def _write_state(user_id: str, state_snapshot: dict, previous: Optional[asyncio.Task]) -> None:
+    """Пишет снимок в файл вне event loop; снимки одного пользователя — по порядку"""
+    if previous is not None:
+        await asyncio.wait([previous])
+    await asyncio.to_thread(persistence_manager.save_state, user_id, state_snapshot)
+
+
+def _speculative_generator_payload(
+    request: ChatRequest,
+    history_messages: List[dict],
+    fields: dict,
+    memory: Optional[str] = None,
+    pending_action: Optional[str] = None,
+    pending_refusal: Optional[str] = None,
+) -> tuple:
+    """Аргументы генерации по частичному решению потокового роутера (проверки CTA ещё не записаны)"""
+    user_signal = effective_user_signal(request.user_id, "success", fields.get("user_signal", "exploring_only"))
+    should_block_cta, block_reason = simple_cta_blocker.should_block_cta(
+        request.user_id, len(history_messages) + 1, user_signal, pending_action, pending_refusal
+    )
+    cta_frequency_modifier = simple_cta_blocker.get_cta_frequency_modifier(request.user_id, pending_refusal)
+    return generator_payload(
+        request, history_messages, fields, user_signal, should_block_cta, block_reason, cta_frequency_modifier, memory
+    )
+
+
 # === ЭНДПОИНТЫ ===
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """Основной эндпоинт для общения с чатботом - версия с State Machine"""
+    # Все LLM-вызовы запроса учитываются на пользователя
+    with usage_scope(request.user_id) as llm_calls:
+        response = await _process_chat(request)
+
+    if is_debug_logging():
+        # Копия, чтобы usage не попадал в metadata, сохранённую в истории
+        metadata = dict(response.metadata or {})
+        metadata["usage"] = summarize_calls(llm_calls)
+        response.metadata = metadata
+    return response
+
+
+async def _process_chat(request: ChatRequest) -> ChatResponse:
+    """Пайплайн обработки сообщения: Router → Generator → постобработка"""
     global signal_stats, request_count, total_latency
     
     # RATE LIMITING: Проверка лимитов перед обработкой
@@ -386,22 +585,52 @@ async def chat(request: ChatRequest):
     
     # Получаем историю если есть
     history_messages = []
+    memory_prompt = None
     if history:
         history_messages = history.get_history(request.user_id)
+        memory_prompt = history.get_memory_prompt(request.user_id)
     
     # === PIPELINE: Router (Gemini) → Generator (Claude) ===
     
     # Всё идет в Router
-    print(f"ℹ️ Routing message ({message_log_summary(request.message)})")
+    log.info("main.process_chat", "ℹ️ Routing message (%s)", message_log_summary(request.message))
+    
+    # Подсчитываем количество сообщений для текущего пользователя
+    current_message_count = len(history_messages) + 1
     
+    dispatch = None
+    cta_checks = (None, None)  # Потоковый режим: записываются, только если роутер ответил
     try:
         # Передаем user_id в Router для отслеживания социального состояния
-        route_result = await router.route(request.message, history_messages, request.user_id)
+        if config.ROUTER_STREAMING:
+            # Спекулятивная генерация должна видеть блокировку CTA с учётом этого сообщения:
+            # проверки SimpleCTABlocker считаются заранее, а записываются только после роутера
+            pending_action = simple_cta_blocker.detect_completed_action(request.message)
+            pending_refusal = simple_cta_blocker.detect_refusal(request.message)
+            # Документы и генерация стартуют, пока Gemini ещё дописывает решение
+            dispatch = EarlyDispatch(
+                response_generator,
+                lambda fields: _speculative_generator_payload(
+                    request, history_messages, fields, memory_prompt, pending_action, pending_refusal
+                ),
+            )
+            route_result = await router.route_streaming(
+                request.message, history_messages, request.user_id, on_partial=dispatch.on_partial, memory=memory_prompt
+            )
+            cta_checks = (pending_action, pending_refusal)
+        else:
+            route_result = await router.route(request.message, history_messages, request.user_id, memory=memory_prompt)
         
         if config.LOG_LEVEL == "DEBUG":
-            print(f"🔍 DEBUG Router result: {route_result}")
+            log.debug("main.process_chat", "🔍 DEBUG Router result: %s", route_result)
+    except BulkheadRejected:
+        if dispatch is not None:
+            dispatch.cancel()
+        raise
     except Exception as e:
-        print(f"❌ Router failed: {e}")
+        log.error("main.process_chat", "❌ Router failed: %s", e)
+        if dispatch is not None:
+            dispatch.cancel()
         route_result = {
             "status": "offtopic",
             "message": "Временная проблема. Попробуйте позже.",
@@ -419,7 +648,7 @@ async def chat(request: ChatRequest):
         )
         # Логируем если была корректировка
         if route_result.get("_correction_applied") == "completed_action":
-            print(f"✅ Completed action corrected: {original_status} → {route_result.get('status')}")
+            log.info("main.process_chat", "✅ Completed action corrected: %s → %s", original_status, route_result.get('status'))
     
     # Обрабатываем результат роутера
     status = route_result.get("status", "offtopic")
@@ -431,55 +660,51 @@ async def chat(request: ChatRequest):
     user_signal = route_result.get("user_signal", "exploring_only")  # Получаем user_signal
     detected_language = route_result.get("detected_language", "ru")  # Получаем detected_language для мультиязычности
     
-    # HOTFIX: Восстанавливаем user_signal для offtopic из предыдущих успешных запросов
-    # Проблема: Gemini 2.5 Flash игнорирует инструкцию сохранять user_signal для offtopic
-    if status == "offtopic" and user_signal == "exploring_only":
-        # Получаем последний известный сигнал для этого пользователя
-        if request.user_id in user_signals_history:
-            last_signal = user_signals_history[request.user_id]
-            if last_signal != "exploring_only":
-                original_signal = user_signal
-                user_signal = last_signal
-                print(f"🔧 HOTFIX: Восстановлен user_signal='{user_signal}' из истории (Router вернул '{original_signal}')")
+    # HOTFIX: Восстанавливаем user_signal из истории (см. effective_user_signal)
+    original_signal = user_signal
+    user_signal = effective_user_signal(request.user_id, status, user_signal)
+    if user_signal != original_signal:
+        log.info("main.process_chat", "🔧 HOTFIX: Восстановлен user_signal='%s' из истории (Router вернул '%s')", user_signal, original_signal)
     
     # Сохраняем текущий сигнал для будущих offtopic
-    if status == "success" and user_signal != "exploring_only":
-        user_signals_history[request.user_id] = user_signal
-        print(f"💾 Сохранён user_signal='{user_signal}' для user_id='{request.user_id}'")
-
-    # РАСШИРЕННЫЙ HOTFIX: Восстанавливаем price_sensitive инерцию для success запросов
-    # Проблема: При переходе от негативных вопросов о цене к информационным, теряется контекст
-    if status == "success" and user_signal == "exploring_only":
-        # Проверяем, был ли ранее price_sensitive
-        if request.user_id in user_signals_history:
-            last_signal = user_signals_history[request.user_id]
-            if last_signal == "price_sensitive":
-                # Восстанавливаем price_sensitive для сохранения контекста скептицизма
-                original_signal = user_signal
-                user_signal = "price_sensitive"
-                print(f"🔧 HOTFIX: Восстановлена инерция price_sensitive (Router вернул '{original_signal}')")
-                # НЕ обновляем user_signals_history - сохраняем price_sensitive
+    # (восстановленную инерцию price_sensitive не записываем — она и так в истории)
+    if status == "success" and original_signal != "exploring_only":
+        user_signals_history[request.user_id] = original_signal
+        log.info("main.process_chat", "💾 Сохранён user_signal='%s' для user_id='%s'", original_signal, request.user_id)
 
     if is_debug_logging():
-        print(f"🔍 DEBUG: Router returned user_signal='{user_signal}', status='{status}'")
+        log.debug("main.process_chat", "🔍 DEBUG: Router returned user_signal='%s', status='%s'", user_signal, status)
     
     # Собираем метрики
     if user_signal in signal_stats:
         signal_stats[user_signal] += 1
+
+    # /chat/stream: решение роутера уходит клиенту первым событием, до генерации
+    stream = current_stream()
+    if stream is not None:
+        stream.metadata({
+            "intent": status,
+            "user_signal": user_signal,
+            "humor_generated": False,
+            "detected_language": detected_language,
+        })
     
     # === SIMPLE CTA BLOCKER - Проверка завершённых действий и отказов ===
-    # Подсчитываем количество сообщений для текущего пользователя
-    current_message_count = len(history_messages) + 1
-    
-    # Проверяем завершённые действия
-    completed_action = simple_cta_blocker.check_completed_action(request.user_id, request.message)
+    if config.ROUTER_STREAMING:
+        completed_action, refusal_type = cta_checks
+        if completed_action:
+            simple_cta_blocker.record_completed_action(request.user_id, completed_action)
+        if refusal_type:
+            simple_cta_blocker.record_refusal(request.user_id, refusal_type, current_message_count)
+    else:
+        # Проверяем завершённые действия
+        completed_action = simple_cta_blocker.check_completed_action(request.user_id, request.message)
+        # Проверяем отказы
+        refusal_type = simple_cta_blocker.check_refusal(request.user_id, request.message, current_message_count)
     if completed_action:
-        print(f"✅ SimpleCTABlocker: обнаружено завершённое действие '{completed_action}'")
-    
-    # Проверяем отказы
-    refusal_type = simple_cta_blocker.check_refusal(request.user_id, request.message, current_message_count)
+        log.info("main.process_chat", "✅ SimpleCTABlocker: обнаружено завершённое действие '%s'", completed_action)
     if refusal_type:
-        print(f"🚫 SimpleCTABlocker: обнаружен отказ типа '{refusal_type}'")
+        log.info("main.process_chat", "🚫 SimpleCTABlocker: обнаружен отказ типа '%s'", refusal_type)
     
     # Определяем, нужно ли блокировать CTA
     should_block_cta, block_reason = simple_cta_blocker.should_block_cta(
@@ -492,49 +717,8 @@ async def chat(request: ChatRequest):
     cta_frequency_modifier = simple_cta_blocker.get_cta_frequency_modifier(request.user_id)
     
     if should_block_cta:
-        print(f"🔒 SimpleCTABlocker: CTA заблокированы (причина: {block_reason})")
+        log.info("main.process_chat", "🔒 SimpleCTABlocker: CTA заблокированы (причина: %s)", block_reason)
     
-    # Функция фильтрации offtopic из истории
-    def filter_offtopic_from_history(history_messages):
-        """Убирает пары сообщений (user+assistant), где assistant отвечал на offtopic"""
-        filtered = []
-        offtopic_markers = [
-            "Давайте сосредоточимся на",
-            "Это не связано с нашими курсами",
-            "футбольной секции",
-            "парковка",
-            "пробки",
-            "погода",
-            "перемена в школе",  # Часть юмора про парковку
-            "У нас парковка",    # Начало шутки про парковку
-        ]
-        
-        i = 0
-        while i < len(history_messages):
-            # Проверяем пару user+assistant сообщений
-            if i + 1 < len(history_messages):
-                user_msg = history_messages[i]
-                assistant_msg = history_messages[i + 1]
-                
-                # Если в ответе ассистента есть маркеры offtopic - пропускаем оба сообщения
-                if assistant_msg.get("role") == "assistant":
-                    is_offtopic = any(marker in assistant_msg.get("content", "") for marker in offtopic_markers)
-                    if not is_offtopic:
-                        filtered.append(user_msg)
-                        filtered.append(assistant_msg)
-                    else:
-                        print(f"🔍 Фильтруем offtopic из истории: {user_msg.get('content', '')[:30]}...")
-                    i += 2
-                else:
-                    # Если структура нарушена, добавляем как есть
-                    filtered.append(history_messages[i])
-                    i += 1
-            else:
-                # Последнее сообщение без пары
-                filtered.append(history_messages[i])
-                i += 1
-        
-        return filtered
     
     # Генерация ответа в зависимости от статуса
     if status == "success":
@@ -552,29 +736,25 @@ async def chat(request: ChatRequest):
                     "cta_type": None,
                     "humor_generated": False
                 }
-                print(f"📝 Using pre-generated response for completed action")
+                log.info("main.process_chat", "📝 Using pre-generated response for completed action")
+                if dispatch is not None:
+                    dispatch.cancel()
             else:
-                # Фильтруем offtopic из истории перед передачей в генератор
-                filtered_history = filter_offtopic_from_history(history_messages)
-                
                 # Передаем социальный контекст, user_signal и параметры блокировки CTA
-                # Теперь generate() возвращает tuple (text, metadata)
-                response_text, response_metadata = await response_generator.generate(
-                    {
-                        "status": status,
-                        "documents": documents_used,
-                        "decomposed_questions": decomposed_questions,
-                        "social_context": social_context,  # Передаем контекст
-                        "user_signal": user_signal,  # Передаем user_signal для персонализации
-                        "original_message": request.message,  # Добавляем оригинальное сообщение
-                        "cta_blocked": should_block_cta,  # Передаем флаг блокировки CTA
-                        "cta_frequency_modifier": cta_frequency_modifier,  # Передаем модификатор частоты
-                        "detected_language": detected_language,  # Передаем detected_language для перевода
-                        "block_reason": block_reason if should_block_cta else None,  # Причина блокировки
-                    },
-                    filtered_history,  # Используем отфильтрованную историю
-                    request.message,  # Передаём текущее сообщение отдельно для корректной проверки CTA
+                # (история отфильтрована от offtopic); generate() возвращает tuple (text, metadata)
+                payload = generator_payload(
+                    request, history_messages, route_result, user_signal,
+                    should_block_cta, block_reason, cta_frequency_modifier, memory_prompt,
                 )
+                speculative = await dispatch.take_generation(payload) if dispatch is not None else None
+                if speculative is not None:
+                    # Решение роутера не изменилось — генерация уже шла, пока он дописывал ответ
+                    response_text, response_metadata = speculative
+                else:
+                    doc_texts = await dispatch.documents_for(documents_used) if dispatch is not None else None
+                    response_text, response_metadata = await response_generator.generate(
+                        *payload, doc_texts=doc_texts, on_token=stream.token if stream is not None else None
+                    )
             
             # === ОБРАБОТКА СОЦИАЛЬНЫХ ИНТЕНТОВ ДЛЯ SUCCESS СЛУЧАЕВ ===
             # Правило: Бизнес-интент ВСЕГДА приоритетнее социального
@@ -582,8 +762,7 @@ async def chat(request: ChatRequest):
             # 1. Farewell для success - добавляем прощание в КОНЕЦ ответа
             if social_context == "farewell":
                 # Проверяем, нет ли уже прощания в ответе
-                farewell_markers = ["до свидания", "до встречи", "всего доброго", "удачи", "до связи"]
-                if not any(marker in response_text.lower() for marker in farewell_markers):
+                if not get_keyword_matcher().scan(response_text.lower()).any("main.farewell"):
                     farewells = [
                         "\n\nДо свидания! Будем рады видеть вас в нашей школе!",
                         "\n\nВсего доброго! Обращайтесь, если появятся вопросы!",
@@ -592,20 +771,21 @@ async def chat(request: ChatRequest):
                     ]
                     response_text += random.choice(farewells)
                     if config.LOG_LEVEL == "DEBUG":
-                        print(f"✅ Added farewell to success response")
+                        log.info("main.process_chat", "✅ Added farewell to success response")
             
             # 2. Thanks для success - добавляем короткий префикс
             elif social_context == "thanks":
                 # Проверяем, нет ли уже благодарности в начале
-                thanks_markers = ["рад", "пожалуйста", "всегда пожалуйста"]
-                if not any(response_text.lower().startswith(marker) for marker in thanks_markers):
+                if not get_keyword_matcher().scan(response_text.lower()).starts_with("main.thanks"):
                     thanks_prefixes = ["Рады помочь! ", "Пожалуйста! "]
                     response_text = random.choice(thanks_prefixes) + response_text
                     if config.LOG_LEVEL == "DEBUG":
-                        print(f"✅ Added thanks prefix to success response")
+                        log.info("main.process_chat", "✅ Added thanks prefix to success response")
                         
+        except BulkheadRejected:
+            raise  # Перегрузка генератора — 503 с Retry-After, а не ответ-заглушка
         except Exception as e:
-            print(f"❌ ResponseGenerator failed: {e}")
+            log.error("main.process_chat", "❌ ResponseGenerator failed: %s", e)
             response_text = get_error_response("generation_failed")
             # Создаём metadata для случая ошибки
             response_metadata = {
@@ -616,6 +796,8 @@ async def chat(request: ChatRequest):
                 "humor_generated": False
             }
     else:
+        if dispatch is not None:
+            dispatch.cancel()
         # Для offtopic и need_simplification тоже обрабатываем социальный контекст
         # Определяем, нужно ли добавлять offtopic сообщение
         pure_social_intents = ["greeting", "thanks", "farewell", "apology"]
@@ -641,7 +823,7 @@ async def chat(request: ChatRequest):
         # Проверяем возможность использования юмора для content offtopic
         if status == "offtopic" and not is_pure_social and zhvanetsky_generator and zhvanetsky_safety_checker:
             if is_debug_logging():
-                print(f"🔍 DEBUG main.py: Checking humor for offtopic. user_signal='{user_signal}', is_pure_social={is_pure_social}")
+                log.debug("main.process_chat", "🔍 DEBUG main.py: Checking humor for offtopic. user_signal='%s', is_pure_social=%s", user_signal, is_pure_social)
             
             # Используем глобальный SafetyChecker для проверки
             can_use_humor, humor_context = zhvanetsky_safety_checker.should_use_humor(
@@ -672,14 +854,14 @@ async def chat(request: ChatRequest):
                         zhvanetsky_safety_checker.mark_humor_used(request.user_id)
                         # Помечаем в metadata что юмор был использован
                         response_metadata["humor_generated"] = True
-                        print(f"🎭 Zhvanetsky humor used for user {request.user_id}")
+                        log.info("main.process_chat", "🎭 Zhvanetsky humor used for user %s", request.user_id)
                     else:
                         # Fallback на стандартный offtopic
                         from standard_responses import get_offtopic_response
                         base_message = get_offtopic_response()
                         
                 except Exception as e:
-                    print(f"❌ Zhvanetsky generation failed: {e}")
+                    log.error("main.process_chat", "❌ Zhvanetsky generation failed: %s", e)
                     from standard_responses import get_offtopic_response
                     base_message = get_offtopic_response()
         
@@ -739,7 +921,7 @@ async def chat(request: ChatRequest):
                     "Рада, что понятно! Что ещё рассказать?"
                 ]
                 response_text = random.choice(acknowledgment_responses)
-                print(f"ℹ️ Using acknowledgment response ({message_log_summary(request.message)})")
+                log.info("main.process_chat", "ℹ️ Using acknowledgment response (%s)", message_log_summary(request.message))
             elif social_context == "farewell":
                 # Для прощания используем ТОЛЬКО прощальную фразу, без offtopic сообщения
                 farewells = [
@@ -761,16 +943,8 @@ async def chat(request: ChatRequest):
         history.add_message(request.user_id, "user", request.message)
         # Передаём metadata при сохранении ответа ассистента
         history.add_message(request.user_id, "assistant", response_text, response_metadata)
-        
-        # === СОХРАНЕНИЕ ПЕРСИСТЕНТНОГО СОСТОЯНИЯ ===
-        # Создаём снимок текущего состояния и сохраняем в файл
-        try:
-            state_snapshot = create_state_snapshot(
-                history, user_signals_history, social_state, request.user_id
-            )
-            persistence_manager.save_state(request.user_id, state_snapshot)
-        except Exception as e:
-            print(f"⚠️ Ошибка сохранения состояния для {request.user_id}: {e}")
+        # Память диалога и снимок состояния обновляются после ответа, вне горячего пути
+        asyncio.get_running_loop().call_soon(_after_response, request.user_id)
     
     # Собираем финальные метрики
     latency = time.time() - start
@@ -778,7 +952,7 @@ async def chat(request: ChatRequest):
     total_latency += latency
     
     if config.LOG_LEVEL == "DEBUG":
-        print(f"⏱️ Latency: {latency:.2f}s | Signal: {user_signal}")
+        log.info("main.latency", "⏱️ Latency: %.2fs | Signal: %s", latency, user_signal, latency=round(latency, 3), user_signal=user_signal)
     
     # === ВОЗВРАТ РЕЗУЛЬТАТА ===
     return ChatResponse(
@@ -811,6 +985,10 @@ async def process_chat_message(user_id: str, message: str) -> dict:
     return response.dict()
 
 
+# Задачи /chat/stream, которые дорабатывают после отключения клиента
+_stream_tasks: set = set()
+
+
 @app.get("/chat/stream")
 async def chat_stream(
     user_id: str = Query(..., min_length=1, max_length=50),
@@ -827,51 +1005,81 @@ async def chat_stream(
     except ValidationError as exc:
         raise HTTPException(status_code=422, detail=serializable_validation_errors(exc))
 
+    # Если роутер уже перегружен, отвечаем 503 до открытия стрима
+    rejection = get_bulkheads().for_stage("router").would_reject()
+    if rejection is not None:
+        raise rejection
+
     async def generate():
+        # Пайплайн идёт отдельной задачей: если клиент отключится, ответ всё равно
+        # допишется в историю и состояние сохранится
+        with stream_scope() as stream:
+            task = asyncio.create_task(process_chat_message(user_id, message))
+        _stream_tasks.add(task)
+        task.add_done_callback(_stream_tasks.discard)
         try:
-            # Получаем полный ответ через существующую логику
-            result = await process_chat_message(user_id, message)
-            
-            # Метаданные для отладки (MVP - показываем intent)
-            metadata = {
-                "intent": result.get("intent", "unknown"),
-                "user_signal": result.get("user_signal", "exploring_only"),
-                "humor_generated": result.get("metadata", {}).get("humor_generated", False) if result.get("metadata") else False
-            }
-            
-            # Добавляем язык в метаданные
+            # Метаданные роутера и токены Claude — по мере появления
+            async for event, data in stream.events(task):
+                yield {
+                    "event": event,
+                    "data": json.dumps(data) if event == "metadata" else data
+                }
+            result = await task
+
+            result_metadata = result.get("metadata") or {}
             detected_language = result.get("detected_language", "ru")
-            metadata["detected_language"] = detected_language
-            
-            # Отправляем метаданные
-            yield {
-                "event": "metadata",
-                "data": json.dumps(metadata)
-            }
-            
-            response_text = result.get("response", "")
+            if not stream.metadata_sent:
+                # Ответ без роутера (например, готовый заранее) — метаданные из результата
+                yield {
+                    "event": "metadata",
+                    "data": json.dumps({
+                        "intent": result.get("intent", "unknown"),
+                        "user_signal": result.get("user_signal", "exploring_only"),
+                        "humor_generated": result_metadata.get("humor_generated", False),
+                        "detected_language": detected_language,
+                    })
+                }
 
+            response_text = result.get("response", "")
             if is_debug_logging():
-                newline_count = response_text.count('\n')
-                print(
-                    f"🔍 DEBUG: stream language={detected_language}, "
-                    f"response_len={len(response_text)}, newlines={newline_count}"
-                )
+                log.debug("main.generate", "🔍 DEBUG: stream language=%s, response_len=%s, streamed_len=%s",
+                          detected_language, len(response_text), len(stream.streamed_text))
 
-            async for chunk in stream_response_chunks(response_text):
+            if not stream.streamed:
+                # Генератор не стримил (offtopic, перевод, спекулятивная генерация) — текст целиком
                 yield {
                     "event": "message",
-                    "data": chunk
+                    "data": response_text
                 }
-            
+
+            # Итог после постобработки: CTA, прощание, санитайзинг. replace=True — показать
+            # этот текст вместо накопленного из токенов
+            yield {
+                "event": "final",
+                "data": json.dumps({
+                    "response": response_text,
+                    "replace": bool(stream.streamed) and response_text != stream.streamed_text,
+                    "cta_added": result_metadata.get("cta_added", False),
+                    "cta_type": result_metadata.get("cta_type"),
+                    "humor_generated": result_metadata.get("humor_generated", False),
+                    "relevant_documents": result.get("relevant_documents", []),
+                }, ensure_ascii=False)
+            }
+
             # Завершение стрима
             yield {
                 "event": "done",
                 "data": "completed"
             }
-            
+
+        except BulkheadRejected as e:
+            log.info("main.generate", "🚦 SSE load shedding (%s): %s", e.stage, e.reason)
+            yield {
+                "event": "error",
+                "data": json.dumps({"error": "overloaded", "retry_after": e.retry_after_header})
+            }
         except Exception as e:
-            print(f"❌ SSE Error: {e}")
+            log.error("main.generate", "❌ SSE Error: %s", e)
             yield {
                 "event": "error",
                 "data": "Ошибка при обработке сообщения"
@@ -922,7 +1130,21 @@ async def get_metrics(x_admin_token: Optional[str] = Header(None, alias="X-Admin
         "signal_percentages": percentages,
         "most_common_signal": max(signal_stats, key=signal_stats.get) if request_count > 0 and signal_stats else None,
         "zhvanetsky_humor": zhvanetsky_metrics,
-        "persistence": persistence_metrics
+        "persistence": persistence_metrics,
+        "conversation_memory": history.get_memory_stats() if history else {"enabled": False},
+        "http_pool": get_http_pool().get_stats(),
+        "llm_coalescing": get_singleflight().get_stats(),
+        "llm_resilience": get_resilience_executor().get_stats(),
+        "model_health": get_model_health().get_stats(),
+        "usage": get_usage_ledger().get_stats(),
+        "bulkheads": get_bulkheads().get_stats(),
+        "keyword_matcher": get_keyword_matcher().get_stats(),
+        "documents": get_document_store().get_stats(),
+        "passages": response_generator.passages.get_stats(),
+        "postprocess": response_generator.postprocessor.get_stats(),
+        "answer_cache": response_generator.answer_cache.get_stats() if response_generator.answer_cache is not None else {"enabled": False},
+        "safety_rules": zhvanetsky_safety_checker.engine.get_stats() if zhvanetsky_safety_checker else {"enabled": False},
+        "router": {**router.get_stats(), "early_dispatch": get_early_dispatch_stats()}
     }
 
 
@@ -957,12 +1179,12 @@ async def trial_signup(request: TrialSignupRequest):
     Эндпоинт для регистрации на пробный урок
     Создает или обновляет контакт в HubSpot CRM
     """
-    print(f"📝 Trial signup request: email={redact_email(request.email)}")
+    log.info("main.trial_signup", "📝 Trial signup request: email=%s", redact_email(request.email))
 
     try:
         # Проверяем наличие HubSpot API ключа
         if not config.HUBSPOT_PRIVATE_APP_TOKEN:
-            print("❌ HubSpot API key не настроен")
+            log.error("main.trial_signup", "❌ HubSpot API key не настроен")
             return TrialSignupResponse(
                 success=False,
                 message="Сервис временно недоступен. Пожалуйста, попробуйте позже.",
@@ -992,7 +1214,7 @@ async def trial_signup(request: TrialSignupRequest):
 
         if result:
             action_text = "обновлена" if result.get("existing") else "создана"
-            print(f"✅ Заявка на пробный урок обработана: email={redact_email(request.email)} ({action_text})")
+            log.info("main.trial_signup", "✅ Заявка на пробный урок обработана: email=%s (%s)", redact_email(request.email), action_text)
 
             return TrialSignupResponse(
                 success=True,
@@ -1000,7 +1222,7 @@ async def trial_signup(request: TrialSignupRequest):
                 action=result.get("action")
             )
         else:
-            print(f"❌ Ошибка обработки заявки: email={redact_email(request.email)}")
+            log.error("main.trial_signup", "❌ Ошибка обработки заявки: email=%s", redact_email(request.email))
             return TrialSignupResponse(
                 success=False,
                 message="Произошла ошибка при обработке заявки. Пожалуйста, попробуйте еще раз.",
@@ -1008,7 +1230,7 @@ async def trial_signup(request: TrialSignupRequest):
             )
 
     except Exception as e:
-        print(f"❌ Критическая ошибка в trial_signup: {e}")
+        log.error("main.trial_signup", "❌ Критическая ошибка в trial_signup: %s", e)
         return TrialSignupResponse(
             success=False,
             message="Временная техническая проблема. Мы уже работаем над её решением.",
@@ -1038,7 +1260,7 @@ else:
 # Нормализуем путь и создаём директорию
 static_dir = os.path.normpath(static_dir)
 os.makedirs(static_dir, exist_ok=True)
-print(f"📂 Static files directory: {static_dir}")
+log.info("main.startup", "📂 Static files directory: %s", static_dir)
 
 app.mount("/", StaticFiles(directory=static_dir, html=True), name="static")
 
@@ -0,0 +1,199 @@
+"""
+model_health.py - Circuit breaker по моделям и цепочка фолбэков для стадий пайплайна
+
+Для каждой стадии (router, generator, translator, humor) есть упорядоченный список
+моделей: основная из Config плюс фолбэки. Модель с открытым breaker пропускается,
+среди здоровых выбирается заметно более быстрая по скользящей задержке.
+"""
+
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from config import Config
+
+
+class CircuitBreaker:
+    """Breaker одной модели: closed → open → half_open → closed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: Optional[int] = None,
+        slow_call_ratio: Optional[float] = None,
+        window: Optional[int] = None,
+        min_calls: Optional[int] = None,
+        open_seconds: Optional[float] = None,
+        half_open_probes: Optional[int] = None,
+    ):
+        self.failure_threshold = failure_threshold or Config.CIRCUIT_FAILURE_THRESHOLD
+        self.slow_call_ratio = slow_call_ratio or Config.CIRCUIT_SLOW_CALL_RATIO
+        self.min_calls = min_calls or Config.CIRCUIT_MIN_CALLS
+        self.open_seconds = open_seconds if open_seconds is not None else Config.CIRCUIT_OPEN_SECONDS
+        self.half_open_probes = half_open_probes or Config.CIRCUIT_HALF_OPEN_PROBES
+
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.probes_in_flight = 0
+        # Окно последних вызовов: True — медленный или неудачный
+        self.calls: Deque[bool] = deque(maxlen=window or Config.CIRCUIT_WINDOW)
+        self.times_opened = 0
+
+    def is_available(self) -> bool:
+        """Не открыт (или время открытия истекло) — без резервирования пробы"""
+        return self.state != self.OPEN or time.monotonic() - self.opened_at >= self.open_seconds
+
+    def allow_request(self) -> bool:
+        """Можно ли отправить запрос в эту модель сейчас"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self.probes_in_flight = 0
+        if self.state == self.HALF_OPEN:
+            if self.probes_in_flight >= self.half_open_probes:
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def release_probe(self) -> None:
+        """Проба завершилась без вердикта о здоровье модели (ошибка самого запроса)"""
+        if self.state == self.HALF_OPEN and self.probes_in_flight > 0:
+            self.probes_in_flight -= 1
+
+    def record_success(self, slow: bool = False) -> None:
+        if self.state == self.HALF_OPEN:
+            if slow:
+                self._open()
+                return
+            self._close()
+            return
+        self.consecutive_failures = 0
+        self.calls.append(slow)
+        self._check_slow_ratio()
+
+    def record_failure(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self._open()
+            return
+        self.consecutive_failures += 1
+        self.calls.append(True)
+        if self.consecutive_failures >= self.failure_threshold:
+            self._open()
+        else:
+            self._check_slow_ratio()
+
+    def _check_slow_ratio(self) -> None:
+        if len(self.calls) >= self.min_calls and sum(self.calls) / len(self.calls) >= self.slow_call_ratio:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.probes_in_flight = 0
+        self.times_opened += 1
+
+    def _close(self) -> None:
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.probes_in_flight = 0
+        self.calls.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "bad_call_ratio": round(sum(self.calls) / len(self.calls), 3) if self.calls else 0.0,
+            "window_calls": len(self.calls),
+            "times_opened": self.times_opened,
+        }
+
+
+class ModelHealthRegistry:
+    """Breakers и скользящая задержка по моделям, выбор модели для стадии"""
+
+    def __init__(self, latency_window: int = 50):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # (stage, model) -> последние задержки успешных вызовов
+        self.latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self.latency_window = latency_window
+        self.stats = {"fallback_calls": 0, "all_open_rejections": 0}
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        if model not in self.breakers:
+            self.breakers[model] = CircuitBreaker()
+        return self.breakers[model]
+
+    def avg_latency(self, stage: str, model: str) -> Optional[float]:
+        samples = self.latencies.get((stage, model))
+        if not samples:
+            return None
+        return sum(samples) / len(samples)
+
+    def chain_for(self, stage: str, primary: str) -> List[str]:
+        """Основная модель + фолбэки стадии без дублей, в порядке из Config"""
+        chain = [primary]
+        for model in Config.MODEL_FALLBACKS.get(stage, []):
+            if model not in chain:
+                chain.append(model)
+        return chain
+
+    def candidates(self, stage: str, primary: str) -> List[str]:
+        """
+        Модели для попытки по порядку: здоровые, самая быстрая первой
+
+        Фолбэк обгоняет модель выше по списку, только если она заметно быстрее
+        (MODEL_LATENCY_SWITCH_RATIO) — без замеров порядок из Config сохраняется.
+        """
+        healthy = [model for model in self.chain_for(stage, primary) if self.breaker(model).is_available()]
+
+        ranked: List[str] = []
+        for model in healthy:
+            position = len(ranked)
+            latency = self.avg_latency(stage, model)
+            if latency is not None:
+                while position > 0:
+                    ahead = self.avg_latency(stage, ranked[position - 1])
+                    if ahead is None or ahead < latency * Config.MODEL_LATENCY_SWITCH_RATIO:
+                        break
+                    position -= 1
+            ranked.insert(position, model)
+        return ranked
+
+    def record_success(self, stage: str, model: str, latency: float) -> None:
+        samples = self.latencies.setdefault((stage, model), deque(maxlen=self.latency_window))
+        samples.append(latency)
+        slow_after = Config.CIRCUIT_SLOW_CALL_SECONDS.get(stage, Config.CIRCUIT_SLOW_CALL_SECONDS["default"])
+        self.breaker(model).record_success(slow=latency > slow_after)
+
+    def record_failure(self, stage: str, model: str) -> None:
+        self.breaker(model).record_failure()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        return {
+            "breakers": {model: breaker.get_stats() for model, breaker in self.breakers.items()},
+            "avg_latency": {
+                f"{stage}:{model}": round(self.avg_latency(stage, model), 3)
+                for stage, model in self.latencies
+            },
+            "fallback_chains": {
+                stage: models for stage, models in Config.MODEL_FALLBACKS.items() if models
+            },
+            **self.stats,
+        }
+
+
+_registry: Optional[ModelHealthRegistry] = None
+
+
+def get_model_health() -> ModelHealthRegistry:
+    """Общий реестр процесса"""
+    global _registry
+    if _registry is None:
+        _registry = ModelHealthRegistry()
+    return _registry
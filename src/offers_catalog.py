@@ -4,6 +4,9 @@ offers_catalog.py - Каталог персонализированных пре
 """
 
 import random  # Добавляем для лучшей случайности выбора
+from event_log import get_logger
+
+log = get_logger(__name__)
 
 # Каталог предложений для каждого user_signal
 OFFERS_CATALOG = {
@@ -174,7 +177,7 @@ def get_offer(user_signal: str, history: list = None) -> dict:
         
         # Логируем для отладки
         variant_index = offer["text_variants"].index(selected_variant)
-        print(f"🎲 CTA вариант #{variant_index + 1} из {len(offer['text_variants'])} для {user_signal}")
+        log.info("offers.get_offer", "🎲 CTA вариант #%s из %s для %s", variant_index + 1, len(offer['text_variants']), user_signal)
     
     return offer
 
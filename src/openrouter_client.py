@@ -3,40 +3,72 @@ openrouter_client.py - Клиент для OpenRouter API
 MVP версия: минимум кода для работы
 """
 
+import asyncio
+import hashlib
+import time
 import httpx
 import json
 from typing import List, Dict, Optional, Any
 
+from http_pool import HttpPool, get_http_pool
+from singleflight import get_singleflight
+from llm_resilience import LLMAttemptError, get_resilience_executor
+from model_health import get_model_health
+from config import Config
+from bulkhead import get_bulkheads
+from usage_accounting import LLMResult, estimate_cost, get_usage_ledger, parse_usage
+from event_log import get_logger
+
+log = get_logger(__name__)
+
 class OpenRouterClient:
     """Клиент для работы с OpenRouter API"""
     
-    def __init__(self, api_key: str, seed: int = None, max_tokens: int = None, temperature: float = 0.3, model: Optional[str] = None):
+    def __init__(self, api_key: str, seed: int = None, max_tokens: int = None, temperature: float = 0.3, model: Optional[str] = None, http_pool: Optional[HttpPool] = None, stage: str = "default"):
         """Инициализация с API ключом и параметрами для оптимальной классификации"""
+        self.stage = stage  # Точка вызова: определяет бюджет времени и статистику задержек
         self.api_key = api_key
-        self.api_url = "https://openrouter.ai/api/v1/chat/completions"
+        self._http_pool = http_pool
+        self.api_url = Config.API_URL
         self.model = model or "google/gemini-2.5-flash"
         self.seed = seed
         self.max_tokens = max_tokens
         self.temperature = temperature
+
+    @property
+    def http_pool(self) -> HttpPool:
+        """Пул соединений: явно переданный или общий пул процесса"""
+        return self._http_pool or get_http_pool()
     
-    async def chat(self, messages: List[Dict[str, str]], *, model: Optional[str] = None, temperature: Optional[float] = None, max_tokens: Optional[int] = None, seed: Optional[int] = None, response_format: Optional[Dict[str, Any]] = None, top_p: Optional[float] = None, frequency_penalty: Optional[float] = None, presence_penalty: Optional[float] = None) -> str:
+    async def chat(self, messages: List[Dict[str, str]], **kwargs) -> str:
         """
-        Отправляет сообщения в API и получает ответ
-        
+        Отправляет сообщения в API и получает текст ответа
+
         Args:
             messages: История диалога [{"role": "user", "content": "..."}]
+            **kwargs: Параметры chat_result
         Returns:
-            Текст ответа от модели
+            Текст ответа от модели или пустая строка, если все попытки неудачны
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        result = await self.chat_result(messages, **kwargs)
+        return result.text
+
+    async def chat_result(self, messages: List[Dict[str, str]], *, model: Optional[str] = None, temperature: Optional[float] = None, max_tokens: Optional[int] = None, seed: Optional[int] = None, response_format: Optional[Dict[str, Any]] = None, top_p: Optional[float] = None, frequency_penalty: Optional[float] = None, presence_penalty: Optional[float] = None, coalesce: bool = False, stage: Optional[str] = None) -> LLMResult:
+        """
+        Отправляет сообщения в API и возвращает структурированный результат
         
+        Args:
+            messages: История диалога [{"role": "user", "content": "..."}]
+            coalesce: Склеивать одновременные идентичные запросы в один upstream-вызов
+            stage: Точка вызова (router, generator, translator, humor); по умолчанию stage клиента
+        Returns:
+            LLMResult: текст, модель, токены, задержка и стоимость вызова
+        """
         data: Dict[str, Any] = {
             "model": model or self.model,
             "messages": messages,
             "temperature": self.temperature if temperature is None else temperature,
+            "usage": {"include": True},  # OpenRouter вернёт токены (в т.ч. кешированные) и стоимость
         }
         
         # Добавляем опциональные параметры если они заданы
@@ -57,61 +89,179 @@ class OpenRouterClient:
             data["frequency_penalty"] = frequency_penalty
         if presence_penalty is not None:
             data["presence_penalty"] = presence_penalty
-        
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:  # 30 секунд таймаут для предотвращения зависания
-                print(f"🔍 Отправляю запрос к OpenRouter: {data.get('model')}")
-                print(f"🔍 Размер промпта: {len(str(data))} символов")
-                
-                response = await client.post(
-                    self.api_url,
-                    headers=headers,
-                    json=data,
-                    timeout=30.0
+
+        if coalesce:
+            # Ключ: URL + модель + сообщения + все параметры генерации
+            payload = json.dumps(data, sort_keys=True, ensure_ascii=False)
+            key = hashlib.sha256(f"{self.api_url}\n{payload}".encode()).hexdigest()
+            return await get_singleflight().do(key, lambda: self._send(data, stage))
+        return await self._send(data, stage)
+
+    async def _send(self, data: Dict[str, Any], stage: Optional[str] = None) -> LLMResult:
+        """
+        Выполняет запрос по цепочке моделей стадии с повторами и хеджированием
+
+        Модели с открытым circuit breaker пропускаются; при неудаче основной модели
+        запрос уходит в следующую модель цепочки в пределах общего бюджета стадии.
+        Если все попытки неудачны, возвращает результат с пустым текстом (ok=False).
+        Каждый вызов учитывается в журнале использования.
+
+        Raises:
+            BulkheadRejected: Стадия перегружена (очередь заполнена или ждать слишком долго)
+        """
+        stage = stage or self.stage
+        async with get_bulkheads().for_stage(stage).slot():
+            result = await self._send_chain(data, stage)
+        if result.cost is None and result.ok:
+            result.cost = estimate_cost(result.model, result.prompt_tokens, result.completion_tokens, result.cached_tokens)
+        get_usage_ledger().record(result)
+        return result
+
+    async def _send_chain(self, data: Dict[str, Any], stage: str) -> LLMResult:
+        """Перебирает модели цепочки стадии до первого успешного ответа"""
+        executor = get_resilience_executor()
+        health = get_model_health()
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        deadline = started_at + executor.budget_for(stage)
+        primary = data.get("model", "")
+        log.info("llm.request", "🔍 Отправляю запрос к OpenRouter: %s (%s)", primary, stage, model=primary, stage=stage)
+
+        attempted = False
+        candidates = health.candidates(stage, primary)
+        for index, model in enumerate(candidates):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            if index < len(candidates) - 1:
+                # Оставляем часть бюджета следующим моделям цепочки
+                remaining *= Config.MODEL_BUDGET_SHARE
+            if not health.breaker(model).allow_request():
+                continue
+            if model != primary:
+                health.stats["fallback_calls"] += 1
+                log.info("openrouter.send_chain", "↪️ Фолбэк %s: %s → %s", stage, primary, model)
+            attempted = True
+            request_data = data if model == primary else {**data, "model": model}
+            started = time.perf_counter()
+            try:
+                result = await executor.run(
+                    lambda timeout, payload=request_data: self._attempt(payload, timeout),
+                    stage=stage,
+                    model=model,
+                    budget=remaining,
                 )
-                
-                print(f"🔍 HTTP статус: {response.status_code}")
-                
-                # Проверяем HTTP статус
-                if response.status_code != 200:
-                    print(f"❌ API ошибка {response.status_code}: {response.text[:500]}")
-                    return ""
-                
-                # Парсим ответ
-                result = response.json()
-                
-                # Безопасное извлечение ответа
-                if "choices" in result and len(result["choices"]) > 0:
-                    choice = result["choices"][0]
-                    # Пробуем разные варианты получения контента
-                    content = None
-                    
-                    # Стандартный формат OpenAI
-                    if "message" in choice and "content" in choice["message"]:
-                        content = choice["message"]["content"]
-                    # Альтернативный формат (некоторые модели)
-                    elif "text" in choice:
-                        content = choice["text"]
-                    # Прямой content в choice
-                    elif "content" in choice:
-                        content = choice["content"]
-                    
-                    if not content or content.strip() == "":
-                        print("⚠️ API вернул пустой content")
-                        print(f"🔍 Содержимое choices[0]: {choice}")
-                        # Попробуем альтернативный подход для streaming ответов
-                        if "delta" in choice and "content" in choice["delta"]:
-                            content = choice["delta"]["content"]
-                    else:
-                        print(f"✅ Получен ответ длиной {len(content)} символов")
-                    return content or ""
-                else:
-                    print("❌ API не вернул choices")
-                    print(f"🔍 Структура ответа: {list(result.keys())}")
-                    return ""
-                    
+            except LLMAttemptError as e:
+                log.error("openrouter.send_chain", "❌ Запрос к %s (%s) не удался: %s", model, stage, e.reason)
+                if e.model_unhealthy:
+                    health.record_failure(stage, model)
+                    continue
+                health.breaker(model).release_probe()
+                break
+            except Exception as e:
+                log.error("openrouter.send_chain", "❌ Ошибка: %s", e)
+                health.breaker(model).release_probe()
+                break
+            health.record_success(stage, model, time.perf_counter() - started)
+            result.stage = stage
+            result.total_latency = loop.time() - started_at
+            return result
+
+        if not attempted:
+            health.stats["all_open_rejections"] += 1
+            log.warning("openrouter.send_chain", "⛔ Все модели стадии %s недоступны (circuit breaker открыт)", stage)
+        return LLMResult(text="", model=primary, stage=stage, total_latency=loop.time() - started_at, ok=False)
+
+    async def _attempt(self, data: Dict[str, Any], timeout: float) -> LLMResult:
+        """Одна попытка HTTP-запроса к API: текст ответа и блок usage"""
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+        client = self.http_pool.get_client(self.api_url)
+        started = time.perf_counter()
+        try:
+            response = await client.post(
+                self.api_url,
+                headers=headers,
+                json=data,
+                timeout=min(timeout, 30.0)
+            )
         except httpx.TimeoutException:
-            return "Превышено время ожидания ответа"
-        except Exception as e:
-            print(f"❌ Ошибка: {e}")
-            return "Произошла ошибка при обработке запроса"
\ No newline at end of file
+            raise LLMAttemptError("timeout")
+        except httpx.TransportError as e:
+            raise LLMAttemptError(f"transport error: {e}")
+
+        latency = time.perf_counter() - started
+        log.debug("openrouter.attempt", "🔍 HTTP статус: %s", response.status_code)
+
+        # Проверяем HTTP статус: 429 и 5xx имеет смысл повторить
+        if response.status_code != 200:
+            log.error("openrouter.attempt", "❌ API ошибка %s: %s", response.status_code, response.text[:500])
+            retryable = response.status_code == 429 or response.status_code >= 500
+            raise LLMAttemptError(
+                f"HTTP {response.status_code}",
+                retryable=retryable,
+                status_code=response.status_code,
+                retry_after=self._parse_retry_after(response.headers.get("Retry-After")),
+            )
+
+        # Парсим ответ. 200 без ответа модели (не JSON, {"error": ...}, нет choices, пустой
+        # content) — тоже сбой модели: повтор, счётчик circuit breaker и фолбэк по цепочке
+        try:
+            result = response.json()
+        except ValueError:
+            log.error("openrouter.attempt", "❌ API вернул не JSON: %s", response.text[:500])
+            raise LLMAttemptError("invalid JSON body")
+        if not isinstance(result, dict):
+            raise LLMAttemptError("invalid JSON body")
+        if result.get("error"):
+            error = result["error"]
+            message = error.get("message", error) if isinstance(error, dict) else error
+            log.error("openrouter.attempt", "❌ API вернул ошибку с HTTP 200: %s", message)
+            raise LLMAttemptError(f"error in body: {message}")
+        usage = parse_usage(result.get("usage"))
+        model = result.get("model") or data.get("model", "")
+
+        # Безопасное извлечение ответа
+        if "choices" not in result or len(result["choices"]) == 0:
+            log.error("openrouter.attempt", "❌ API не вернул choices")
+            log.debug("openrouter.attempt", "🔍 Структура ответа: %s", list(result.keys()))
+            raise LLMAttemptError("no choices")
+
+        choice = result["choices"][0]
+        # Пробуем разные варианты получения контента
+        content = None
+
+        # Стандартный формат OpenAI
+        if "message" in choice and "content" in choice["message"]:
+            content = choice["message"]["content"]
+        # Альтернативный формат (некоторые модели)
+        elif "text" in choice:
+            content = choice["text"]
+        # Прямой content в choice
+        elif "content" in choice:
+            content = choice["content"]
+
+        if not content or content.strip() == "":
+            # Попробуем альтернативный подход для streaming ответов
+            if "delta" in choice and "content" in choice["delta"]:
+                content = choice["delta"]["content"]
+        if not content or content.strip() == "":
+            log.warning("openrouter.attempt", "⚠️ API вернул пустой content")
+            log.debug("openrouter.attempt", "🔍 Содержимое choices[0]: %s", choice)
+            raise LLMAttemptError("empty content")
+
+        log.info("llm.response", "✅ Получен ответ длиной %s символов", len(content), model=model, chars=len(content), latency=round(latency, 3))
+        return LLMResult(text=content, model=model, stage=self.stage, latency=latency, **usage)
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """Retry-After в секундах (даты не поддерживаем — используем backoff)"""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
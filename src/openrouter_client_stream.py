@@ -3,9 +3,23 @@
 """
 
 import json
-import httpx
+import time
+from dataclasses import dataclass
 from typing import List, Dict, Optional, Any, AsyncGenerator
 
+from usage_accounting import LLMResult, estimate_cost, get_usage_ledger, parse_usage
+from event_log import get_logger
+
+log = get_logger(__name__)
+
+
+@dataclass
+class StreamOutcome:
+    """Чем закончился стрим: без completed ответ мог оборваться на середине"""
+    completed: bool = False  # Пришёл [DONE] или finish_reason
+    error: Optional[str] = None  # Ошибка транспорта/HTTP, если была
+
+
 async def chat_stream(
     client, 
     messages: List[Dict[str, str]], 
@@ -13,7 +27,10 @@ async def chat_stream(
     model: Optional[str] = None, 
     temperature: Optional[float] = None, 
     max_tokens: Optional[int] = None, 
-    seed: Optional[int] = None
+    seed: Optional[int] = None,
+    http_pool=None,
+    stage: Optional[str] = None,
+    outcome: Optional[StreamOutcome] = None,
 ) -> AsyncGenerator[str, None]:
     """
     Стримит ответ от модели по частям
@@ -21,6 +38,10 @@ async def chat_stream(
     Args:
         client: Экземпляр OpenRouterClient
         messages: История диалога
+        http_pool: Пул соединений (по умолчанию пул клиента)
+        stage: Стадия для учёта использования (по умолчанию stage клиента)
+        outcome: Сюда записывается, дошёл ли стрим до конца. Ошибки стрима не
+            пробрасываются, поэтому без outcome оборванный ответ неотличим от полного
     Yields:
         Части текста по мере генерации
     """
@@ -33,7 +54,8 @@ async def chat_stream(
         "model": model or client.model,
         "messages": messages,
         "temperature": client.temperature if temperature is None else temperature,
-        "stream": True  # Включаем стриминг!
+        "stream": True,  # Включаем стриминг!
+        "usage": {"include": True}  # Последний чанк содержит токены и стоимость
     }
     
     # Добавляем опциональные параметры
@@ -46,27 +68,52 @@ async def chat_stream(
     elif client.max_tokens is not None:
         data["max_tokens"] = client.max_tokens
     
+    outcome = outcome if outcome is not None else StreamOutcome()
+    started = time.perf_counter()
+    usage: Dict[str, Any] = {}
+    pieces: List[str] = []
     try:
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            async with http_client.stream("POST", client.api_url, headers=headers, json=data) as response:
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        try:
-                            chunk_data = line[6:]  # Убираем "data: "
-                            if chunk_data == "[DONE]":
-                                break
-                            
-                            chunk = json.loads(chunk_data)
-                            if "choices" in chunk and len(chunk["choices"]) > 0:
-                                choice = chunk["choices"][0]
-                                if "delta" in choice and "content" in choice["delta"]:
-                                    content = choice["delta"]["content"]
-                                    if content:
-                                        yield content
-                        except json.JSONDecodeError:
-                            continue
+        pool = http_pool or client.http_pool
+        http_client = pool.get_client(client.api_url)
+        async with http_client.stream("POST", client.api_url, headers=headers, json=data, timeout=30.0) as response:
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    try:
+                        chunk_data = line[6:]  # Убираем "data: "
+                        if chunk_data == "[DONE]":
+                            outcome.completed = True
+                            break
+                        
+                        chunk = json.loads(chunk_data)
+                        if chunk.get("usage"):
+                            usage = parse_usage(chunk["usage"])
+                        if "choices" in chunk and len(chunk["choices"]) > 0:
+                            choice = chunk["choices"][0]
+                            if choice.get("finish_reason"):
+                                outcome.completed = True
+                            if "delta" in choice and "content" in choice["delta"]:
+                                content = choice["delta"]["content"]
+                                if content:
+                                    pieces.append(content)
+                                    yield content
+                    except json.JSONDecodeError:
+                        continue
                             
     except Exception as e:
-        print(f"❌ Ошибка стриминга: {e}")
-        # В случае ошибки возвращаем пустую строку
-        return
\ No newline at end of file
+        outcome.error = str(e) or type(e).__name__
+        log.error("openrouter.chat_stream", "❌ Ошибка стриминга: %s", outcome.error)
+        return
+    finally:
+        elapsed = time.perf_counter() - started
+        result = LLMResult(
+            text="".join(pieces),
+            model=data["model"],
+            stage=stage or getattr(client, "stage", "default"),
+            latency=elapsed,
+            total_latency=elapsed,
+            ok=bool(pieces) and outcome.error is None,
+            **usage,
+        )
+        if result.cost is None and result.ok:
+            result.cost = estimate_cost(result.model, result.prompt_tokens, result.completion_tokens, result.cached_tokens)
+        get_usage_ledger().record(result)
\ No newline at end of file
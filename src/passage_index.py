@@ -0,0 +1,257 @@
+"""
+passage_index.py - Отбор фрагментов документов для промпта генератора
+
+ResponseGenerator раньше вставлял в промпт полные тексты всех документов,
+выбранных роутером. PassageIndex режет документы по markdown-заголовкам на
+фрагменты (разделы до PASSAGE_HEADING_LEVEL), один раз токенизирует каждый и
+на запрос выбирает по BM25 фрагменты, относящиеся к decomposed_questions, в
+пределах бюджета токенов. Каждый вопрос получает свой лучший фрагмент раньше,
+чем остальные — вторые, поэтому многовопросные сообщения не теряют ответов.
+
+Фрагменты с таблицами и документы из whole_documents (pricing.md и т.п.)
+отдаются целиком всегда. Если документы и так помещаются в бюджет или ни один
+фрагмент не совпал с вопросами, отдаются полные тексты — как раньше.
+"""
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Tuple
+
+from prompt_segments import estimate_tokens
+from text_tokens import tokenize
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+
+HEADING_WEIGHT = 2  # Термы заголовков раздела считаются дважды
+
+
+@dataclass(frozen=True)
+class Passage:
+    """Раздел документа между заголовками"""
+    id: str  # "pricing.md#2"
+    document: str
+    position: int  # Порядковый номер в документе
+    heading: str  # Путь заголовков: "СТОИМОСТЬ И ОПЛАТА > ЦЕНЫ"
+    text: str
+    tokens: int
+    has_table: bool
+    terms: Counter
+
+
+@dataclass
+class PassageSelection:
+    """Фрагменты для промпта генератора"""
+    doc_texts: Dict[str, str]  # Документ → текст фрагментов с метками (порядок документов сохранён)
+    passage_ids: List[str]  # Пустой список — отданы полные документы
+    tokens: int
+    full_tokens: int
+    mode: str  # "passages" | "full_small" | "full_no_match" | "disabled"
+
+
+def split_passages(document: str, text: str, heading_level: int = 2) -> List[Passage]:
+    """
+    Режет документ на разделы по заголовкам уровня не глубже heading_level
+
+    Заголовок без собственного текста (например, "# СТОИМОСТЬ" сразу перед "## ЦЕНЫ")
+    присоединяется к следующему разделу. Более глубокие заголовки остаются внутри
+    раздела, так что таблица или список цен не разрезаются.
+    """
+    sections: List[Tuple[List[str], List[str]]] = []  # (путь заголовков, строки)
+    path: List[Tuple[int, str]] = []
+    lines: List[str] = []
+    carried: List[str] = []
+
+    def flush() -> None:
+        nonlocal lines, carried
+        body = [line for line in lines if line.strip() and not _is_heading(line, heading_level)]
+        if body:
+            sections.append(([title for _, title in path], carried + lines))
+            carried = []
+        else:
+            carried = carried + lines
+        lines = []
+
+    for line in text.splitlines():
+        match = _HEADING_RE.match(line)
+        if match and len(match.group(1)) <= heading_level:
+            flush()
+            level = len(match.group(1))
+            path = [(lvl, title) for lvl, title in path if lvl < level] + [(level, match.group(2))]
+        lines.append(line)
+    flush()
+    if carried and sections:
+        heading, body = sections[-1]
+        sections[-1] = (heading, body + carried)
+
+    passages = []
+    for position, (heading_path, body) in enumerate(sections, 1):
+        passage_text = "\n".join(body).strip()
+        heading = " > ".join(heading_path)
+        terms = Counter(tokenize(passage_text))
+        for term in tokenize(heading):
+            terms[term] += HEADING_WEIGHT - 1  # Заголовок уже учтён в тексте один раз
+        passages.append(Passage(
+            id=f"{document}#{position}",
+            document=document,
+            position=position,
+            heading=heading,
+            text=passage_text,
+            tokens=estimate_tokens(passage_text),
+            has_table=any(line.lstrip().startswith("|") for line in body),
+            terms=terms,
+        ))
+    return passages
+
+
+def _is_heading(line: str, heading_level: int) -> bool:
+    match = _HEADING_RE.match(line)
+    return bool(match) and len(match.group(1)) <= heading_level
+
+
+def render_passages(passages: Iterable[Passage]) -> str:
+    """Текст фрагментов с метками для промпта"""
+    return "\n\n".join(
+        f"[{passage.id}{' · ' + passage.heading if passage.heading else ''}]\n{passage.text}"
+        for passage in passages
+    )
+
+
+class PassageIndex:
+    """Фрагменты документов и их выбор под вопросы пользователя"""
+
+    def __init__(
+        self,
+        token_budget: int = 3000,
+        heading_level: int = 2,
+        whole_documents: Iterable[str] = (),
+        enabled: bool = True,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        """
+        Args:
+            token_budget: Сколько токенов (оценка estimate_tokens) документов отдавать в промпт
+            heading_level: До какого уровня заголовков резать документы
+            whole_documents: Документы, которые всегда отдаются целиком
+            enabled: False — всегда полные документы
+        """
+        self.token_budget = token_budget
+        self.heading_level = heading_level
+        self.whole_documents = frozenset(whole_documents)
+        self.enabled = enabled
+        self.k1 = k1
+        self.b = b
+        self._passages: Dict[str, Tuple[str, List[Passage]]] = {}  # документ → (текст, фрагменты)
+        self.stats = {
+            "selections": 0,
+            "full_small": 0,  # документы и так помещаются в бюджет
+            "full_no_match": 0,  # ни один фрагмент не совпал с вопросами
+            "splits": 0,
+            "tokens_full_total": 0,
+            "tokens_sent_total": 0,
+        }
+
+    def passages(self, document: str, text: str) -> List[Passage]:
+        """Фрагменты документа (нарезка запоминается, пока текст не изменится)"""
+        cached = self._passages.get(document)
+        if cached is not None and (cached[0] is text or cached[0] == text):
+            return cached[1]
+        passages = split_passages(document, text, self.heading_level)
+        self._passages[document] = (text, passages)
+        self.stats["splits"] += 1
+        return passages
+
+    def select(self, doc_texts: Dict[str, str], questions: List[str]) -> PassageSelection:
+        """
+        Фрагменты выбранных роутером документов под вопросы
+
+        Args:
+            doc_texts: Документ → полный текст (как из DocumentStore)
+            questions: decomposed_questions роутера
+        Returns:
+            PassageSelection; при mode != "passages" doc_texts — полные тексты
+        """
+        full_tokens = sum(estimate_tokens(text) for text in doc_texts.values())
+        self.stats["tokens_full_total"] += full_tokens
+
+        def full(mode: str) -> PassageSelection:
+            if mode in self.stats:
+                self.stats[mode] += 1
+            self.stats["tokens_sent_total"] += full_tokens
+            return PassageSelection(dict(doc_texts), [], full_tokens, full_tokens, mode)
+
+        if not self.enabled:
+            return full("disabled")
+        if full_tokens <= self.token_budget:
+            return full("full_small")
+
+        pinned: List[Passage] = []
+        candidates: List[Passage] = []
+        for document, text in doc_texts.items():
+            for passage in self.passages(document, text):
+                (pinned if document in self.whole_documents or passage.has_table else candidates).append(passage)
+
+        rankings = [ranking for ranking in (self._rank(question, candidates) for question in questions) if ranking]
+        if not rankings:
+            return full("full_no_match")
+
+        chosen = {passage.id: passage for passage in pinned}
+        used = sum(passage.tokens for passage in pinned)
+        # По кругу: лучший фрагмент каждого вопроса, затем вторые и т.д.
+        for depth in range(max(len(ranking) for ranking in rankings)):
+            for ranking in rankings:
+                if depth >= len(ranking):
+                    continue
+                passage = ranking[depth]
+                if passage.id in chosen or used + passage.tokens > self.token_budget:
+                    continue
+                chosen[passage.id] = passage
+                used += passage.tokens
+
+        selected: Dict[str, str] = {}
+        passage_ids: List[str] = []
+        for document, text in doc_texts.items():
+            passages = [passage for passage in self.passages(document, text) if passage.id in chosen]
+            if passages:
+                selected[document] = render_passages(passages)
+                passage_ids.extend(passage.id for passage in passages)
+        tokens = sum(estimate_tokens(text) for text in selected.values())
+        self.stats["selections"] += 1
+        self.stats["tokens_sent_total"] += tokens
+        return PassageSelection(selected, passage_ids, tokens, full_tokens, "passages")
+
+    def _rank(self, question: str, passages: List[Passage]) -> List[Passage]:
+        """BM25 фрагментов по одному вопросу (только с ненулевой оценкой, лучшие первыми)"""
+        query = set(tokenize(question))
+        if not query or not passages:
+            return []
+        count = len(passages)
+        lengths = [sum(passage.terms.values()) for passage in passages]
+        avg_length = sum(lengths) / count or 1.0
+        df = Counter(term for passage in passages for term in query if term in passage.terms)
+        scored = []
+        for index, passage in enumerate(passages):
+            norm = self.k1 * (1 - self.b + self.b * lengths[index] / avg_length)
+            score = 0.0
+            for term in query:
+                tf = passage.terms.get(term, 0)
+                if tf:
+                    idf = math.log(1 + (count - df[term] + 0.5) / (df[term] + 0.5))
+                    score += idf * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scored.append((score, index))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [passages[index] for _, index in scored]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        full_total = self.stats["tokens_full_total"]
+        return {
+            **self.stats,
+            "token_budget": self.token_budget,
+            "enabled": self.enabled,
+            "tokens_saved_ratio": round(1 - self.stats["tokens_sent_total"] / full_total, 3) if full_total else 0.0,
+        }
+
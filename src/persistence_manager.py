@@ -38,9 +38,7 @@ class PersistenceManager:
         # Очищаем старые файлы при старте
         self._cleanup_old_files()
         
-        print(f"💾 PersistenceManager инициализирован: {self.base_path}")
-        print(f"   - Максимальный возраст файлов: {max_age_days} дней")
-        print(f"   - Максимум файлов: {max_files}")
+        logger.info("💾 PersistenceManager инициализирован: %s (хранение %s дней, максимум %s файлов)", self.base_path, max_age_days, max_files)
     
     def _sanitize_user_id(self, user_id: str) -> str:
         """
@@ -188,7 +186,7 @@ class PersistenceManager:
                     logger.warning(f"Не удалось удалить {file_path}: {e}")
             
             if deleted_count > 0:
-                print(f"🧹 Удалено {deleted_count} старых файлов состояний")
+                logger.info("🧹 Удалено %s старых файлов состояний", deleted_count)
             
             # Проверяем общее количество файлов
             files = list(self.base_path.glob("*.json"))
@@ -202,7 +200,7 @@ class PersistenceManager:
                         deleted_count += 1
                     except:
                         pass
-                print(f"🧹 Удалено {to_delete} файлов для соблюдения лимита")
+                logger.info("🧹 Удалено %s файлов для соблюдения лимита", to_delete)
                 
         except Exception as e:
             logger.error(f"Ошибка при очистке старых файлов: {e}")
@@ -222,7 +220,7 @@ class PersistenceManager:
             if self.save_state(user_id, state_data):
                 saved_count += 1
         
-        print(f"💾 Сохранено {saved_count}/{len(states)} состояний при shutdown")
+        logger.info("💾 Сохранено %s/%s состояний при shutdown", saved_count, len(states))
         return saved_count
     
     def load_all_states(self) -> Dict[str, Dict[str, Any]]:
@@ -257,7 +255,7 @@ class PersistenceManager:
                 except Exception as e:
                     logger.warning(f"Не удалось загрузить {file_path}: {e}")
             
-            print(f"📂 Загружено {loaded_count} сохранённых состояний")
+            logger.info("📂 Загружено %s сохранённых состояний", loaded_count)
             
         except Exception as e:
             logger.error(f"Ошибка при загрузке состояний: {e}")
@@ -309,6 +307,11 @@ def create_state_snapshot(history_manager, user_signals_history: Dict,
         "greeting_exchanged": False,
         "message_count": len(history_manager.get_history(user_id)) if history_manager else 0
     }
+
+    # Сжатая память диалога (ранние реплики, уже обрезанные из истории, и факты)
+    memory = history_manager.memories.get(user_id) if history_manager else None
+    if memory is not None:
+        state["memory"] = memory.to_dict()
     
     # Добавляем социальное состояние если есть
     if social_state_manager:
@@ -338,6 +341,7 @@ def restore_state_snapshot(state_data: Dict[str, Any], history_manager,
     if history_manager and 'history' in state_data:
         for msg in state_data['history']:
             history_manager.add_message(user_id, msg['role'], msg['content'])
+        history_manager.restore_memory(user_id, state_data.get('memory'))
     
     # Восстанавливаем user_signal
     if 'user_signal' in state_data:
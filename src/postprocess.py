@@ -0,0 +1,922 @@
+"""
+postprocess.py - Постобработка ответа генератора как цепочка проходов, пригодная для стрима
+
+ResponseGenerator чистил ответ Claude цепочкой методов (_strip_source_citations,
+_remove_question_headings, ..., _final_sanitize, унификация домена), и каждый ждал
+полный текст — поэтому /chat/stream не мог показывать ответ по мере генерации.
+Теперь каждый шаг — проход TextPass, который объявляет область действия:
+
+- CHUNK: замена подстрок; на потоке придерживается хвост короче самого длинного ключа
+- SENTENCE: правка внутри предложения; ждёт границы предложения ([.!?] и пробелы)
+- LINE: решение о строке целиком; строка ждёт своего конца, только если её начало
+  похоже на то, что проход удаляет (заголовок-вопрос, служебная метка, навязчивый CTA)
+- GLOBAL: смотрит на весь ответ (обрезанный хвост, дедупликация, абзацы) и держит
+  только небольшое окно в конце
+
+PostProcessor.process() применяет проходы к полному тексту — ровно как старая
+цепочка. PostProcessor.stream() отдаёт StreamingPostProcessor: feed(кусок) возвращает
+текст, готовый к показу, finish() — остаток. Склейка потока совпадает с process(),
+если метка [doc: ...] или фраза об отсутствии данных не разорваны переводом строки.
+
+Проходы собираются один раз: регулярные выражения компилируются при импорте,
+словари замен ищутся одной альтернативой по префиксному дереву ключей, а соседние
+LiteralPass (английские и украинские слова) сливаются в один (compile_passes).
+Результат побайтно сверяется с эталонами tests/golden_responses.json, время по
+шагам — scripts/bench_postprocess.py.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from event_log import get_logger
+
+log = get_logger(__name__)
+
+CHUNK = "chunk"
+SENTENCE = "sentence"
+LINE = "line"
+GLOBAL = "global"
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_DEDUP_SPLIT = re.compile(r"(?<=[\.\?\!])\s+|\n")
+_COMPLETE_ENDINGS = ('.', '!', '?', '"', '»')
+
+
+def _last_boundary(text: str, boundary: "re.Pattern" = _SENTENCE_END, followed: bool = False) -> int:
+    """
+    Конец последней границы предложения в text (0 — границы нет)
+
+    Args:
+        followed: Граница в самом конце не считается — пробелы ещё могут продолжиться.
+            Нужно только на входе потока: дальше каждый поток отдаёт текст так,
+            что пробелы после [.!?] в конце куска уже полные.
+    """
+    cut = 0
+    for match in boundary.finditer(text):
+        if not followed or match.end() < len(text):
+            cut = match.end()
+    return cut
+
+
+def _literal_pattern(keys: Iterable[str]) -> "re.Pattern":
+    """Одна альтернатива по префиксному дереву ключей: при совпадении берётся самый длинный ключ"""
+    trie: Dict[str, dict] = {}
+    for key in keys:
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def branch(node: Dict[str, dict]) -> str:
+        ends = "" in node
+        alternatives = [re.escape(char) + branch(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        body = alternatives[0] if len(alternatives) == 1 and not ends else "(?:" + "|".join(alternatives) + ")"
+        return body + ("?" if ends else "")
+
+    return re.compile(branch(trie))
+
+
+def _independent(replacements: Dict[str, str]) -> bool:
+    """
+    Можно ли заменить попарные str.replace одним проходом по альтернативе
+
+    Да, если порядок замен ни на что не влияет: ключи не входят друг в друга и не
+    перекрываются, замена не содержит ключей и не образует ключ со своими соседями.
+    """
+    keys, values = list(replacements), list(replacements.values())
+    if not all(values):
+        return False  # Удаление склеивает соседей — проверить нельзя
+    for key in keys:
+        for other in keys:
+            if other != key and (key in other or any(other.startswith(key[i:]) for i in range(1, len(key)))):
+                return False
+        for value in values:
+            if key in value or value in key:
+                return False
+            if any(key.startswith(value[i:]) or key.endswith(value[:-i]) for i in range(1, len(value))):
+                return False
+    return True
+
+
+class TextPass:
+    """Шаг постобработки: apply() — над полным текстом, stream() — состояние для потока"""
+    name = "pass"
+    scope = SENTENCE
+
+    def apply(self, text: str) -> str:
+        raise NotImplementedError
+
+    def stream(self):
+        """Потоковое состояние прохода с методами feed(text) -> str и finish() -> str"""
+        if self.scope == SENTENCE:
+            return SentenceStream(self)
+        if self.scope == CHUNK:
+            return ChunkStream(self)
+        if self.scope == LINE:
+            return LineStream(self)
+        raise NotImplementedError(f"{self.name}: глобальному проходу нужен свой stream()")
+
+
+class LiteralPass(TextPass):
+    """CHUNK-проход: замена фиксированных подстрок"""
+    scope = CHUNK
+
+    def __init__(self, name: str, replacements: Dict[str, str]):
+        self.name = name
+        self.replacements = dict(replacements)
+        self.pattern = _literal_pattern(self.replacements)
+        self.window = max(len(key) for key in self.replacements) - 1  # Самое длинное незаконченное начало ключа
+        self.single_pass = len(self.replacements) > 1 and _independent(self.replacements)
+
+    def apply(self, text: str) -> str:
+        # Обычно в ответе нет ни одного ключа: один поиск вместо replace по каждому
+        if not self.pattern.search(text):
+            return text
+        if self.single_pass:
+            return self.pattern.sub(self._replacement, text)
+        for old, new in self.replacements.items():
+            text = text.replace(old, new)
+        return text
+
+    def _replacement(self, match: "re.Match") -> str:
+        return self.replacements[match.group(0)]
+
+    def merge(self, other: "LiteralPass") -> Optional["LiteralPass"]:
+        """Один проход вместо двух подряд: замены идут в том же порядке (None, если ключи пересекаются)"""
+        if self.replacements.keys() & other.replacements.keys():
+            return None
+        return LiteralPass(f"{self.name}+{other.name}", {**self.replacements, **other.replacements})
+
+
+class SentenceStream:
+    """Поток для SENTENCE-прохода: применяет проход к готовым предложениям"""
+
+    def __init__(self, text_pass: TextPass):
+        self.text_pass = text_pass
+        self.buffer = ""
+
+    def feed(self, text: str) -> str:
+        self.buffer += text
+        cut = _last_boundary(self.buffer)
+        if not cut:
+            return ""
+        ready, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        return self.text_pass.apply(ready)
+
+    def finish(self) -> str:
+        rest, self.buffer = self.buffer, ""
+        return self.text_pass.apply(rest) if rest else ""
+
+
+class ChunkStream:
+    """Поток для CHUNK-прохода: придерживает только хвост, с которого может начинаться ключ"""
+
+    def __init__(self, text_pass: LiteralPass):
+        self.text_pass = text_pass
+        self.buffer = ""
+
+    def feed(self, text: str) -> str:
+        self.buffer += text
+        cut = len(self.buffer) - self._partial_key(self.buffer)
+        for match in self.text_pass.pattern.finditer(self.buffer):
+            if match.start() >= cut:
+                break
+            if match.end() > cut:
+                cut = match.end()  # Ключ целиком в буфере — не разрезаем его
+                break
+        ready, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        return self.text_pass.apply(ready) if ready else ""
+
+    def finish(self) -> str:
+        rest, self.buffer = self.buffer, ""
+        return self.text_pass.apply(rest) if rest else ""
+
+    def _partial_key(self, text: str) -> int:
+        """Длина самого длинного хвоста text, который является началом ключа"""
+        for size in range(min(self.text_pass.window, len(text)), 0, -1):
+            tail = text[-size:]
+            if any(len(key) > size and key.startswith(tail) for key in self.text_pass.replacements):
+                return size
+        return 0
+
+
+class LinePass(TextPass):
+    """LINE-проход: apply_line() решает судьбу строки, trigger — какие строки вообще могут измениться"""
+    scope = LINE
+    trigger: "re.Pattern" = re.compile(r"")
+    max_blank_lines: Optional[int] = None  # Сколько пустых строк подряд оставлять (None — все)
+    strip_edges = False  # strip() всего результата
+    trim_trailing_blanks = False  # Убирать пустые строки в конце
+
+    def apply_line(self, line: str) -> Optional[str]:
+        """Новая строка или None, если строку нужно удалить"""
+        raise NotImplementedError
+
+    def apply(self, text: str) -> str:
+        out: List[str] = []
+        empty = 0
+        for ln in text.splitlines():
+            if self.trigger.match(ln):
+                ln = self.apply_line(ln)
+            if ln is None:
+                continue
+            if ln.strip() == "":
+                empty += 1
+                if self.max_blank_lines is None or empty <= self.max_blank_lines:
+                    out.append(ln)
+            else:
+                empty = 0
+                out.append(ln)
+        if self.strip_edges:
+            return "\n".join(out).strip()
+        while self.trim_trailing_blanks and out and out[-1].strip() == "":
+            out.pop()
+        return "\n".join(out)
+
+
+class LineStream:
+    """
+    Поток для LINE-прохода
+
+    Строка, начало которой не совпало с trigger, отдаётся сразу (проход её не меняет),
+    остальные ждут перевода строки. Пробелы в конце строки и пустые строки отдаются
+    только вместе со следующей непустой строкой: хвостовые пустые строки в итоге
+    всё равно убирает GenericCtaPass.
+    """
+    DECIDE_AT = 30  # Длиннее любого начала строки из trigger ("Могу уточнить у менеджера")
+
+    def __init__(self, text_pass: LinePass):
+        self.text_pass = text_pass
+        self.line = ""
+        self.plain = False  # Текущая строка отдаётся без изменений
+        self.started = False
+        self.trailing = ""  # Пробелы в конце последней отданной строки
+        self.blank_run = 0
+        self.blanks: List[str] = []
+
+    def feed(self, text: str) -> str:
+        out: List[str] = []
+        while text:
+            head, newline, text = text.partition("\n")
+            if self.plain:
+                if newline:
+                    content = head.rstrip()
+                    self.trailing = head[len(content):]
+                    head = content
+                    self.plain = False
+                out.append(head)
+                continue
+            self.line += head
+            if newline:
+                out.append(self._complete(self.line))
+                self.line = ""
+            elif len(self.line.lstrip()) >= self.DECIDE_AT and not self.text_pass.trigger.match(self.line):
+                out.append(self._start(self.line))
+                self.line = ""
+                self.plain = True
+        return "".join(out)
+
+    def finish(self) -> str:
+        line, self.line = self.line, ""
+        if self.plain or not line:
+            return ""
+        return self._complete(line)
+
+    def _complete(self, line: str) -> str:
+        result = self.text_pass.apply_line(line)
+        if result is None:
+            return ""
+        if result.strip() == "":
+            self.blank_run += 1
+            if self.text_pass.max_blank_lines is None or self.blank_run <= self.text_pass.max_blank_lines:
+                self.blanks.append(result)
+            return ""
+        content = result.rstrip()
+        out = self._start(content)
+        self.trailing = result[len(content):]
+        return out
+
+    def _start(self, text: str) -> str:
+        """Начало непустой строки вместе с разделителем и ждавшими пустыми строками"""
+        self.blank_run = 0
+        if self.started:
+            prefix = self.trailing + "\n" + "".join(blank + "\n" for blank in self.blanks)
+        elif self.text_pass.strip_edges:
+            prefix, text = "", text.lstrip()
+        else:
+            prefix = "".join(blank + "\n" for blank in self.blanks)
+        self.blanks = []
+        self.trailing = ""
+        self.started = True
+        return prefix + text
+
+
+# --- Проходы очистки ответа генератора (порядок — как в старой цепочке) ---
+
+class SourceCitationPass(TextPass):
+    """Полностью удаляет метки источников вида [doc: filename.md] из текста ответа."""
+    name = "source_citations"
+    pattern = re.compile(r"\[doc:\s*[^\]]+\]")
+
+    def apply(self, text: str) -> str:
+        return self.pattern.sub("", text)
+
+
+class QuestionHeadingPass(LinePass):
+    """Убирает строки-заголовки, которые дублируют декомпозированные вопросы,
+    вида '1. **...?...**' или '- **...?...**' в начале блоков. Не трогает обычные списки.
+    Заодно сжимает избыточные пустые строки.
+    """
+    name = "question_headings"
+    heading_re = re.compile(r"^\s*(?:\d+\.|-)\s*\*\*[^*\n]*\?\*\*\s*$")
+    trigger = re.compile(r"^\s*(?:\d+\.|-)\s*\*\*")
+    max_blank_lines = 2
+    strip_edges = True
+
+    def apply_line(self, line: str) -> Optional[str]:
+        return None if self.heading_re.match(line) else line
+
+
+class MissingInfoPass(TextPass):
+    """Заменяет сухие формулировки об отсутствующих данных на более дружелюбные.
+    Примеры: "Нет данных в документах", "в документах не указано" → человеческая фраза.
+    """
+    name = "missing_info"
+    friendly = "В наших материалах этого нет."
+    patterns = [
+        re.compile(r"нет\s+данных\s+в\s+документ(ах|ахах|ахах)?", re.IGNORECASE),
+        re.compile(r"в\s+документ(ах|ахах|ахах)?\s+не\s+указано", re.IGNORECASE),
+        re.compile(r"информац(ии|ия)\s+в\s+документ(ах|ахах|ахах)?\s+отсутствует", re.IGNORECASE),
+    ]
+
+    marker = re.compile(r"документ", re.IGNORECASE)  # Есть в каждом шаблоне
+
+    def apply(self, text: str) -> str:
+        if not self.marker.search(text):
+            return text
+        for pattern in self.patterns:
+            text = pattern.sub(self.friendly, text)
+        return text
+
+
+class ServiceLabelPass(LinePass):
+    """Удаляет служебные заголовки вида 'Коротко:', 'Важно:', 'Итого:', 'Могу помочь:'
+    При этом сохраняет содержимое после двоеточия (если есть)."""
+    name = "service_labels"
+    label_re = re.compile(r"^\s*(Коротко|Важно|Итого|Могу помочь)\s*:\s*(.*)$", re.IGNORECASE)
+    trigger = re.compile(r"^\s*(Коротко|Важно|Итого|Могу помочь)\s*:", re.IGNORECASE)
+
+    def apply_line(self, line: str) -> Optional[str]:
+        match = self.label_re.match(line)
+        if not match:
+            return line
+        # если только лейбл без текста — пропускаем строку
+        return match.group(2).strip() or None
+
+
+class GenericCtaPass(LinePass):
+    """Убирает навязчивые финальные CTA вроде 'Если у вас есть дополнительные вопросы...' и похожие."""
+    name = "generic_cta"
+    patterns = [
+        re.compile(r"^\s*Если у вас есть .*вопрос", re.IGNORECASE),
+        re.compile(r"^\s*Если будут вопросы", re.IGNORECASE),
+        re.compile(r"^\s*Готов(а|ы)? помочь", re.IGNORECASE),
+        re.compile(r"^\s*Могу уточнить у менеджера", re.IGNORECASE),
+        re.compile(r"^\s*Я могу .* (уточнить|помочь)", re.IGNORECASE),
+    ]
+    trim_trailing_blanks = True  # также удалим лишние пустые строки в конце
+    trigger = re.compile(r"^\s*(?:Если у вас есть |Если будут вопросы|Готов|Могу уточнить у менеджера|Я могу )", re.IGNORECASE)
+
+    def apply_line(self, line: str) -> Optional[str]:
+        return None if any(pattern.search(line) for pattern in self.patterns) else line
+
+
+# Английские слова → русские эквиваленты
+ENGLISH_TO_RUSSIAN = {
+    "empathy": "эмпатичными",
+    # "soft skills": "гибкие навыки",  # ОТКЛЮЧЕНО: оставляем термин на английском
+    "feedback": "обратную связь",
+    "team building": "командообразование",
+    "deadline": "срок",
+    "workshop": "мастер-класс",
+    "mentor": "наставник"
+}
+
+# Украинские слова → русские эквиваленты
+# (Claude иногда генерирует украинские слова из-за контекста украинской школы)
+UKRAINIAN_TO_RUSSIAN = {
+    "підтримують": "поддерживают",
+    "підтримати": "поддержать",
+    "підтримка": "поддержка",
+    "дітей": "детей",
+    "діти": "дети",
+    "дитина": "ребёнок",
+    "навчання": "обучение",
+    "навчають": "обучают",
+    "навчатися": "учиться",
+    "вчитель": "учитель",
+    "вчителі": "учителя",
+    "батьки": "родители",
+    "батьків": "родителей",
+    "розвиток": "развитие",
+    "один одного": "друг друга",
+    "допомагають": "помогают",
+    "допомогти": "помочь",
+    "працюють": "работают",
+    "працювати": "работать"
+}
+
+
+def _with_capitalized(words: Dict[str, str]) -> Dict[str, str]:
+    """Словарь замен с учётом регистра (порядок как у попарных replace)"""
+    pairs: Dict[str, str] = {}
+    for old, new in words.items():
+        pairs[old] = new
+        pairs.setdefault(old.capitalize(), new.capitalize())
+    return pairs
+
+
+class TruncatedTailPass(TextPass):
+    """Если последнее предложение не заканчивается знаком препинания — удаляет его"""
+    name = "truncated_tail"
+    scope = GLOBAL
+
+    def apply(self, text: str) -> str:
+        out = text
+        if out and not out.rstrip().endswith(_COMPLETE_ENDINGS):
+            # Находим последнее полное предложение
+            sentences = _SENTENCE_END.split(out)
+            if len(sentences) > 1:
+                # Удаляем неполное последнее предложение
+                out = ' '.join(sentences[:-1])
+                if not out.rstrip().endswith(('.', '!', '?')):
+                    out = out.rstrip() + '.'
+            else:
+                # Если весь текст - одно неполное предложение, добавляем многоточие
+                out = out.rstrip() + '...'
+        return out
+
+    def stream(self) -> "_TruncatedTailStream":
+        return _TruncatedTailStream(self)
+
+
+class _TruncatedTailStream:
+    """
+    Отдаёт законченные предложения сразу, последнее — только в finish()
+
+    Обрезая хвост, apply() склеивает предложения пробелом. Дальше по цепочке это
+    заметно только после "т.д."/"т.п.": dedup не считает их концом предложения,
+    и одиночный перевод строки или табуляция там остаются как есть. Такую границу
+    поток не отдаёт: всё после неё ждёт finish(), где известно, обрезан ли ответ.
+    """
+
+    def __init__(self, text_pass: TruncatedTailPass):
+        self.text_pass = text_pass
+        self.tail = ""
+        self.released = False
+        self.held = False  # Остаток начинается с границы после "т.д."/"т.п."
+
+    def feed(self, text: str) -> str:
+        self.tail += text
+        if self.held:
+            return ""
+        cut = _last_boundary(self.tail)
+        if not cut:
+            return ""
+        for match in _SENTENCE_END.finditer(self.tail, 0, cut):
+            # "д."/"п." — с запасом: сами эти буквы последующие проходы не меняют
+            if match.group() != " " and len(match.group()) == 1 and self.tail.endswith(("д.", "п."), 0, match.start()):
+                cut, self.held = match.start(), True
+                break
+        self.released = True
+        ready, self.tail = self.tail[:cut], self.tail[cut:]
+        return ready
+
+    def finish(self) -> str:
+        tail, self.tail = self.tail, ""
+        if not self.released:
+            return self.text_pass.apply(tail)
+        if not tail.strip() or tail.rstrip().endswith(_COMPLETE_ENDINGS):
+            return tail
+        if self.held:
+            # Граница в начале остатка и все следующие — пробелом, как в apply()
+            sentences = _SENTENCE_END.split(tail.lstrip())[:-1]
+            return "".join(" " + sentence for sentence in sentences)
+        return ""  # Обрезанное последнее предложение
+
+
+class ArtifactPass(TextPass):
+    """Убирает артефакты "00" БЕЗ удаления нулей из чисел и лишние пробелы после очистки"""
+    name = "artifacts"
+    # 1. Артефакты типа "30-секундное00", "5-минутное00"
+    suffix_re = re.compile(r'(\d+)-([а-яё]+)00\b', re.IGNORECASE)
+    # 2. "00" только после БУКВ, не после цифр — "7000", "2800" не трогаем.
+    # Буква проверяется назад, а не захватывается: иначе шаблон перебирает каждое слово
+    after_letter_re = re.compile(r'(?<=[а-яА-ЯёЁa-zA-Z])00\s+')
+    # 3. Отдельно стоящие "00" (но не внутри чисел и не во времени HH:00)
+    standalone_re = re.compile(r'(?<!\d)(?<!:)00(?!\d)')
+    # 4. Множественные пробелы после очистки
+    spaces_re = re.compile(r'\s{2,}')
+
+    def apply(self, text: str) -> str:
+        return self.spaces_re.sub(' ', self.remove_zeros(text))
+
+    def remove_zeros(self, text: str) -> str:
+        """Шаги 1-3: внутри предложения, на потоке — по готовым предложениям"""
+        if "00" not in text:
+            return text
+        text = self.suffix_re.sub(r'\1-\2', text)
+        text = self.after_letter_re.sub(' ', text)
+        return self.standalone_re.sub('', text)
+
+    def stream(self) -> "_ArtifactStream":
+        return _ArtifactStream(self)
+
+
+class _ArtifactStream(SentenceStream):
+    """
+    Как SentenceStream, но пробелы сжимаются по всему потоку: убранное "00" в начале
+    предложения оставляет пробел, который в apply() сливается с предыдущими
+    """
+
+    def __init__(self, text_pass: ArtifactPass):
+        super().__init__(text_pass)
+        self.spaces = ""  # Одиночный пробельный символ в конце: станет " ", если за ним пробелы
+        self.after_space = False  # Отдан " " — пробелы в начале следующего куска сливаются с ним
+
+    def feed(self, text: str) -> str:
+        self.buffer += text
+        cut = _last_boundary(self.buffer)
+        if not cut:
+            return ""
+        ready, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        return self._squeeze(self.text_pass.remove_zeros(ready))
+
+    def finish(self) -> str:
+        rest, self.buffer = self.buffer, ""
+        out = self._squeeze(self.text_pass.remove_zeros(rest)) + self.spaces
+        self.spaces, self.after_space = "", False
+        return out
+
+    def _squeeze(self, text: str) -> str:
+        text = self.spaces + text
+        self.spaces = ""
+        if self.after_space:
+            text = text.lstrip()
+        content = text.rstrip()  # rstrip() и \s — одни и те же пробельные символы
+        spaces = text[len(content):]
+        out = self.text_pass.spaces_re.sub(' ', content)
+        if content:
+            self.after_space = False
+        if len(spaces) == 1 and spaces != " ":
+            self.spaces = spaces
+        elif spaces:
+            out += " "
+            self.after_space = True
+        return out
+
+
+class DedupPass(TextPass):
+    """Дедупликация предложений с защитой сокращений т.д./т.п.; склеивает предложения пробелом"""
+    name = "dedup"
+    scope = GLOBAL
+
+    etc_re = re.compile(r"\bт\.д\.")
+    and_so_on_re = re.compile(r"\bт\.п\.")
+    blank_lines_re = re.compile(r"\n{3,}")
+
+    def protect(self, text: str) -> str:
+        # Два sub по очереди, не один: после "т_д" граница \b перед следующим "т.п." пропадает
+        if "т." not in text:
+            return text
+        return self.and_so_on_re.sub("т_п", self.etc_re.sub("т_д", text))
+
+    def restore(self, text: str) -> str:
+        if "т_" in text:
+            text = text.replace("т_д", "т.д.").replace("т_п", "т.п.")
+        text = "\n".join(line.rstrip() for line in text.splitlines())
+        return self.blank_lines_re.sub("\n", text) if "\n\n\n" in text else text
+
+    @staticmethod
+    def key(sentence: str) -> str:
+        # split() режет по тем же пробельным символам, что и \s+
+        return " ".join(sentence.lower().split())
+
+    def apply(self, text: str) -> str:
+        seen = set()
+        deduped: List[str] = []
+        for chunk in _DEDUP_SPLIT.split(self.protect(text)):
+            sentence = chunk.strip()
+            key = self.key(sentence)
+            if key and key not in seen:
+                seen.add(key)
+                deduped.append(sentence)
+        return self.restore(" ".join(deduped))
+
+    def stream(self) -> "_DedupStream":
+        return _DedupStream(self)
+
+
+class _DedupStream:
+    """Помнит ключи отданных предложений; держит только незаконченное"""
+
+    def __init__(self, text_pass: DedupPass):
+        self.text_pass = text_pass
+        self.buffer = ""
+        self.seen = set()
+        self.started = False
+
+    def feed(self, text: str) -> str:
+        self.buffer = self.text_pass.protect(self.buffer + text)
+        cut = _last_boundary(self.buffer, _DEDUP_SPLIT)
+        ready, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        return self._sentences(ready) if ready else ""
+
+    def finish(self) -> str:
+        rest, self.buffer = self.buffer, ""
+        return self._sentences(rest)
+
+    def _sentences(self, text: str) -> str:
+        out: List[str] = []
+        for chunk in _DEDUP_SPLIT.split(text):
+            sentence = chunk.strip()
+            key = self.text_pass.key(sentence)
+            if key and key not in self.seen:
+                self.seen.add(key)
+                out.append((" " if self.started else "") + self.text_pass.restore(sentence))
+                self.started = True
+        return "".join(out)
+
+
+class ParagraphPass(TextPass):
+    """Принудительно разбивает длинный ответ без абзацев на абзацы по 2-3 предложения"""
+    name = "paragraphs"
+    scope = GLOBAL
+    min_length = 200
+
+    def apply(self, text: str) -> str:
+        text_out = text
+        if '\n' not in text_out and len(text_out) > self.min_length:
+            sentences = _SENTENCE_END.split(text_out)
+            if len(sentences) >= 3:
+                paragraphs = []
+                current_para = []
+                for i, sentence in enumerate(sentences):
+                    current_para.append(sentence)
+                    # Новый абзац после каждых 2-3 предложений
+                    if len(current_para) >= 2 and (i == len(sentences) - 1 or len(current_para) >= 3):
+                        paragraphs.append(' '.join(current_para))
+                        current_para = []
+                if current_para:
+                    paragraphs.append(' '.join(current_para))
+                text_out = '\n'.join(paragraphs)
+                log.info("postprocess.paragraphs", "📝 Принудительно добавлены абзацы: %s абзацев", len(paragraphs))
+        # Важно: strip() только по краям, переводы строк внутри — это абзацы
+        return text_out.strip()
+
+    def stream(self) -> "_ParagraphStream":
+        return _ParagraphStream(self)
+
+
+class _ParagraphStream:
+    """
+    Абзацы на потоке: перевод строки ставится после каждого третьего предложения
+
+    Сами предложения проход не меняет, поэтому их текст отдаётся сразу, а разделитель
+    после предложения с [.!?] на конце — не дожидаясь следующего (DedupPass склеивает
+    предложения пробелом, так что граница будет; лишний пробел в самом конце ответа
+    убирает StreamingPostProcessor). Делить ли ответ, известно только когда он длиннее
+    min_length — до этого придерживается всё, начиная с первого разделителя, который
+    зависит от решения.
+    """
+
+    def __init__(self, text_pass: ParagraphPass):
+        self.text_pass = text_pass
+        self.pending = ""  # Текст после последнего отданного разделителя
+        self.shown = 0  # Сколько символов pending уже отдано
+        self.skip_space = False  # Разделитель уже отдан заранее — пропустить пробелы склейки
+        self.length = 0
+        self.count = 0  # Отданных разделителей
+        self.split: Optional[bool] = None
+        self.has_newline = False
+
+    def feed(self, text: str) -> str:
+        self.length += len(text)
+        self.has_newline = self.has_newline or "\n" in text
+        if self.skip_space and text:
+            text = text.lstrip()
+            self.skip_space = False
+        self.pending += text
+        return self._release(final=False)
+
+    def finish(self) -> str:
+        out = self._release(final=True)
+        self.pending, self.shown = "", 0
+        return out
+
+    def _separator(self, number: int, original: str) -> Optional[str]:
+        """Разделитель после предложения number или None, пока решение не принято"""
+        if self.split is None:
+            return None if number % 3 == 0 or original != " " else " "
+        if self.split:
+            return "\n" if number % 3 == 0 else " "
+        return original
+
+    def _release(self, final: bool) -> str:
+        boundaries = list(_SENTENCE_END.finditer(self.pending))
+        if not final and boundaries and boundaries[-1].end() == len(self.pending):
+            boundaries.pop()  # Следующего предложения может и не быть
+        if self.split is None:
+            if self.has_newline:
+                self.split = False
+            elif self.length > self.text_pass.min_length and self.count + len(boundaries) + 1 >= 3:
+                self.split = True
+            elif final:
+                self.split = False
+        out: List[str] = []
+        position = 0
+        for match in boundaries:
+            separator = self._separator(self.count + 1, match.group())
+            if separator is None:
+                self._keep(position)
+                return "".join(out)
+            out.append(self.pending[max(position, self.shown):match.start()] + separator)
+            position = match.end()
+            self.count += 1
+        self._keep(position)
+        end = len(self.pending.rstrip())  # Пробелы в конце — возможный разделитель (или strip() в конце)
+        out.append(self.pending[self.shown:end])
+        self.shown = max(self.shown, end)
+        if not final and self.pending.endswith(('.', '!', '?')):
+            separator = self._separator(self.count + 1, " ")
+            if separator is not None:
+                out.append(separator)
+                self.count += 1
+                self.pending, self.shown = "", 0
+                self.skip_space = True
+        return "".join(out)
+
+    def _keep(self, position: int) -> None:
+        self.pending = self.pending[position:]
+        self.shown = max(0, self.shown - position)
+
+
+class LinkPass(TextPass):
+    """Преобразует URL в тексте в HTML-ссылки"""
+    name = "links"
+    url_patterns = [
+        r'https?://[^\s/$]+',  # https://domain.tld/...
+        r'shao3d\.github\.io/[^\s/]+',  # shao3d.github.io/...
+        r'ukido\.com\.ua/[^\s/]+',  # ukido.com.ua/...
+        r'(?:[^/]+\.)\.(?:com|ua|io|site|online|app|dev|stage|prod)[^\s/]+',  # domain.extension/
+    ]
+    pattern = re.compile('|'.join(url_patterns))
+
+    @staticmethod
+    def _link(match: "re.Match") -> str:
+        url = match.group(0)
+        # Добавляем https:// если нет протокола
+        if not url.startswith(('http://', 'https://')):
+            url = 'https://' + url
+        return f'<a href="{url}" target="_blank">{url}</a>'
+
+    def apply(self, text: str) -> str:
+        return self.pattern.sub(self._link, text)
+
+
+def compile_passes(passes: Iterable[TextPass]) -> List[TextPass]:
+    """Цепочка для выполнения: соседние LiteralPass сливаются в один проход"""
+    compiled: List[TextPass] = []
+    for text_pass in passes:
+        if compiled and isinstance(text_pass, LiteralPass) and isinstance(compiled[-1], LiteralPass):
+            merged = compiled[-1].merge(text_pass)
+            if merged is not None:
+                compiled[-1] = merged
+                continue
+        compiled.append(text_pass)
+    return compiled
+
+
+def cleanup_passes() -> List[TextPass]:
+    """Очистка ответа генератора: порядок проходов — как в прежней цепочке методов"""
+    return [
+        SourceCitationPass(),
+        QuestionHeadingPass(),
+        MissingInfoPass(),
+        ServiceLabelPass(),
+        GenericCtaPass(),
+        LiteralPass("english_words", _with_capitalized(ENGLISH_TO_RUSSIAN)),
+        LiteralPass("ukrainian_words", _with_capitalized(UKRAINIAN_TO_RUSSIAN)),
+        TruncatedTailPass(),
+        ArtifactPass(),
+        LiteralPass("exclamations", {"!": "."}),
+        DedupPass(),
+        ParagraphPass(),
+        # Унификация домена - всегда используем ukido.com.ua
+        LiteralPass("domain", {
+            "ukido.ua/": "ukido.com.ua/",
+            "ukido.ua ": "ukido.com.ua ",
+            "ukido.ua.": "ukido.com.ua.",
+            "ukido.ua,": "ukido.com.ua,",
+        }),
+    ]
+
+
+class PostProcessor:
+    """Цепочка проходов: целиком (process) или по мере прихода текста (stream)"""
+
+    def __init__(self, passes: Iterable[TextPass]):
+        self.passes = list(passes)
+        self.compiled = compile_passes(self.passes)
+        self.stats = {
+            "processed": 0,
+            "streams": 0,
+            "streams_exact": 0,  # итог продолжил показанный текст
+            "streams_replaced": 0,  # итог пришлось прислать целиком
+        }
+
+    def process(self, text: str) -> str:
+        self.stats["processed"] += 1
+        for text_pass in self.compiled:
+            text = text_pass.apply(text)
+        return text
+
+    def stream(self, hold_back: int = 0, extra: Iterable[TextPass] = ()) -> "StreamingPostProcessor":
+        """
+        Args:
+            hold_back: Сколько последних символов не отдавать до finish()
+                (например, под правку конца ответа при встраивании CTA)
+            extra: Проходы после цепочки, нужные только потоку (ссылки)
+        """
+        self.stats["streams"] += 1
+        return StreamingPostProcessor([*self.compiled, *extra], hold_back)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        return {
+            **self.stats,
+            "passes": {text_pass.name: text_pass.scope for text_pass in self.passes},
+            "compiled": [text_pass.name for text_pass in self.compiled],
+        }
+
+
+class StreamingPostProcessor:
+    """Состояние цепочки проходов для одного потока"""
+
+    def __init__(self, passes: Iterable[TextPass], hold_back: int = 0):
+        self._streams = [text_pass.stream() for text_pass in passes]
+        self.hold_back = hold_back
+        self._held = ""
+        self._started = False
+        self._carriage = ""  # "\r" в конце куска: "\n" может прийти следующим
+        self._sentence = ""  # Незаконченное предложение (граница ещё не пришла)
+        self.emitted: List[str] = []
+
+    @property
+    def text(self) -> str:
+        """Всё, что уже отдано"""
+        return "".join(self.emitted)
+
+    def feed(self, chunk: str) -> str:
+        """Кусок ответа модели → текст, который уже можно показать"""
+        if not self._started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return ""
+            self._started = True
+        chunk = self._carriage + chunk
+        self._carriage = "\r" if chunk.endswith("\r") else ""
+        # Строки, как у splitlines() в apply(): \r\n и \r — переводы строки
+        chunk = chunk[:len(chunk) - len(self._carriage)].replace("\r\n", "\n").replace("\r", "\n")
+        # Единственный буфер предложения на входе: проходам приходят только законченные
+        self._sentence += chunk
+        cut = _last_boundary(self._sentence, followed=True)
+        if not cut:
+            return ""
+        chunk, self._sentence = self._sentence[:cut], self._sentence[cut:]
+        for stream in self._streams:
+            chunk = stream.feed(chunk)
+            if not chunk:
+                return ""
+        chunk = self._held + chunk
+        # Пробелы в конце ждут продолжения: итог по краям обрезан
+        ready = chunk.rstrip()
+        if self.hold_back:
+            ready = ready[:-self.hold_back]
+        chunk, self._held = ready, chunk[len(ready):]
+        if chunk:
+            self.emitted.append(chunk)
+        return chunk
+
+    def finish(self) -> str:
+        """Остаток после конца ответа"""
+        chunk = self._sentence + self._carriage.replace("\r", "\n")
+        self._sentence = self._carriage = ""
+        for stream in self._streams:
+            chunk = stream.feed(chunk) + stream.finish()
+        chunk, self._held = (self._held + chunk).rstrip(), ""
+        if chunk:
+            self.emitted.append(chunk)
+        return chunk
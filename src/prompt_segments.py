@@ -0,0 +1,113 @@
+"""
+prompt_segments.py - Скомпилированные статичные сегменты промпта роутера
+
+Статичная часть промпта (роль, база знаний, правила декомпозиции и классификации,
+формат ответа) одинакова для всех запросов. Сегменты собираются один раз и хранятся
+готовыми строками вместе с размерами; склейки сегментов тоже кешируются.
+Пересборка — только когда меняется файл-источник (summaries.json): mtime проверяется
+не чаще раза в PROMPT_RELOAD_CHECK_SECONDS. Правила промпта живут в коде и меняются
+только с перезапуском процесса.
+
+Версия — хеш содержимого всех сегментов: по ней кеш решений роутера понимает,
+что решения получены на другом промпте.
+"""
+
+import hashlib
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from event_log import get_logger
+
+log = get_logger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов: ~4 байта UTF-8 на токен (кириллица — ~2 символа)"""
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+class PromptSegments:
+    """Набор готовых сегментов промпта с версией и отслеживанием источников"""
+
+    def __init__(self, sources: List[Path], check_interval: float = 5.0):
+        """
+        Args:
+            sources: Файлы, при изменении которых сегменты нужно пересобрать
+            check_interval: Как часто проверять mtime источников, сек
+        """
+        self.sources = list(sources)
+        self.check_interval = check_interval
+        self.version = ""
+        self.compilations = 0
+        self._segments: Dict[str, str] = {}
+        self._joined: Dict[Tuple[str, ...], str] = {}
+        self._mtimes: Dict[Path, Optional[float]] = {}
+        self._checked_at = 0.0
+
+    def _source_mtimes(self) -> Dict[Path, Optional[float]]:
+        mtimes: Dict[Path, Optional[float]] = {}
+        for path in self.sources:
+            try:
+                mtimes[path] = path.stat().st_mtime
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def is_stale(self) -> bool:
+        """True, если сегменты ещё не собраны или источник изменился"""
+        if not self._segments:
+            return True
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        return self._source_mtimes() != self._mtimes
+
+    def compile(self, sections: Dict[str, str]) -> None:
+        """
+        Сохраняет новые сегменты и пересчитывает версию
+
+        Args:
+            sections: Имя сегмента → готовый текст
+        """
+        digest = hashlib.sha1()
+        for name, text in sections.items():
+            digest.update(name.encode("utf-8"))
+            digest.update(b"\0")
+            digest.update(text.encode("utf-8"))
+        self._segments = dict(sections)
+        self._joined.clear()
+        self._mtimes = self._source_mtimes()
+        self._checked_at = time.monotonic()
+        self.version = digest.hexdigest()[:12]
+        self.compilations += 1
+        log.info(
+            "prompt_segments.compile", "🧩 Сегменты промпта собраны: версия %s, %s символов",
+            self.version, sum(len(text) for text in self._segments.values()),
+            version=self.version, compilations=self.compilations,
+        )
+
+    def get(self, name: str) -> str:
+        return self._segments[name]
+
+    def join(self, *names: str) -> str:
+        """Склейка сегментов по порядку (собирается один раз на версию)"""
+        joined = self._joined.get(names)
+        if joined is None:
+            joined = "".join(self._segments[name] for name in names)
+            self._joined[names] = joined
+        return joined
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        return {
+            "version": self.version,
+            "compilations": self.compilations,
+            "segments": {
+                name: {"chars": len(text), "estimated_tokens": estimate_tokens(text)}
+                for name, text in self._segments.items()
+            },
+            "total_chars": sum(len(text) for text in self._segments.values()),
+            "total_estimated_tokens": sum(estimate_tokens(text) for text in self._segments.values()),
+        }
@@ -1,19 +1,44 @@
+import asyncio
+import contextvars
+import hashlib
+import time
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 from config import Config
 from openrouter_client import OpenRouterClient
+from bulkhead import BulkheadRejected, get_bulkheads
 from standard_responses import DEFAULT_FALLBACK
 from offers_catalog import get_offer, get_tone_adaptation, get_dynamic_example
 from translator import SmartTranslator
-import re
+from document_store import DocumentStore, get_document_store
+from answer_cache import AnswerCache
+from route_cache import history_fingerprint
+from passage_index import PassageIndex
+from postprocess import LinkPass, PostProcessor, StreamingPostProcessor, cleanup_passes
+from openrouter_client_stream import StreamOutcome, chat_stream
+from llm_resilience import get_resilience_executor
+from model_health import get_model_health
+from event_log import get_logger
+from keyword_matcher import get_keyword_matcher
+
+log = get_logger(__name__)
+
+# Словари постобработки ответа (общий автомат keyword_matcher, один проход по тексту)
+get_keyword_matcher().register("generator.greeting", ["привет", "здравствуйте", "добрый день", "добрый вечер", "доброе утро"])
+get_keyword_matcher().register("generator.negative_experience", ["пустышк", "обманули", "потеря", "плох", "негатив"])
+get_keyword_matcher().register("generator.trial", ["попроб", "пробн", "давайте попробуем", "хочу попробовать", "запишите на пробное"])
+get_keyword_matcher().register("generator.contacts", ["ukido", "+380", "запишитесь", "запись"])
+get_keyword_matcher().register("generator.transport", ["забира", "привози", "довози", "везти", "отвози", "вожу", "везу", "заберу", "привезу"])
+get_keyword_matcher().register("generator.aggressive", ["развод", "обман", "выкачивание", "мошенники", "враньё"])
 
 class ResponseGenerator:
     """
     Генератор ответа:
     - Принимает результат роутера (status=success, documents, decomposed_questions)
-    - Подгружает MD документы из data/documents_compressed (оптимизированные версии)
+    - Берёт MD документы data/documents_compressed из DocumentStore (в памяти, без чтения диска)
     - Собирает составной промпт (системная роль + документы + история[последние 10] + вопросы)
     - Вызывает LLM и возвращает итоговый ответ ассистента
+    - Повторные вопросы по тем же документам отдаёт из AnswerCache (с персонализацией)
     """
 
     def __init__(self, docs_dir: Optional[Path] = None):
@@ -25,21 +50,46 @@ class ResponseGenerator:
             max_tokens=self.cfg.MAX_TOKENS_ANSWER,  # Используем настройку из конфига (1200 токенов)
             temperature=0.1,  # Минимальная температура для точности
             model=self.cfg.MODEL_ANSWER,
+            stage="generator",
         )
         self.docs_dir = docs_dir or (Path(__file__).parent.parent / "data" / "documents_compressed")
+        # Документы отдаются из памяти; свой корпус — только для нестандартной папки
+        self.documents = get_document_store() if docs_dir is None else DocumentStore(docs_dir)
+        # В промпт идут разделы документов, относящиеся к вопросам, а не полные тексты
+        self.passages = PassageIndex(
+            token_budget=self.cfg.PASSAGE_TOKEN_BUDGET,
+            heading_level=self.cfg.PASSAGE_HEADING_LEVEL,
+            whole_documents=self.cfg.PASSAGE_WHOLE_DOCUMENTS,
+            enabled=self.cfg.PASSAGE_RETRIEVAL,
+        )
+        self.postprocessor = PostProcessor(cleanup_passes())
+        self.links = LinkPass()
+        # Кеш очищенных ответов: персонализация накладывается заново при каждом попадании
+        self.answer_cache = (
+            AnswerCache(self.cfg.ANSWER_CACHE_SIZE, self.cfg.ANSWER_CACHE_TTL, self.cfg.ANSWER_CACHE_STALE_SECONDS)
+            if self.cfg.ANSWER_CACHE_ENABLED else None
+        )
+        self._refresh_tasks: set = set()  # Фоновые обновления кеша (ссылки, чтобы задачи не собрал GC)
         self.history_limit = self.cfg.HISTORY_LIMIT  # Используем настройку из конфига
         self.translator = SmartTranslator(self.client, model=self.cfg.TRANSLATION_MODEL)  # Инициализируем переводчик
 
-    def _debug(self, message: str) -> None:
-        if self.cfg.LOG_LEVEL == "DEBUG":
-            print(message)
-
     async def generate(
         self,
         router_result: Dict,
         history: Optional[List[Dict[str, str]]] = None,
         current_message: Optional[str] = None,
+        doc_texts: Optional[Dict[str, str]] = None,
+        on_token: Optional[Callable[[str], None]] = None,
     ) -> tuple[str, dict]:
+        """
+        Ответ по решению роутера
+
+        Args:
+            on_token: Получатель очищенного текста по мере генерации (/chat/stream).
+                Для ответов, которые потом переводятся, текст не отдаётся.
+        Returns:
+            (итоговый текст после постобработки, metadata)
+        """
         if router_result.get("status") != "success":
             # Возвращаем tuple с пустой metadata для фоллбэка
             return DEFAULT_FALLBACK, {"intent": "error", "user_signal": "exploring_only", "cta_added": False, "cta_type": None, "humor_generated": False}
@@ -53,11 +103,13 @@ class ResponseGenerator:
         # Получаем user_signal для персонализации
         user_signal = router_result.get("user_signal", "exploring_only")
         
-        doc_texts = self._load_docs(docs)
+        if doc_texts is None:
+            await self.documents.ensure_loaded()
+            doc_texts = self._load_docs(docs)
         
         # ЗАЩИТА ОТ ГАЛЛЮЦИНАЦИЙ: Если документов не загрузилось - отказываемся отвечать
         if not doc_texts:
-            print("⚠️ ЗАЩИТА: Нет загруженных документов для генерации ответа")
+            log.warning("generator.generate", "⚠️ ЗАЩИТА: Нет загруженных документов для генерации ответа")
             return "К сожалению, у меня нет информации по этому вопросу. Расскажите, что именно вас интересует о школе Ukido?", {"intent": "success", "user_signal": user_signal, "cta_added": False, "cta_type": None, "humor_generated": False}
         
         # Проверяем необходимость CTA ПЕРЕД генерацией
@@ -71,12 +123,12 @@ class ResponseGenerator:
         block_reason = router_result.get("block_reason", "")
         
         if cta_blocked:
-            print(f"🔒 CTA заблокированы: {block_reason}")
+            log.info("generator.generate", "🔒 CTA заблокированы: %s", block_reason)
             # Пропускаем всю логику CTA если они заблокированы
         else:
             offer = get_offer(user_signal, history)
             if offer and offer["priority"] in ["high", "medium"]:
-                self._debug(f"🎯 DEBUG: Есть offer для {user_signal}, проверяем нужно ли добавлять...")
+                log.debug("generator.generate", "🎯 DEBUG: Есть offer для %s, проверяем нужно ли добавлять...", user_signal)
                 should_add = self._should_add_offer(user_signal, history, offer, current_message)
                 
                 # Применяем модификатор частоты
@@ -85,11 +137,11 @@ class ResponseGenerator:
                     # Уменьшаем вероятность добавления CTA
                     if random.random() > cta_frequency_modifier:
                         should_add = False
-                        print(f"📉 CTA пропущен из-за модификатора частоты ({cta_frequency_modifier:.1%})")
+                        log.info("generator.generate", "📉 CTA пропущен из-за модификатора частоты (%s)", format(cta_frequency_modifier, '.1%'))
                 
-                self._debug(f"🎯 DEBUG: _should_add_offer вернул: {should_add}")
+                log.debug("generator.generate", "🎯 DEBUG: _should_add_offer вернул: %s", should_add)
                 if should_add:
-                    self._debug(f"🎯 DEBUG: Будем встраивать CTA для {user_signal} органично")
+                    log.debug("generator.generate", "🎯 DEBUG: Будем встраивать CTA для %s органично", user_signal)
                     cta_offer = offer  # Сохраняем для fallback
                     # Выбираем правильный вариант CTA текста
                     if "text_variants" in offer and offer["text_variants"]:
@@ -97,79 +149,103 @@ class ResponseGenerator:
                         cta_count = self._count_cta_occurrences(user_signal, history)
                         variant_index = cta_count % len(offer["text_variants"])
                         cta_text = offer["text_variants"][variant_index]
-                        print(f"   Используем вариант #{variant_index+1} из {len(offer['text_variants'])}")
+                        log.info("generator.generate", "Используем вариант #%s из %s", variant_index+1, len(offer['text_variants']))
                     else:
                         # Используем основной текст
                         cta_text = offer.get("text", "")
                 else:
-                    self._debug(f"🎯 DEBUG: CTA НЕ будет добавлен для {user_signal}")
+                    log.debug("generator.generate", "🎯 DEBUG: CTA НЕ будет добавлен для %s", user_signal)
         
-        # Одноэтапная генерация с Claude Haiku + dynamic few-shot + CTA (если нужен)
-        messages = self._build_messages(doc_texts, questions, history or [], router_result, cta_text)
+        # Кеш ответов: те же вопросы по тем же версиям документов не идут в Claude
+        cache_key = self._answer_cache_key(router_result, questions, doc_texts, history or [], cta_text)
+        cached = self.answer_cache.get(cache_key) if cache_key is not None else None
+
+        messages: List[Dict[str, str]] = []
+        if cached is None or cached.stale:
+            # Одноэтапная генерация с Claude Haiku + dynamic few-shot + CTA (если нужен)
+            selection = self.passages.select(doc_texts, questions)
+            if selection.passage_ids:
+                log.info("generator.generate", "📑 Фрагменты: %s (~%s из ~%s токенов)",
+                         len(selection.passage_ids), selection.tokens, selection.full_tokens)
+            messages = self._build_messages(
+                selection.doc_texts, questions, history or [], router_result, cta_text, selection.passage_ids
+            )
+        if cached is not None and cached.stale:
+            self._schedule_refresh(cache_key, messages)
 
+        view: Optional[StreamingPostProcessor] = None
+        started = time.perf_counter()
         try:
-            reply = await self.client.chat(messages)
+            if cached is not None:
+                reply = cached.text
+                log.info("generator.answer_cache", "♻️ Ответ из кеша%s", " (устарел, обновляется в фоне)" if cached.stale else "")
+            elif on_token is not None and router_result.get("detected_language", "ru") == "ru":
+                # Последний символ ждёт проверки CTA: _inject_offer меняет конец ответа
+                view = self.postprocessor.stream(hold_back=1 if cta_text else 0, extra=[self.links])
+
+                def forward(piece: str) -> None:
+                    ready = view.feed(piece)
+                    if ready:
+                        on_token(ready)
+
+                reply = await self._stream_reply(messages, forward)
+            else:
+                reply = await self.client.chat(messages)
             cleaned = (reply or "").strip()
             if not cleaned:
                 return "Извините, не удалось сформировать ответ. Попробуйте переформулировать вопрос.", {"intent": "error", "user_signal": user_signal, "cta_added": False, "cta_type": None, "humor_generated": False}
             
-            # Базовая очистка ответа
-            sanitized = self._strip_source_citations(cleaned)
-            polished = self._remove_question_headings(sanitized)
-            humanized = self._humanize_missing_info(polished)
-            no_labels = self._strip_service_labels(humanized)
-            no_cta = self._strip_generic_cta(no_labels)
-            
-            # Финальная санитизация (убираем восклицания и дедупликация)
-            final_text = self._final_sanitize(no_cta)
-            
-            # Унификация домена - всегда используем ukido.com.ua
-            final_text = final_text.replace("ukido.ua/", "ukido.com.ua/")
-            final_text = final_text.replace("ukido.ua ", "ukido.com.ua ")
-            final_text = final_text.replace("ukido.ua.", "ukido.com.ua.")
-            final_text = final_text.replace("ukido.ua,", "ukido.com.ua,")
+            if cached is not None:
+                final_text = cached.text  # Уже очищен
+            else:
+                # Базовая очистка, финальная санитизация (восклицания, дедупликация, абзацы)
+                # и унификация домена ukido.com.ua — проходы postprocess
+                final_text = self.postprocessor.process(cleaned)
+                if cache_key is not None and final_text:
+                    self.answer_cache.put(cache_key, final_text, time.perf_counter() - started)
+
+            # Один проход по сообщению пользователя для всех словарей постобработки
+            matcher = get_keyword_matcher()
+            message_hits = matcher.scan((current_message or "").lower())
             
             # Постпроцессинг: обрабатываем приветствия
             # 1. Исправляем точку на восклицательный знак
             if final_text.startswith("Привет."):
                 final_text = "Привет!" + final_text[7:]
-                print("✅ Исправлено приветствие: Привет. → Привет!")
+                log.info("generator.generate", "✅ Исправлено приветствие: Привет. → Привет!")
             
             # 2. Если был social_context == "greeting" но ответ НЕ начинается с приветствия - добавляем
             social_ctx = router_result.get("social_context")
-            self._debug(f"🔍 DEBUG postprocessing: social_context = {social_ctx}, text starts with: {final_text[:30]}...")
+            log.debug("generator.generate", "🔍 DEBUG postprocessing: social_context = %s, text starts with: %s...", social_ctx, final_text[:30])
             if social_ctx == "greeting":
-                greeting_starters = ["привет", "здравствуйте", "добрый день", "добрый вечер", "доброе утро"]
-                if not any(final_text.lower().startswith(g) for g in greeting_starters):
+                if not matcher.scan(final_text.lower()).starts_with("generator.greeting"):
                     final_text = "Привет! " + final_text
-                    print("✅ Добавлено приветствие в начало ответа")
+                    log.info("generator.generate", "✅ Добавлено приветствие в начало ответа")
                 
                 # ЗАЩИТА: если после приветствия текст слишком короткий, но есть вопросы
                 if len(final_text) < 50 and router_result.get("decomposed_questions"):
-                    print(f"⚠️ ПРЕДУПРЕЖДЕНИЕ: Обнаружен слишком короткий ответ после приветствия: '{final_text}'")
+                    log.warning("generator.generate", "⚠️ ПРЕДУПРЕЖДЕНИЕ: Обнаружен слишком короткий ответ после приветствия: '%s'", final_text)
                     # Fallback ответ для mixed интентов
-                    if any(word in current_message.lower() for word in ["пустышк", "обманули", "потеря", "плох", "негатив"]):
+                    if message_hits.any("generator.negative_experience"):
                         final_text = "Привет! Понимаю ваши сомнения после негативного опыта. В Ukido мы работаем принципиально иначе - мини-группы до 6 человек, профессиональные педагоги-психологи и индивидуальный подход к каждому ребенку. Давайте я подробнее расскажу о наших отличиях."
                     else:
                         final_text = "Привет! Спасибо за ваш вопрос. Давайте я подробно расскажу о нашей школе и чем мы можем помочь вашему ребенку."
-                    print("✅ Использован fallback ответ для mixed greeting")
+                    log.info("generator.generate", "✅ Использован fallback ответ для mixed greeting")
             
             # 3. Добавление контактов при готовности к пробному занятию
-            trial_words = ["попроб", "пробн", "давайте попробуем", "хочу попробовать", "запишите на пробное"]
-            if current_message and any(word in current_message.lower() for word in trial_words):
+            if current_message and message_hits.any("generator.trial"):
                 # Проверяем, есть ли уже контакты в ответе (любое упоминание ukido считается контактом)
-                if not any(contact in final_text.lower() for contact in ["ukido", "+380", "запишитесь", "запись"]):
+                if not matcher.scan(final_text.lower()).any("generator.contacts"):
                     # Добавляем контактную информацию в конец ответа
                     contact_info = "\n\n📞 Для записи на пробное занятие: ukido.com.ua/trial или позвоните +380 93 567 89 01"
                     final_text = final_text.rstrip() + contact_info
-                    print("✅ Добавлены контакты для пробного занятия")
+                    log.info("generator.generate", "✅ Добавлены контакты для пробного занятия")
             
             # 4. Обработка непонимания формата обучения (проблема "забирать")
-            transport_words = ["забира", "привози", "довози", "везти", "отвози", "вожу", "везу", "заберу", "привезу"]
-            if current_message and any(word in current_message.lower() for word in transport_words):
+            if current_message and message_hits.any("generator.transport"):
                 # Проверяем, упоминается ли уже онлайн в ответе
                 if "онлайн" not in final_text.lower() and "zoom" not in final_text.lower() and "из дома" not in final_text.lower():
-                    print("🔍 Обнаружено непонимание формата обучения, добавляем уточнение...")
+                    log.debug("generator.generate", "🔍 Обнаружено непонимание формата обучения, добавляем уточнение...")
                     
                     # Ищем упоминание времени/расписания для органичной вставки
                     time_patterns = [
@@ -197,7 +273,7 @@ class ResponseGenerator:
                             # Вставляем уточнение перед точкой
                             insert_pos = index + sentence_end
                             final_text = final_text[:insert_pos] + insertion + final_text[insert_pos:]
-                            print(f"✅ Добавлено органичное уточнение про онлайн-формат после '{pattern}'")
+                            log.info("generator.generate", "✅ Добавлено органичное уточнение про онлайн-формат после '%s'", pattern)
                             inserted = True
                             break
                     
@@ -212,28 +288,27 @@ class ResponseGenerator:
                             prefix = "Занятия проходят полностью онлайн через Zoom, поэтому забирать ребёнка не нужно - он учится из дома. "
                         
                         final_text = prefix + final_text
-                        print("✅ Добавлено уточнение про онлайн-формат в начало ответа")
+                        log.info("generator.generate", "✅ Добавлено уточнение про онлайн-формат в начало ответа")
             
             # Проверяем, встроил ли Claude CTA (если мы его запрашивали)
             cta_was_added = False
             if cta_text and cta_offer:
                 # Определяем контекст агрессивности
-                is_aggressive = any(word in current_message.lower() for word in ["развод", "обман", "выкачивание", "мошенники", "враньё"]) if current_message else False
+                is_aggressive = message_hits.any("generator.aggressive") if current_message else False
                 context_type = "агрессивный" if is_aggressive else "нормальный"
                 
                 if not self._verify_cta_included(final_text, cta_text):
                     # Fallback: Claude не встроил CTA, добавляем механически
-                    print(f"⚠️ ПРОВАЛ: Claude НЕ встроил CTA для {user_signal}")
-                    print(f"   Контекст: {context_type}")
                     # Используем self.cfg вместо несуществующего config
                     temperature = getattr(self.cfg, 'TEMPERATURE_BY_SIGNAL', {}).get(user_signal, 0.1)
-                    print(f"   Температура: {temperature}")
-                    print(f"   CTA текст: '{cta_text[:50]}...'")
+                    log.warning(
+                        "generator.cta_missing", "⚠️ ПРОВАЛ: Claude НЕ встроил CTA для %s (контекст: %s, температура: %s, CTA: '%s...')",
+                        user_signal, context_type, temperature, cta_text[:50],
+                    )
                     final_text = self._inject_offer(final_text, cta_offer, user_signal)
                     cta_was_added = True
                 else:
-                    print(f"✅ УСПЕХ: CTA органично встроен для {user_signal}")
-                    print(f"   Контекст: {context_type}")
+                    log.info("generator.generate", "✅ УСПЕХ: CTA органично встроен для %s (контекст: %s)", user_signal, context_type)
                     cta_was_added = True
                     # Маркер больше не добавляем к тексту ответа
                     # так как он виден пользователю
@@ -263,13 +338,19 @@ class ResponseGenerator:
                 metadata["detected_language"] = detected_language
 
             # НОВОЕ: Преобразуем URL в кликабельные HTML-ссылки
-            self._debug(f"🔗 DEBUG: До преобразования URL: {final_text[:100]}...")
-            final_text = self._make_urls_clickable(final_text)
-            self._debug(f"🔗 DEBUG: После преобразования URL: {final_text[:100]}...")
+            log.debug("generator.generate", "🔗 DEBUG: До преобразования URL: %s...", final_text[:100])
+            final_text = self.links.apply(final_text)
+            log.debug("generator.generate", "🔗 DEBUG: После преобразования URL: %s...", final_text[:100])
 
+            if view is not None:
+                self._finish_stream(view, final_text, on_token)
+            elif cached is not None and on_token is not None and detected_language == "ru":
+                on_token(final_text)  # Ответ из кеша — одним сообщением
             return final_text, metadata
+        except BulkheadRejected:
+            raise
         except Exception as e:
-            print(f"❌ Ошибка генерации ответа: {e}")
+            log.error("generator.generate", "❌ Ошибка генерации ответа: %s", e)
             # Возвращаем tuple с metadata для случая ошибки
             return "Извините, временная техническая неполадка. Попробуйте еще раз.", {
                 "intent": "error",
@@ -279,22 +360,141 @@ class ResponseGenerator:
                 "humor_generated": False
             }
 
-    def _load_doc(self, doc_name: str) -> str:
-        """Синхронная загрузка документа - ОТКАТ асинхронности"""
+    async def _stream_reply(self, messages: List[Dict[str, str]], on_token: Callable[[str], None]) -> str:
+        """
+        Ответ Claude потоком: куски уходят в on_token сразу по приходу
+
+        Если стрим оборвался (не дошёл до [DONE]/finish_reason) или не уложился в бюджет
+        стадии, ответ запрашивается обычным вызовом (с повторами и фолбэками) — клиент
+        получит его в финальном событии.
+        """
+        candidates = get_model_health().candidates("generator", self.client.model)
+        if not candidates:
+            return await self.client.chat(messages)
+        model = candidates[0]
+        budget = get_resilience_executor().budget_for("generator")
+        if len(candidates) > 1:
+            budget *= self.cfg.MODEL_BUDGET_SHARE  # Фолбэк-моделям должно остаться время
+
+        pieces: List[str] = []
+        outcome = StreamOutcome()
+        started = time.perf_counter()
+        async with get_bulkheads().for_stage("generator").slot():
+            stream = chat_stream(self.client, messages, model=model, stage="generator", outcome=outcome)
+            try:
+                async with asyncio.timeout(budget):
+                    async for piece in stream:
+                        pieces.append(piece)
+                        on_token(piece)
+            except TimeoutError:
+                log.warning("generator.stream", "⚠️ Стрим генератора не уложился в %.1fс, переходим на обычный запрос", budget)
+                pieces = []
+            finally:
+                await stream.aclose()
+
+        if pieces and not outcome.completed:
+            # Обрыв на середине: усечённый ответ не показываем целиком и не кешируем
+            log.warning("generator.stream", "⚠️ Стрим генератора оборвался (%s), переходим на обычный запрос",
+                        outcome.error or "нет [DONE]")
+            pieces = []
+        if pieces:
+            get_model_health().record_success("generator", model, time.perf_counter() - started)
+            return "".join(pieces)
+        get_model_health().record_failure("generator", model)
+        return await self.client.chat(messages)
+
+    def _answer_cache_key(
+        self,
+        router_result: Dict,
+        questions: List[str],
+        doc_texts: Dict[str, str],
+        history: List[Dict[str, str]],
+        cta_text: Optional[str],
+    ) -> Optional[str]:
+        """Ключ кеша ответов; None — кеш выключен или ответ опирается на диалог"""
+        if self.answer_cache is None:
+            return None
+        # Память диалога или длинная история: модель отвечает с оглядкой на сказанное раньше
+        if router_result.get("memory") or len(history) > self.cfg.ANSWER_CACHE_MAX_HISTORY:
+            self.answer_cache.stats["bypassed"] += 1
+            return None
+        user_signal = router_result.get("user_signal", "exploring_only")
+        # Остальное, что меняет промпт (см. _build_messages): социальный контекст,
+        # короткая реакция на цену, агрессивный тон при CTA
+        original_message = router_result.get("original_message", "").lower().strip()
+        context = [router_result.get("social_context") or ""]
+        if user_signal == "price_sensitive" and len(original_message.split()) <= 2:
+            context.append("short_price")
+        if cta_text and get_keyword_matcher().scan(original_message).any("generator.aggressive"):
+            context.append("aggressive")
+        if history:
+            # Короткая история тоже попадает в промпт — ответ после неё кешируется отдельно
+            context.append(history_fingerprint(history, self.cfg.ANSWER_CACHE_MAX_HISTORY))
+        hashes = {name: self._document_hash(name, text) for name, text in doc_texts.items()}
+        return AnswerCache.make_key(
+            questions, hashes, user_signal, cta_text, router_result.get("detected_language", "ru"), ",".join(context)
+        )
+
+    def _document_hash(self, name: str, text: str) -> str:
+        """sha256 содержимого: из DocumentStore, если текст оттуда, иначе считается"""
+        document = self.documents.document(name)
+        if document is not None and document.text is text:
+            return document.sha256
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _schedule_refresh(self, cache_key: str, messages: List[Dict[str, str]]) -> None:
+        """Фоновое обновление устаревшего ответа (не больше одного на ключ)"""
+        if not self.answer_cache.begin_refresh(cache_key):
+            return
+        # Пустой контекст: расход на обновление не записывается на пользователя текущего запроса
+        task = asyncio.create_task(self._refresh_answer(cache_key, messages), context=contextvars.Context())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _refresh_answer(self, cache_key: str, messages: List[Dict[str, str]]) -> None:
+        started = time.perf_counter()
         try:
-            path = self.docs_dir / doc_name
-            if not path.exists():
-                print(f"⚠️ Документ не найден: {doc_name}")
-                return ""
-            
-            with open(path, 'r', encoding='utf-8') as f:
-                return f.read()
+            reply = (await self.client.chat(messages) or "").strip()
+            if reply:
+                self.answer_cache.put(cache_key, self.postprocessor.process(reply), time.perf_counter() - started)
+                log.info("generator.answer_cache", "🔄 Устаревший ответ в кеше обновлён")
         except Exception as e:
-            print(f"⚠️ Ошибка чтения {doc_name}: {e}")
+            log.warning("generator.answer_cache", "⚠️ Фоновое обновление ответа не удалось: %s", e)
+        finally:
+            self.answer_cache.end_refresh(cache_key)
+
+    def _finish_stream(self, view: StreamingPostProcessor, final_text: str, on_token: Callable[[str], None]) -> None:
+        """
+        Досылает конец ответа после стрима
+
+        Если итог продолжает уже показанный текст (обычный случай, в т.ч. CTA или
+        контакты в конце), клиент получает только остаток. Иначе (приветствие в
+        начале, вставка про онлайн-формат, ответ после фолбэка) текст заменит событие final.
+        """
+        shown = view.text
+        if final_text.startswith(shown):
+            self.postprocessor.stats["streams_exact"] += 1
+            if len(final_text) > len(shown):
+                on_token(final_text[len(shown):])
+        else:
+            self.postprocessor.stats["streams_replaced"] += 1
+            log.info("generator.stream", "🔁 Итог отличается от показанного потока, клиент заменит текст")
+
+    def _load_doc(self, doc_name: str) -> str:
+        """Текст документа из DocumentStore (из памяти, без чтения диска)"""
+        text = self.documents.get(doc_name)
+        if text is None:
+            log.warning("generator.load_doc", "⚠️ Документ не найден: %s", doc_name)
             return ""
+        return text
     
+    async def prefetch_documents(self, docs: List[str]) -> Dict[str, str]:
+        """Документы для генерации, пока роутер ещё дописывает ответ (корпус грузится при первом обращении)"""
+        await self.documents.ensure_loaded()
+        return self._load_docs(docs)
+
     def _load_docs(self, docs: List[str]) -> Dict[str, str]:
-        """Синхронная загрузка всех документов - простая и надёжная"""
+        """Тексты документов из памяти в порядке списка (без повторов и пустых)"""
         unique_docs = list(dict.fromkeys(docs))
         texts = {}
         for doc_name in unique_docs:
@@ -310,6 +510,7 @@ class ResponseGenerator:
         history: List[Dict[str, str]],
         router_result: Dict,
         cta_text: str = None,  # НОВЫЙ ПАРАМЕТР для органичной интеграции CTA
+        passage_ids: Optional[List[str]] = None,  # Какие фрагменты документов отобраны (пусто — полные тексты)
     ) -> List[Dict[str, str]]:
         # Получаем user_signal для адаптации тона
         user_signal = router_result.get("user_signal", "exploring_only")
@@ -341,8 +542,7 @@ class ResponseGenerator:
         if cta_text:
             # Определяем агрессивность контекста
             current_message = router_result.get("original_message", "").lower()
-            aggressive_keywords = ["развод", "обман", "выкачивание", "мошенники", "враньё"]
-            is_aggressive = any(word in current_message for word in aggressive_keywords)
+            is_aggressive = get_keyword_matcher().scan(current_message).any("generator.aggressive")
             
             # Специальная обработка для агрессивного контекста и price_sensitive
             if user_signal == "price_sensitive" and is_aggressive:
@@ -440,21 +640,32 @@ class ResponseGenerator:
         # Разрешённые документы
         allowed_docs = list(doc_texts.keys())
 
-        # Полные тексты документов (без тримминга)
+        # Тексты документов: полные или отобранные фрагменты с метками [документ#N · заголовок]
         docs_block_lines = []
         for name, text in doc_texts.items():
             docs_block_lines.append(f"=== Документ: {name} ===\n{text}\n")
         docs_block = "\n".join(docs_block_lines) if docs_block_lines else "=== Документы не найдены ==="
 
+        passages_line = (
+            f"Использованные фрагменты: {', '.join(passage_ids)} (остальные разделы документов опущены)\n"
+            if passage_ids else ""
+        )
+
         system_content = (
             f"{system_role}\n\n"
-            f"Разрешённые источники: {', '.join(allowed_docs) if allowed_docs else '—'}\n\n"
+            f"Разрешённые источники: {', '.join(allowed_docs) if allowed_docs else '—'}\n"
+            f"{passages_line}\n"
             f"=== База знаний ===\n{docs_block}\n\n"
         )
         
         # Добавляем динамический пример если есть
         if dynamic_example:
             system_content += f"=== ПРИМЕР АДАПТАЦИИ СТИЛЯ ===\n{dynamic_example}\n\n"
+
+        # Сжатая память диалога: ранние реплики и факты вместо длинной сырой истории
+        memory = router_result.get("memory")
+        if memory:
+            system_content += f"=== ЧТО ИЗВЕСТНО ИЗ ДИАЛОГА ===\n{memory}\n\n"
         
         # Динамически устанавливаем лимит слов в зависимости от наличия CTA
         if cta_text:
@@ -514,8 +725,10 @@ class ResponseGenerator:
                     "content": "А теперь ответь на мой актуальный вопрос, используя похожий стиль интеграции информации о пробном занятии:"
                 })
 
-        # История: только последние сообщения согласно настройке (по умолчанию 10)
-        trimmed_history = history[-self.history_limit :] if len(history) > self.history_limit else history
+        # История: только последние сообщения согласно настройке (по умолчанию 10),
+        # а при сжатой памяти — последние MEMORY_RECENT_MESSAGES (остальное уже в памяти)
+        limit = self.cfg.MEMORY_RECENT_MESSAGES if memory else self.history_limit
+        trimmed_history = history[-limit:] if len(history) > limit else history
         if trimmed_history:
             messages.extend(trimmed_history)
 
@@ -562,12 +775,11 @@ class ResponseGenerator:
         cta_final_instruction = ""
         if cta_text:
             # Диагностическое логирование
-            self._debug(f"\n📝 DEBUG CTA: Добавляем инструкцию для {user_signal}")
-            self._debug(f"   CTA текст: {cta_text[:80]}...")
+            log.debug("generator.build_messages", "📝 DEBUG CTA: Добавляем инструкцию для %s: %s...", user_signal, cta_text[:80])
             
             # Дифференцированная позиция CTA в зависимости от сигнала
             if user_signal == "ready_to_buy":
-                self._debug(f"   Позиция: в НАЧАЛЕ ответа (ready_to_buy)")
+                log.debug("generator.build_messages", "Позиция: в НАЧАЛЕ ответа (ready_to_buy)")
                 cta_final_instruction = (
                     f"\n\n🔴🔴🔴 КРИТИЧНО: ПОЛЬЗОВАТЕЛЬ ГОТОВ ЗАПИСАТЬСЯ! 🔴🔴🔴\n"
                     f"ОН ЯВНО ПРОСИТ ЗАПИСАТЬ ЕГО НА ПРОБНОЕ ЗАНЯТИЕ!\n"
@@ -579,7 +791,7 @@ class ResponseGenerator:
                     f"После информации о записи можешь добавить 1-2 предложения о гарантиях."
                 )
             elif user_signal == "price_sensitive":
-                self._debug(f"   Позиция: в НАЧАЛЕ ответа (price_sensitive)")
+                log.debug("generator.build_messages", "Позиция: в НАЧАЛЕ ответа (price_sensitive)")
                 cta_final_instruction = (
                     f"\n\n🔴🔴🔴 ФИНАЛЬНОЕ КРИТИЧЕСКОЕ ТРЕБОВАНИЕ 🔴🔴🔴\n"
                     f"{cta_detail_instruction}\n"
@@ -589,7 +801,7 @@ class ResponseGenerator:
                     f"Если не включишь - ответ считается ПРОВАЛЬНЫМ!"
                 )
             else:
-                self._debug(f"   Позиция: в КОНЦЕ ответа (exploring/anxiety)")
+                log.debug("generator.build_messages", "Позиция: в КОНЦЕ ответа (exploring/anxiety)")
                 cta_final_instruction = (
                     f"\n\n🔴🔴🔴 ФИНАЛЬНОЕ КРИТИЧЕСКОЕ ТРЕБОВАНИЕ 🔴🔴🔴\n"
                     f"{cta_detail_instruction}\n"
@@ -621,227 +833,6 @@ class ResponseGenerator:
         )
         return messages
 
-    def _strip_source_citations(self, text: str) -> str:
-        """Полностью удаляет метки источников вида [doc: filename.md] из текста ответа."""
-        pattern = re.compile(r"\[doc:\s*[^\]]+\]")
-        return pattern.sub("", text)
-
-    # --- Постобработка для гладкого ответного текста ---
-    def _remove_question_headings(self, text: str) -> str:
-        """Убирает строки-заголовки, которые дублируют декомпозированные вопросы,
-        вида '1. **...?...**' или '- **...?...**' в начале блоков. Не трогает обычные списки.
-        """
-        lines = text.splitlines()
-        cleaned_lines: List[str] = []
-        heading_re = re.compile(r"^\s*(?:\d+\.|-)\s*\*\*[^*\n]*\?\*\*\s*$")
-        for ln in lines:
-            if heading_re.match(ln):
-                # Пропускаем такие заголовки
-                continue
-            cleaned_lines.append(ln)
-        # Сжать избыточные пустые строки
-        out: List[str] = []
-        empty = 0
-        for ln in cleaned_lines:
-            if ln.strip() == "":
-                empty += 1
-                if empty <= 2:
-                    out.append(ln)
-            else:
-                empty = 0
-                out.append(ln)
-        return "\n".join(out).strip()
-
-    def _humanize_missing_info(self, text: str) -> str:
-        """Заменяет сухие формулировки об отсутствующих данных на более дружелюбные.
-        Примеры: "Нет данных в документах", "в документах не указано" → человеческая фраза.
-        """
-        replacements = [
-            r"нет\s+данных\s+в\s+документ(ах|ахах|ахах)?",
-            r"в\s+документ(ах|ахах|ахах)?\s+не\s+указано",
-            r"информац(ии|ия)\s+в\s+документ(ах|ахах|ахах)?\s+отсутствует",
-        ]
-        friendly = "В наших материалах этого нет."
-        out = text
-        for pat in replacements:
-            out = re.sub(pat, friendly, out, flags=re.IGNORECASE)
-        return out
-
-    def _strip_service_labels(self, text: str) -> str:
-        """Удаляет служебные заголовки вида 'Коротко:', 'Важно:', 'Итого:', 'Могу помочь:'
-        При этом сохраняет содержимое после двоеточия (если есть)."""
-        out_lines: List[str] = []
-        label_re = re.compile(r"^\s*(Коротко|Важно|Итого|Могу помочь)\s*:\s*(.*)$", re.IGNORECASE)
-        for ln in text.splitlines():
-            m = label_re.match(ln)
-            if m:
-                content_after = m.group(2).strip()
-                if content_after:
-                    out_lines.append(content_after)
-                # если только лейбл без текста — пропускаем строку
-            else:
-                out_lines.append(ln)
-        return "\n".join(out_lines)
-
-    def _strip_generic_cta(self, text: str) -> str:
-        """Убирает навязчивые финальные CTA вроде 'Если у вас есть дополнительные вопросы...' и похожие."""
-        patterns = [
-            r"^\s*Если у вас есть .*вопрос",
-            r"^\s*Если будут вопросы",
-            r"^\s*Готов(а|ы)? помочь",
-            r"^\s*Могу уточнить у менеджера",
-            r"^\s*Я могу .* (уточнить|помочь)",
-        ]
-        lines = [ln for ln in text.splitlines() if not any(re.search(p, ln, flags=re.IGNORECASE) for p in patterns)]
-        # также удалим лишние пустые строки в конце
-        while lines and lines[-1].strip() == "":
-            lines.pop()
-        return "\n".join(lines)
-
-    # Удаляем метод _stylize_response, так как теперь стилизация встроена в основной промпт
-    
-    def _final_sanitize(self, text: str) -> str:
-        """Финальная очистка: убираем восклицания и дедуплицируем предложения."""
-        out = text
-        
-        # Заменяем английские слова на русские эквиваленты
-        english_to_russian = {
-            "empathy": "эмпатичными",
-            # "soft skills": "гибкие навыки",  # ОТКЛЮЧЕНО: оставляем термин на английском
-            "feedback": "обратную связь",
-            "team building": "командообразование",
-            "deadline": "срок",
-            "workshop": "мастер-класс",
-            "mentor": "наставник"
-        }
-        
-        for eng, rus in english_to_russian.items():
-            # Заменяем с учётом регистра
-            out = out.replace(eng, rus)
-            out = out.replace(eng.capitalize(), rus.capitalize())
-        
-        # Заменяем украинские слова на русские эквиваленты
-        # (Claude иногда генерирует украинские слова из-за контекста украинской школы)
-        ukrainian_to_russian = {
-            "підтримують": "поддерживают",
-            "підтримати": "поддержать",
-            "підтримка": "поддержка",
-            "дітей": "детей",
-            "діти": "дети",
-            "дитина": "ребёнок",
-            "навчання": "обучение",
-            "навчають": "обучают",
-            "навчатися": "учиться",
-            "вчитель": "учитель",
-            "вчителі": "учителя",
-            "батьки": "родители",
-            "батьків": "родителей",
-            "розвиток": "развитие",
-            "один одного": "друг друга",
-            "допомагають": "помогают",
-            "допомогти": "помочь",
-            "працюють": "работают",
-            "працювати": "работать"
-        }
-        
-        for ukr, rus in ukrainian_to_russian.items():
-            # Заменяем с учётом регистра
-            out = out.replace(ukr, rus)
-            out = out.replace(ukr.capitalize(), rus.capitalize())
-        
-        # Проверка на обрезанный ответ и исправление
-        # Если последнее предложение не заканчивается знаком препинания - удаляем его
-        if out and not out.rstrip().endswith(('.', '!', '?', '"', '»')):
-            # Находим последнее полное предложение
-            sentences = re.split(r'(?<=[.!?])\s+', out)
-            if len(sentences) > 1:
-                # Удаляем неполное последнее предложение
-                out = ' '.join(sentences[:-1])
-                # Добавляем многоточие, чтобы показать продолжение мысли
-                if not out.rstrip().endswith(('.', '!', '?')):
-                    out = out.rstrip() + '.'
-            else:
-                # Если весь текст - одно неполное предложение, добавляем многоточие
-                out = out.rstrip() + '...'
-        
-        # ИСПРАВЛЕНИЕ: Убираем артефакты "00" БЕЗ удаления нулей из чисел
-        # 1. Убираем артефакты типа "30-секундное00", "5-минутное00"
-        out = re.sub(r'(\d+)-([\u0430-\u044f\u0451]+)00\b', r'\1-\2', out, flags=re.IGNORECASE)
-        
-        # 2. ИСПРАВЛЕНО: Убираем "00" только после БУКВ, не после цифр!
-        # Это предотвратит удаление нулей из "7000", "2800" и т.д.
-        out = re.sub(r'([а-яА-ЯёЁa-zA-Z]+)00\s+', r'\1 ', out)  # Только после букв!
-        
-        # 3. Убираем отдельно стоящие "00" (но не внутри чисел и не во времени)
-        # Используем negative lookbehind и lookahead чтобы не трогать числа
-        # Добавлено исключение для времени в формате HH:00
-        out = re.sub(r'(?<!\d)(?<!:)00(?!\d)', '', out)  # "00" не окружённые цифрами и не после двоеточия
-        
-        # 4. Убираем множественные пробелы после очистки
-        out = re.sub(r'\s{2,}', ' ', out)
-        
-        # Убираем восклицания
-        out = out.replace("!", ".")
-        
-        # Дедупликация предложений с защитой от сокращений
-        safe = out
-        safe = re.sub(r"\bт\.д\.", "т_д", safe)
-        safe = re.sub(r"\bт\.п\.", "т_п", safe)
-        
-        chunks = re.split(r"(?<=[\.\?\!])\s+|\n", safe)
-        sentences: List[str] = []
-        for ch in chunks:
-            s = ch.strip()
-            if s:
-                sentences.append(s)
-        
-        seen = set()
-        deduped: List[str] = []
-        for s in sentences:
-            key = re.sub(r"\s+", " ", s.lower()).strip()
-            if key and key not in seen:
-                seen.add(key)
-                deduped.append(s)
-        
-        # Склейка и восстановление сокращений
-        text_out = " ".join(deduped)
-        text_out = text_out.replace("т_д", "т.д.").replace("т_п", "т.п.")
-        text_out = "\n".join(line.rstrip() for line in text_out.splitlines())
-        text_out = re.sub(r"\n{3,}", "\n", text_out)
-        
-        # КРИТИЧЕСКОЕ: Принудительное добавление абзацев, если их нет
-        if '\n' not in text_out and len(text_out) > 200:
-            # Разбиваем длинный текст на абзацы по предложениям
-            sentences = re.split(r'(?<=[.!?])\s+', text_out)
-            
-            if len(sentences) >= 3:
-                # Группируем предложения в абзацы (по 2-3 предложения)
-                paragraphs = []
-                current_para = []
-                
-                for i, sentence in enumerate(sentences):
-                    current_para.append(sentence)
-                    # Создаём новый абзац после каждых 2-3 предложений
-                    if len(current_para) >= 2 and (i == len(sentences) - 1 or len(current_para) >= 3):
-                        paragraphs.append(' '.join(current_para))
-                        current_para = []
-                
-                # Оставшиеся предложения
-                if current_para:
-                    paragraphs.append(' '.join(current_para))
-                
-                # Объединяем абзацы с одинарным переводом строки
-                text_out = '\n'.join(paragraphs)
-                print(f"📝 Принудительно добавлены абзацы: {len(paragraphs)} абзацев")
-        
-        # Важно: strip() удаляет ВСЕ переводы строк, включая абзацы!
-        # Удаляем только лишние пробелы в начале/конце, сохраняя структуру
-        return text_out.strip()
-    
-    def _sanitize_style(self, text: str) -> str:
-        """Старый метод оставляем для обратной совместимости."""
-        return self._final_sanitize(text)
-    
     def _should_add_offer(self, user_signal: str, history: list, offer: dict, current_message: str = None) -> bool:
         """Проверяет, нужно ли добавлять offer (rate limiting + контекст)
         
@@ -861,7 +852,7 @@ class ResponseGenerator:
         # Максимум 2 CTA про скидки за весь диалог
         discount_count = self._count_cta_occurrences("price_sensitive", history)
         if user_signal == "price_sensitive" and discount_count >= 2:
-            print(f"🔒 ГЛОБАЛЬНОЕ ОГРАНИЧЕНИЕ: Уже было {discount_count} CTA про скидки (максимум 2)")
+            log.info("generator.should_add_offer", "🔒 ГЛОБАЛЬНОЕ ОГРАНИЧЕНИЕ: Уже было %s CTA про скидки (максимум 2)", discount_count)
             return False
         
         # Минимум 3 сообщения между любыми CTA
@@ -880,7 +871,7 @@ class ResponseGenerator:
         
         if last_cta_position >= 0 and len(history) - last_cta_position < 3:
             messages_since = len(history) - last_cta_position
-            print(f"⏰ ГЛОБАЛЬНОЕ: Последний CTA был {messages_since} сообщений назад (нужно минимум 3)")
+            log.info("generator.should_add_offer", "⏰ ГЛОБАЛЬНОЕ: Последний CTA был %s сообщений назад (нужно минимум 3)", messages_since)
             return False
         
         # Блокировка для exploring_only при упоминании цены
@@ -891,7 +882,7 @@ class ResponseGenerator:
                 if msg.get("role") == "user":
                     user_text = msg.get("content", "").lower()
                     if any(keyword in user_text for keyword in price_keywords):
-                        print(f"🚫 Блокировка CTA для exploring_only: обнаружено упоминание цены")
+                        log.info("generator.should_add_offer", "🚫 Блокировка CTA для exploring_only: обнаружено упоминание цены")
                         return False
         
         # ========== КОНТЕКСТНЫЕ ПРОВЕРКИ ПО СИГНАЛАМ ==========
@@ -910,15 +901,14 @@ class ResponseGenerator:
         if user_signal == "price_sensitive":
             # Проверяем только прямые вопросы о скидках/рассрочке
             skip_phrases = ["скидки", "скидка", "рассрочк", "есть ли скидк", "какие скидк"]
-            self._debug(f"🔍 DEBUG _should_add_offer для price_sensitive:")
-            self._debug(f"   last_user_msg: '{last_user_msg}'")
+            log.debug("generator.should_add_offer", "🔍 DEBUG _should_add_offer для price_sensitive: last_user_msg='%s'", last_user_msg)
             
             for phrase in skip_phrases:
                 if phrase in last_user_msg:
-                    self._debug(f"   ✅ Найдена фраза '{phrase}' в сообщении пользователя")
-                    self._debug("🔄 Контекст: Пользователь прямо спрашивает про скидки, пропускаем CTA")
+                    log.debug("generator.should_add_offer", "✅ Найдена фраза '%s' в сообщении пользователя", phrase)
+                    log.debug("generator.should_add_offer", "🔄 Контекст: Пользователь прямо спрашивает про скидки, пропускаем CTA")
                     return False
-            self._debug(f"   ⭕ Контекстная проверка пройдена, проверяем rate limiting...")
+            log.debug("generator.should_add_offer", "⭕ Контекстная проверка пройдена, проверяем rate limiting...")
         
         # Для price_sensitive - rate limiting (каждое 2-е сообщение)
         if user_signal == "price_sensitive":
@@ -934,7 +924,7 @@ class ResponseGenerator:
             
             # Добавляем CTA только на чётных позициях (0, 2, 4...)
             if price_sensitive_streak % 2 == 1:
-                print(f"🔄 Rate limiting: price_sensitive streak={price_sensitive_streak}, пропускаем CTA")
+                log.info("generator.should_add_offer", "🔄 Rate limiting: price_sensitive streak=%s, пропускаем CTA", price_sensitive_streak)
                 return False
         
         # Для anxiety_about_child - контекстная проверка и rate limiting
@@ -955,13 +945,13 @@ class ResponseGenerator:
             
             # Не добавляем CTA сразу при первом появлении anxiety
             if anxiety_count < 2:
-                print(f"🕑 Задержка CTA для anxiety: только {anxiety_count} сообщений с этим сигналом, нужно минимум 2")
+                log.info("generator.should_add_offer", "🕑 Задержка CTA для anxiety: только %s сообщений с этим сигналом, нужно минимум 2", anxiety_count)
                 return False
             
             # Контекстная проверка - не дублируем информацию о пробном занятии
             trial_phrases = ["пробное", "пробный", "первое занятие", "попробовать", "бесплатн"]
             if any(phrase in last_user_msg for phrase in trial_phrases):
-                print("🔄 Контекст: Пользователь спрашивает про пробное занятие, пропускаем CTA")
+                log.info("generator.should_add_offer", "🔄 Контекст: Пользователь спрашивает про пробное занятие, пропускаем CTA")
                 return False
             
             # Проверяем последние 4 сообщения ассистента
@@ -979,7 +969,7 @@ class ResponseGenerator:
                     "попробует", "оцените подходит"
                 ]
                 if any(phrase in msg_content.lower() for phrase in anxiety_cta_phrases):
-                    print("🔄 Rate limiting: CTA для anxiety был недавно, пропускаем")
+                    log.info("generator.should_add_offer", "🔄 Rate limiting: CTA для anxiety был недавно, пропускаем")
                     return False
         
         # Для ready_to_buy - rate limiting и контекстная проверка
@@ -987,7 +977,7 @@ class ResponseGenerator:
             # Контекстная проверка - если пользователь уже говорит о записи
             recording_phrases = ["записалась", "записался", "отправил", "заполнил", "зарегистрировал"]
             if any(phrase in last_user_msg for phrase in recording_phrases):
-                print("🔄 Контекст: Пользователь уже записался, пропускаем CTA")
+                log.info("generator.should_add_offer", "🔄 Контекст: Пользователь уже записался, пропускаем CTA")
                 return False
             
             # Rate limiting - не чаще чем каждое второе сообщение
@@ -1001,7 +991,7 @@ class ResponseGenerator:
                         recent_count += 1
             
             if recent_count >= 1:
-                print("🔄 Rate limiting: CTA для ready_to_buy был в предыдущем сообщении")
+                log.info("generator.should_add_offer", "🔄 Rate limiting: CTA для ready_to_buy был в предыдущем сообщении")
                 return False
         
         return True
@@ -1101,7 +1091,7 @@ class ResponseGenerator:
                                 "снижен", "рассрочк", "оплат", "стоимост", "доступн"]
             found = any(concept in response_lower for concept in discount_concepts)
             if found:
-                print(f"✅ CTA обнаружен: нашли концепты скидок/рассрочки")
+                log.info("generator.verify_cta_included", "✅ CTA обнаружен: нашли концепты скидок/рассрочки")
             return found
         
         if "пробное" in cta_text.lower() or "бесплатн" in cta_text.lower():
@@ -1110,7 +1100,7 @@ class ResponseGenerator:
                              "без обязательств", "оценить", "познакомиться"]
             found = any(concept in response_lower for concept in trial_concepts)
             if found:
-                print(f"✅ CTA обнаружен: нашли концепты пробного занятия")
+                log.info("generator.verify_cta_included", "✅ CTA обнаружен: нашли концепты пробного занятия")
             return found
         
         if "shao3d.github.io" in cta_text.lower():
@@ -1119,7 +1109,7 @@ class ResponseGenerator:
                               "регистр", "оформ", "перейти", "ссылк"]
             found = any(concept in response_lower for concept in signup_concepts)
             if found:
-                print(f"✅ CTA обнаружен: нашли концепты записи")
+                log.info("generator.verify_cta_included", "✅ CTA обнаружен: нашли концепты записи")
             return found
         
         # Fallback - если хотя бы 30% слов из CTA есть в ответе
@@ -1128,7 +1118,7 @@ class ResponseGenerator:
         common_words = cta_words & response_words
         found = len(common_words) >= len(cta_words) * 0.3
         if found:
-            print(f"✅ CTA обнаружен через fallback: {len(common_words)}/{len(cta_words)} слов")
+            log.info("generator.verify_cta_included", "✅ CTA обнаружен через fallback: %s/%s слов", len(common_words), len(cta_words))
         return found
     
     def _get_few_shot_examples(self, user_signal: str, has_cta: bool) -> List[Dict[str, str]]:
@@ -1202,33 +1192,6 @@ class ResponseGenerator:
             
         return keywords
     
-    def _make_urls_clickable(self, text: str) -> str:
-        """Преобразует URL в тексте в HTML-ссылки
-
-        Args:
-            text: Текст для обработки
-
-        Returns:
-            Текст с кликабельными ссылками
-        """
-        # Паттерны для поиска URL (включая наш новый домен)
-        url_patterns = [
-            r'https?://[^\s/$]+',  # https://domain.tld/...
-            r'shao3d\.github\.io/[^\s/]+',  # shao3d.github.io/...
-            r'ukido\.com\.ua/[^\s/]+',  # ukido.com.ua/...
-            r'(?:[^/]+\.)\.(?:com|ua|io|site|online|app|dev|stage|prod)[^\s/]+',  # domain.extension/
-        ]
-
-        def replace_url(match):
-            url = match.group(0)
-            # Добавляем https:// если нет протокола
-            if not url.startswith(('http://', 'https://')):
-                url = 'https://' + url
-            return f'<a href="{url}" target="_blank">{url}</a>'
-
-        # Применяем ко всем найденным URL
-        return re.sub('|'.join(url_patterns), replace_url, text)
-
     def _get_cta_marker(self, user_signal: str) -> str:
         """Возвращает невидимый маркер для отслеживания CTA
 
@@ -0,0 +1,76 @@
+"""
+response_stream.py - Канал событий /chat/stream на время обработки одного сообщения
+
+/chat/stream раньше ждал полного ответа chat() и затем «печатал» готовый текст
+по словам с задержкой. Теперь обработчик SSE открывает stream_scope() и запускает
+обычный пайплайн: роутер отправляет в канал свои метаданные, генератор — токены
+Claude по мере прихода. Канал передаётся через contextvar (как usage_scope), поэтому
+сигнатура пайплайна не меняется, а без открытого канала всё работает как раньше.
+"""
+
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+
+class ResponseStream:
+    """События одного ответа: ("metadata", dict) и ("message", str)"""
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.metadata_sent = False
+        self.streamed: list = []  # Отправленные клиенту куски текста
+
+    @property
+    def streamed_text(self) -> str:
+        return "".join(self.streamed)
+
+    def metadata(self, data: Dict[str, Any]) -> None:
+        """Метаданные роутера — первое событие стрима (повторные игнорируются)"""
+        if self.metadata_sent:
+            return
+        self.metadata_sent = True
+        self._queue.put_nowait(("metadata", data))
+
+    def token(self, text: str) -> None:
+        """Кусок ответа генератора"""
+        if text:
+            self.streamed.append(text)
+            self._queue.put_nowait(("message", text))
+
+    async def events(self, task: "asyncio.Task") -> AsyncIterator[Tuple[str, Any]]:
+        """
+        События по мере появления, пока task не завершится
+
+        Исключение task не перехватывается: его получает await task после цикла.
+        """
+        while True:
+            getter = asyncio.ensure_future(self._queue.get())
+            done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+                continue
+            getter.cancel()
+            break
+        while not self._queue.empty():
+            yield self._queue.get_nowait()
+
+
+_current_stream: contextvars.ContextVar[Optional[ResponseStream]] = contextvars.ContextVar("response_stream", default=None)
+
+
+@contextmanager
+def stream_scope() -> Iterator[ResponseStream]:
+    """Открывает канал событий для задач, созданных внутри блока"""
+    stream = ResponseStream()
+    token = _current_stream.set(stream)
+    try:
+        yield stream
+    finally:
+        _current_stream.reset(token)
+
+
+def current_stream() -> Optional[ResponseStream]:
+    """Канал текущего запроса или None (обычный /chat)"""
+    return _current_stream.get()
@@ -0,0 +1,115 @@
+"""
+route_cache.py - LRU+TTL кеш решений роутера
+
+Одни и те же вступительные вопросы («сколько стоит?», «какие курсы для 9 лет?»)
+приходят много раз в день, и каждый раз Gemini заново классифицирует идентичный
+запрос. Кеш хранит провалидированные решения роутера по ключу:
+нормализованное сообщение + отпечаток окна истории + версия саммари.
+
+В кеше лежит общая часть решения — без полей конкретного пользователя
+(original_message, fuzzy_matched, учёт повторных приветствий): их роутер
+накладывает заново при каждом попадании.
+"""
+
+import copy
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def normalize_message(text: str) -> str:
+    """Регистр, ё/е, пунктуация и пробелы не влияют на решение роутера"""
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def history_fingerprint(history: List[Dict[str, str]], window: int, extra: str = "") -> str:
+    """
+    Компактный отпечаток последних сообщений истории
+
+    Args:
+        history: История диалога
+        window: Сколько последних сообщений учитывать (0 — история не учитывается)
+        extra: Дополнительные признаки контекста, влияющие на промпт
+    """
+    recent = history[-window:] if window > 0 else []
+    digest = hashlib.sha1(extra.encode("utf-8"))
+    for msg in recent:
+        digest.update(f"{msg.get('role', '')}:{normalize_message(msg.get('content', ''))}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class RouteCache:
+    """Ограниченный по размеру и времени жизни кеш решений роутера"""
+
+    def __init__(self, max_size: int = 2048, ttl_seconds: float = 3600.0):
+        """
+        Args:
+            max_size: Максимум решений в кеше (самые давно использованные вытесняются)
+            ttl_seconds: Время жизни решения
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # key → (решение, истекает в, сколько секунд стоил запрос к Gemini)
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float, float]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0}
+        self.latency_saved = 0.0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Копия решения или None (промах / истёк срок)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        decision, expires_at, cost = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        self.latency_saved += cost
+        # Вызывающий код дописывает поля в решение — отдаём копию
+        return copy.deepcopy(decision)
+
+    def put(self, key: str, decision: Dict[str, Any], cost_seconds: float = 0.0) -> None:
+        """
+        Сохраняет решение
+
+        Args:
+            key: Ключ из make_key
+            decision: Провалидированное решение без пользовательских полей
+            cost_seconds: Время запроса к Gemini (для оценки сэкономленной задержки)
+        """
+        self._entries[key] = (copy.deepcopy(decision), time.monotonic() + self.ttl_seconds, cost_seconds)
+        self._entries.move_to_end(key)
+        self.stats["stores"] += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    @staticmethod
+    def make_key(message: str, fingerprint: str, summaries_version: str) -> Optional[str]:
+        """Ключ кеша; None — сообщение без слов (эмодзи, пунктуация) не кешируется"""
+        normalized = normalize_message(message)
+        if not normalized:
+            return None
+        return f"{summaries_version}|{fingerprint}|{normalized}"
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            **self.stats,
+            "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+        }
@@ -3,18 +3,66 @@ router.py - Псевдо-двухэтапный LLM роутер для выбо
 Версия 2.0: Декомпозиция + Классификация в одном промпте
 """
 
+import asyncio
 import json
+import re
+import time
+from contextvars import ContextVar
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from openrouter_client import OpenRouterClient
 from gemini_cached_client import GeminiCachedClient
+from bulkhead import BulkheadRejected, get_bulkheads
 from config import Config
-from social_intents import has_business_signals_extended
+from social_intents import (
+    ACKNOWLEDGMENT_PHRASES,
+    SocialIntent,
+    detect_pure_social,
+    detect_social_intent,
+    has_business_signals_extended,
+)
 from social_state import SocialStateManager  # Нужен для отслеживания повторных приветствий
-# Удалены неиспользуемые импорты после рефакторинга:
-# detect_social_intent, SocialIntent - больше не нужны (Gemini обрабатывает)
+# detect_pure_social — локальный быстрый путь для чистых социальных реплик,
+# detect_social_intent — ранний offtopic в route_streaming (остальное определяет Gemini)
 # SocialResponder - больше не нужен (обработка в main.py)
+from openrouter_client_stream import chat_stream
+from json_stream import JsonFieldStream
+from llm_resilience import get_resilience_executor
+from model_health import get_model_health
+from route_cache import RouteCache, history_fingerprint
+from prompt_segments import PromptSegments, estimate_tokens
+from summary_selector import SummarySelector
+from keyword_index import KeywordIndex
+from keyword_matcher import get_keyword_matcher
 from standard_responses import get_offtopic_response, DEFAULT_FALLBACK, NEED_SIMPLIFICATION_MESSAGE
+from event_log import get_logger
+
+log = get_logger(__name__)
+
+# Путь: src/ -> корень проекта -> data/summaries.json
+SUMMARIES_PATH = Path(__file__).parent.parent / "data" / "summaries.json"
+# Документы, которые отдаёт генератор (их заголовки входят в индекс предотбора)
+DOCUMENTS_DIR = Path(__file__).parent.parent / "data" / "documents_compressed"
+
+# Общий для экземпляров Router индекс ключевых слов текущей версии промпта
+_keyword_indexes: Dict[str, KeywordIndex] = {}
+
+# Телеметрия текущего вызова route()/route_streaming() — своя у каждой asyncio-задачи
+_call_trace: ContextVar[Optional[Dict[str, Any]]] = ContextVar("router_call_trace", default=None)
+
+# Маркеры price_sensitive в истории (общий автомат keyword_matcher)
+get_keyword_matcher().register("router.money", ["деньги", "цена", "стоит", "оплата", "платить", "грн", "гривен", "тысяч"])
+get_keyword_matcher().register("router.price_negative", ["дорого", "30 тысяч", "лабуда", "золотые уроки", "с ума сошли"])
+
+
+def last_call_trace() -> Optional[Dict[str, Any]]:
+    """
+    Телеметрия последнего вызова роутера в текущей задаче (бенчмарки, отладка)
+
+    Returns:
+        {"path": social|cache|gemini|fallback, "prompt_chars", "estimated_tokens", "parse_seconds"} или None
+    """
+    return _call_trace.get()
 
 
 class Router:
@@ -37,7 +85,8 @@ class Router:
                 seed=config.SEED,
                 max_tokens=config.MAX_TOKENS,
                 temperature=config.TEMPERATURE,
-                model=config.MODEL
+                model=config.MODEL,
+                stage="router"
             )
         else:
             self.client = OpenRouterClient(
@@ -45,18 +94,52 @@ class Router:
                 seed=config.SEED,
                 max_tokens=config.MAX_TOKENS,
                 temperature=config.TEMPERATURE,
-                model=config.MODEL
+                model=config.MODEL,
+                stage="router"
             )
         
         self.summaries = self._load_summaries()
+        # Статичные сегменты промпта собираются один раз и пересобираются при изменении summaries.json
+        self._segments = PromptSegments([SUMMARIES_PATH], check_interval=config.PROMPT_RELOAD_CHECK_SECONDS)
+        self._segments.compile(self._prompt_sections())
+        # Версия промпта входит в ключ кеша решений: новые саммари — новые решения
+        self.summaries_version = self._segments.version
+        # BM25-предотбор: в промпт идут саммари только документов-кандидатов
+        self._selector = self._build_selector()
+        self.preselect_stats = {"estimated_tokens_saved": 0}
+        # Индекс ключевых слов: документы для need_simplification и проверка выбора Gemini
+        self._keyword_index = self._build_keyword_index()
+        self.keyword_stats = {
+            "simplification_resolved": 0,
+            "checked": 0,
+            "unknown_dropped": 0,
+            "unsupported": 0,
+            "suggested_missing": 0,
+        }
         self.use_cache = use_cache
+        # Кеш провалидированных решений (use_cache — это кеш промпта Gemini, не путать)
+        self.route_cache = (
+            RouteCache(Config.ROUTE_CACHE_SIZE, Config.ROUTE_CACHE_TTL) if Config.ROUTE_CACHE_ENABLED else None
+        )
         # Социальные компоненты теперь обрабатываются в main.py
         # после получения ответа от Gemini
         self._social_state = social_state or SocialStateManager()  # Используем переданный экземпляр или создаём новый
 
+        # Статистика потокового режима (route_streaming)
+        self.stream_stats = {"streamed": 0, "early_offtopic": 0, "stream_fallbacks": 0}
+        self._stream_timings = {"first_field": 0.0, "complete": 0.0, "complete_count": 0}
+        # Статистика локального быстрого пути для социальных реплик
+        self.social_stats = {"checked": 0, "hits": 0, "latency_saved_seconds": 0.0}
+        self.social_hits_by_intent: Dict[str, int] = {}
+        # Какой путь прошёл каждый вызов и сколько стоили запросы к Gemini
+        self.call_stats = {
+            "calls": 0, "social": 0, "cache": 0, "gemini": 0, "fallback": 0,
+            "invalid_responses": 0, "prompt_chars": 0, "estimated_tokens": 0, "parse_seconds": 0.0,
+        }
+
         # Проверяем что саммари загрузились
         if not self.summaries:
-            print("⚠️ Внимание: summaries.json не загружен!")
+            log.warning("router.init", "⚠️ Внимание: summaries.json не загружен!")
     
     def _is_recent_session(self, history: List[Dict[str, str]]) -> bool:
         """Проверяет, была ли недавняя активность в диалоге (в пределах часа)
@@ -78,24 +161,28 @@ class Router:
     def _load_summaries(self) -> dict:
         """Загружает summaries.json из data/"""
         try:
-            # Путь: src/ -> корень проекта -> data/summaries.json
-            path = Path(__file__).parent.parent / "data" / "summaries.json"
-            with open(path, "r", encoding="utf-8") as f:
+            with open(SUMMARIES_PATH, "r", encoding="utf-8") as f:
                 data = json.load(f)
-                print(f"✅ Загружено {len(data)} саммари документов")
+                log.info("router.load_summaries", "✅ Загружено %s саммари документов", len(data))
                 return data
         except FileNotFoundError:
-            print(f"❌ Файл summaries.json не найден")
+            log.error("router.load_summaries", "❌ Файл summaries.json не найден")
             return {}
         except json.JSONDecodeError as e:
-            print(f"❌ Ошибка парсинга JSON: {e}")
+            log.error("router.load_summaries", "❌ Ошибка парсинга JSON: %s", e)
             return {}
         except Exception as e:
-            print(f"❌ Неожиданная ошибка: {e}")
+            log.error("router.load_summaries", "❌ Неожиданная ошибка: %s", e)
             return {}
     
     
-    async def route(self, user_message: str, history: Optional[List[Dict[str, str]]] = None, user_id: str = "anonymous") -> dict:
+    async def route(
+        self,
+        user_message: str,
+        history: Optional[List[Dict[str, str]]] = None,
+        user_id: str = "anonymous",
+        memory: Optional[str] = None,
+    ) -> dict:
         """
         Анализирует запрос и возвращает решение о маршрутизации
         
@@ -103,6 +190,7 @@ class Router:
             user_message: Текущее сообщение пользователя
             history: История диалога формата [{"role": "user/assistant", "content": "..."}]
             user_id: Идентификатор пользователя для отслеживания социального состояния
+            memory: Сжатая память диалога (HistoryManager.get_memory_prompt) — тогда дословно идут только последние сообщения
             
         Returns:
             Для success: {"status": "success", "documents": ["doc1.md", "doc2.md"], "decomposed_questions": [...]}
@@ -114,7 +202,321 @@ class Router:
         # Защита от None
         if history is None:
             history = []
+        self._begin_call()
+
+        # Чистые социальные реплики без бизнес-маркеров отвечаются без Gemini
+        local_decision = self._local_social_decision(user_message, history)
+        if local_decision is not None:
+            return self._end_call("social", local_decision)
+
+        self._refresh_prompt_segments()
+        user_message, was_fuzzy_matched = self._prepare_message(user_message, history)
+
+        # Тот же вопрос в том же контексте уже классифицирован
+        cache_key = self._cache_key(user_message, history, memory)
+        cached = self._cached_decision(cache_key)
+        if cached is not None:
+            return self._end_call("cache", self._personalize(cached, original_message, was_fuzzy_matched, user_id))
+        
+        # Логируем что остальные запросы идут в Gemini для умной классификации
+        log.info("router.route", "ℹ️ Routing to Gemini: %s%s", user_message[:50], "..." if len(user_message) > 50 else "")
         
+        # ВАЖНО: Больше НЕ блокируем mixed интенты!
+        # Gemini сам определит social_context, user_signal и status
+        # Это решает проблему с фразами типа "Спасибо, запишите нас"
+        
+        try:
+            started = time.perf_counter()
+            response = await self._request_decision(user_message, history, memory)
+            decision = await self._decide(response, user_message, history)
+            if decision is None:
+                return self._fallback_response()
+            self._store_decision(cache_key, decision, time.perf_counter() - started)
+            return self._end_call("gemini", self._personalize(decision, original_message, was_fuzzy_matched, user_id))
+        except BulkheadRejected:
+            # Перегрузка: пусть API ответит 503, а не подменит ответ фолбэком
+            raise
+        except Exception as e:
+            log.error("router.route", "❌ Ошибка при вызове Gemini: %s", e)
+            return self._fallback_response()
+
+    async def route_streaming(
+        self,
+        user_message: str,
+        history: Optional[List[Dict[str, str]]] = None,
+        user_id: str = "anonymous",
+        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+        memory: Optional[str] = None,
+    ) -> dict:
+        """
+        То же решение, что route(), но ответ Gemini читается потоком
+
+        Поля JSON разбираются по мере поступления: on_partial получает их, как только
+        появляется новое поле (документы можно грузить до конца ответа), а offtopic
+        возвращается сразу после status и detected_language — остаток ответа не ждём.
+        Если стрим не удался, решение запрашивается обычным route-путём.
+
+        Args:
+            user_message: Текущее сообщение пользователя
+            history: История диалога
+            user_id: Идентификатор пользователя
+            on_partial: Колбэк с уже известными полями решения (документы нормализованы)
+            memory: Сжатая память диалога
+        Returns:
+            Решение роутера в том же формате, что у route()
+        """
+        original_message = user_message
+        if history is None:
+            history = []
+        self._begin_call()
+
+        local_decision = self._local_social_decision(user_message, history)
+        if local_decision is not None:
+            return self._end_call("social", local_decision)
+
+        self._refresh_prompt_segments()
+        user_message, was_fuzzy_matched = self._prepare_message(user_message, history)
+
+        cache_key = self._cache_key(user_message, history, memory)
+        cached = self._cached_decision(cache_key)
+        if cached is not None:
+            return self._end_call("cache", self._personalize(cached, original_message, was_fuzzy_matched, user_id))
+
+        log.info("router.route", "ℹ️ Streaming route to Gemini: %s%s", user_message[:50], "..." if len(user_message) > 50 else "")
+
+        try:
+            started = time.perf_counter()
+            response, early = await self._stream_decision(user_message, history, on_partial, memory)
+            if early is not None:
+                # Ранний offtopic не кешируем: в кеше только решения по полному ответу
+                decision = await self._finalize_decision(early, user_message, history)
+                return self._end_call("gemini", self._personalize(decision, original_message, was_fuzzy_matched, user_id))
+            if not response.strip():
+                self.stream_stats["stream_fallbacks"] += 1
+                response = await self._request_decision(user_message, history, memory)
+            decision = await self._decide(response, user_message, history)
+            if decision is None:
+                return self._fallback_response()
+            self._store_decision(cache_key, decision, time.perf_counter() - started)
+            return self._end_call("gemini", self._personalize(decision, original_message, was_fuzzy_matched, user_id))
+        except BulkheadRejected:
+            raise
+        except Exception as e:
+            log.error("router.route", "❌ Ошибка при вызове Gemini: %s", e)
+            return self._fallback_response()
+
+    async def _stream_decision(
+        self,
+        user_message: str,
+        history: List[Dict[str, str]],
+        on_partial: Optional[Callable[[Dict[str, Any]], None]],
+        memory: Optional[str] = None,
+    ) -> Tuple[str, Optional[dict]]:
+        """
+        Читает решение потоком
+
+        Returns:
+            (полный текст ответа, ранний offtopic или None); пустой текст — стрим не удался
+        """
+        candidates = get_model_health().candidates("router", self.client.model)
+        if not candidates:
+            return "", None
+        model = candidates[0]
+        budget = get_resilience_executor().budget_for("router")
+        if len(candidates) > 1:
+            # Стрим получает долю бюджета стадии: фолбэк-моделям должно остаться время
+            budget *= Config.MODEL_BUDGET_SHARE
+
+        parser = JsonFieldStream()
+        pieces: List[str] = []
+        started = time.perf_counter()
+        first_field: Optional[float] = None
+        self.stream_stats["streamed"] += 1
+        async with get_bulkheads().for_stage("router").slot():
+            stream = chat_stream(
+                self.client,
+                self._decision_messages(user_message, history, memory),
+                model=model,
+                temperature=0.3,
+                max_tokens=500,
+                stage="router",
+            )
+            try:
+                async with asyncio.timeout(budget):
+                    async for piece in stream:
+                        pieces.append(piece)
+                        if not parser.feed(piece):
+                            continue
+                        if first_field is None:
+                            first_field = time.perf_counter() - started
+                            self._stream_timings["first_field"] += first_field
+                        early = self._early_offtopic(parser.fields, user_message)
+                        if early is not None:
+                            self.stream_stats["early_offtopic"] += 1
+                            get_model_health().record_success("router", model, time.perf_counter() - started)
+                            return "".join(pieces), early
+                        if on_partial is not None and parser.fields.get("status") == "success":
+                            on_partial(self._partial_view(parser.fields))
+            except TimeoutError:
+                log.warning("router.stream", "⚠️ Стрим роутера не уложился в %.1fс, переходим на обычный запрос", budget)
+                pieces = []
+            finally:
+                await stream.aclose()
+
+        if not parser.done:
+            # Обрыв стрима или не-JSON: частичный ответ не используем
+            pieces = []
+        if pieces:
+            elapsed = time.perf_counter() - started
+            self._stream_timings["complete"] += elapsed
+            self._stream_timings["complete_count"] += 1
+            get_model_health().record_success("router", model, elapsed)
+        else:
+            get_model_health().record_failure("router", model)
+        return "".join(pieces), None
+
+    def _early_offtopic(self, fields: Dict[str, Any], user_message: str) -> Optional[dict]:
+        """Offtopic известен по первым полям: ответ заготовленный, остаток JSON не нужен"""
+        if fields.get("status") != "offtopic" or "detected_language" not in fields:
+            return None
+        result = {
+            "status": "offtopic",
+            "detected_language": fields["detected_language"],
+            "decomposed_questions": fields.get("decomposed_questions", []),
+        }
+        if "user_signal" in fields:
+            result["user_signal"] = fields["user_signal"]
+        # social_context идёт в конце ответа — определяем его локально
+        # (user_signal для offtopic main.py восстанавливает из истории)
+        detection = detect_social_intent(user_message)
+        if detection.intent != SocialIntent.UNKNOWN:
+            result["social_context"] = detection.intent.value
+        return result
+
+    def _partial_view(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Копия частичного решения с теми же ограничениями на документы, что у финального"""
+        partial = dict(fields)
+        if isinstance(partial.get("documents"), list):
+            partial["documents"] = self._dedup_documents(partial["documents"])[:4]
+        return partial
+
+    def _local_social_decision(self, user_message: str, history: List[Dict[str, str]]) -> Optional[dict]:
+        """
+        Решение для чистой социальной реплики без вызова Gemini
+
+        Формат тот же, что у offtopic от Gemini с social_context: main.py выбирает
+        заготовленный ответ, обновляет SocialStateManager и историю как обычно.
+        Любой бизнес-маркер (включая опечатки) или постороннее содержание — в Gemini.
+
+        Returns:
+            Решение роутера или None, если нужен Gemini
+        """
+        if not Config.SOCIAL_FAST_PATH:
+            return None
+        self.social_stats["checked"] += 1
+
+        detection = detect_pure_social(user_message, after_question=self._assistant_asked_last(history))
+        if detection.intent == SocialIntent.UNKNOWN or detection.confidence < Config.SOCIAL_FAST_PATH_MIN_CONFIDENCE:
+            return None
+
+        intent = detection.intent.value
+        self.social_stats["hits"] += 1
+        self.social_hits_by_intent[intent] = self.social_hits_by_intent.get(intent, 0) + 1
+        # Сэкономлено примерно столько, сколько в среднем отвечает Gemini-роутер
+        avg_latency = get_model_health().avg_latency("router", self.client.model)
+        if avg_latency is not None:
+            self.social_stats["latency_saved_seconds"] += avg_latency
+        log.info(
+            "router.social_fast_path", "⚡ Социальная реплика без Gemini: %s (уверенность %.2f)",
+            intent, detection.confidence, social_context=intent, confidence=detection.confidence,
+        )
+        return {
+            "status": "offtopic",
+            "message": get_offtopic_response(),
+            "decomposed_questions": [],
+            "detected_language": self._detect_language(user_message),
+            "user_signal": "exploring_only",
+            "social_context": intent,
+            "fuzzy_matched": False,
+            "original_message": user_message,
+        }
+
+    @staticmethod
+    def _assistant_asked_last(history: List[Dict[str, str]]) -> bool:
+        """Последняя реплика ассистента заканчивалась вопросом («Записать вас?»)"""
+        for msg in reversed(history):
+            if msg.get("role") == "assistant":
+                return msg.get("content", "").rstrip().endswith("?")
+        return False
+
+    @staticmethod
+    def _detect_language(text: str) -> str:
+        """Язык по тем же правилам, что в промпте роутера: і/ї/є/ґ → uk, только латиница → en"""
+        if re.search(r"[іїєґІЇЄҐ]", text):
+            return "uk"
+        if re.search(r"[a-zA-Z]", text) and not re.search(r"[а-яА-ЯёЁ]", text):
+            return "en"
+        return "ru"
+
+    def _begin_call(self) -> None:
+        self.call_stats["calls"] += 1
+        _call_trace.set({"path": None, "prompt_chars": 0, "estimated_tokens": 0, "parse_seconds": 0.0})
+
+    def _end_call(self, path: str, decision: dict) -> dict:
+        """Запоминает, каким путём получено решение"""
+        self.call_stats[path] += 1
+        trace = _call_trace.get()
+        if trace is not None:
+            trace["path"] = path
+        return decision
+
+    def _record_prompt(self, *parts: str) -> None:
+        """Размер промпта, отправляемого в Gemini (повторный запрос после стрима считается ещё раз)"""
+        chars = sum(len(part) for part in parts)
+        tokens = sum(estimate_tokens(part) for part in parts)
+        self.call_stats["prompt_chars"] += chars
+        self.call_stats["estimated_tokens"] += tokens
+        trace = _call_trace.get()
+        if trace is not None:
+            trace["prompt_chars"] += chars
+            trace["estimated_tokens"] += tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        streamed = self.stream_stats["streamed"]
+        completed = self._stream_timings["complete_count"]
+        checked = self.social_stats["checked"]
+        gemini_calls = self.call_stats["gemini"] + self.call_stats["fallback"]
+        return {
+            "calls": {
+                **self.call_stats,
+                "parse_seconds": round(self.call_stats["parse_seconds"], 4),
+                "fallback_rate": round(self.call_stats["fallback"] / self.call_stats["calls"], 3) if self.call_stats["calls"] else 0.0,
+                "avg_estimated_tokens": round(self.call_stats["estimated_tokens"] / gemini_calls, 1) if gemini_calls else 0.0,
+            },
+            "streaming": {
+                **self.stream_stats,
+                # Время до первого поля против времени полного ответа — выигрыш раннего запуска
+                "avg_first_field_seconds": round(self._stream_timings["first_field"] / streamed, 3) if streamed else 0.0,
+                "avg_full_stream_seconds": round(self._stream_timings["complete"] / completed, 3) if completed else 0.0,
+            },
+            "cache": self.route_cache.get_stats() if self.route_cache is not None else {"enabled": False},
+            "prompt": self._segments.get_stats(),
+            "preselect": (
+                {**self._selector.get_stats(), **self.preselect_stats} if self._selector is not None else {"enabled": False}
+            ),
+            "keyword_index": dict(self.keyword_stats),
+            "social_fast_path": {
+                "checked": checked,
+                "hits": self.social_stats["hits"],
+                "hit_rate": round(self.social_stats["hits"] / checked, 3) if checked else 0.0,
+                "latency_saved_seconds": round(self.social_stats["latency_saved_seconds"], 3),
+                "hits_by_intent": dict(self.social_hits_by_intent),
+            },
+        }
+
+    def _prepare_message(self, user_message: str, history: List[Dict[str, str]]) -> Tuple[str, bool]:
+        """Дедупликация и раскрытие ультра-кратких вопросов; возвращает (сообщение, fuzzy_matched)"""
         # MVP: Дедупликация точных дубликатов вопросов
         user_message = self._deduplicate_questions(user_message)
 
@@ -129,7 +531,7 @@ class Router:
                     break
             
             if last_assistant_msg:
-                print(f"🔍 Обнаружен ультра-краткий вопрос '{user_message}' - восстанавливаем контекст из истории")
+                log.debug("router.route", "🔍 Обнаружен ультра-краткий вопрос '%s' - восстанавливаем контекст из истории", user_message)
                 # Определяем тему из последнего ответа
                 if "цен" in last_assistant_msg.lower() or "стои" in last_assistant_msg.lower():
                     expanded_question = "Расскажите подробнее о ценах и скидках"
@@ -140,247 +542,278 @@ class Router:
                 
                 # Подменяем вопрос на расширенный
                 user_message = expanded_question
-                print(f"📝 Расширенный вопрос: {expanded_question}")
+                log.info("router.route", "📝 Расширенный вопрос: %s", expanded_question)
 
         # Проверяем был ли fuzzy matching для статистики
         _, was_fuzzy_matched = has_business_signals_extended(user_message)
+        return user_message, was_fuzzy_matched
+
+    def _decision_messages(self, user_message: str, history: List[Dict[str, str]], memory: Optional[str] = None) -> List[Dict[str, str]]:
+        """Сообщения для запроса решения роутера (для стриминга)"""
+        if self.use_cache and isinstance(self.client, GeminiCachedClient):
+            # Тот же формат, что у chat_with_prefix_cache: статичная часть + динамическая
+            static_prompt, dynamic_prompt = self._prefix_cache_prompts(user_message, history, memory)
+            self._record_prompt(static_prompt, dynamic_prompt)
+            return [{"role": "user", "content": f"{static_prompt}\n\n{dynamic_prompt}"}]
+        prompts = self._build_router_prompts(user_message, history, memory=memory)
+        self._record_prompt(prompts["system"], prompts["user"])
+        return [
+            {"role": "system", "content": prompts["system"]},
+            {"role": "user", "content": prompts["user"]},
+        ]
+
+    async def _request_decision(self, user_message: str, history: List[Dict[str, str]], memory: Optional[str] = None) -> str:
+        """Запрашивает решение у Gemini целиком (с повторами, хеджированием и фолбэком модели)"""
+        if self.use_cache and isinstance(self.client, GeminiCachedClient):
+            # Используем разделение на статичную и динамическую части
+            static_prompt, dynamic_prompt = self._prefix_cache_prompts(user_message, history, memory)  # Префикс кешируется
+            self._record_prompt(static_prompt, dynamic_prompt)
+            
+            response = await self.client.chat_with_prefix_cache(
+                static_prefix=static_prompt,
+                dynamic_suffix=dynamic_prompt,
+                # coalesce: всплески одинаковых промптов (демо-ссылка) уходят одним запросом
+                model_params={"temperature": 0.3, "max_tokens": 500, "coalesce": True}
+            )
+        else:
+            # Обычный метод (для обратной совместимости)
+            prompts = self._build_router_prompts(user_message, history, memory=memory)
+            self._record_prompt(prompts["system"], prompts["user"])
+            messages = [
+                {"role": "system", "content": prompts["system"]},
+                {"role": "user", "content": prompts["user"]},
+            ]
+            response = await self.client.chat(messages, coalesce=True)
+        return response
+
+    async def _decide(self, response: str, user_message: str, history: List[Dict[str, str]]) -> Optional[dict]:
+        """Разбирает и валидирует ответ Gemini; None — ответ пустой или невалидный"""
+        # Проверяем что ответ не пустой
+        if not response or response.strip() == "":
+            log.warning("router.route", "⚠️ Пустой ответ от Gemini")
+            self.call_stats["invalid_responses"] += 1
+            return None
+
+        started = time.perf_counter()
+        try:
+            result = self._parse_decision(response)
+            return await self._finalize_decision(result, user_message, history)
+        except (json.JSONDecodeError, ValueError) as e:
+            log.warning("router.route", "⚠️ Невалидный ответ от Gemini: %s", e)
+            self.call_stats["invalid_responses"] += 1
+            return None
+        finally:
+            elapsed = time.perf_counter() - started
+            self.call_stats["parse_seconds"] += elapsed
+            trace = _call_trace.get()
+            if trace is not None:
+                trace["parse_seconds"] += elapsed
+
+    @staticmethod
+    def _parse_decision(response: str) -> dict:
+        """JSON из ответа Gemini (без markdown-обёртки ```json)"""
+        cleaned_response = response.strip()
+        if cleaned_response.startswith("```json"):
+            cleaned_response = cleaned_response[7:]
+        if cleaned_response.endswith("```"):
+            cleaned_response = cleaned_response[:-3]
+        cleaned_response = cleaned_response.strip()
+
+        result = json.loads(cleaned_response)
+
+        # Валидация структуры ответа
+        if not isinstance(result, dict):
+            raise ValueError("Response is not a dict")
+        if "status" not in result:
+            raise ValueError("Missing 'status' field")
+        return result
+
+    async def _finalize_decision(self, result: dict, user_message: str, history: List[Dict[str, str]]) -> dict:
+        """
+        Нормализует решение роутера: статусы, документы, язык, социальный контекст
+
+        Поля конкретного пользователя добавляет _personalize — результат можно кешировать.
+
+        Raises:
+            ValueError: Решение не соответствует формату
+        """
+        # Гарантируем наличие decomposed_questions (всегда список)
+        if "decomposed_questions" not in result or not isinstance(result.get("decomposed_questions"), list):
+            result["decomposed_questions"] = []
         
-        # Логируем что все запросы теперь идут в Gemini для умной классификации
-        print(f"ℹ️ Routing to Gemini: {user_message[:50]}..." if len(user_message) > 50 else f"ℹ️ Routing to Gemini: {user_message}")
+        # Проверяем корректность статуса
+        valid_statuses = ["success", "offtopic", "need_simplification"]
+        valid_signals = ["price_sensitive", "anxiety_about_child", "ready_to_buy", "exploring_only"]
+        valid_languages = ["ru", "uk", "en"]
         
-        # ВАЖНО: Больше НЕ блокируем mixed интенты!
-        # Gemini сам определит social_context, user_signal и status
-        # Это решает проблему с фразами типа "Спасибо, запишите нас"
+        # Проверяем и добавляем detected_language если отсутствует
+        if "detected_language" not in result or result.get("detected_language") not in valid_languages:
+            result["detected_language"] = "ru"  # По умолчанию русский
+            log.warning("router.route", "⚠️ Добавлен detected_language по умолчанию: ru")
         
-        try:
-            # Получаем ответ от Gemini с ПРАВИЛЬНЫМ кешированием
-            if self.use_cache and isinstance(self.client, GeminiCachedClient):
-                # Используем разделение на статичную и динамическую части
-                static_prompt = self._build_static_prompt()  # Кешируется
-                dynamic_prompt = self._build_dynamic_prompt(user_message, history)  # Не кешируется
-                
-                response = await self.client.chat_with_prefix_cache(
-                    static_prefix=static_prompt,
-                    dynamic_suffix=dynamic_prompt,
-                    model_params={"temperature": 0.3, "max_tokens": 500}
+        # Обработка случая, когда Gemini путает status и user_signal
+        if result["status"] in valid_signals and result["status"] not in valid_statuses:
+            # Gemini вернул user_signal вместо status - исправляем
+            actual_signal = result["status"]
+            result["status"] = "success"  # По умолчанию success для обычных запросов
+            if "user_signal" not in result:
+                result["user_signal"] = actual_signal
+            log.warning("router.route", "⚠️ Исправлена путаница status/signal: %s → success", actual_signal)
+        
+        if result["status"] not in valid_statuses:
+            raise ValueError(f"Invalid status: {result['status']}")
+        
+        # Дополнительная валидация: проверяем соответствие количества вопросов статусу
+        if "decomposed_questions" in result:
+            questions_count = len(result["decomposed_questions"])
+            # MVP: допускаем до 3 вопросов в статусе success, 4+ → need_simplification
+            if result["status"] == "success" and questions_count > 3:
+                log.warning("router.route", "⚠️ Предупреждение: статус 'success' с %s вопросами! Исправляем на 'need_simplification'", questions_count)
+                result["status"] = "need_simplification"
+                result["message"] = NEED_SIMPLIFICATION_MESSAGE
+                if "documents" in result:
+                    del result["documents"]
+
+        # need_simplification при 1–3 вопросах — это success (Gemini иногда упрямится).
+        # Документы подбирает локальный индекс ключевых слов — без повторного запроса к Gemini
+        if result.get("status") == "need_simplification":
+            questions_count = len(result.get("decomposed_questions", []))
+            if 1 <= questions_count <= 3:
+                documents = [doc for doc in result.get("documents") or [] if doc in self._keyword_index.documents]
+                if not documents:
+                    documents = self._keyword_index.resolve(result["decomposed_questions"]) or ["faq.md"]  # faq.md — fallback документ
+                log.warning(
+                    "router.route", "⚠️ OVERRIDE: need_simplification при %s вопросах → success, документы: %s",
+                    questions_count, documents,
                 )
-            else:
-                # Обычный метод (для обратной совместимости)
-                prompts = self._build_router_prompts(user_message, history)
-                messages = [
-                    {"role": "system", "content": prompts["system"]},
-                    {"role": "user", "content": prompts["user"]},
-                ]
-                response = await self.client.chat(messages)
-            
-            # Проверяем что ответ не пустой
-            if not response or response.strip() == "":
-                print("⚠️ Пустой ответ от Gemini")
-                return self._fallback_response()
+                result["status"] = "success"
+                result["documents"] = documents
+                result.pop("message", None)
+                self.keyword_stats["simplification_resolved"] += 1
+        
+        # Для success должны быть documents, для остальных - message
+        if result["status"] == "success":
+            if "documents" not in result or not isinstance(result["documents"], list):
+                raise ValueError("Success status requires 'documents' list")
+            # Дедупликация и ограничение до 4 документов (MVP)
+            docs_dedup = self._dedup_documents(result.get("documents", []))
+            docs_dedup = self._check_documents(docs_dedup, result.get("decomposed_questions", []))
+            if len(docs_dedup) > 4:
+                log.info("router.route", "ℹ️ Обрезаем список документов до 4 (было %s)", len(docs_dedup))
+                docs_dedup = docs_dedup[:4]
             
-            # Парсим JSON из ответа
-            try:
-                # Очищаем от markdown code blocks (```json...```)
-                cleaned_response = response.strip()
-                if cleaned_response.startswith("```json"):
-                    cleaned_response = cleaned_response[7:]
-                if cleaned_response.endswith("```"):
-                    cleaned_response = cleaned_response[:-3]
-                cleaned_response = cleaned_response.strip()
-                
-                result = json.loads(cleaned_response)
-                
-                # Валидация структуры ответа
-                if not isinstance(result, dict):
-                    raise ValueError("Response is not a dict")
-                    
-                if "status" not in result:
-                    raise ValueError("Missing 'status' field")
-                
-                # Гарантируем наличие decomposed_questions (всегда список)
-                if "decomposed_questions" not in result or not isinstance(result.get("decomposed_questions"), list):
-                    result["decomposed_questions"] = []
-                
-                # Проверяем корректность статуса
-                valid_statuses = ["success", "offtopic", "need_simplification"]
-                valid_signals = ["price_sensitive", "anxiety_about_child", "ready_to_buy", "exploring_only"]
-                valid_languages = ["ru", "uk", "en"]
-                
-                # Проверяем и добавляем detected_language если отсутствует
-                if "detected_language" not in result or result.get("detected_language") not in valid_languages:
-                    result["detected_language"] = "ru"  # По умолчанию русский
-                    print(f"⚠️ Добавлен detected_language по умолчанию: ru")
-                
-                # Обработка случая, когда Gemini путает status и user_signal
-                if result["status"] in valid_signals and result["status"] not in valid_statuses:
-                    # Gemini вернул user_signal вместо status - исправляем
-                    actual_signal = result["status"]
-                    result["status"] = "success"  # По умолчанию success для обычных запросов
-                    if "user_signal" not in result:
-                        result["user_signal"] = actual_signal
-                    print(f"⚠️ Исправлена путаница status/signal: {actual_signal} → success")
-                
-                if result["status"] not in valid_statuses:
-                    raise ValueError(f"Invalid status: {result['status']}")
-                
-                # Дополнительная валидация: проверяем соответствие количества вопросов статусу
+            # 🔴 ЗАЩИТА ОТ ГАЛЛЮЦИНАЦИЙ: Если документов нет или пустой список → offtopic
+            if not docs_dedup:
+                log.warning("router.route", "⚠️ ЗАЩИТА: Нет документов для ответа → переключаем на offtopic")
+                result["status"] = "offtopic"
+                result["message"] = get_offtopic_response()
+                del result["documents"]
+            else:
+                result["documents"] = docs_dedup
+                # Выводим статус и документы для success
+                log.info("router.route", "✅ Статус: %s, документы: %s", result['status'], result['documents'], status=result['status'], documents=result['documents'])
                 if "decomposed_questions" in result:
-                    questions_count = len(result["decomposed_questions"])
-                    # MVP: допускаем до 3 вопросов в статусе success, 4+ → need_simplification
-                    if result["status"] == "success" and questions_count > 3:
-                        print(f"⚠️ Предупреждение: статус 'success' с {questions_count} вопросами! Исправляем на 'need_simplification'")
-                        result["status"] = "need_simplification"
-                        result["message"] = NEED_SIMPLIFICATION_MESSAGE
-                        if "documents" in result:
-                            del result["documents"]
-
-                    # Коррекция: если модель вернула need_simplification при 1–3 вопросах, выполняем один повторный запрос с жёсткой подсказкой
-                    if result.get("status") == "need_simplification" and 1 <= questions_count <= 3:
-                        print("🔁 Повторный запрос: need_simplification при ≤3 вопросах. Требуем success.")
-                        strict_hint = (
-                            "\n=== КОРРЕКЦИЯ (СТРОГО) ===\n"
-                            "Если в decomposed_questions РОВНО 1, 2 или 3 вопроса — ОБЯЗАТЕЛЬНО верни status: \"success\".\n"
-                            "Подбери документы по правилам: максимум 4 на весь ответ; по одному основному (primary) на каждый вопрос и, при необходимости, один общий support-документ, если он покрывает 2+ вопросов.\n"
-                            "Верни ТОЛЬКО валидный JSON по формату ниже, без markdown и текста.\n"
-                        )
-                        prompts2 = self._build_router_prompts(user_message, history, extra_hint=strict_hint)
-                        
-                        # Повторный запрос с кешированием
-                        if self.use_cache and isinstance(self.client, GeminiCachedClient):
-                            response2 = await self.client.chat_with_cache(
-                                system_content=prompts2["system"],
-                                user_message=prompts2["user"],
-                                history=None
-                            )
-                        else:
-                            messages2 = [
-                                {"role": "system", "content": prompts2["system"]},
-                                {"role": "user", "content": prompts2["user"]},
-                            ]
-                            response2 = await self.client.chat(messages2)
-                        if response2 and response2.strip():
-                            cleaned2 = response2.strip()
-                            if cleaned2.startswith("```json"):
-                                cleaned2 = cleaned2[7:]
-                            if cleaned2.endswith("```"):
-                                cleaned2 = cleaned2[:-3]
-                            cleaned2 = cleaned2.strip()
-                            try:
-                                result2 = json.loads(cleaned2)
-                                if isinstance(result2, dict) and result2.get("status") in ["success", "offtopic", "need_simplification"]:
-                                    # Гарантируем наличие decomposed_questions в ответе повтора
-                                    if "decomposed_questions" not in result2 or not isinstance(result2.get("decomposed_questions"), list):
-                                        result2["decomposed_questions"] = []
-                                    result = result2
-                                    print("✅ Повторный запрос принят.")
-                            except Exception:
-                                print("⚠️ Повторный ответ не удалось распарсить, оставляем исходный.")
-                
-                # ФИНАЛЬНАЯ ПРОВЕРКА: если всё ещё need_simplification при ≤3 вопросах
-                # Принудительно меняем на success (Gemini иногда упрямится)
-                if result.get("status") == "need_simplification":
-                    questions_count = len(result.get("decomposed_questions", []))
-                    if 1 <= questions_count <= 3:
-                        print(f"⚠️ OVERRIDE: need_simplification при {questions_count} вопросах → success")
-                        result["status"] = "success"
-                        # Пытаемся подобрать документы на основе ключевых слов
-                        if questions_count > 0:
-                            # Простая эвристика для подбора документов
-                            question_text = " ".join(result["decomposed_questions"]).lower()
-                            result["documents"] = []
-                            if "скидк" in question_text or "цен" in question_text or "стои" in question_text:
-                                result["documents"].append("pricing.md")
-                            if "блогер" in question_text or "реклам" in question_text or "сотруднич" in question_text:
-                                result["documents"].append("partners.md")
-                            if not result["documents"]:
-                                result["documents"] = ["faq.md"]  # Fallback документ
-                
-                # Для success должны быть documents, для остальных - message
-                if result["status"] == "success":
-                    if "documents" not in result or not isinstance(result["documents"], list):
-                        raise ValueError("Success status requires 'documents' list")
-                    # Дедупликация и ограничение до 4 документов (MVP)
-                    docs_in = result.get("documents", [])
-                    seen = set()
-                    docs_dedup = []
-                    for d in docs_in:
-                        if isinstance(d, str) and d not in seen:
-                            seen.add(d)
-                            docs_dedup.append(d)
-                    if len(docs_dedup) > 4:
-                        print(f"ℹ️ Обрезаем список документов до 4 (было {len(docs_dedup)})")
-                        docs_dedup = docs_dedup[:4]
-                    
-                    # 🔴 ЗАЩИТА ОТ ГАЛЛЮЦИНАЦИЙ: Если документов нет или пустой список → offtopic
-                    if not docs_dedup:
-                        print("⚠️ ЗАЩИТА: Нет документов для ответа → переключаем на offtopic")
-                        result["status"] = "offtopic"
-                        result["message"] = get_offtopic_response()
-                        del result["documents"]
-                    else:
-                        result["documents"] = docs_dedup
-                        # Выводим статус и документы для success
-                        print(f"✅ Статус: {result['status']}")
-                        print(f"📋 Выбранные документы: {', '.join(result['documents'])}")
-                        if "decomposed_questions" in result:
-                            print(f"🔍 Декомпозированные вопросы: {result['decomposed_questions']}")
-                else:
-                    # Для offtopic используем заготовленную фразу вместо генерации
-                    if result["status"] == "offtopic":
-                        result["message"] = get_offtopic_response()
-                        print(f"ℹ️ Статус: offtopic (используем заготовленную фразу)")
-                    elif "message" not in result or not isinstance(result["message"], str):
-                        raise ValueError(f"{result['status']} status requires 'message' string")
-                    else:
-                        # Выводим статус для остальных типов ответов
-                        print(f"ℹ️ Статус: {result['status']}")
-                    if "decomposed_questions" in result:
-                        print(f"🔍 Декомпозированные вопросы: {result['decomposed_questions']}")
-                
-                # Добавляем флаг fuzzy_matched в результат
-                result["fuzzy_matched"] = was_fuzzy_matched
-                
-                # Добавляем оригинальное сообщение пользователя для умной обработки в response_generator
-                result["original_message"] = original_message
-                
-                # MVP: Проверяем повторные приветствия для mixed запросов
-                if result.get("status") == "success" and result.get("social_context") == "greeting":
-                    # Проверяем, было ли уже приветствие в этой сессии
-                    if self._social_state.has_greeted(user_id):
-                        if self.log_level == "DEBUG":
-                            print(f"🔍 DEBUG: Mixed запрос с повторным приветствием от {user_id[:8]}...")
-                        result["social_context"] = "repeated_greeting"
-                    else:
-                        # Первое приветствие в mixed запросе - отмечаем
-                        self._social_state.mark_greeted(user_id)
-                        print(f"ℹ️ Router: Первое приветствие в mixed запросе от {user_id[:8]}...")
-                
-                # Проверка на acknowledgment (соглашательские ответы и смайлики)
-                if result.get("status") == "offtopic" and not result.get("social_context"):
-                    # Паттерны для acknowledgment
-                    acknowledgment_patterns = [
-                        "ок", "окей", "okay", "ok", "хорошо", "ладно", "понял", "поняла",
-                        "понятно", "ясно", "спасибо", "спс", "благодарю", "принято",
-                        "согласен", "согласна", "да", "угу", "ага", "👍", "👌", "✅",
-                        ":)", ";)", ":-))", ")", "))", "😊", "🙂", "👍🏻", "💯"
-                    ]
-                    
-                    # Проверяем, является ли сообщение acknowledgment
-                    clean_msg = user_message.strip().lower().replace("!", "").replace(".", "")
-                    if clean_msg in acknowledgment_patterns or (len(clean_msg) < 10 and not "?" in clean_msg):
-                        result["social_context"] = "acknowledgment"
-                        print(f"ℹ️ Router: Определен acknowledgment для сообщения '{user_message}'")
-                
-                return result
-                
-            except (json.JSONDecodeError, ValueError) as e:
-                print(f"⚠️ Невалидный ответ от Gemini: {e}")
-                return self._fallback_response()
-                
-        except Exception as e:
-            print(f"❌ Ошибка при вызове Gemini: {e}")
-            return self._fallback_response()
-    
+                    log.debug("router.route", "🔍 Декомпозированные вопросы: %s", result['decomposed_questions'])
+        else:
+            # Для offtopic используем заготовленную фразу вместо генерации
+            if result["status"] == "offtopic":
+                result["message"] = get_offtopic_response()
+                log.info("router.route", "ℹ️ Статус: offtopic (используем заготовленную фразу)")
+            elif "message" not in result or not isinstance(result["message"], str):
+                raise ValueError(f"{result['status']} status requires 'message' string")
+            else:
+                # Выводим статус для остальных типов ответов
+                log.info("router.route", "ℹ️ Статус: %s", result['status'])
+            if "decomposed_questions" in result:
+                log.debug("router.route", "🔍 Декомпозированные вопросы: %s", result['decomposed_questions'])
+        
+        # Проверка на acknowledgment (соглашательские ответы и смайлики)
+        if result.get("status") == "offtopic" and not result.get("social_context"):
+            # Проверяем, является ли сообщение acknowledgment
+            clean_msg = user_message.strip().lower().replace("!", "").replace(".", "")
+            if clean_msg in ACKNOWLEDGMENT_PHRASES or (len(clean_msg) < 10 and not "?" in clean_msg):
+                result["social_context"] = "acknowledgment"
+                log.info("router.route", "ℹ️ Router: Определен acknowledgment для сообщения '%s'", user_message)
+        
+        return result
+
+    def _check_documents(self, documents: List[str], questions: List[str]) -> List[str]:
+        """
+        Сверка выбора Gemini с индексом ключевых слов
+
+        Несуществующие имена отбрасываются (если не осталось ни одного — документы
+        подбирает индекс). Документы без совпадений с вопросами и пропущенные сильные
+        кандидаты только попадают в лог и статистику: смысл вопроса Gemini понимает лучше.
+        """
+        self.keyword_stats["checked"] += 1
+        check = self._keyword_index.check(documents, questions)
+        if check.unknown:
+            self.keyword_stats["unknown_dropped"] += len(check.unknown)
+            log.warning("router.check_documents", "⚠️ Gemini выбрал несуществующие документы: %s", check.unknown)
+        if check.unsupported:
+            self.keyword_stats["unsupported"] += len(check.unsupported)
+            log.info("router.check_documents", "ℹ️ Документы без совпадений с вопросами: %s", check.unsupported)
+        if check.suggested:
+            self.keyword_stats["suggested_missing"] += len(check.suggested)
+            log.debug("router.check_documents", "🔍 Индекс предлагает ещё: %s", check.suggested)
+        if not check.documents and check.unknown:
+            return self._keyword_index.resolve(questions)
+        return check.documents
+
+    def _personalize(self, result: dict, original_message: str, was_fuzzy_matched: bool, user_id: str) -> dict:
+        """Поля конкретного пользователя поверх общего решения (свежего или из кеша)"""
+        # Добавляем флаг fuzzy_matched в результат
+        result["fuzzy_matched"] = was_fuzzy_matched
+        
+        # Добавляем оригинальное сообщение пользователя для умной обработки в response_generator
+        result["original_message"] = original_message
+        
+        # MVP: Проверяем повторные приветствия для mixed запросов
+        if result.get("status") == "success" and result.get("social_context") == "greeting":
+            # Проверяем, было ли уже приветствие в этой сессии
+            if self._social_state.has_greeted(user_id):
+                if self.log_level == "DEBUG":
+                    log.debug("router.route", "🔍 DEBUG: Mixed запрос с повторным приветствием от %s...", user_id[:8])
+                result["social_context"] = "repeated_greeting"
+            else:
+                # Первое приветствие в mixed запросе - отмечаем
+                self._social_state.mark_greeted(user_id)
+                log.info("router.route", "ℹ️ Router: Первое приветствие в mixed запросе от %s...", user_id[:8])
+        return result
+
+    def _cache_key(self, user_message: str, history: List[Dict[str, str]], memory: Optional[str] = None) -> Optional[str]:
+        """Ключ кеша решений: сообщение + окно истории + маркер цены из истории + память диалога + версия саммари"""
+        if self.route_cache is None:
+            return None
+        # Маркер price_sensitive ищется по всем 10 сообщениям промпта, даже если окно отпечатка меньше
+        extra = self._previous_signal(history[-10:]) or ""
+        if memory:
+            # Память (ранние реплики и факты) тоже в промпте: Gemini дополняет из неё decomposed_questions
+            extra += "\n" + memory
+        fingerprint = history_fingerprint(history, Config.ROUTE_CACHE_HISTORY_WINDOW, extra)
+        return RouteCache.make_key(user_message, fingerprint, self.summaries_version)
+
+    def _cached_decision(self, cache_key: Optional[str]) -> Optional[dict]:
+        if cache_key is None:
+            return None
+        decision = self.route_cache.get(cache_key)
+        if decision is None:
+            return None
+        if decision["status"] == "offtopic":
+            # Заготовленные фразы выбираются случайно — не повторяем одну и ту же
+            decision["message"] = get_offtopic_response()
+        log.info("router.route_cache", "♻️ Решение роутера из кеша: %s", decision["status"], status=decision["status"])
+        return decision
+
+    def _store_decision(self, cache_key: Optional[str], decision: dict, cost_seconds: float) -> None:
+        if cache_key is not None:
+            self.route_cache.put(cache_key, decision, cost_seconds)
+
+    @staticmethod
+    def _dedup_documents(documents: List[Any]) -> List[str]:
+        """Уникальные имена документов в исходном порядке"""
+        return list(dict.fromkeys(d for d in documents if isinstance(d, str)))
+
     def _deduplicate_questions(self, text: str) -> str:
         """
         Удаляет точные дубликаты вопросов из текста
@@ -416,17 +849,9 @@ class Router:
             if sent:
                 # Добавляем знак вопроса, если его нет и предложение вопросительное
                 if not re.search(r'[.!?]$', sent):
-                    # Паттерны для acknowledgment и смайликов - им НЕ нужен вопросительный знак
-                    acknowledgment_patterns = [
-                        "ок", "окей", "okay", "ok", "хорошо", "ладно", "понял", "поняла",
-                        "понятно", "ясно", "спасибо", "спс", "благодарю", "принято",
-                        "согласен", "согласна", "да", "угу", "ага", "👍", "👌", "✅",
-                        ":)", ";)", ":-))", ")", "))", "😊", "🙂", "👍🏻", "💯"
-                    ]
-                    
-                    # Проверяем, является ли сообщение acknowledgment или смайликом
+                    # Acknowledgment и смайликам НЕ нужен вопросительный знак
                     clean_sent = sent.strip().lower()
-                    is_acknowledgment = clean_sent in acknowledgment_patterns
+                    is_acknowledgment = clean_sent in ACKNOWLEDGMENT_PHRASES
                     # Проверяем на эмодзи (Unicode категории для эмодзи)
                     is_emoji = len(sent.strip()) <= 3 and any(ord(c) > 127 for c in sent.strip())
                     
@@ -447,55 +872,107 @@ class Router:
         
         # Логируем если были дубликаты
         if len(unique_sentences) < len(sentences) - 1:  # -1 учитывая пустые
-            print(f"🔄 Дедупликация: {len(sentences)} предложений → {len(unique_sentences)} уникальных")
-            print(f"   Оригинал: {text[:100]}...")
-            print(f"   После: {deduplicated[:100]}...")
+            log.info(
+                "router.deduplicate_questions", "🔄 Дедупликация: %s предложений → %s уникальных (было: %s..., стало: %s...)",
+                len(sentences), len(unique_sentences), text[:100], deduplicated[:100],
+            )
         
         return deduplicated
     
+    def _prompt_sections(self) -> Dict[str, str]:
+        """Статичные сегменты промпта по именам (порядок = порядок в статичном префиксе)"""
+        return {
+            "role": self._get_role_section(),
+            "summaries": self._get_summaries_section(),
+            "decomposition": self._get_decomposition_section(),
+            "classification": self._get_classification_section(),
+            "response_format": self._get_response_format_section(),
+        }
+
+    def _refresh_prompt_segments(self) -> None:
+        """Пересобирает сегменты, если summaries.json изменился на диске"""
+        if not self._segments.is_stale():
+            return
+        log.info("router.refresh_prompt_segments", "🔄 summaries.json изменился — пересобираем промпт")
+        self.summaries = self._load_summaries()
+        self._segments.compile(self._prompt_sections())
+        self.summaries_version = self._segments.version
+        self._selector = self._build_selector()
+        self._keyword_index = self._build_keyword_index()
+
+    def _build_keyword_index(self) -> KeywordIndex:
+        """Индекс строится один раз на версию промпта (тексты документов читаются с диска)"""
+        index = _keyword_indexes.get(self.summaries_version)
+        if index is None:
+            index = KeywordIndex.build(self.summaries, DOCUMENTS_DIR)
+            _keyword_indexes.clear()
+            _keyword_indexes[self.summaries_version] = index
+        return index
+
+    def _build_selector(self) -> Optional[SummarySelector]:
+        if not Config.ROUTER_PRESELECT or not self.summaries:
+            return None
+        return SummarySelector(
+            self.summaries,
+            DOCUMENTS_DIR,
+            top_k=Config.ROUTER_PRESELECT_TOP_K,
+            min_score=Config.ROUTER_PRESELECT_MIN_SCORE,
+            min_coverage=Config.ROUTER_PRESELECT_MIN_COVERAGE,
+        )
+
+    def _prefix_cache_prompts(self, user_message: str, history: List[Dict[str, str]], memory: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Статичный префикс и динамическая часть для chat_with_prefix_cache
+
+        С предотбором саммари кандидатов уходят в динамическую часть: префикс без базы
+        знаний остаётся одинаковым для всех запросов и по-прежнему кешируется Gemini.
+        """
+        selection = self._selector.select(user_message, history) if self._selector is not None else None
+        if selection is None:
+            return self._build_static_prompt(), self._build_dynamic_prompt(user_message, history, memory)
+
+        candidates_section = self._get_summaries_section(selection.documents)
+        self.preselect_stats["estimated_tokens_saved"] += (
+            estimate_tokens(self._segments.get("summaries")) - estimate_tokens(candidates_section)
+        )
+        log.debug("router.preselect", "🔎 Кандидаты для роутера: %s (покрытие %.2f)", selection.documents, selection.confidence)
+        static_prompt = self._segments.join("role", "decomposition", "classification", "response_format")
+        return static_prompt, candidates_section + self._build_dynamic_prompt(user_message, history, memory)
+
     def _build_static_prompt(self) -> str:
         """Статичная часть промпта для кеширования (без истории и текущего сообщения)"""
-        static_content = ""
-        # Роль и правила
-        static_content += self._get_role_section()
-        # База знаний (summaries)
-        static_content += self._get_summaries_section()
-        # Инструкции по декомпозиции и классификации
-        static_content += self._get_decomposition_section()
-        static_content += self._get_classification_section()
-        # Формат ответа
-        static_content += self._get_response_format_section()
-        return static_content
+        # Роль и правила, база знаний (summaries), инструкции по декомпозиции и классификации, формат ответа
+        return self._segments.join("role", "summaries", "decomposition", "classification", "response_format")
     
-    def _build_dynamic_prompt(self, user_message: str, history: List[Dict[str, str]]) -> str:
+    def _build_dynamic_prompt(self, user_message: str, history: List[Dict[str, str]], memory: Optional[str] = None) -> str:
         """Динамическая часть промпта (история и текущий запрос)"""
         dynamic_content = ""
         # История диалога
-        dynamic_content += self._get_history_section(history)
+        dynamic_content += self._get_history_section(history, memory)
         # Текущий запрос
         dynamic_content += f"\n=== ТЕКУЩИЙ ЗАПРОС ===\nUser: {user_message}\n\n"
         dynamic_content += "Теперь проанализируйте этот запрос согласно инструкциям выше и верните JSON-ответ.\n"
         return dynamic_content
     
-    def _build_router_prompts(self, user_message: str, history: List[Dict[str, str]], extra_hint: Optional[str] = None) -> Dict[str, str]:
+    def _build_router_prompts(
+        self,
+        user_message: str,
+        history: List[Dict[str, str]],
+        memory: Optional[str] = None,
+    ) -> Dict[str, str]:
         """
         Возвращает два блока промпта: system и user.
         system — роль и строгие правила/формат.
-        user — база знаний, история, текущий запрос, инструкции по шагам (+extra_hint).
+        user — база знаний, история, текущий запрос, инструкции по шагам.
         """
         # System: роль + формат ответа как строгие правила
-        system_content = self._get_role_section()
-        system_content += self._get_response_format_section()
+        system_content = self._segments.join("role", "response_format")
 
-        # User: база знаний + история + текущий запрос + этапы
-        user_content = ""
-        user_content += self._get_summaries_section()
-        user_content += self._get_history_section(history)
+        # User: база знаний + история + текущий запрос + этапы (статичные части — готовые сегменты)
+        user_content = self._segments.get("summaries")
+        user_content += self._get_history_section(history, memory)
         user_content += f"\n=== ТЕКУЩИЙ ЗАПРОС ===\nUser: {user_message}\n\n"
-        user_content += self._get_decomposition_section()
-        user_content += self._get_classification_section()
-        if extra_hint:
-            user_content += extra_hint + "\n\n"
+        user_content += self._segments.join("decomposition", "classification")
         return {"system": system_content, "user": user_content}
     
     def _get_role_section(self) -> str:
@@ -526,40 +1003,54 @@ class Router:
 
 """
     
-    def _get_summaries_section(self) -> str:
-        """Секция с саммари документов"""
-        return f"""=== БАЗА ЗНАНИЙ (ДОСТУПНЫЕ ДОКУМЕНТЫ) ===
+    def _get_summaries_section(self, documents: Optional[List[str]] = None) -> str:
+        """Секция с саммари документов (все или только кандидаты предотбора)"""
+        if documents is None:
+            return f"""=== БАЗА ЗНАНИЙ (ДОСТУПНЫЕ ДОКУМЕНТЫ) ===
 {json.dumps(self.summaries, ensure_ascii=False, indent=2)}
 
+"""
+        subset = {name: self.summaries[name] for name in documents if name in self.summaries}
+        return f"""=== БАЗА ЗНАНИЙ (ДОКУМЕНТЫ-КАНДИДАТЫ ДЛЯ ЭТОГО ЗАПРОСА) ===
+{json.dumps(subset, ensure_ascii=False, indent=2)}
+
 """
     
-    def _get_history_section(self, history: List[Dict[str, str]]) -> str:
-        """Секция с историей диалога"""
+    @staticmethod
+    def _previous_signal(recent_history: List[Dict[str, str]]) -> Optional[str]:
+        """price_sensitive, если в истории был негатив к цене"""
+        for msg in recent_history:
+            content = msg.get("content", "").lower()
+            # Ищем маркеры price_sensitive в предыдущих сообщениях
+            if msg.get("role") == "user":
+                # Проверяем "развод" только в контексте денег/цены
+                if "развод" in content:
+                    # Если "развод" упоминается с денежным контекстом - это price_sensitive
+                    if get_keyword_matcher().scan(content).any("router.money"):
+                        return "price_sensitive"
+                    # Иначе игнорируем (это про доверие, а не про цену)
+                elif get_keyword_matcher().scan(content).any("router.price_negative"):
+                    return "price_sensitive"
+        return None
+
+    def _get_history_section(self, history: List[Dict[str, str]], memory: Optional[str] = None) -> str:
+        """Секция с историей диалога (с памятью — её краткое содержание и последние сообщения)"""
         if not history:
             return ""
             
         section = "=== ИСТОРИЯ ДИАЛОГА ===\n"
-        section += "(последние 10 сообщений для понимания контекста)\n\n"
 
         # Берём только последние 10 сообщений
         recent_history = history[-10:] if len(history) > 10 else history
         
         # Ищем предыдущий user_signal в истории
-        previous_signal = None
-        for msg in recent_history:
-            content = msg.get("content", "").lower()
-            # Ищем маркеры price_sensitive в предыдущих сообщениях
-            if msg.get("role") == "user":
-                # Проверяем "развод" только в контексте денег/цены
-                if "развод" in content:
-                    # Если "развод" упоминается с денежным контекстом - это price_sensitive
-                    if any(money_word in content for money_word in ["деньги", "цена", "стоит", "оплата", "платить", "грн", "гривен", "тысяч"]):
-                        previous_signal = "price_sensitive"
-                        break
-                    # Иначе игнорируем (это про доверие, а не про цену)
-                elif any(marker in content for marker in ["дорого", "30 тысяч", "лабуда", "золотые уроки", "с ума сошли"]):
-                    previous_signal = "price_sensitive"
-                    break
+        previous_signal = self._previous_signal(recent_history)
+
+        if memory:
+            section += f"(краткое содержание и последние {Config.MEMORY_RECENT_MESSAGES} сообщения)\n\n{memory}\n\n"
+            recent_history = history[-Config.MEMORY_RECENT_MESSAGES:]
+        else:
+            section += "(последние 10 сообщений для понимания контекста)\n\n"
 
         for msg in recent_history:
             role = "User" if msg.get("role") == "user" else "Assistant"
@@ -904,10 +1395,10 @@ Ukido - это онлайн-школа, работающая через Zoom. В
     
     def _fallback_response(self) -> dict:
         """Универсальный ответ при любых ошибках"""
-        return {
+        return self._end_call("fallback", {
             "status": "offtopic",
             "message": DEFAULT_FALLBACK,
             "decomposed_questions": [],
             "user_signal": "exploring_only",
             "detected_language": "ru"
-        }
+        })
@@ -5,6 +5,7 @@ MVP версия: только критичный функционал без п
 
 from typing import Dict, Set, Optional, Tuple
 import logging
+from keyword_matcher import get_keyword_matcher
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +40,13 @@ class SimpleCTABlocker:
             'надо подумать', 'посоветуюсь с мужем', 'посоветуюсь с женой'
         ]
         
+        # Словари в общем автомате: сообщение проверяется одним проходом
+        self.matcher = get_keyword_matcher()
+        for action_type, triggers in self.COMPLETION_TRIGGERS.items():
+            self.matcher.register(f"cta.completion.{action_type}", triggers)
+        self.matcher.register("cta.hard_refusal", self.HARD_REFUSALS)
+        self.matcher.register("cta.soft_refusal", self.SOFT_REFUSALS)
+        
         logger.info("🔧 SimpleCTABlocker инициализирован (MVP версия)")
     
     def check_completed_action(self, user_id: str, message: str) -> Optional[str]:
@@ -46,61 +54,83 @@ class SimpleCTABlocker:
         Проверяет, содержит ли сообщение информацию о завершённом действии.
         Возвращает тип действия или None.
         """
-        message_lower = message.lower()
+        action_type = self.detect_completed_action(message)
+        if action_type:
+            self.record_completed_action(user_id, action_type)
+        return action_type
+    
+    def detect_completed_action(self, message: str) -> Optional[str]:
+        """Тип завершённого действия в сообщении — без записи в состояние"""
+        hits = self.matcher.scan(message.lower())
         
-        for action_type, triggers in self.COMPLETION_TRIGGERS.items():
-            if any(trigger in message_lower for trigger in triggers):
-                # Сохраняем завершённое действие
-                if user_id not in self.completed_actions:
-                    self.completed_actions[user_id] = set()
-                
-                self.completed_actions[user_id].add(action_type)
-                logger.info(f"✅ Пользователь {user_id}: зафиксировано действие '{action_type}'")
+        for action_type in self.COMPLETION_TRIGGERS:
+            if hits.any(f"cta.completion.{action_type}"):
                 return action_type
         
         return None
     
+    def record_completed_action(self, user_id: str, action_type: str) -> None:
+        """Сохраняет завершённое действие"""
+        if user_id not in self.completed_actions:
+            self.completed_actions[user_id] = set()
+        
+        self.completed_actions[user_id].add(action_type)
+        logger.info(f"✅ Пользователь {user_id}: зафиксировано действие '{action_type}'")
+    
     def check_refusal(self, user_id: str, message: str, current_message_count: int) -> Optional[str]:
         """
         Проверяет, содержит ли сообщение отказ от предложений.
         Возвращает тип отказа ('hard' или 'soft') или None.
         """
-        message_lower = message.lower()
+        refusal_type = self.detect_refusal(message)
+        if refusal_type:
+            self.record_refusal(user_id, refusal_type, current_message_count)
+        return refusal_type
+    
+    def detect_refusal(self, message: str) -> Optional[str]:
+        """Тип отказа в сообщении ('hard' или 'soft') — без записи в состояние"""
+        hits = self.matcher.scan(message.lower())
         
         # Проверяем жёсткие отказы
-        if any(refusal in message_lower for refusal in self.HARD_REFUSALS):
-            # Блокируем на 7 сообщений
-            self.refusals[user_id] = {
-                'count': self.refusals.get(user_id, {}).get('count', 0) + 1,
-                'block_until_message': current_message_count + 7,
-                'type': 'hard'
-            }
-            logger.info(f"🚫 Пользователь {user_id}: жёсткий отказ, CTA заблокированы до сообщения {current_message_count + 7}")
+        if hits.any("cta.hard_refusal"):
             return 'hard'
         
         # Проверяем мягкие отказы
-        if any(refusal in message_lower for refusal in self.SOFT_REFUSALS):
-            # Блокируем на 3 сообщения
-            self.refusals[user_id] = {
-                'count': self.refusals.get(user_id, {}).get('count', 0) + 1,
-                'block_until_message': current_message_count + 3,
-                'type': 'soft'
-            }
-            logger.info(f"🟡 Пользователь {user_id}: мягкий отказ, CTA заблокированы до сообщения {current_message_count + 3}")
+        if hits.any("cta.soft_refusal"):
             return 'soft'
         
         return None
     
-    def should_block_cta(self, user_id: str, current_message_count: int, user_signal: str = None) -> Tuple[bool, str]:
+    def record_refusal(self, user_id: str, refusal_type: str, current_message_count: int) -> None:
+        """Сохраняет отказ: жёсткий блокирует CTA на 7 сообщений, мягкий — на 3"""
+        self.refusals[user_id] = self._refusal_after(user_id, refusal_type, current_message_count)
+        if refusal_type == 'hard':
+            logger.info(f"🚫 Пользователь {user_id}: жёсткий отказ, CTA заблокированы до сообщения {current_message_count + 7}")
+        else:
+            logger.info(f"🟡 Пользователь {user_id}: мягкий отказ, CTA заблокированы до сообщения {current_message_count + 3}")
+    
+    def _refusal_after(self, user_id: str, refusal_type: str, current_message_count: int) -> Dict:
+        """Запись об отказах пользователя после ещё одного отказа"""
+        return {
+            'count': self.refusals.get(user_id, {}).get('count', 0) + 1,
+            'block_until_message': current_message_count + (7 if refusal_type == 'hard' else 3),
+            'type': refusal_type
+        }
+    
+    def should_block_cta(self, user_id: str, current_message_count: int, user_signal: str = None, pending_action: Optional[str] = None, pending_refusal: Optional[str] = None) -> Tuple[bool, str]:
         """
         Определяет, нужно ли блокировать CTA для пользователя.
         Возвращает (should_block, reason).
+        
+        pending_action / pending_refusal — результаты detect_*, которые ещё не записаны:
+        решение принимается так, будто они уже сохранены (состояние не меняется).
         """
+        actions = self.completed_actions.get(user_id, set())
+        if pending_action:
+            actions = actions | {pending_action}
         
         # Проверяем завершённые действия
-        if user_id in self.completed_actions:
-            actions = self.completed_actions[user_id]
-            
+        if actions:
             # Если оплатил - блокируем CTA про оплату и скидки
             if 'paid' in actions and user_signal in ['price_sensitive', 'ready_to_buy']:
                 logger.info(f"🔒 Блокировка CTA для {user_id}: уже оплатил курс")
@@ -117,8 +147,8 @@ class SimpleCTABlocker:
                 pass
         
         # Проверяем отказы
-        if user_id in self.refusals:
-            refusal_data = self.refusals[user_id]
+        refusal_data = self._refusal_after(user_id, pending_refusal, current_message_count) if pending_refusal else self.refusals.get(user_id)
+        if refusal_data:
             if current_message_count < refusal_data['block_until_message']:
                 remaining = refusal_data['block_until_message'] - current_message_count
                 logger.info(f"🔒 Блокировка CTA для {user_id}: отказ, осталось {remaining} сообщений")
@@ -126,15 +156,12 @@ class SimpleCTABlocker:
         
         return False, ""
     
-    def get_cta_frequency_modifier(self, user_id: str) -> float:
+    def get_cta_frequency_modifier(self, user_id: str, pending_refusal: Optional[str] = None) -> float:
         """
         Возвращает модификатор частоты CTA на основе истории отказов.
         1.0 = нормальная частота, 0.5 = в два раза реже, и т.д.
         """
-        if user_id not in self.refusals:
-            return 1.0
-        
-        refusal_count = self.refusals[user_id].get('count', 0)
+        refusal_count = self.refusals.get(user_id, {}).get('count', 0) + (1 if pending_refusal else 0)
         
         if refusal_count >= 3:
             return 0.2  # Очень редко (20% от нормы)
@@ -0,0 +1,72 @@
+"""
+singleflight.py - Склейка одинаковых конкурентных запросов (singleflight)
+
+Если несколько корутин одновременно запрашивают одно и то же по одному ключу,
+реальный вызов выполняется один раз, а остальные ждут его результат.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class SingleFlight:
+    """Объединяет конкурентные вызовы с одинаковым ключом в один"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            "calls": 0,        # всего вызовов через singleflight
+            "executed": 0,     # реально выполненных upstream-запросов
+            "collapsed": 0,    # вызовов, присоединившихся к уже идущему запросу
+        }
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполняет fn() или присоединяется к уже идущему вызову с тем же ключом
+
+        Args:
+            key: Ключ идентичности запроса
+            fn: Фабрика корутины с реальным вызовом
+        Returns:
+            Результат общего вызова
+        """
+        self.stats["calls"] += 1
+        loop = asyncio.get_running_loop()
+
+        task = self._inflight.get(key)
+        if task is not None and not task.done() and task.get_loop() is loop:
+            self.stats["collapsed"] += 1
+        else:
+            self.stats["executed"] += 1
+            task = loop.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+
+        # shield: отмена одного ожидающего не должна отменять запрос остальным
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # помечаем исключение как полученное
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        stats = dict(self.stats)
+        stats["in_flight"] = len(self._inflight)
+        stats["collapse_rate"] = (
+            f"{(stats['collapsed'] / stats['calls'] * 100):.1f}%" if stats["calls"] else "0.0%"
+        )
+        return stats
+
+
+_singleflight: Optional[SingleFlight] = None
+
+
+def get_singleflight() -> SingleFlight:
+    """Общий singleflight процесса"""
+    global _singleflight
+    if _singleflight is None:
+        _singleflight = SingleFlight()
+    return _singleflight
@@ -1,7 +1,7 @@
 """
 social_intents.py — лёгкий детектор социальных интентов по правилам.
 
-Интенты: greeting, farewell, thanks, unknown.
+Интенты: greeting, farewell, thanks, apology, acknowledgment, unknown.
 Используется как быстрый путь до вызова LLM.
 """
 
@@ -11,12 +11,15 @@ from enum import Enum
 from typing import List, Optional
 from difflib import SequenceMatcher
 
+from fuzzy_keywords import FuzzyKeywordIndex
+
 
 class SocialIntent(str, Enum):
     GREETING = "greeting"
     FAREWELL = "farewell"
     THANKS = "thanks"
     APOLOGY = "apology"
+    ACKNOWLEDGMENT = "acknowledgment"
     UNKNOWN = "unknown"
 
 
@@ -49,10 +52,34 @@ THANKS_PATTERNS = [
     r"\bthank\s+you\b",
 ]
 
+APOLOGY_PATTERNS = [
+    r"\bизвин(ите|и|яюсь|яемся)\b",
+    r"\bпрост(ите|и)\b",
+    r"\bsorry\b",
+]
+
 _COMPILED = {
     SocialIntent.GREETING: [re.compile(p, re.IGNORECASE) for p in GREETING_PATTERNS],
     SocialIntent.FAREWELL: [re.compile(p, re.IGNORECASE) for p in FAREWELL_PATTERNS],
     SocialIntent.THANKS: [re.compile(p, re.IGNORECASE) for p in THANKS_PATTERNS],
+    SocialIntent.APOLOGY: [re.compile(p, re.IGNORECASE) for p in APOLOGY_PATTERNS],
+}
+
+# Соглашательские ответы и смайлики (сообщение целиком, без «!» и «.»)
+ACKNOWLEDGMENT_PHRASES = [
+    "ок", "окей", "okay", "ok", "хорошо", "ладно", "понял", "поняла",
+    "понятно", "ясно", "спасибо", "спс", "благодарю", "принято",
+    "согласен", "согласна", "да", "угу", "ага", "👍", "👌", "✅",
+    ":)", ";)", ":-))", ")", "))", "😊", "🙂", "👍🏻", "💯"
+]
+
+# Согласие после вопроса ассистента («Записать вас?» → «Да») — это ответ, а не вежливость
+AFFIRMATIVE_PHRASES = {"да", "ок", "окей", "okay", "ok", "хорошо", "ладно", "согласен", "согласна", "угу", "ага", "👍", "👌", "✅"}
+
+# Слова, которые не меняют социальный смысл: «Спасибо вам большое», «Всем привет»
+SOCIAL_FILLERS = {
+    "и", "вам", "вас", "тебе", "всем", "большое", "огромное", "очень", "ещё", "еще", "раз",
+    "уважаемые", "друзья", "ну", "же", "so", "much", "very", "all", "everyone",
 }
 
 
@@ -166,6 +193,9 @@ CRITICAL_BUSINESS_KEYWORDS = [
     "секта",  # Добавляем для обработки скептических вопросов
 ]
 
+# Индекс опечаток для CRITICAL_BUSINESS_KEYWORDS (те же правила, что fuzzy_match_word с порогом 0.85)
+_FUZZY_BUSINESS = FuzzyKeywordIndex(CRITICAL_BUSINESS_KEYWORDS, threshold=0.85)
+
 
 @dataclass
 class SocialDetection:
@@ -205,6 +235,55 @@ def detect_social_intent(text: str) -> SocialDetection:
     return SocialDetection(SocialIntent.UNKNOWN, 0.0, [])
 
 
+def detect_pure_social(text: str, after_question: bool = False) -> SocialDetection:
+    """Чистая социальная реплика без бизнес-содержания — для ответа без вызова LLM.
+
+    Сообщение должно целиком состоять из одного социального интента (плюс слова-связки
+    и пунктуация). Уверенность:
+        0.9  — один интент покрывает всё сообщение
+        0.5  — несколько разных интентов или согласие сразу после вопроса ассистента
+        0.0  — есть постороннее содержание или бизнес-маркеры
+
+    Args:
+        text: Сообщение пользователя
+        after_question: Последняя реплика ассистента заканчивалась вопросом
+    """
+    if not text or not text.strip() or len(text) > 80:
+        return SocialDetection(SocialIntent.UNKNOWN, 0.0, [])
+
+    has_business, _ = has_business_signals_extended(text)
+    if has_business:
+        return SocialDetection(SocialIntent.UNKNOWN, 0.0, [])
+
+    text_norm = text.strip().lower()
+    clean = text_norm.replace("!", "").replace(".", "").strip()
+    if clean in ACKNOWLEDGMENT_PHRASES and clean not in ("спасибо", "благодарю"):
+        confidence = 0.5 if after_question and clean in AFFIRMATIVE_PHRASES else 0.9
+        return SocialDetection(SocialIntent.ACKNOWLEDGMENT, confidence, [clean])
+
+    intents: List[SocialIntent] = []
+    matches: List[str] = []
+    rest = text_norm
+    for intent, regs in _COMPILED.items():
+        for rgx in regs:
+            found = [m.group(0) for m in rgx.finditer(rest)]
+            if found:
+                if intent not in intents:
+                    intents.append(intent)
+                matches.extend(found)
+                rest = rgx.sub(" ", rest)
+
+    if not intents:
+        return SocialDetection(SocialIntent.UNKNOWN, 0.0, [])
+    # Всё, что осталось кроме связок, — содержание, которое должен разобрать Gemini
+    leftover = [word for word in re.findall(r"\w+", rest) if word not in SOCIAL_FILLERS]
+    if leftover or "?" in rest:
+        return SocialDetection(SocialIntent.UNKNOWN, 0.0, matches)
+    if len(intents) > 1:
+        return SocialDetection(intents[0], 0.5, matches)
+    return SocialDetection(intents[0], 0.9, matches)
+
+
 def fuzzy_match_word(word: str, pattern: str, threshold: float = 0.8) -> bool:
     """Проверяет схожесть слов с учётом опечаток.
     
@@ -228,11 +307,23 @@ def fuzzy_match_word(word: str, pattern: str, threshold: float = 0.8) -> bool:
     return ratio >= threshold
 
 
+def _has_fuzzy_business_word(text: str) -> bool:
+    """Есть ли в тексте слово, похожее на критичное бизнес-слово (через индекс опечаток)"""
+    for word in text.lower().split():
+        # Убираем знаки препинания с краёв слова
+        word_clean = word.strip('.,!?;:')
+        if len(word_clean) < 3:  # Пропускаем слишком короткие
+            continue
+        if _FUZZY_BUSINESS.match(word_clean) is not None:
+            return True
+    return False
+
+
 def has_business_signals(text: str) -> bool:
     """True если в тексте есть маркеры бизнес-вопроса.
     
     Сначала проверяет точные regex паттерны (быстро).
-    Если не нашли - проверяет критичные слова через fuzzy matching (медленнее).
+    Если не нашли - проверяет критичные слова через индекс опечаток (fuzzy_keywords).
     """
     if not text:
         return False
@@ -242,18 +333,7 @@ def has_business_signals(text: str) -> bool:
         return True
     
     # 2. Fuzzy matching для критичных слов (обработка опечаток)
-    words = text.lower().split()
-    for word in words:
-        # Убираем знаки препинания с краёв слова
-        word_clean = word.strip('.,!?;:')
-        if len(word_clean) < 3:  # Пропускаем слишком короткие
-            continue
-            
-        for keyword in CRITICAL_BUSINESS_KEYWORDS:
-            if fuzzy_match_word(word_clean, keyword, threshold=0.85):
-                return True
-    
-    return False
+    return _has_fuzzy_business_word(text)
 
 
 def has_business_signals_extended(text: str) -> tuple[bool, bool]:
@@ -270,16 +350,8 @@ def has_business_signals_extended(text: str) -> tuple[bool, bool]:
         return True, False
     
     # 2. Fuzzy matching для критичных слов (обработка опечаток)
-    words = text.lower().split()
-    for word in words:
-        # Убираем знаки препинания с краёв слова
-        word_clean = word.strip('.,!?;:')
-        if len(word_clean) < 3:  # Пропускаем слишком короткие
-            continue
-            
-        for keyword in CRITICAL_BUSINESS_KEYWORDS:
-            if fuzzy_match_word(word_clean, keyword, threshold=0.85):
-                return True, True  # Нашли через fuzzy
+    if _has_fuzzy_business_word(text):
+        return True, True  # Нашли через fuzzy
     
     return False, False
 
@@ -0,0 +1,207 @@
+"""
+summary_selector.py - Локальный BM25-предотбор документов для промпта роутера
+
+Роутер отправляет в Gemini саммари всех документов базы знаний — это основная
+часть токенов промпта. SummarySelector строит при старте BM25-индекс по полям
+summaries.json (trigger_words, typical_questions, core_topics, key_facts,
+unique_value) и заголовкам самих документов, выбирает top-k кандидатов под
+текущее сообщение (с учётом последних реплик пользователя) и отдаёт роутеру
+только их. При низкой уверенности возвращает None — роутер шлёт полный раздел.
+
+NumPy ускоряет подсчёт, но не обязателен: без него используется тот же расчёт
+на словарях.
+"""
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from text_tokens import tokenize
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+# Вес поля = сколько раз его термы входят в документ индекса
+FIELD_WEIGHTS = {
+    "trigger_words": 3,
+    "typical_questions": 2,
+    "core_topics": 1,
+    "key_facts": 1,
+    "unique_value": 1,
+    "headings": 1,
+}
+
+_HEADING_RE = re.compile(r"^#{1,6}\s+(.+)$", re.MULTILINE)
+
+
+@dataclass
+class Selection:
+    """Кандидаты для промпта роутера"""
+    documents: List[str]
+    confidence: float  # Доля суммарного BM25-веса запроса, покрытая кандидатами
+    scores: Dict[str, float]
+
+
+class BM25Index:
+    """BM25 по небольшому набору документов (матрица tf: термы × документы)"""
+
+    def __init__(self, documents: Dict[str, List[str]], k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            documents: Имя документа → список термов
+        """
+        self.names = list(documents)
+        self.vocabulary: Dict[str, int] = {}
+        counts = [Counter(terms) for terms in documents.values()]
+        for counter in counts:
+            for term in counter:
+                self.vocabulary.setdefault(term, len(self.vocabulary))
+
+        lengths = [sum(counter.values()) for counter in counts]
+        avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        doc_count = len(self.names)
+        df = Counter(term for counter in counts for term in counter)
+
+        # Вклад терма в документ не зависит от запроса — считаем заранее
+        self._weights: Dict[str, Dict[int, float]] = {}
+        for index, counter in enumerate(counts):
+            norm = k1 * (1 - b + b * lengths[index] / avg_length) if avg_length else k1
+            for term, tf in counter.items():
+                idf = math.log(1 + (doc_count - df[term] + 0.5) / (df[term] + 0.5))
+                self._weights.setdefault(term, {})[index] = idf * tf * (k1 + 1) / (tf + norm)
+
+        self._matrix = None
+        if NUMPY_AVAILABLE:
+            self._matrix = np.zeros((len(self.vocabulary), doc_count), dtype=np.float32)
+            for term, row in self._weights.items():
+                for index, weight in row.items():
+                    self._matrix[self.vocabulary[term], index] = weight
+
+    def scores(self, query: Dict[str, float]) -> Dict[str, float]:
+        """
+        Args:
+            query: Терм → вес в запросе
+        Returns:
+            Имя документа → BM25-оценка (только ненулевые)
+        """
+        known = {term: weight for term, weight in query.items() if term in self.vocabulary}
+        if not known:
+            return {}
+        if self._matrix is not None:
+            rows = [self.vocabulary[term] for term in known]
+            totals = np.asarray(list(known.values()), dtype=np.float32) @ self._matrix[rows]
+            return {self.names[i]: float(score) for i, score in enumerate(totals) if score > 0}
+
+        totals: Dict[int, float] = {}
+        for term, weight in known.items():
+            for index, value in self._weights[term].items():
+                totals[index] = totals.get(index, 0.0) + weight * value
+        return {self.names[i]: score for i, score in totals.items() if score > 0}
+
+
+class SummarySelector:
+    """Выбор документов-кандидатов для раздела базы знаний в промпте роутера"""
+
+    def __init__(
+        self,
+        summaries: Dict[str, Any],
+        docs_dir: Optional[Path] = None,
+        top_k: int = 6,
+        min_score: float = 2.0,
+        min_coverage: float = 0.75,
+    ):
+        """
+        Args:
+            summaries: Содержимое summaries.json
+            docs_dir: Папка с документами (заголовки добавляются в индекс)
+            top_k: Сколько документов отправлять
+            min_score: Минимальная оценка лучшего документа, ниже — полный раздел
+            min_coverage: Минимальная доля веса запроса, покрытая кандидатами
+        """
+        self.summaries = summaries
+        self.top_k = top_k
+        self.min_score = min_score
+        self.min_coverage = min_coverage
+        self.index = BM25Index({
+            name: self.document_terms(summary, docs_dir / name if docs_dir else None)
+            for name, summary in summaries.items()
+        })
+        self.stats = {"selections": 0, "low_confidence": 0, "no_terms": 0, "candidates_total": 0}
+
+    @staticmethod
+    def document_terms(summary: Dict[str, Any], document_path: Optional[Path] = None) -> List[str]:
+        """Термы документа для индекса с учётом весов полей"""
+        if not isinstance(summary, dict):
+            summary = {"core_topics": str(summary)}
+        fields: Dict[str, List[str]] = {}
+        for field, value in summary.items():
+            if field not in FIELD_WEIGHTS:
+                continue
+            texts = value if isinstance(value, list) else [value]
+            fields[field] = [text for text in texts if isinstance(text, str)]
+        if document_path is not None and document_path.exists():
+            fields["headings"] = _HEADING_RE.findall(document_path.read_text(encoding="utf-8"))
+
+        terms: List[str] = []
+        for field, texts in fields.items():
+            field_terms = [term for text in texts for term in tokenize(text)]
+            terms.extend(field_terms * FIELD_WEIGHTS[field])
+        return terms
+
+    def select(self, message: str, history: Optional[List[Dict[str, str]]] = None) -> Optional[Selection]:
+        """
+        Кандидаты для текущего сообщения
+
+        Args:
+            message: Сообщение пользователя (после подготовки роутером)
+            history: История диалога — последние реплики пользователя добавляются к запросу с меньшим весом
+        Returns:
+            Selection или None — уверенности мало, нужен полный раздел
+        """
+        query: Dict[str, float] = {}
+        for term in tokenize(message):
+            query[term] = query.get(term, 0.0) + 1.0
+        if not any(term in self.index.vocabulary for term in query):
+            # Сообщение держится на контексте («а это платно?») — без полного раздела нельзя
+            self.stats["no_terms"] += 1
+            return None
+        user_turns = [msg.get("content", "") for msg in (history or []) if msg.get("role") == "user"]
+        for text in user_turns[-2:]:
+            for term in tokenize(text):
+                query[term] = query.get(term, 0.0) + 0.5
+
+        scores = self.index.scores(query)
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        total = sum(scores.values())
+        if not ranked or scores[ranked[0]] < self.min_score:
+            self.stats["low_confidence"] += 1
+            return None
+
+        documents = ranked[: self.top_k]
+        confidence = sum(scores[name] for name in documents) / total
+        if confidence < self.min_coverage:
+            self.stats["low_confidence"] += 1
+            return None
+
+        self.stats["selections"] += 1
+        self.stats["candidates_total"] += len(documents)
+        return Selection(documents, round(confidence, 3), {name: round(scores[name], 3) for name in documents})
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        selections = self.stats["selections"]
+        attempts = selections + self.stats["low_confidence"] + self.stats["no_terms"]
+        return {
+            **self.stats,
+            "selection_rate": round(selections / attempts, 3) if attempts else 0.0,
+            "avg_candidates": round(self.stats["candidates_total"] / selections, 2) if selections else 0.0,
+            "numpy": NUMPY_AVAILABLE,
+            "vocabulary": len(self.index.vocabulary),
+        }
@@ -0,0 +1,72 @@
+"""
+text_tokens.py - Общая токенизация для локального поиска по базе знаний
+
+Нормализация (регистр, ё/е), разбиение на слова, стоп-слова и лёгкий стеммер
+для русского/украинского/английского: отрезает типовые окончания, чтобы
+«курсы», «курсов» и «курсах» попадали в один терм. Точность морфологии
+не нужна — важно, чтобы запрос и база знаний разбирались одинаково.
+"""
+
+import re
+from typing import Iterable, List
+
+_WORD_RE = re.compile(r"[a-zа-яёіїєґ0-9]+")
+
+STOPWORDS = frozenset({
+    # ru
+    "а", "и", "в", "во", "на", "по", "с", "со", "к", "ко", "у", "о", "об", "от", "до", "за", "из",
+    "для", "при", "про", "же", "ли", "ну", "да", "нет", "не", "ни", "то", "это", "этот", "эта",
+    "эти", "как", "что", "так", "там", "тут", "вот", "вы", "вас", "вам", "ваш", "ваша", "ваши",
+    "мы", "нас", "нам", "наш", "я", "мне", "меня", "мой", "моя", "он", "она", "они", "его", "ее",
+    "их", "есть", "быть", "был", "была", "будет", "или", "но", "если", "уже", "еще", "бы",
+    "можно", "какой", "какая", "какие", "каких", "который", "которые",
+    # uk
+    "і", "й", "це", "чи", "як", "що", "ви", "вас", "вам", "ваш", "є",
+    # en
+    "the", "a", "an", "and", "or", "of", "to", "in", "on", "for", "is", "are", "do", "you", "your",
+})
+
+# Окончания от длинных к коротким; стем не короче MIN_STEM символов
+_SUFFIXES = sorted({
+    "ость", "ости", "остью", "ение", "ения", "ений", "ением", "ание", "ания", "аний",
+    "ами", "ями", "ого", "его", "ому", "ему", "ими", "ыми", "иях", "ях", "ах", "ам", "ям",
+    "ом", "ем", "ов", "ев", "ей", "ой", "ий", "ый", "ая", "яя", "ое", "ее", "ие", "ые", "ую", "юю",
+    "ться", "тся", "ать", "ять", "ить", "еть", "уть", "ет", "ит", "ут", "ют", "ат", "ят", "ешь", "ишь",
+    "ал", "ил", "ла", "ли", "ся", "сь",
+    "а", "я", "о", "е", "и", "ы", "у", "ю", "ь", "й",
+    # en
+    "ing", "es", "ed", "s",
+}, key=len, reverse=True)
+
+MIN_STEM = 3
+
+
+def normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def stem(word: str) -> str:
+    """Отрезает одно самое длинное подходящее окончание"""
+    if len(word) <= MIN_STEM + 1 or word.isdigit():
+        return word
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[: -len(suffix)]
+    return word
+
+
+def words(text: str) -> List[str]:
+    """Слова без стоп-слов, в нижнем регистре, без стемминга"""
+    return [word for word in _WORD_RE.findall(normalize(text)) if word not in STOPWORDS]
+
+
+def tokenize(text: str) -> List[str]:
+    """Стеммированные термы текста"""
+    return [stem(word) for word in words(text)]
+
+
+def tokenize_all(texts: Iterable[str]) -> List[str]:
+    terms: List[str] = []
+    for text in texts:
+        terms.extend(tokenize(text))
+    return terms
@@ -28,14 +28,16 @@ class SmartTranslator:
     translation_count = 0
     cache_hits = 0
     
-    def __init__(self, openrouter_client, model: Optional[str] = None):
+    def __init__(self, openrouter_client, model: Optional[str] = None, http_pool=None):
         """
         Инициализация переводчика
         
         Args:
             openrouter_client: Клиент для вызова OpenRouter API
+            http_pool: Пул соединений для стриминга (по умолчанию пул клиента)
         """
         self.client = openrouter_client
+        self.http_pool = http_pool
         self.model = model or getattr(openrouter_client, "model", "anthropic/claude-3.5-haiku")
         
     async def translate(
@@ -103,10 +105,16 @@ class SmartTranslator:
                 ],
                 model=self.model,
                 temperature=0.3,  # Низкая температура для консистентности
-                max_tokens=3000  # Увеличено для полных переводов
+                max_tokens=3000,  # Увеличено для полных переводов
+                stage="translator"
             )
             
             logger.debug(f"Получен ответ от API: {response[:100]}...")
+
+            # Пустой ответ = все попытки неудачны: отдаём оригинал и не кешируем
+            if not response or not response.strip():
+                logger.warning(f"⚠️ Пустой перевод на {target_language}, возвращаем оригинал")
+                return text
             
             # Сохраняем форматирование абзацев
             translated = response
@@ -342,7 +350,9 @@ Just output the final {target_lang_name} text, nothing else."""
                 ],
                 model=self.model,
                 temperature=0.3,
-                max_tokens=3000  # Увеличено для полных переводов
+                max_tokens=3000,  # Увеличено для полных переводов
+                http_pool=self.http_pool,
+                stage="translator"
             ):
                 # Сохраняем форматирование абзацев
                 if chunk:
@@ -0,0 +1,181 @@
+"""
+usage_accounting.py - Учёт токенов, стоимости и задержек LLM-вызовов
+
+Каждый ответ OpenRouter превращается в LLMResult и попадает в общий журнал:
+агрегаты по стадиям (router, generator, translator, humor) и по пользователям.
+Пользователь текущего запроса передаётся через contextvar (usage_scope).
+"""
+
+import contextvars
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+# Цены за 1M токенов (USD), если OpenRouter не прислал usage.cost
+PRICES = {
+    "google/gemini-2.5-flash": {"input": 0.30, "output": 2.50, "cached_input": 0.075},
+    "google/gemini-2.0-flash-001": {"input": 0.10, "output": 0.40, "cached_input": 0.025},
+    "anthropic/claude-3.5-haiku": {"input": 0.80, "output": 4.00, "cached_input": 0.08},
+    "openai/gpt-4o-mini": {"input": 0.15, "output": 0.60, "cached_input": 0.075},
+}
+
+
+@dataclass
+class LLMResult:
+    """Результат одного LLM-вызова"""
+    text: str
+    model: str
+    stage: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    latency: float = 0.0         # Время успешной upstream-попытки, сек
+    total_latency: float = 0.0   # С учётом повторов и фолбэков, сек
+    cost: Optional[float] = None  # USD из ответа OpenRouter или по таблице цен
+    ok: bool = True
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("text")
+        data["latency"] = round(self.latency, 3)
+        data["total_latency"] = round(self.total_latency, 3)
+        return data
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    """Стоимость по таблице цен; None для неизвестной модели"""
+    prices = PRICES.get(model)
+    if not prices:
+        return None
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (
+        uncached * prices["input"]
+        + cached_tokens * prices.get("cached_input", prices["input"])
+        + completion_tokens * prices["output"]
+    ) / 1_000_000
+
+
+def parse_usage(usage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Извлекает токены и стоимость из блока usage ответа OpenRouter"""
+    if not isinstance(usage, dict):
+        return {}
+    details = usage.get("prompt_tokens_details") or {}
+    parsed = {
+        "prompt_tokens": int(usage.get("prompt_tokens") or 0),
+        "completion_tokens": int(usage.get("completion_tokens") or 0),
+        "cached_tokens": int(details.get("cached_tokens") or 0),
+    }
+    if usage.get("cost") is not None:
+        parsed["cost"] = float(usage["cost"])
+    return parsed
+
+
+_current_user: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("usage_user_id", default=None)
+_current_calls: contextvars.ContextVar[Optional[List[LLMResult]]] = contextvars.ContextVar("usage_calls", default=None)
+
+
+@contextmanager
+def usage_scope(user_id: str) -> Iterator[List[LLMResult]]:
+    """Привязывает LLM-вызовы внутри блока к пользователю и собирает их в список"""
+    calls: List[LLMResult] = []
+    user_token = _current_user.set(user_id)
+    calls_token = _current_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _current_user.reset(user_token)
+        _current_calls.reset(calls_token)
+
+
+def summarize_calls(calls: List[LLMResult]) -> Dict[str, Any]:
+    """Сводка вызовов одного запроса (для metadata в режиме отладки)"""
+    return {
+        "calls": [call.to_dict() for call in calls],
+        "prompt_tokens": sum(call.prompt_tokens for call in calls),
+        "completion_tokens": sum(call.completion_tokens for call in calls),
+        "cached_tokens": sum(call.cached_tokens for call in calls),
+        "cost_usd": round(sum(call.cost or 0.0 for call in calls), 6),
+    }
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {
+        "calls": 0,
+        "failed_calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "cost_usd": 0.0,
+        "latency_total": 0.0,
+    }
+
+
+class UsageLedger:
+    """Агрегаты использования по стадиям и пользователям"""
+
+    def __init__(self, max_users: int = 1000):
+        self.max_users = max_users
+        self.by_stage: Dict[str, Dict[str, Any]] = defaultdict(_empty_totals)
+        self.by_model: Dict[str, Dict[str, Any]] = defaultdict(_empty_totals)
+        # LRU как в HistoryManager, чтобы журнал не рос бесконечно
+        self.by_user: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def record(self, result: LLMResult) -> None:
+        """Учитывает вызов в агрегатах и в сводке текущего запроса"""
+        user_id = _current_user.get()
+        targets = [self.by_stage[result.stage], self.by_model[result.model]]
+        if user_id:
+            if user_id not in self.by_user:
+                self.by_user[user_id] = _empty_totals()
+                if len(self.by_user) > self.max_users:
+                    self.by_user.popitem(last=False)
+            self.by_user.move_to_end(user_id)
+            targets.append(self.by_user[user_id])
+
+        for totals in targets:
+            totals["calls"] += 1
+            if not result.ok:
+                totals["failed_calls"] += 1
+            totals["prompt_tokens"] += result.prompt_tokens
+            totals["completion_tokens"] += result.completion_tokens
+            totals["cached_tokens"] += result.cached_tokens
+            totals["cost_usd"] += result.cost or 0.0
+            totals["latency_total"] += result.total_latency
+
+        calls = _current_calls.get()
+        if calls is not None:
+            calls.append(result)
+
+    @staticmethod
+    def _format(totals: Dict[str, Any]) -> Dict[str, Any]:
+        formatted = dict(totals)
+        formatted["cost_usd"] = round(totals["cost_usd"], 6)
+        formatted["avg_latency"] = round(totals["latency_total"] / totals["calls"], 3) if totals["calls"] else 0.0
+        del formatted["latency_total"]
+        return formatted
+
+    def get_stats(self, top_users: int = 10) -> Dict[str, Any]:
+        """Статистика для /metrics: стадии, модели и самые дорогие пользователи"""
+        users = sorted(self.by_user.items(), key=lambda item: item[1]["cost_usd"], reverse=True)[:top_users]
+        return {
+            "by_stage": {stage: self._format(totals) for stage, totals in self.by_stage.items()},
+            "by_model": {model: self._format(totals) for model, totals in self.by_model.items()},
+            "top_users": {user_id: self._format(totals) for user_id, totals in users},
+            "tracked_users": len(self.by_user),
+        }
+
+
+_ledger: Optional[UsageLedger] = None
+
+
+def get_usage_ledger() -> UsageLedger:
+    """Общий журнал процесса"""
+    global _ledger
+    if _ledger is None:
+        _ledger = UsageLedger()
+    return _ledger
@@ -116,13 +116,14 @@ class ZhvanetskyGenerator:
         self.used_examples_per_user = defaultdict(set)  # user_id -> set of used example indices
         self.last_humor_per_user = defaultdict(list)     # user_id -> list of last 3 generated humors
     
-    def _extract_dialogue_context(self, history: List[Dict], limit: int = 5) -> str:
+    def _extract_dialogue_context(self, history: List[Dict], limit: int = 5, user_id: Optional[str] = None) -> str:
         """
         Извлекает контекст из истории диалога.
         
         Args:
             history: История сообщений
             limit: Максимум сообщений для анализа
+            user_id: ID пользователя (настроение берётся из памяти SafetyRuleEngine)
             
         Returns:
             Строка с кратким описанием контекста
@@ -164,7 +165,7 @@ class ZhvanetskyGenerator:
             context_parts.append(f"обсуждали: {', '.join(set(topics_discussed))}")
         
         # Определяем общее настроение
-        mood = self.safety_checker.analyze_dialogue_mood(history)
+        mood = self.safety_checker.analyze_dialogue_mood(history, user_id)
         if mood == 'positive':
             context_parts.append("настроение позитивное")
         elif mood == 'neutral':
@@ -325,7 +326,7 @@ class ZhvanetskyGenerator:
             formatted_examples = "\n".join([ex["example"] if isinstance(ex, dict) else ex for _, ex in selected])
             
             # Извлекаем контекст диалога
-            dialogue_context = self._extract_dialogue_context(history)
+            dialogue_context = self._extract_dialogue_context(history, user_id=user_id)
             
             # Добавляем расширенный контекст
             key_words = self._extract_key_words(message)
@@ -1,13 +1,21 @@
 """
 Система безопасности для юмора Жванецкого.
 Проверяет уместность юмора в зависимости от контекста и темы.
+
+Все наборы правил (блеклист, чувствительные темы, категории TopicClassifier,
+маркеры настроения) собраны в SafetyRuleEngine: одно регулярное выражение с
+именованными группами и один проход общего автомата keyword_matcher дают
+SafetyVerdict для сообщения, вердикты кэшируются по тексту, а настроение
+диалога запоминается по пользователю.
 """
 
 import re
 import logging
-from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
-from collections import defaultdict
+from keyword_matcher import get_keyword_matcher
 
 logger = logging.getLogger(__name__)
 
@@ -60,8 +68,12 @@ class SafetyChecker:
         'понравилось', 'рад', 'доволен', 'хорошо'
     ]
     
+    # Негативные слова в самой шутке
+    NEGATIVE_CONTENT_WORDS = ['плохо', 'ужасно', 'кошмар', 'идиот', 'дурак', 'тупой']
+    
     def __init__(self):
         self.user_humor_count = defaultdict(list)  # user_id -> список timestamp
+        self.engine = get_safety_engine()  # Скомпилированные правила, общие для процесса
         
     def is_safe_topic(self, message: str) -> bool:
         """
@@ -73,14 +85,8 @@ class SafetyChecker:
         Returns:
             True если тема безопасна
         """
-        message_lower = message.lower()
-        
-        # Проверяем блеклист
-        for pattern in self.BLACKLIST_PATTERNS:
-            if re.search(pattern, message_lower, re.IGNORECASE):
-                return False
-        
-        return True
+        # Блеклист проверяется вместе с остальными правилами одним проходом (вердикт кэшируется)
+        return self.engine.evaluate(message).is_safe
     
     def check_user_signal(self, user_signal: str) -> bool:
         """
@@ -97,51 +103,22 @@ class SafetyChecker:
         result = user_signal not in forbidden_signals
         
         # Отладочный вывод
-        print(f"🔍 DEBUG check_user_signal: signal='{user_signal}', forbidden={forbidden_signals}, can_use_humor={result}")
+        logger.debug("🔍 DEBUG check_user_signal: signal='%s', forbidden=%s, can_use_humor=%s", user_signal, forbidden_signals, result)
         
         return result
     
-    def analyze_dialogue_mood(self, history: List[Dict]) -> str:
+    def analyze_dialogue_mood(self, history: List[Dict], user_id: Optional[str] = None) -> str:
         """
         Анализирует настроение в истории диалога.
         
         Args:
             history: История сообщений
+            user_id: ID пользователя — настроение запоминается и не пересчитывается для того же окна
             
         Returns:
             'positive', 'negative' или 'neutral'
         """
-        if not history:
-            return 'neutral'
-        
-        # Анализируем последние 5 сообщений
-        recent_messages = history[-5:] if len(history) >= 5 else history
-        
-        positive_count = 0
-        negative_count = 0
-        
-        for msg in recent_messages:
-            if msg.get('role') == 'user':
-                text = msg.get('content', '').lower()
-                
-                # Проверяем негативные маркеры
-                for marker in self.NEGATIVE_MOOD_MARKERS:
-                    if marker in text:
-                        negative_count += 1
-                        break
-                
-                # Проверяем позитивные маркеры
-                for marker in self.POSITIVE_MOOD_MARKERS:
-                    if marker in text:
-                        positive_count += 1
-                        break
-        
-        if negative_count > 0:
-            return 'negative'
-        elif positive_count >= 2:
-            return 'positive'
-        else:
-            return 'neutral'
+        return self.engine.dialogue_mood(history, user_id)
     
     def check_rate_limit(self, user_id: str, max_per_hour: int = 3) -> bool:
         """
@@ -261,8 +238,7 @@ class SafetyChecker:
         #     return False, "no_school_reference"
         
         # Проверка на негативные слова
-        negative_words = ['плохо', 'ужасно', 'кошмар', 'идиот', 'дурак', 'тупой']
-        has_negative = any(word in response_lower for word in negative_words)
+        has_negative = self.engine.evaluate(response).negative_content
         
         if has_negative:
             return False, "negative_content"
@@ -301,7 +277,7 @@ class SafetyChecker:
 
         # Блокировка юмора для первого сообщения пользователя
         if message_count <= 1:
-            print(f"🛡️ Zhvanetsky humor blocked: first message protection for user {user_id}")
+            logger.info("🛡️ Zhvanetsky humor blocked: first message protection for user %s", user_id)
             context['reason'] = 'first_message_protection'
             return False, context
 
@@ -317,9 +293,12 @@ class SafetyChecker:
             return False, context
         
         # Проверка темы
-        if not self.is_safe_topic(message):
+        verdict = self.engine.evaluate(message)
+        context['sensitive_topics'] = list(verdict.sensitive)
+        if not verdict.is_safe:
             context['safe_topic'] = False
             context['reason'] = 'unsafe_topic'
+            context['blacklist'] = list(verdict.blacklist)
             return False, context
         
         # Проверка user_signal
@@ -329,7 +308,7 @@ class SafetyChecker:
             return False, context
         
         # Проверка настроения
-        mood = self.analyze_dialogue_mood(history)
+        mood = self.analyze_dialogue_mood(history, user_id)
         if mood == 'negative':
             context['good_mood'] = False
             context['reason'] = 'negative_mood'
@@ -388,11 +367,152 @@ class TopicClassifier:
         Returns:
             Название категории или 'general'
         """
-        message_lower = message.lower()
-        
-        for category, patterns in cls.TOPIC_PATTERNS.items():
-            for pattern in patterns:
-                if re.search(pattern, message_lower, re.IGNORECASE):
-                    return category
-        
-        return 'general'
\ No newline at end of file
+        return get_safety_engine().evaluate(message).topic
+
+
+# Названия категорий в порядке SafetyChecker.BLACKLIST_PATTERNS и SENSITIVE_TOPICS
+BLACKLIST_CATEGORIES = ("health", "tragedy", "war", "finance", "family", "crime", "psychology")
+SENSITIVE_CATEGORIES = ("religion", "politics", "ethnicity")
+
+
+@dataclass(frozen=True)
+class SafetyVerdict:
+    """Результат всех правил безопасности для одного текста"""
+    blacklist: Tuple[str, ...]  # Категории блеклиста
+    blacklist_hits: Tuple[str, ...]  # Найденные слова блеклиста
+    sensitive: Tuple[str, ...]  # Чувствительные темы (информационно, юмор не блокируют)
+    topic: str  # Категория TopicClassifier или 'general'
+    mood_negative: bool
+    mood_positive: bool
+    negative_content: bool  # Негативные слова (проверка сгенерированной шутки)
+
+    @property
+    def is_safe(self) -> bool:
+        return not self.blacklist
+
+
+class SafetyRuleEngine:
+    """Правила безопасности юмора, скомпилированные в один проход по тексту"""
+
+    def __init__(self, cache_size: int = 1024):
+        groups: List[str] = []
+        self._groups: Dict[str, Tuple[str, str]] = {}  # имя группы -> (вид правила, категория)
+        rules = [("blacklist", name, pattern) for name, pattern in zip(BLACKLIST_CATEGORIES, SafetyChecker.BLACKLIST_PATTERNS)]
+        rules += [("sensitive", name, pattern) for name, pattern in zip(SENSITIVE_CATEGORIES, SafetyChecker.SENSITIVE_TOPICS)]
+        rules += [
+            ("topic", category, pattern)
+            for category, patterns in TopicClassifier.TOPIC_PATTERNS.items() for pattern in patterns
+        ]
+        for index, (kind, name, pattern) in enumerate(rules):
+            # Все правила начинаются с \b и буквы — граница слова проверяется один раз для всех
+            if not pattern.startswith(r"\b"):
+                raise ValueError(f"Правило должно начинаться с границы слова: {pattern}")
+            group = f"r{index}"
+            groups.append(f"(?P<{group}>{pattern[2:]})")
+            self._groups[group] = (kind, name)
+        # Блеклист идёт первым: на одной позиции его совпадение всегда приоритетнее
+        self._regex = re.compile(r"(?<!\w)(?:" + "|".join(groups) + ")", re.IGNORECASE)
+        self._topic_order = list(TopicClassifier.TOPIC_PATTERNS)
+
+        self.matcher = get_keyword_matcher()
+        self.matcher.register("safety.mood_negative", SafetyChecker.NEGATIVE_MOOD_MARKERS)
+        self.matcher.register("safety.mood_positive", SafetyChecker.POSITIVE_MOOD_MARKERS)
+        self.matcher.register("safety.negative_content", SafetyChecker.NEGATIVE_CONTENT_WORDS)
+
+        self._cache: "OrderedDict[str, SafetyVerdict]" = OrderedDict()
+        self.cache_size = cache_size
+        self._moods: Dict[str, Tuple[Tuple[str, ...], str]] = {}  # user_id -> (реплики окна, настроение)
+        self.stats = {"evaluations": 0, "cache_hits": 0, "mood_checks": 0, "mood_reused": 0}
+
+    def evaluate(self, text: str) -> SafetyVerdict:
+        """
+        Все правила для текста за один проход
+
+        Args:
+            text: Сообщение пользователя или сгенерированный ответ
+        Returns:
+            SafetyVerdict (кэшируется по тексту)
+        """
+        self.stats["evaluations"] += 1
+        lowered = text.lower()
+        cached = self._cache.get(lowered)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            self._cache.move_to_end(lowered)
+            return cached
+
+        found: Dict[str, List[str]] = {"blacklist": [], "sensitive": [], "topic": []}
+        hits: List[str] = []
+        for match in self._regex.finditer(lowered):
+            kind, name = self._groups[match.lastgroup]
+            if name not in found[kind]:
+                found[kind].append(name)
+            if kind == "blacklist":
+                hits.append(match.group(0))
+        topic = next((category for category in self._topic_order if category in found["topic"]), "general")
+        keywords = self.matcher.scan(lowered)
+        verdict = SafetyVerdict(
+            blacklist=tuple(found["blacklist"]),
+            blacklist_hits=tuple(hits),
+            sensitive=tuple(found["sensitive"]),
+            topic=topic,
+            mood_negative=keywords.any("safety.mood_negative"),
+            mood_positive=keywords.any("safety.mood_positive"),
+            negative_content=keywords.any("safety.negative_content"),
+        )
+        self._cache[lowered] = verdict
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return verdict
+
+    def dialogue_mood(self, history: List[Dict], user_id: Optional[str] = None) -> str:
+        """
+        Настроение по последним 5 сообщениям истории (считаются реплики пользователя)
+
+        Args:
+            history: История сообщений
+            user_id: Если задан, настроение для того же окна реплик берётся из памяти
+        Returns:
+            'positive', 'negative' или 'neutral'
+        """
+        if not history:
+            return 'neutral'
+        self.stats["mood_checks"] += 1
+        window = tuple(msg.get('content', '') for msg in history[-5:] if msg.get('role') == 'user')
+        if user_id is not None:
+            known = self._moods.get(user_id)
+            if known is not None and known[0] == window:
+                self.stats["mood_reused"] += 1
+                return known[1]
+
+        verdicts = [self.evaluate(text) for text in window]
+        if any(verdict.mood_negative for verdict in verdicts):
+            mood = 'negative'
+        elif sum(verdict.mood_positive for verdict in verdicts) >= 2:
+            mood = 'positive'
+        else:
+            mood = 'neutral'
+        if user_id is not None:
+            self._moods[user_id] = (window, mood)
+        return mood
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика для /metrics"""
+        stats = dict(self.stats)
+        stats["cached_verdicts"] = len(self._cache)
+        stats["tracked_users"] = len(self._moods)
+        stats["cache_hit_rate"] = (
+            f"{(stats['cache_hits'] / stats['evaluations'] * 100):.1f}%" if stats["evaluations"] else "0.0%"
+        )
+        return stats
+
+
+_safety_engine: Optional[SafetyRuleEngine] = None
+
+
+def get_safety_engine() -> SafetyRuleEngine:
+    """Общий движок правил процесса"""
+    global _safety_engine
+    if _safety_engine is None:
+        _safety_engine = SafetyRuleEngine()
+    return _safety_engine
@@ -52,3 +52,14 @@ def test_router_uses_configured_router_model(monkeypatch):
 
     assert router_module.Router(use_cache=False).client.model == "test/router-model"
     assert router_module.Router(use_cache=True).client.model == "test/router-model"
+
+
+def test_model_fallbacks_are_opt_in(monkeypatch):
+    for env_name in ("ROUTER_FALLBACK_MODELS", "ANSWER_FALLBACK_MODELS", "TRANSLATION_FALLBACK_MODELS", "ZHVANETSKY_FALLBACK_MODELS"):
+        monkeypatch.delenv(env_name, raising=False)
+    assert all(models == [] for models in reload_module("config").Config.MODEL_FALLBACKS.values())
+
+    monkeypatch.setenv("ANSWER_FALLBACK_MODELS", "test/spare, test/other")
+    assert reload_module("config").Config.MODEL_FALLBACKS["generator"] == ["test/spare", "test/other"]
+    monkeypatch.delenv("ANSWER_FALLBACK_MODELS")
+    reload_module("config")
@@ -188,3 +188,42 @@ def test_trial_signup_does_not_expose_hubspot_contact_id(client, monkeypatch):
     assert body["success"] is True
     assert body["action"] == "created"
     assert "contact_id" not in body
+
+
+def test_chat_sheds_load_with_503_and_retry_after(client, monkeypatch):
+    main = sys.modules["main"]
+
+    async def overloaded_route(*args, **kwargs):
+        raise main.BulkheadRejected("router", "queue full", 2.3)
+
+    monkeypatch.setattr(main.router, "route", overloaded_route)
+
+    response = client.post("/chat", json={"user_id": "load_test_user", "message": "Сколько стоит курс?"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert response.json()["stage"] == "router"
+
+
+def test_chat_sheds_generator_overload_with_503(client, monkeypatch):
+    main = sys.modules["main"]
+
+    async def success_route(*args, **kwargs):
+        return {
+            "status": "success",
+            "documents": ["pricing.md"],
+            "decomposed_questions": ["Сколько стоит курс?"],
+            "user_signal": "exploring_only",
+        }
+
+    async def overloaded_generate(*args, **kwargs):
+        raise main.BulkheadRejected("generator", "queue full", 1.2)
+
+    monkeypatch.setattr(main.router, "route", success_route)
+    monkeypatch.setattr(main.response_generator, "generate", overloaded_generate)
+
+    response = client.post("/chat", json={"user_id": "generator_load_user", "message": "Сколько стоит курс?"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+    assert response.json()["stage"] == "generator"
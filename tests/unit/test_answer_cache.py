@@ -0,0 +1,158 @@
+"""Кеш ответов генератора: ключ, свежесть и фоновое обновление, персонализация и инвалидация по документам."""
+
+import asyncio
+import os
+
+import pytest
+
+import answer_cache
+from answer_cache import AnswerCache
+
+HASHES = {"pricing.md": "a" * 64}
+ROUTE = {
+    "status": "success",
+    "documents": ["pricing.md"],
+    "decomposed_questions": ["Сколько стоит Юный Оратор?"],
+    "user_signal": "exploring_only",
+    "cta_blocked": True,
+    "original_message": "Сколько стоит Юный Оратор?",
+}
+
+
+def test_key_covers_questions_documents_signal_cta_and_language():
+    key = AnswerCache.make_key(["Сколько стоит Юный Оратор?"], HASHES, "exploring_only", None, "ru")
+
+    assert key == AnswerCache.make_key(["  сколько СТОИТ юный оратор "], HASHES, "exploring_only", None, "ru")
+    assert key != AnswerCache.make_key(["Сколько стоит Юный Оратор?"], {"pricing.md": "b" * 64}, "exploring_only", None, "ru")
+    assert key != AnswerCache.make_key(["Сколько стоит Юный Оратор?"], HASHES, "price_sensitive", None, "ru")
+    assert key != AnswerCache.make_key(["Сколько стоит Юный Оратор?"], HASHES, "exploring_only", "Скидка 10%", "ru")
+    assert key != AnswerCache.make_key(["Сколько стоит Юный Оратор?"], HASHES, "exploring_only", None, "uk")
+    assert key != AnswerCache.make_key(["Сколько стоит Юный Оратор?"], HASHES, "exploring_only", None, "ru", "greeting")
+    assert AnswerCache.make_key(["?!"], HASHES, "exploring_only", None, "ru") is None
+    assert AnswerCache.make_key(["Сколько стоит?"], {}, "exploring_only", None, "ru") is None
+
+
+def test_fresh_then_stale_then_expired(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = AnswerCache(max_size=2, ttl_seconds=60, stale_seconds=300)
+
+    cache.put("a", "Ответ", cost_seconds=2.0)
+    assert cache.get("a").stale is False
+    now[0] += 61
+    assert cache.get("a").stale is True
+    assert cache.begin_refresh("a") and not cache.begin_refresh("a")  # одно обновление на ключ
+    cache.end_refresh("a")
+    now[0] += 300
+    assert cache.get("a") is None
+
+    cache.put("b", "1")
+    cache.put("c", "2")
+    cache.put("d", "3")
+    assert cache.get("b") is None  # вытеснен как давно не использованный
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["stale_hits"], stats["expirations"], stats["evictions"]) == (2, 1, 1, 1)
+    assert stats["latency_saved_seconds"] == 4.0
+
+
+@pytest.fixture
+def generator(tmp_path, monkeypatch):
+    from response_generator import ResponseGenerator
+
+    (tmp_path / "pricing.md").write_text("# Цены\nЮный Оратор — 6000 грн в месяц.", encoding="utf-8")
+    generator = ResponseGenerator(docs_dir=tmp_path)
+    calls = []
+
+    async def fake_chat(messages, *args, **kwargs):
+        calls.append(messages)
+        return f"Юный Оратор стоит 6000 грн в месяц [doc: pricing.md]. Ответ номер {len(calls)}!"
+
+    monkeypatch.setattr(generator.client, "chat", fake_chat)
+    generator.calls = calls
+    return generator
+
+
+def test_repeated_question_is_served_from_cache_with_fresh_personalization(generator):
+    async def scenario():
+        first = await generator.generate(dict(ROUTE), [], "Сколько стоит Юный Оратор?")
+        again = await generator.generate(dict(ROUTE, original_message="сколько стоит юный оратор"), [], "Хочу попробовать, сколько стоит?")
+        return first, again
+
+    (first, _), (again, metadata) = asyncio.run(scenario())
+
+    assert len(generator.calls) == 1
+    assert first == "Юный Оратор стоит 6000 грн в месяц . Ответ номер 1."
+    # Контакты для пробного — персонализация этого запроса, в кеш не попадают
+    assert again.startswith(first) and "ukido.com.ua/trial" in again
+    assert metadata["intent"] == "success"
+    assert generator.answer_cache.get_stats()["hits"] == 1
+
+
+def test_changed_document_invalidates_answers(generator, tmp_path):
+    async def scenario():
+        await generator.generate(dict(ROUTE), [], "Сколько стоит?")
+        path = tmp_path / "pricing.md"
+        path.write_text("# Цены\nЮный Оратор — 7000 грн в месяц.", encoding="utf-8")
+        os.utime(path, (path.stat().st_atime, path.stat().st_mtime + 5))
+        generator.documents.revalidate()
+        return await generator.generate(dict(ROUTE), [], "Сколько стоит?")
+
+    text, _ = asyncio.run(scenario())
+
+    assert len(generator.calls) == 2
+    assert "7000 грн" in generator.calls[1][0]["content"]
+    assert text.endswith("Ответ номер 2.")
+
+
+def test_dialogue_dependent_answers_bypass_cache(generator):
+    history = [{"role": "user", "content": "Какие курсы есть?"}, {"role": "assistant", "content": "Три курса."}] * 2
+
+    async def scenario():
+        await generator.generate(dict(ROUTE), history, "Сколько стоит?")
+        await generator.generate(dict(ROUTE), history, "Сколько стоит?")
+        await generator.generate(dict(ROUTE, memory="Ребёнку 9 лет"), [], "Сколько стоит?")
+
+    asyncio.run(scenario())
+
+    assert len(generator.calls) == 3
+    assert generator.answer_cache.get_stats()["bypassed"] == 3
+
+
+def test_short_history_is_part_of_the_key(generator):
+    about_courses = [{"role": "user", "content": "Какие курсы есть?"}, {"role": "assistant", "content": "Три курса."}]
+    about_teachers = [{"role": "user", "content": "Кто преподаёт?"}, {"role": "assistant", "content": "Психологи."}]
+
+    async def scenario():
+        await generator.generate(dict(ROUTE), about_courses, "Сколько стоит?")
+        await generator.generate(dict(ROUTE), about_teachers, "Сколько стоит?")
+        await generator.generate(dict(ROUTE), [], "Сколько стоит?")
+        return await generator.generate(dict(ROUTE), about_courses, "Сколько стоит?")
+
+    text, _ = asyncio.run(scenario())
+
+    assert len(generator.calls) == 3
+    assert text.endswith("Ответ номер 1.")
+    assert generator.answer_cache.get_stats()["hits"] == 1
+
+
+def test_stale_answer_is_served_and_refreshed_in_background(generator, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    tokens = []
+
+    async def scenario():
+        await generator.generate(dict(ROUTE), [], "Сколько стоит?")
+        now[0] += generator.answer_cache.ttl_seconds + 1
+        stale, _ = await generator.generate(dict(ROUTE), [], "Сколько стоит?", on_token=tokens.append)
+        await asyncio.gather(*generator._refresh_tasks)
+        fresh, _ = await generator.generate(dict(ROUTE), [], "Сколько стоит?")
+        return stale, fresh
+
+    stale, fresh = asyncio.run(scenario())
+
+    assert stale.endswith("Ответ номер 1.") and tokens == [stale]  # из кеша — одним сообщением
+    assert fresh.endswith("Ответ номер 2.")
+    assert len(generator.calls) == 2
+    stats = generator.answer_cache.get_stats()
+    assert (stats["stale_hits"], stats["refreshes"], stats["refreshing"]) == (1, 1, 0)
@@ -0,0 +1,64 @@
+"""Бенчмарк роутера: загрузка диалогов, запись/воспроизведение ответов и телеметрия вызовов."""
+
+import asyncio
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+import benchmark_router
+import http_pool
+import model_health
+from benchmark_router import ReplayTransport, load_dialogues, parse_args, run, summarize
+from mock_openrouter import MockSettings, create_app
+
+
+def test_loads_dialogues_from_all_file_formats():
+    dialogues = load_dialogues()
+    sources = {dialogue_id.split("#")[0] for dialogue_id, _ in dialogues}
+
+    assert "tests/test_scenarios.json" in sources  # список сценариев со steps
+    assert "tests/personas/test_tech_dad.json" in sources  # {"scenarios": [...]} с messages
+    assert "tests/test_irritated_parent.json" in sources  # один сценарий
+    assert "tests/test_cta_blocker_scenarios.json" in sources  # словарь сценариев
+    assert all(messages and all(isinstance(text, str) for text in messages) for _, messages in dialogues)
+
+
+def test_record_then_replay_gives_same_decisions(monkeypatch):
+    monkeypatch.setattr(http_pool, "_http_pool", None)
+    monkeypatch.setattr(model_health, "_registry", model_health.ModelHealthRegistry())
+    dialogues = [
+        ("demo#0", ["Сколько стоит курс?", "А кто преподаватели?"]),
+        ("demo#1", ["Привет!", "Расскажите о курсах"]),
+    ]
+    args = parse_args([])
+
+    recorder = ReplayTransport(upstream=httpx.ASGITransport(app=create_app(MockSettings())))
+    recorded = asyncio.run(run(dialogues, recorder, args))
+    monkeypatch.setattr(http_pool, "_http_pool", None)
+    replayer = ReplayTransport(records=recorder.records)
+    replayed = asyncio.run(run(dialogues, replayer, args))
+
+    assert replayer.misses == 0
+    assert [call["documents"] for call in replayed] == [call["documents"] for call in recorded]
+    assert [call["path"] for call in replayed] == ["gemini", "gemini", "social", "gemini"]
+    assert all(call["prompt_chars"] > 0 for call in replayed if call["path"] == "gemini")
+
+    summary = summarize(replayed)
+    assert summary["paths"] == {"gemini": 3, "social": 1}
+    assert summary["gemini_requests"] == 3
+    assert summary["fallback_rate"] == 0.0
+
+
+def test_missing_recording_counts_as_fallback(monkeypatch):
+    monkeypatch.setattr(http_pool, "_http_pool", None)
+    monkeypatch.setattr(model_health, "_registry", model_health.ModelHealthRegistry())
+    monkeypatch.setattr(benchmark_router.Config, "LLM_MAX_RETRIES", 0)
+    replayer = ReplayTransport(records={})
+
+    calls = asyncio.run(run([("demo#0", ["Сколько стоит курс?"])], replayer, parse_args([])))
+
+    assert replayer.misses >= 1
+    assert calls[0]["path"] == "fallback"
@@ -0,0 +1,65 @@
+"""Stage bulkheads: bounded concurrency, bounded queue, fast rejection."""
+
+import asyncio
+
+import pytest
+
+from bulkhead import Bulkhead, BulkheadRejected
+
+
+def test_calls_beyond_concurrency_wait_in_queue_and_run_in_order():
+    bulkhead = Bulkhead("router", max_concurrent=2, max_queue=10, max_wait=5.0)
+    order = []
+
+    async def call(index):
+        async with bulkhead.slot():
+            order.append(("start", index))
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        await asyncio.gather(*(call(i) for i in range(5)))
+
+    asyncio.run(scenario())
+
+    assert [index for _, index in order] == [0, 1, 2, 3, 4]
+    assert bulkhead.active == 0
+    assert bulkhead.stats["queued"] == 3
+    assert bulkhead.stats["acquired"] == 5
+
+
+def test_full_queue_is_rejected_immediately_with_retry_after():
+    bulkhead = Bulkhead("humor", max_concurrent=1, max_queue=0, max_wait=0.0)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def holder():
+            async with bulkhead.slot():
+                await release.wait()
+
+        task = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        with pytest.raises(BulkheadRejected) as rejected:
+            async with bulkhead.slot():
+                pass
+        release.set()
+        await task
+        return rejected.value
+
+    rejection = asyncio.run(scenario())
+
+    assert rejection.stage == "humor"
+    assert rejection.retry_after_header == "1"
+    assert bulkhead.stats["rejected_queue_full"] == 1
+
+
+def test_estimated_wait_beyond_deadline_is_shed():
+    bulkhead = Bulkhead("generator", max_concurrent=1, max_queue=10, max_wait=1.0)
+    bulkhead.active = 1
+    bulkhead._avg_hold = 3.0  # каждый вызов в среднем держит слот 3 секунды
+
+    rejection = bulkhead.would_reject()
+
+    assert rejection is not None
+    assert rejection.reason == "estimated wait exceeds deadline"
+    assert rejection.retry_after_header == "3"
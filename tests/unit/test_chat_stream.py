@@ -0,0 +1,204 @@
+"""/chat/stream: метаданные роутера первым событием, очищенный текст генератора по мере прихода, итог после постобработки."""
+
+import asyncio
+import importlib
+import json
+import os
+import sys
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sse_starlette.sse import AppStatus
+
+import http_pool
+import model_health
+from response_stream import ResponseStream, current_stream, stream_scope
+
+ROUTE = {
+    "status": "success",
+    "documents": ["pricing.md"],
+    "decomposed_questions": ["Сколько стоит Юный Оратор?"],
+    "user_signal": "exploring_only",
+    "detected_language": "ru",
+}
+PIECES = ["Юный Оратор", " стоит 6000 грн", " в месяц. [doc: pricing.md]", " Занятия проходят онлайн", " через Zoom!"]
+
+
+def _events(body: str):
+    """(событие, данные) из текста SSE"""
+    events = []
+    for block in body.replace("\r\n", "\n").split("\n\n"):
+        lines = block.strip("\n").split("\n")
+        event = next((line[7:] for line in lines if line.startswith("event: ")), None)
+        if event:
+            events.append((event, "\n".join(line[6:] for line in lines if line.startswith("data: "))))
+    return events
+
+
+@pytest.fixture(scope="module")
+def main_module(tmp_path_factory):
+    os.environ["OPENROUTER_API_KEY"] = "test_key_for_ci"
+    os.environ["DETERMINISTIC_MODE"] = "true"
+    os.environ["PERSISTENCE_BASE_PATH"] = str(tmp_path_factory.mktemp("states"))
+    for module_name in ("main", "config", "router", "gemini_cached_client", "response_generator", "translator"):
+        sys.modules.pop(module_name, None)
+    return importlib.import_module("main")
+
+
+@pytest.fixture
+def stream_client(main_module, monkeypatch):
+    async def fake_route(message, history, user_id, memory=None):
+        return dict(ROUTE)
+
+    async def fake_chat_stream(client, messages, outcome=None, **kwargs):
+        for piece in PIECES:
+            await asyncio.sleep(0)
+            yield piece
+        outcome.completed = True
+
+    async def no_chat(*args, **kwargs):
+        raise AssertionError("при стриминге генератор не должен делать обычный запрос")
+
+    generator_module = sys.modules["response_generator"]
+    monkeypatch.setattr(main_module.config, "ROUTER_STREAMING", False)
+    monkeypatch.setattr(main_module.router, "route", fake_route)
+    monkeypatch.setattr(generator_module, "chat_stream", fake_chat_stream)
+    monkeypatch.setattr(main_module.response_generator.client, "chat", no_chat)
+    # sse_starlette держит глобальное событие остановки, привязанное к первому event loop
+    monkeypatch.setattr(AppStatus, "should_exit_event", None)
+    return TestClient(main_module.app)
+
+
+def test_stream_sends_router_metadata_then_tokens_then_final(main_module, stream_client):
+    response = stream_client.get("/chat/stream", params={"user_id": "stream_tokens", "message": "Сколько стоит Юный Оратор?"})
+    events = _events(response.text)
+
+    messages = [data for event, data in events if event == "message"]
+
+    assert response.status_code == 200
+    assert [event for event, _ in events] == ["metadata"] + ["message"] * len(messages) + ["final", "done"]
+    assert json.loads(events[0][1])["intent"] == "success"
+    assert len(messages) >= 2  # первое предложение ушло до конца ответа
+    assert messages[0].startswith("Юный Оратор стоит 6000 грн в месяц.")
+    assert not any("[doc:" in message or "!" in message for message in messages)
+
+    final = json.loads(events[-2][1])
+    assert final["relevant_documents"] == ["pricing.md"]
+    assert final["replace"] is False
+    assert "".join(messages) == final["response"]
+    assert main_module.history.get_history("stream_tokens")[-1]["content"] == final["response"]
+
+
+def test_offtopic_arrives_as_one_message(main_module, stream_client, monkeypatch):
+    async def offtopic_route(message, history, user_id, memory=None):
+        return {"status": "offtopic", "message": "Мы говорим только о школе Ukido.", "user_signal": "exploring_only"}
+
+    monkeypatch.setattr(main_module.router, "route", offtopic_route)
+    monkeypatch.setattr(main_module, "zhvanetsky_generator", None)
+    events = _events(stream_client.get("/chat/stream", params={"user_id": "stream_offtopic", "message": "Какая погода?"}).text)
+
+    assert [event for event, _ in events] == ["metadata", "message", "final", "done"]
+    assert events[1][1] == "Мы говорим только о школе Ukido."
+    assert json.loads(events[2][1])["replace"] is False
+
+
+def test_cut_stream_falls_back_to_full_answer_and_is_not_cached(main_module, monkeypatch):
+    full = "Юный Оратор стоит 6000 грн в месяц. Занятия проходят онлайн через Zoom."
+    streamed_requests = []
+
+    async def cut_body():
+        for word in ["Юный ", "Оратор ", "стоит 6000 грн в месяц. ", "Занятия "]:
+            chunk = {"choices": [{"index": 0, "delta": {"content": word}}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+        raise httpx.ReadError("connection dropped")
+
+    def handler(request):
+        body = json.loads(request.content)
+        streamed_requests.append(bool(body.get("stream")))
+        if body.get("stream"):
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=cut_body())
+        return httpx.Response(200, json={"model": body["model"], "choices": [{"message": {"content": full}, "finish_reason": "stop"}]})
+
+    monkeypatch.setattr(http_pool, "_http_pool", http_pool.HttpPool(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(model_health, "_registry", model_health.ModelHealthRegistry())
+    generator = sys.modules["response_generator"].ResponseGenerator()
+    tokens = []
+    route = dict(ROUTE, cta_blocked=True, original_message="Сколько стоит Юный Оратор?")
+
+    text, _ = asyncio.run(generator.generate(route, [], "Сколько стоит Юный Оратор?", on_token=tokens.append))
+
+    assert streamed_requests == [True, False]  # обрыв стрима → обычный запрос
+    assert text == "Юный Оратор стоит 6000 грн в месяц. Занятия проходят онлайн через Zoom."
+    assert "".join(tokens) == text
+    assert [entry[0] for entry in generator.answer_cache._entries.values()] == [text]  # в кеше только полный ответ
+    breaker = model_health.get_model_health().get_stats()["breakers"][generator.client.model]
+    assert breaker["bad_call_ratio"] > 0  # обрыв учтён как сбой модели
+
+
+def test_stream_scope_is_visible_only_to_tasks_created_inside():
+    async def scenario():
+        async def pipeline():
+            stream = current_stream()
+            stream.metadata({"intent": "success"})
+            stream.metadata({"intent": "ignored"})
+            for piece in PIECES:
+                await asyncio.sleep(0)
+                stream.token(piece)
+            return "done"
+
+        with stream_scope() as stream:
+            task = asyncio.create_task(pipeline())
+        assert current_stream() is None
+        events = [event async for event in stream.events(task)]
+        return events, await task, stream
+
+    events, result, stream = asyncio.run(scenario())
+    assert events == [("metadata", {"intent": "success"})] + [("message", piece) for piece in PIECES]
+    assert result == "done"
+    assert isinstance(stream, ResponseStream) and stream.streamed_text == "".join(PIECES)
+
+
+def test_streaming_router_records_cta_checks_only_after_routing(main_module, monkeypatch):
+    blocker = main_module.simple_cta_blocker
+    request = main_module.ChatRequest(user_id="cta_after_routing", message="Не надо мне ничего предлагать")
+
+    async def failed_route(message, history, user_id, on_partial=None, memory=None):
+        raise RuntimeError("router down")
+
+    async def offtopic_route(message, history, user_id, on_partial=None, memory=None):
+        return {"status": "offtopic", "message": "Понимаю.", "decomposed_questions": [], "user_signal": "exploring_only"}
+
+    monkeypatch.setattr(main_module.config, "ROUTER_STREAMING", True)
+    monkeypatch.setattr(main_module.router, "route_streaming", failed_route)
+    asyncio.run(main_module._process_chat(request))
+    assert request.user_id not in blocker.refusals
+
+    monkeypatch.setattr(main_module.router, "route_streaming", offtopic_route)
+    asyncio.run(main_module._process_chat(request))
+    assert blocker.refusals[request.user_id]["type"] == "hard"
+    assert blocker.should_block_cta(request.user_id, 2) == (True, "user_refused_hard")
+
+
+def test_state_snapshot_is_written_off_the_event_loop(main_module, monkeypatch):
+    import threading
+
+    writes = []
+
+    def fake_save_state(user_id, state_data):
+        writes.append((user_id, len(state_data["history"]), threading.current_thread() is threading.main_thread()))
+        return True
+
+    monkeypatch.setattr(main_module.persistence_manager, "save_state", fake_save_state)
+
+    async def scenario():
+        main_module.history.add_message("state_writes", "user", "Привет")
+        main_module._after_response("state_writes")
+        main_module.history.add_message("state_writes", "assistant", "Здравствуйте!")
+        main_module._after_response("state_writes")
+        await asyncio.gather(*main_module._state_writes.values())
+
+    asyncio.run(scenario())
+
+    assert writes == [("state_writes", 1, False), ("state_writes", 2, False)]
+    assert not main_module._state_writes
@@ -0,0 +1,98 @@
+"""Сжатая память диалога: факты, свёртка старых реплик, снимки и размер промптов."""
+
+from config import Config
+from conversation_memory import extract_facts
+from history_manager import HistoryManager
+from persistence_manager import create_state_snapshot, restore_state_snapshot
+
+TURNS = [
+    "Здравствуйте, у меня сын 9 лет, очень стеснительный.",
+    "Сколько стоит Юный Оратор?",
+    "А скидки есть, если двое детей?",
+    "Кто преподаватели?",
+    "Сколько детей в группе?",
+    "А если пропустим занятие?",
+    "Какие результаты через 3 месяца?",
+]
+REPLY = "Для 9-летнего ребёнка подойдёт Юный Оратор. " + "Группы небольшие, занятия дважды в неделю, преподаватели с опытом. " * 6
+
+
+def _dialogue(manager: HistoryManager, turns=TURNS, user_id="memory_user"):
+    for text in turns:
+        manager.add_message(user_id, "user", text)
+        manager.add_message(user_id, "assistant", REPLY)
+        manager.update_memory(user_id)
+
+
+def test_extract_facts():
+    facts = extract_facts("Дочке 11 лет, стеснительная, хотим Капитан Проектов онлайн, но дорого")
+
+    assert facts["child_age"] == "11"
+    assert facts["course"] == "Капитан Проектов"
+    assert facts["format"] == "онлайн"
+    assert facts["price_concern"]
+    assert "стеснительная" in facts["child_traits"]
+    assert extract_facts("Какие у вас преподаватели?") == {}
+
+
+def test_old_turns_are_folded_and_recent_kept_verbatim():
+    manager = HistoryManager()
+    _dialogue(manager)
+
+    memory = manager.memories["memory_user"]
+    total = len(TURNS) * 2
+    assert memory.folded == total - Config.MEMORY_RECENT_MESSAGES
+    assert memory.seen == total
+    assert len(memory.summary) <= Config.MEMORY_SUMMARY_MAX_LINES
+    # Первая реплика уже обрезана историей (HISTORY_LIMIT), но осталась в памяти
+    assert manager.get_history("memory_user")[0]["content"] != TURNS[0]
+    prompt = manager.get_memory_prompt("memory_user")
+    assert "Возраст ребёнка: 9" in prompt
+    assert "Юный Оратор" in prompt
+    assert f"Родитель: {TURNS[0]}" in prompt
+
+
+def test_memory_survives_snapshot_restore():
+    manager = HistoryManager()
+    _dialogue(manager)
+    snapshot = create_state_snapshot(manager, {}, None, "memory_user")
+
+    restored = HistoryManager()
+    restore_state_snapshot(snapshot, restored, {}, None, "memory_user")
+    assert restored.get_memory_prompt("memory_user") == manager.get_memory_prompt("memory_user")
+
+    # После восстановления свёртка продолжается с того же места
+    _dialogue(restored, ["А рассрочка есть?"])
+    _dialogue(manager, ["А рассрочка есть?"])
+    assert restored.memories["memory_user"].to_dict() == manager.memories["memory_user"].to_dict()
+
+
+def test_disabled_memory(monkeypatch):
+    monkeypatch.setattr(Config, "CONVERSATION_MEMORY", False)
+    manager = HistoryManager()
+    _dialogue(manager)
+
+    assert manager.get_memory_prompt("memory_user") is None
+
+
+def test_prompts_use_memory_and_recent_messages_only():
+    from prompt_segments import estimate_tokens
+    from response_generator import ResponseGenerator
+    from router import Router
+
+    router = Router(use_cache=False)
+    generator = ResponseGenerator()
+    manager = HistoryManager()
+    _dialogue(manager)
+    history = manager.get_history("memory_user")
+    memory = manager.get_memory_prompt("memory_user")
+
+    raw_section = router._get_history_section(history)
+    memory_section = router._get_history_section(history, memory)
+    assert memory in memory_section
+    assert memory_section.count("Assistant:") == Config.MEMORY_RECENT_MESSAGES // 2
+    assert estimate_tokens(memory_section) < estimate_tokens(raw_section)
+
+    messages = generator._build_messages({"pricing.md": "Цены"}, ["Вопрос?"], history, {"memory": memory})
+    assert memory in messages[0]["content"]
+    assert messages[1:Config.MEMORY_RECENT_MESSAGES + 1] == history[-Config.MEMORY_RECENT_MESSAGES:]
@@ -0,0 +1,101 @@
+"""Документы в памяти: загрузка корпуса, сверка по mtime и отдача без чтения диска."""
+
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+
+from document_store import DocumentStore, get_document_store
+from prompt_segments import estimate_tokens
+
+
+def _write(path: Path, text: str, mtime: float) -> None:
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    _write(tmp_path / "pricing.md", "# Цены\n6000 грн в месяц", 1_000_000)
+    _write(tmp_path / "faq.md", "# Вопросы\nЧасто спрашивают о группах", 1_000_000)
+    (tmp_path / "notes.txt").write_text("не документ", encoding="utf-8")
+    return tmp_path
+
+
+def test_loads_corpus_with_metadata_and_counts_hits(corpus):
+    store = DocumentStore(corpus)
+    assert store.load_all() == 2
+
+    assert store.get("pricing.md") == "# Цены\n6000 грн в месяц"
+    assert store.get_many(["faq.md", "pricing.md", "faq.md", "missing.md"]) == {
+        "faq.md": "# Вопросы\nЧасто спрашивают о группах",
+        "pricing.md": "# Цены\n6000 грн в месяц",
+    }
+    stats = store.get_stats()
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["per_document"]["pricing.md"] == {
+        "bytes": len("# Цены\n6000 грн в месяц".encode("utf-8")),
+        "estimated_tokens": estimate_tokens("# Цены\n6000 грн в месяц"),
+        "hits": 2,
+    }
+
+
+def test_revalidate_rereads_only_changed_files(corpus):
+    store = DocumentStore(corpus)
+    store.load_all()
+    faq = store.document("faq.md")
+
+    assert store.revalidate() == 0
+    _write(corpus / "pricing.md", "# Цены\n6500 грн в месяц", 1_000_100)
+    _write(corpus / "faq.md", "# Вопросы\nЧасто спрашивают о группах", 1_000_100)  # только mtime
+    _write(corpus / "teachers_team.md", "# Команда", 1_000_100)
+    (corpus / "notes.txt").unlink()
+
+    assert store.revalidate() == 2
+    assert store.get("pricing.md") == "# Цены\n6500 грн в месяц"
+    assert store.get("teachers_team.md") == "# Команда"
+    assert store.document("faq.md") is faq  # содержимое то же — документ не заменён
+    assert store.stats["unchanged"] == 1
+
+    (corpus / "teachers_team.md").unlink()
+    assert store.revalidate() == 1
+    assert store.get("teachers_team.md") is None
+    assert store.stats["removed"] == 1
+
+
+def test_background_revalidation_picks_up_changes(corpus):
+    store = DocumentStore(corpus)
+    store.load_all()
+
+    async def scenario():
+        task = asyncio.create_task(store.run_revalidation(0.01))
+        _write(corpus / "pricing.md", "# Цены\nновые", 1_000_200)
+        for _ in range(200):
+            await asyncio.sleep(0.01)
+            if store.get("pricing.md") == "# Цены\nновые":
+                break
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert store.get("pricing.md") == "# Цены\nновые"
+
+
+def test_generator_serves_documents_without_disk_reads(monkeypatch):
+    from response_generator import ResponseGenerator
+
+    generator = ResponseGenerator()
+    assert generator.documents is get_document_store()
+    asyncio.run(generator.documents.ensure_loaded())
+
+    def no_disk(*args, **kwargs):
+        raise AssertionError("документы читаются с диска в пути запроса")
+
+    monkeypatch.setattr(Path, "read_bytes", no_disk)
+    monkeypatch.setattr(Path, "read_text", no_disk)
+    monkeypatch.setattr("builtins.open", no_disk)
+
+    texts = asyncio.run(generator.prefetch_documents(["pricing.md", "teachers_team.md", "unknown.md"]))
+    assert list(texts) == ["pricing.md", "teachers_team.md"]
+    assert texts["teachers_team.md"]
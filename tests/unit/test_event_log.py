@@ -0,0 +1,89 @@
+"""Structured event logging: level gate before formatting, deferred formatting, sampling."""
+
+import json
+import logging
+import queue
+
+import pytest
+
+from config import Config
+from event_log import EventLogger, JsonFormatter, _DeferredQueueHandler
+
+
+class CountingArg:
+    def __init__(self):
+        self.rendered = 0
+
+    def __str__(self):
+        self.rendered += 1
+        return "rendered"
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def captured():
+    logger = logging.getLogger("tests.event_log")
+    handler = ListHandler()
+    logger.addHandler(handler)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    yield handler
+    logger.removeHandler(handler)
+    logger.propagate = True
+
+
+def test_disabled_level_skips_record_and_formatting(captured):
+    log = EventLogger("tests.event_log")
+    arg = CountingArg()
+
+    log.debug("test.debug", "value %s", arg)
+
+    assert captured.records == []
+    assert arg.rendered == 0
+
+
+def test_queue_handler_defers_formatting_to_listener():
+    log_queue = queue.SimpleQueue()
+    handler = _DeferredQueueHandler(log_queue)
+    arg = CountingArg()
+    record = logging.LogRecord("tests", logging.INFO, __file__, 1, "value %s", (arg,), None)
+
+    handler.handle(record)
+
+    assert arg.rendered == 0
+    queued = log_queue.get_nowait()
+    assert queued.getMessage() == "value rendered"
+    assert arg.rendered == 1
+
+
+def test_sampled_event_is_dropped_at_zero_rate(captured, monkeypatch):
+    monkeypatch.setattr(Config, "LOG_SAMPLING", {"llm.request": 0.0, "llm.response": 1.0})
+    log = EventLogger("tests.event_log")
+
+    for _ in range(20):
+        log.info("llm.request", "request")
+    log.info("llm.response", "response")
+    log.info("router.route", "always")
+
+    assert [record.event for record in captured.records] == ["llm.response", "router.route"]
+
+
+def test_json_formatter_includes_event_and_fields(captured):
+    log = EventLogger("tests.event_log")
+    log.info("main.latency", "⏱️ Latency: %.2fs", 1.234, latency=1.234, user_signal="exploring_only")
+
+    line = json.loads(JsonFormatter().format(captured.records[0]))
+
+    assert line["event"] == "main.latency"
+    assert line["msg"] == "⏱️ Latency: 1.23s"
+    assert line["latency"] == 1.234
+    assert line["user_signal"] == "exploring_only"
+    assert line["level"] == "INFO"
@@ -0,0 +1,102 @@
+"""Индекс опечаток бизнес-слов: те же решения, что попарный SequenceMatcher, на всех фикстурах."""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+import social_intents
+from benchmark_router import load_dialogues
+from fuzzy_keywords import FuzzyKeywordIndex
+from social_intents import CRITICAL_BUSINESS_KEYWORDS, fuzzy_match_word
+
+ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+
+
+def _reference_fuzzy(text: str) -> bool:
+    """Прежняя реализация: каждое слово против каждого ключевого слова"""
+    for word in text.lower().split():
+        word_clean = word.strip('.,!?;:')
+        if len(word_clean) < 3:
+            continue
+        if any(fuzzy_match_word(word_clean, keyword, threshold=0.85) for keyword in CRITICAL_BUSINESS_KEYWORDS):
+            return True
+    return False
+
+
+def _reference_extended(text: str):
+    if not text:
+        return False, False
+    if any(rgx.search(text) for rgx in social_intents._COMPILED_BUSINESS):
+        return True, False
+    fuzzy = _reference_fuzzy(text)
+    return fuzzy, fuzzy
+
+
+def _typo(rnd: random.Random, word: str) -> str:
+    letters = list(word)
+    for _ in range(rnd.randint(1, 3)):
+        op, i = rnd.choice("dist"), rnd.randrange(len(letters))
+        if op == "d" and len(letters) > 1:
+            del letters[i]
+        elif op == "i":
+            letters.insert(i, rnd.choice(ALPHABET))
+        elif op == "s":
+            letters[i] = rnd.choice(ALPHABET)
+        elif op == "t" and i + 1 < len(letters):
+            letters[i], letters[i + 1] = letters[i + 1], letters[i]
+    return "".join(letters)
+
+
+@pytest.fixture(scope="module")
+def fixture_messages():
+    return [text for _, messages in load_dialogues() for text in messages]
+
+
+def test_same_decisions_on_all_fixture_messages(fixture_messages):
+    assert len(fixture_messages) > 500
+    for text in fixture_messages:
+        assert social_intents._has_fuzzy_business_word(text) == _reference_fuzzy(text), text
+        assert social_intents.has_business_signals_extended(text) == _reference_extended(text), text
+        assert social_intents.has_business_signals(text) == _reference_extended(text)[0], text
+
+
+def test_same_decisions_on_fixture_words_and_typos(fixture_messages):
+    rnd = random.Random(18)
+    words = {word.strip('.,!?;:') for text in fixture_messages for word in text.lower().split()}
+    words |= {_typo(rnd, rnd.choice(CRITICAL_BUSINESS_KEYWORDS)) for _ in range(5000)}
+    matched = 0
+    for word in words:
+        if len(word) < 3:
+            continue
+        expected = any(fuzzy_match_word(word, keyword, threshold=0.85) for keyword in CRITICAL_BUSINESS_KEYWORDS)
+        matched += expected
+        assert (social_intents._FUZZY_BUSINESS.match(word) is not None) == expected, word
+    assert matched > 500  # в выборке достаточно настоящих опечаток
+
+
+@pytest.mark.parametrize("word, keyword", [
+    ("оплта", "оплата"),
+    ("распсание", "расписание"),
+    ("преподователь", "преподаватель"),
+    ("сцена", None),  # первая буква защищает от сцена → цена
+    ("крус", None),   # ratio 0.75 ниже порога 0.85
+    ("куррс", "курс"),  # первое подходящее слово в порядке списка
+])
+def test_typo_examples(word, keyword):
+    assert social_intents._FUZZY_BUSINESS.match(word) == keyword
+
+
+def test_other_threshold_and_length_guard():
+    index = FuzzyKeywordIndex(["курс", "цена", "ок"], threshold=0.75)
+
+    assert index.match("крус") == "курс"
+    assert index.match("курсовая") is None  # разница длины больше 1
+    assert index.match("ок") == "ок"  # короткие ключи — только точное совпадение
+    for word in ("крус", "цина", "курсы", "кур", "цен"):
+        assert (index.match(word) is not None) == any(
+            fuzzy_match_word(word, keyword, threshold=0.75) for keyword in ["курс", "цена", "ок"]
+        )
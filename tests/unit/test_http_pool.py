@@ -0,0 +1,65 @@
+"""Shared HTTP pool: one client per host, reused across LLM calls."""
+
+import asyncio
+
+import httpx
+
+from http_pool import HttpPool
+from openrouter_client import OpenRouterClient
+
+
+def make_pool(handler):
+    return HttpPool(transport=httpx.MockTransport(handler))
+
+
+def test_pool_reuses_client_per_host_within_event_loop():
+    pool = make_pool(lambda request: httpx.Response(200, json={}))
+
+    async def scenario():
+        first = pool.get_client("https://openrouter.ai/api/v1/chat/completions")
+        second = pool.get_client("https://openrouter.ai/api/v1/models")
+        other = pool.get_client("https://api.hubapi.com/crm/v3/objects/contacts")
+        await pool.aclose()
+        return first, second, other
+
+    first, second, other = asyncio.run(scenario())
+
+    assert first is second
+    assert other is not first
+    assert pool.stats["pool_hits"] == 1
+    assert pool.stats["pool_misses"] == 2
+
+
+def test_pool_recreates_client_for_new_event_loop():
+    pool = make_pool(lambda request: httpx.Response(200, json={}))
+
+    async def get():
+        return pool.get_client("https://openrouter.ai/api/v1/chat/completions")
+
+    first = asyncio.run(get())
+    second = asyncio.run(get())
+
+    assert first is not second
+    assert pool.stats["pool_misses"] == 2
+
+
+def test_openrouter_client_sends_requests_through_injected_pool():
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers["Authorization"])
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    pool = make_pool(handler)
+    client = OpenRouterClient("test-key", http_pool=pool)
+
+    async def scenario():
+        answers = [await client.chat([{"role": "user", "content": "hi"}]) for _ in range(3)]
+        await pool.aclose()
+        return answers
+
+    assert asyncio.run(scenario()) == ["ok", "ok", "ok"]
+    assert seen == ["Bearer test-key"] * 3
+    assert pool.stats["requests"] == 3
+    assert pool.stats["pool_misses"] == 1
+    assert pool.stats["pool_hits"] == 2
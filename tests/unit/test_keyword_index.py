@@ -0,0 +1,102 @@
+"""Индекс ключевых слов: документы для need_simplification без второго запроса и проверка выбора Gemini."""
+
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+import http_pool
+import model_health
+from keyword_index import KeywordIndex
+from mock_openrouter import MockSettings, create_app
+
+DATA_DIR = Path(__file__).parent.parent.parent / "data"
+
+
+@pytest.fixture(scope="module")
+def index():
+    summaries = json.loads((DATA_DIR / "summaries.json").read_text(encoding="utf-8"))
+    return KeywordIndex.build(summaries, DATA_DIR / "documents_compressed")
+
+
+@pytest.mark.parametrize("question, document", [
+    ("Есть ли скидки для многодетных?", "pricing.md"),
+    ("Можно ли платить в рассрочку?", "pricing.md"),
+    ("Кто преподаватели?", "teachers_team.md"),
+    ("Вы сотрудничаете с блогерами?", "partners.md"),
+    ("Какие результаты у детей?", "results_achievements.md"),
+])
+def test_top_document_for_question(index, question, document):
+    assert index.ranked(question)[0] == document
+
+
+def test_resolve_takes_primary_document_per_question(index):
+    assert index.resolve(["Есть ли скидки?", "Кто преподаватели?"])[:2] == ["pricing.md", "teachers_team.md"]
+    assert index.resolve(["Какая погода в Токио?", "Рецепт борща"]) == []
+
+
+def test_check_drops_unknown_names(index):
+    check = index.check(["pricing.md", "prices_2024.md"], ["Есть ли скидки?"])
+
+    assert check.documents == ["pricing.md"]
+    assert check.unknown == ["prices_2024.md"]
+    assert check.unsupported == []
+
+
+def test_non_dict_summaries_are_indexed_as_text():
+    index = KeywordIndex.build({"pricing.md": "Цены и скидки", "faq.md": "Частые вопросы"})
+
+    assert index.ranked("Какие скидки?") == ["pricing.md"]
+
+
+def _mock(monkeypatch, response):
+    app = create_app(MockSettings(scenario={"router": [{"pattern": ".", "response": response}]}))
+    monkeypatch.setattr(http_pool, "_http_pool", http_pool.HttpPool(transport=httpx.ASGITransport(app=app)))
+    monkeypatch.setattr(model_health, "_registry", model_health.ModelHealthRegistry())
+    return app
+
+
+def test_need_simplification_resolved_without_second_call(monkeypatch):
+    from router import Router
+
+    app = _mock(monkeypatch, {
+        "status": "need_simplification",
+        "detected_language": "ru",
+        "message": "Пожалуйста, задавайте не более трёх вопросов за раз.",
+        "decomposed_questions": ["Есть ли скидки для двоих детей?", "Кто ведёт занятия?"],
+        "user_signal": "price_sensitive",
+    })
+    router = Router(use_cache=False)
+
+    result = asyncio.run(router.route("Есть ли скидки для двоих детей и кто ведёт занятия?", [], "kw_user_1"))
+
+    assert app.state.mock.stats["router"] == 1
+    assert result["status"] == "success"
+    assert "message" not in result
+    assert result["documents"][:2] == ["pricing.md", "teachers_team.md"]
+    assert router.get_stats()["keyword_index"]["simplification_resolved"] == 1
+
+
+def test_unknown_documents_from_gemini_are_replaced(monkeypatch):
+    from router import Router
+
+    _mock(monkeypatch, {
+        "status": "success",
+        "detected_language": "ru",
+        "documents": ["discounts.md"],
+        "decomposed_questions": ["Есть ли скидки?"],
+        "user_signal": "price_sensitive",
+    })
+    router = Router(use_cache=False)
+
+    result = asyncio.run(router.route("Есть ли скидки?", [], "kw_user_2"))
+
+    assert result["status"] == "success"
+    assert result["documents"] == ["pricing.md"]
+    assert router.get_stats()["keyword_index"]["unknown_dropped"] == 1
@@ -0,0 +1,119 @@
+"""Общий автомат ключевых слов: совпадение с циклами any() и поведение детекторов."""
+
+import random
+
+import pytest
+
+from completed_actions_handler import CompletedActionsHandler
+from keyword_matcher import KeywordMatcher, get_keyword_matcher
+from simple_cta_blocker import SimpleCTABlocker
+from zhvanetsky_safety import SafetyChecker
+
+import response_generator  # noqa: F401  регистрирует словари генератора
+import router  # noqa: F401  регистрирует словари роутера
+
+TEXTS = [
+    "Мы уже оплатили курс, спасибо!",
+    "не надо мне ничего предлагать, отстаньте",
+    "я подумаю и потом решу",
+    "Это развод, цена 30 тысяч — с ума сошли?",
+    "Привет! Давайте попробуем пробное занятие",
+    "Кто будет забирать ребёнка после занятий?",
+    "Всё отлично, спасибо, очень интересно",
+    "здравствуйте, добрый день",
+    "",
+]
+
+
+def test_matches_any_loops_on_random_texts():
+    rnd = random.Random(7)
+    alphabet = "абвгд "
+    lexicons = {
+        f"lex{i}": [''.join(rnd.choice(alphabet) for _ in range(rnd.randint(1, 4))) for _ in range(6)]
+        for i in range(25)
+    }
+    matcher = KeywordMatcher()
+    for name, words in lexicons.items():
+        matcher.register(name, words)
+
+    for _ in range(2000):
+        text = ''.join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 40)))
+        hits = matcher.scan(text)
+        for name, words in lexicons.items():
+            assert hits.any(name) == any(word in text for word in words)
+            assert hits.starts_with(name) == any(text.startswith(word) for word in words)
+            assert hits.matched(name) == {word for word in words if word in text}
+
+
+def test_registered_lexicons_match_any_loops():
+    CompletedActionsHandler(), SimpleCTABlocker(), SafetyChecker()
+    matcher = get_keyword_matcher()
+    names = [name for name in matcher._lexicons if name.split(".")[0] in ("cta", "actions", "safety", "generator", "router")]
+    assert "cta.completion.paid" in names and "router.money" in names
+
+    for text in TEXTS:
+        lowered = text.lower()
+        hits = matcher.scan(lowered)
+        for name in names:
+            assert hits.any(name) == any(word in lowered for word in matcher.patterns(name)), (name, text)
+
+
+def test_reregistering_same_lexicon_does_not_rebuild():
+    matcher = KeywordMatcher()
+    matcher.register("greeting", ["привет", "здравствуйте"])
+    matcher.scan("привет")
+    matcher.register("greeting", ["привет", "здравствуйте"])
+    assert matcher.scan("привет всем").starts_with("greeting")
+    assert matcher.get_stats()["builds"] == 1
+
+    matcher.register("greeting", ["добрый день"])
+    assert not matcher.scan("привет").any("greeting")
+    assert matcher.get_stats()["builds"] == 2
+
+
+def test_repeated_scan_is_served_from_cache():
+    matcher = KeywordMatcher(cache_size=2)
+    matcher.register("thanks", ["спасибо"])
+    for text in ("спасибо", "спасибо", "ещё раз спасибо", "пока", "спасибо"):
+        matcher.scan(text)
+
+    stats = matcher.get_stats()
+    assert stats["scans"] == 5
+    assert stats["cache_hits"] == 1  # "спасибо" вытеснен из кэша размером 2 к последнему вызову
+
+
+@pytest.mark.parametrize("message, action", [
+    ("Мы уже оплатили курс", "paid"),
+    ("Я заплатил вчера", "paid"),
+    ("Записала дочь на курс", "registered"),
+    ("Мы были на пробном", "trial_completed"),
+    ("Сколько стоит?", None),
+])
+def test_cta_blocker_completed_actions(message, action):
+    expected = next(
+        (kind for kind, triggers in SimpleCTABlocker().COMPLETION_TRIGGERS.items()
+         if any(trigger in message.lower() for trigger in triggers)),
+        None,
+    )
+    assert SimpleCTABlocker().check_completed_action("kw_user", message) == expected == action
+
+
+def test_detectors_keep_behaviour():
+    blocker = SimpleCTABlocker()
+    assert blocker.check_refusal("kw_user", "Не надо, спасибо", 3) == "hard"
+    assert blocker.check_refusal("kw_user", "Я подумаю", 4) == "soft"
+    assert blocker.check_refusal("kw_user", "Расскажите подробнее", 5) is None
+
+    handler = CompletedActionsHandler()
+    offtopic = {"status": "offtopic"}
+    assert handler.detect_completed_action("Записались на курс", offtopic, [])["status"] == "success"
+    assert handler.detect_completed_action("Оплатил бензин", offtopic, [])["status"] == "offtopic"
+    assert handler.detect_completed_action("Как оплатить курс?", offtopic, [])["status"] == "offtopic"
+
+    checker = SafetyChecker()
+    history = [{"role": "user", "content": "Спасибо, отлично"}, {"role": "user", "content": "Очень интересно"}]
+    assert checker.analyze_dialogue_mood(history) == "positive"
+    assert checker.analyze_dialogue_mood(history + [{"role": "user", "content": "Это кошмар"}]) == "negative"
+
+    assert router.Router._previous_signal([{"role": "user", "content": "Развод на деньги"}]) == "price_sensitive"
+    assert router.Router._previous_signal([{"role": "user", "content": "Развод родителей"}]) is None
@@ -0,0 +1,70 @@
+"""Router and generator run end-to-end against the bundled OpenRouter mock."""
+
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+import http_pool
+from mock_openrouter import MockSettings, create_app
+from openrouter_client import OpenRouterClient
+from openrouter_client_stream import chat_stream
+
+
+@pytest.fixture
+def mock_app(monkeypatch):
+    settings = MockSettings(scenario={
+        "router": [{
+            "pattern": "пробн",
+            "response": {
+                "status": "success",
+                "detected_language": "ru",
+                "documents": ["conditions.md"],
+                "decomposed_questions": ["Как записаться на пробное занятие?"],
+                "user_signal": "ready_to_buy",
+            },
+        }],
+    })
+    app = create_app(settings)
+    monkeypatch.setattr(http_pool, "_http_pool", http_pool.HttpPool(transport=httpx.ASGITransport(app=app)))
+    return app
+
+
+def test_router_routes_through_mock(mock_app):
+    from router import Router
+
+    router = Router(use_cache=True)
+
+    async def scenario():
+        scripted = await router.route("Хочу записать сына на пробное занятие", [], "mock_user_1")
+        heuristic = await router.route("Сколько стоит курс?", [], "mock_user_2")
+        return scripted, heuristic
+
+    scripted, heuristic = asyncio.run(scenario())
+
+    assert scripted["status"] == "success"
+    assert scripted["documents"] == ["conditions.md"]
+    assert scripted["user_signal"] == "ready_to_buy"
+    assert heuristic["status"] == "success"
+    assert "pricing.md" in heuristic["documents"]
+    assert mock_app.state.mock.stats["router"] == 2
+
+
+def test_generator_prose_and_sse_streaming(mock_app):
+    client = OpenRouterClient("test-key", stage="generator")
+    messages = [{"role": "user", "content": "Аспекты для учёта:\n- Как проходят занятия?"}]
+
+    async def scenario():
+        full = await client.chat(messages)
+        streamed = [chunk async for chunk in chat_stream(client, messages)]
+        return full, streamed
+
+    full, streamed = asyncio.run(scenario())
+
+    assert "Ukido" in full
+    assert len(streamed) > 1
+    assert "".join(streamed) == full
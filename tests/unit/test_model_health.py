@@ -0,0 +1,54 @@
+"""Circuit breaker states and latency-ranked model selection."""
+
+import time
+
+from model_health import CircuitBreaker, ModelHealthRegistry
+import model_health
+
+
+def test_breaker_opens_after_consecutive_failures_and_recovers_via_probe():
+    breaker = CircuitBreaker(failure_threshold=3, open_seconds=0.05, min_calls=100)
+
+    for _ in range(3):
+        assert breaker.allow_request()
+        breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request()          # единственная проба half-open
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_opens_on_slow_call_ratio():
+    breaker = CircuitBreaker(failure_threshold=100, slow_call_ratio=0.5, min_calls=4, window=4)
+
+    breaker.record_success(slow=False)
+    breaker.record_success(slow=True)
+    breaker.record_success(slow=False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_success(slow=True)
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_candidates_skip_open_breakers_and_prefer_clearly_faster_model(monkeypatch):
+    monkeypatch.setitem(model_health.Config.MODEL_FALLBACKS, "router", ["fast", "spare"])
+    monkeypatch.setattr(model_health.Config, "MODEL_LATENCY_SWITCH_RATIO", 1.5)
+    registry = ModelHealthRegistry()
+
+    # Без замеров сохраняется порядок из конфигурации
+    assert registry.candidates("router", "primary") == ["primary", "fast", "spare"]
+
+    registry.record_success("router", "primary", 3.0)
+    registry.record_success("router", "fast", 1.0)
+    registry.record_success("router", "spare", 2.5)
+    assert registry.candidates("router", "primary") == ["fast", "primary", "spare"]
+
+    for _ in range(registry.breaker("fast").failure_threshold):
+        registry.record_failure("router", "fast")
+    assert registry.candidates("router", "primary") == ["primary", "spare"]
@@ -0,0 +1,246 @@
+"""OpenRouterClient behaviour against a mocked transport."""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from http_pool import HttpPool
+from openrouter_client import OpenRouterClient
+from singleflight import SingleFlight
+import llm_resilience
+import model_health
+import singleflight
+import usage_accounting
+
+
+def answer(content):
+    return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+
+def make_client(handler, **kwargs):
+    pool = HttpPool(transport=httpx.MockTransport(handler))
+    return OpenRouterClient("test-key", http_pool=pool, **kwargs)
+
+
+def test_concurrent_identical_calls_are_coalesced(monkeypatch):
+    flight = SingleFlight()
+    monkeypatch.setattr(singleflight, "_singleflight", flight)
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return answer("shared")
+
+    client = make_client(handler)
+    messages = [{"role": "user", "content": "Привет"}]
+
+    async def scenario():
+        return await asyncio.gather(*(client.chat(messages, coalesce=True) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["shared"] * 5
+    assert len(calls) == 1
+    assert flight.stats["collapsed"] == 4
+    assert flight.stats["executed"] == 1
+
+
+def test_calls_with_different_parameters_are_not_coalesced(monkeypatch):
+    monkeypatch.setattr(singleflight, "_singleflight", SingleFlight())
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.01)
+        return answer("x")
+
+    client = make_client(handler)
+    messages = [{"role": "user", "content": "Привет"}]
+
+    async def scenario():
+        await asyncio.gather(
+            client.chat(messages, coalesce=True, temperature=0.1),
+            client.chat(messages, coalesce=True, temperature=0.9),
+            client.chat(messages),
+            client.chat(messages),
+        )
+
+    asyncio.run(scenario())
+    assert len(calls) == 4
+
+
+@pytest.fixture(autouse=True)
+def health(monkeypatch):
+    registry = model_health.ModelHealthRegistry()
+    monkeypatch.setattr(model_health, "_registry", registry)
+    return registry
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    fresh = llm_resilience.ResilienceExecutor()
+    monkeypatch.setattr(llm_resilience, "_executor", fresh)
+    monkeypatch.setattr(llm_resilience.Config, "LLM_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(llm_resilience.Config, "LLM_MAX_RETRIES", 2)
+    return fresh
+
+
+def test_retries_transient_errors_then_succeeds(executor):
+    statuses = iter([503, 429, 200])
+
+    def handler(request):
+        status = next(statuses)
+        if status != 200:
+            return httpx.Response(status, text="busy")
+        return answer("recovered")
+
+    client = make_client(handler, stage="router")
+
+    assert asyncio.run(client.chat([{"role": "user", "content": "q"}])) == "recovered"
+    assert executor.stats["router"]["retries"] == 2
+
+
+def test_non_retryable_error_and_exhausted_retries_return_empty_string(executor):
+    calls = []
+
+    def bad_request(request):
+        calls.append(request)
+        return httpx.Response(400, text="bad")
+
+    assert asyncio.run(make_client(bad_request).chat([{"role": "user", "content": "q"}])) == ""
+    assert len(calls) == 1
+
+    def always_timeout(request):
+        raise httpx.ReadTimeout("slow", request=request)
+
+    # Раньше здесь возвращалась строка "Превышено время ожидания ответа"
+    assert asyncio.run(make_client(always_timeout).chat([{"role": "user", "content": "q"}])) == ""
+
+
+def test_slow_request_is_hedged_after_observed_p95(executor, monkeypatch):
+    monkeypatch.setattr(llm_resilience.Config, "LLM_HEDGE_MIN_DELAY", 0.01)
+    for _ in range(executor.tracker.min_samples):
+        executor.tracker.record("router", "test/model", 0.02)
+
+    delays = iter([1.0, 0.0])
+
+    async def handler(request):
+        await asyncio.sleep(next(delays))
+        return answer("fast copy")
+
+    client = make_client(handler, model="test/model", stage="router")
+
+    assert asyncio.run(client.chat([{"role": "user", "content": "q"}])) == "fast copy"
+    assert executor.stats["router"]["hedges"] == 1
+    assert executor.stats["router"]["hedge_wins"] == 1
+
+
+def test_cancelled_call_cancels_in_flight_attempts(executor, monkeypatch):
+    monkeypatch.setattr(llm_resilience.Config, "LLM_HEDGE_MIN_DELAY", 0.01)
+    for _ in range(executor.tracker.min_samples):
+        executor.tracker.record("router", "test/model", 0.5)  # p95 известен: ждём его до хеджа
+    outcome = {"finished": 0, "cancelled": 0}
+
+    async def attempt(timeout):
+        try:
+            await asyncio.sleep(1.0)
+        except asyncio.CancelledError:
+            outcome["cancelled"] += 1
+            raise
+        outcome["finished"] += 1
+        return "late"
+
+    async def scenario():
+        call = asyncio.ensure_future(executor.run(attempt, stage="router", model="test/model", budget=5.0))
+        await asyncio.sleep(0.1)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(1.2)  # Незавершённый запрос успел бы закончиться
+
+    asyncio.run(scenario())
+
+    assert outcome == {"finished": 0, "cancelled": 1}
+
+
+def test_failing_primary_falls_back_to_next_model_in_stage_chain(executor, health, monkeypatch):
+    monkeypatch.setitem(model_health.Config.MODEL_FALLBACKS, "router", ["test/fallback"])
+    monkeypatch.setattr(llm_resilience.Config, "LLM_MAX_RETRIES", 0)
+    models = []
+
+    def handler(request):
+        model = json.loads(request.content)["model"]
+        models.append(model)
+        if model == "test/primary":
+            return httpx.Response(503, text="down")
+        return answer("from fallback")
+
+    client = make_client(handler, model="test/primary", stage="router")
+
+    assert asyncio.run(client.chat([{"role": "user", "content": "q"}])) == "from fallback"
+    assert models == ["test/primary", "test/fallback"]
+    assert health.breaker("test/primary").consecutive_failures == 1
+    assert health.stats["fallback_calls"] == 1
+
+
+@pytest.mark.parametrize("body", [
+    {"error": {"message": "Provider returned error", "code": 502}},
+    {"id": "gen-1"},
+    {"choices": [{"message": {"content": "  "}}]},
+    "<html>Bad gateway</html>",
+])
+def test_ok_status_without_answer_counts_as_model_failure(executor, health, monkeypatch, body):
+    monkeypatch.setitem(model_health.Config.MODEL_FALLBACKS, "router", ["test/fallback"])
+    monkeypatch.setattr(llm_resilience.Config, "LLM_MAX_RETRIES", 1)
+    models = []
+
+    def handler(request):
+        model = json.loads(request.content)["model"]
+        models.append(model)
+        if model == "test/fallback":
+            return answer("from fallback")
+        if isinstance(body, str):
+            return httpx.Response(200, text=body)
+        return httpx.Response(200, json=body)
+
+    client = make_client(handler, model="test/primary", stage="router")
+
+    assert asyncio.run(client.chat([{"role": "user", "content": "q"}])) == "from fallback"
+    assert models == ["test/primary", "test/primary", "test/fallback"]  # повтор, затем фолбэк
+    assert health.breaker("test/primary").consecutive_failures == 1
+
+
+def test_chat_result_captures_usage_and_records_it_per_stage_and_user(monkeypatch):
+    ledger = usage_accounting.UsageLedger()
+    monkeypatch.setattr(usage_accounting, "_ledger", ledger)
+
+    def handler(request):
+        assert json.loads(request.content)["usage"] == {"include": True}
+        return httpx.Response(200, json={
+            "model": "anthropic/claude-3.5-haiku",
+            "choices": [{"message": {"content": "ответ"}}],
+            "usage": {
+                "prompt_tokens": 1200,
+                "completion_tokens": 300,
+                "prompt_tokens_details": {"cached_tokens": 1000},
+            },
+        })
+
+    client = make_client(handler, model="anthropic/claude-3.5-haiku", stage="generator")
+
+    async def scenario():
+        with usage_accounting.usage_scope("parent_42") as calls:
+            result = await client.chat_result([{"role": "user", "content": "q"}])
+        return result, calls
+
+    result, calls = asyncio.run(scenario())
+
+    assert result.text == "ответ"
+    assert (result.prompt_tokens, result.completion_tokens, result.cached_tokens) == (1200, 300, 1000)
+    assert result.cost == pytest.approx((200 * 0.80 + 1000 * 0.08 + 300 * 4.00) / 1_000_000)
+    assert calls == [result]
+
+    stats = ledger.get_stats()
+    assert stats["by_stage"]["generator"]["prompt_tokens"] == 1200
+    assert stats["top_users"]["parent_42"]["completion_tokens"] == 300
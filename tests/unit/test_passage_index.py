@@ -0,0 +1,99 @@
+"""Фрагменты документов для генератора: нарезка по заголовкам, бюджет токенов и метки в промпте."""
+
+import asyncio
+
+import pytest
+
+from document_store import get_document_store
+from passage_index import PassageIndex, split_passages
+
+DOC = """# СТОИМОСТЬ И ОПЛАТА
+
+## ЦЕНЫ
+
+### Юный Оратор
+- Месяц: 6,000 грн
+
+## СРАВНЕНИЕ
+| Курс | Возраст |
+|------|---------|
+| Юный Оратор | 7-10 |
+
+## ВОЗВРАТ
+- 7 дней: 100%
+"""
+
+QUESTIONS = ["Сколько стоит Юный Оратор?", "Какой опыт у преподавателей?"]
+DOCS = ["pricing.md", "conditions.md", "teachers_team.md", "mission_values_history.md"]
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    store = get_document_store()
+    if not store.loaded:
+        store.load_all()
+    return store.get_many(DOCS)
+
+
+def test_split_keeps_deeper_headings_and_tables_inside_sections():
+    passages = split_passages("pricing.md", DOC)
+
+    assert [passage.id for passage in passages] == ["pricing.md#1", "pricing.md#2", "pricing.md#3"]
+    assert passages[0].heading == "СТОИМОСТЬ И ОПЛАТА > ЦЕНЫ"
+    assert passages[0].text.startswith("# СТОИМОСТЬ И ОПЛАТА")  # заголовок без текста не теряется
+    assert "### Юный Оратор\n- Месяц: 6,000 грн" in passages[0].text
+    assert [passage.has_table for passage in passages] == [False, True, False]
+    assert "\n\n".join(passage.text for passage in passages) == DOC.strip()
+
+
+def test_selection_fits_budget_and_keeps_whole_documents(corpus):
+    index = PassageIndex(token_budget=3000, whole_documents=["pricing.md"])
+    selection = index.select(corpus, QUESTIONS)
+
+    assert selection.mode == "passages"
+    assert selection.tokens < selection.full_tokens / 2
+    assert selection.doc_texts["pricing.md"].count("[pricing.md#") == len(index.passages("pricing.md", corpus["pricing.md"]))
+    assert any(passage_id.startswith("teachers_team.md#") for passage_id in selection.passage_ids)
+    assert list(selection.doc_texts) == [name for name in DOCS if name in selection.doc_texts]
+    for passage_id in selection.passage_ids:
+        document = passage_id.split("#")[0]
+        assert f"[{passage_id}" in selection.doc_texts[document]
+
+
+def test_full_documents_when_small_or_unmatched(corpus):
+    index = PassageIndex(token_budget=3000)
+    small = {"pricing.md": corpus["pricing.md"]}
+    assert index.select(small, QUESTIONS).doc_texts == small
+    assert index.select(corpus, ["zzz qqq"]).mode == "full_no_match"
+    assert PassageIndex(enabled=False).select(corpus, QUESTIONS).doc_texts == corpus
+
+    stats = index.get_stats()
+    assert stats["full_small"] == 1 and stats["full_no_match"] == 1
+
+
+def test_generator_prompt_tags_used_passages(corpus, monkeypatch):
+    import response_generator
+    from response_generator import ResponseGenerator
+
+    monkeypatch.setattr(response_generator.Config, "PASSAGE_RETRIEVAL", True)  # По умолчанию выключено
+    generator = ResponseGenerator()
+    captured = {}
+
+    async def fake_chat(messages, *args, **kwargs):
+        captured["messages"] = messages
+        return "Юный Оратор стоит 6000 грн в месяц."
+
+    monkeypatch.setattr(generator.client, "chat", fake_chat)
+    router_result = {
+        "status": "success",
+        "documents": DOCS,
+        "decomposed_questions": QUESTIONS,
+        "user_signal": "exploring_only",
+        "cta_blocked": True,
+    }
+    asyncio.run(generator.generate(router_result, [], QUESTIONS[0]))
+
+    system = captured["messages"][0]["content"]
+    assert "Использованные фрагменты: pricing.md#1" in system
+    assert "[teachers_team.md#" in system
+    assert len(system) < sum(len(text) for text in corpus.values())
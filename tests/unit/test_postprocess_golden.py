@@ -0,0 +1,58 @@
+"""Собранная цепочка постобработки: побайтно как эталоны, соседние словари замен — одним проходом."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+from bench_postprocess import load_golden, main_bench, stream_text
+from postprocess import ArtifactPass, DedupPass, LiteralPass, PostProcessor, cleanup_passes
+
+
+def test_golden_responses_are_byte_identical():
+    processor = PostProcessor(cleanup_passes())
+    golden = load_golden()
+
+    assert len(golden) >= 10
+    for raw, expected in golden:
+        assert processor.process(raw) == expected
+        assert stream_text(processor, raw) == expected
+
+
+def test_adjacent_word_dictionaries_are_merged():
+    processor = PostProcessor(cleanup_passes())
+
+    assert "english_words+ukrainian_words" in processor.get_stats()["compiled"]
+    assert len(processor.compiled) == len(processor.passes) - 1
+    assert processor.process("Наші вчителі дають feedback. Workshop для батьків!") == (
+        "Наші учителя дають обратную связь. Мастер-класс для родителей."
+    )
+
+
+def test_merged_literal_pass_keeps_replace_order():
+    first, second = LiteralPass("first", {"ab": "x"}), LiteralPass("second", {"xc": "y"})
+    merged = first.merge(second)
+
+    assert merged.apply("abc ab xc") == second.apply(first.apply("abc ab xc")) == "y x y"
+    assert not merged.single_pass  # Замена образует чужой ключ — только по очереди
+    assert first.merge(LiteralPass("again", {"ab": "z"})) is None
+
+    domain = cleanup_passes()[-1]
+    assert domain.single_pass  # Ключи домена независимы — одна альтернатива
+    assert domain.apply("ukido.ua/trial, ukido.ua. ukido.ua") == "ukido.com.ua/trial, ukido.com.ua. ukido.ua"
+
+
+def test_precompiled_regex_steps_keep_edge_cases():
+    assert ArtifactPass().apply("Это 5-минутное00 дело, Слово00 и 00 просто. Время 17:00, 7000 грн") == (
+        "Это 5-минутное дело, Слово и просто. Время 17:00, 7000 грн"
+    )
+    dedup = DedupPass()
+    assert dedup.protect("т.д.т.п. и т.п.") == "т_дт.п. и т_п"  # \b перед вторым "т" пропадает, как раньше
+    assert dedup.key("  Юный \n Оратор\tстоит ") == "юный оратор стоит"
+
+
+def test_benchmark_reports_every_stage(capsys):
+    results = main_bench(rounds=1)
+
+    assert set(results) == {*(text_pass.name for text_pass in PostProcessor(cleanup_passes()).compiled), "process", "stream"}
+    assert "совпадают побайтно" in capsys.readouterr().out
@@ -0,0 +1,70 @@
+"""Скомпилированные сегменты промпта роутера и их пересборка по summaries.json."""
+
+import json
+import os
+
+import pytest
+
+import router as router_module
+from prompt_segments import PromptSegments, estimate_tokens
+
+
+def test_compiled_prompt_matches_section_sources():
+    router = router_module.Router(use_cache=True)
+
+    expected = (
+        router._get_role_section()
+        + router._get_summaries_section()
+        + router._get_decomposition_section()
+        + router._get_classification_section()
+        + router._get_response_format_section()
+    )
+
+    assert router._build_static_prompt() == expected
+    # Склейка хранится готовой: повторный вызов отдаёт тот же объект
+    assert router._build_static_prompt() is router._build_static_prompt()
+
+    prompts = router._build_router_prompts("Сколько стоит?", [])
+    assert prompts["system"] == router._get_role_section() + router._get_response_format_section()
+    assert prompts["user"].startswith(router._get_summaries_section())
+    assert prompts["user"].endswith(router._get_classification_section())
+
+
+def test_segments_report_sizes():
+    segments = PromptSegments([])
+    segments.compile({"a": "abcd", "b": "привет"})
+
+    stats = segments.get_stats()
+
+    assert stats["segments"]["a"] == {"chars": 4, "estimated_tokens": 1}
+    assert stats["segments"]["b"] == {"chars": 6, "estimated_tokens": estimate_tokens("привет")}
+    assert stats["total_chars"] == 10
+    assert segments.join("a", "b") == "abcdпривет"
+
+
+@pytest.fixture
+def summaries_file(tmp_path, monkeypatch):
+    path = tmp_path / "summaries.json"
+    path.write_text(json.dumps({"pricing.md": "Цены"}, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(router_module, "SUMMARIES_PATH", path)
+    monkeypatch.setattr(router_module.Config, "PROMPT_RELOAD_CHECK_SECONDS", 0.0)
+    return path
+
+
+def test_summaries_change_recompiles_prompt_and_version(summaries_file):
+    router = router_module.Router(use_cache=True)
+    version = router.summaries_version
+    compilations = router._segments.compilations
+
+    router._refresh_prompt_segments()
+    assert router._segments.compilations == compilations  # файл не менялся — без пересборки
+
+    summaries_file.write_text(json.dumps({"pricing.md": "Новые цены"}, ensure_ascii=False), encoding="utf-8")
+    stat = summaries_file.stat()
+    os.utime(summaries_file, (stat.st_atime, stat.st_mtime + 10))
+    router._refresh_prompt_segments()
+
+    assert router._segments.compilations == compilations + 1
+    assert router.summaries == {"pricing.md": "Новые цены"}
+    assert "Новые цены" in router._build_static_prompt()
+    assert router.summaries_version != version
@@ -0,0 +1,139 @@
+"""Кеш решений роутера: ключ, LRU+TTL и пользовательские поля при попадании."""
+
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+import http_pool
+import model_health
+import route_cache
+from mock_openrouter import MockSettings, create_app
+from route_cache import RouteCache, history_fingerprint
+
+
+def test_key_folds_case_punctuation_and_spacing():
+    fingerprint = history_fingerprint([], 4)
+
+    assert RouteCache.make_key("Сколько стоит?", fingerprint, "v1") == RouteCache.make_key("  сколько   СТОИТ!! ", fingerprint, "v1")
+    assert RouteCache.make_key("Сколько стоит?", fingerprint, "v1") != RouteCache.make_key("Сколько стоит?", fingerprint, "v2")
+    assert RouteCache.make_key("😊😊", fingerprint, "v1") is None
+
+
+def test_fingerprint_covers_only_the_window():
+    older = [{"role": "user", "content": "Про курсы"}, {"role": "assistant", "content": "Есть три курса."}]
+    recent = [{"role": "user", "content": "А цена?"}, {"role": "assistant", "content": "От 6000 грн."}]
+
+    assert history_fingerprint(older + recent, 2) == history_fingerprint(recent, 2)
+    assert history_fingerprint(older + recent, 4) != history_fingerprint(recent, 4)
+    assert history_fingerprint(recent, 2) != history_fingerprint(recent, 2, extra="price_sensitive")
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(route_cache.time, "monotonic", lambda: now[0])
+    cache = RouteCache(max_size=2, ttl_seconds=60)
+
+    cache.put("a", {"status": "success"}, cost_seconds=1.0)
+    cache.put("b", {"status": "offtopic"})
+    assert cache.get("a") == {"status": "success"}
+    cache.put("c", {"status": "success"})
+
+    assert cache.get("b") is None  # вытеснен как давно не использованный
+    assert cache.get("a") is not None
+    now[0] += 61
+    assert cache.get("a") is None
+
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1
+    assert stats["expirations"] == 1
+    assert stats["hits"] == 2
+    assert stats["latency_saved_seconds"] == 2.0
+
+
+def test_cached_decision_is_a_copy():
+    cache = RouteCache()
+    cache.put("k", {"documents": ["pricing.md"]})
+
+    cache.get("k")["documents"].append("faq.md")
+
+    assert cache.get("k") == {"documents": ["pricing.md"]}
+
+
+@pytest.fixture
+def mock_app(monkeypatch):
+    settings = MockSettings(scenario={
+        "router": [{
+            "pattern": "сколько стоит",
+            "response": {
+                "status": "success",
+                "detected_language": "ru",
+                "documents": ["pricing.md"],
+                "decomposed_questions": ["Сколько стоит обучение?"],
+                "user_signal": "price_sensitive",
+                "social_context": "greeting",
+            },
+        }],
+    })
+    app = create_app(settings)
+    monkeypatch.setattr(http_pool, "_http_pool", http_pool.HttpPool(transport=httpx.ASGITransport(app=app)))
+    monkeypatch.setattr(model_health, "_registry", model_health.ModelHealthRegistry())
+    return app
+
+
+def test_router_reuses_decision_and_reapplies_user_fields(mock_app):
+    from router import Router
+
+    router = Router(use_cache=True)
+
+    async def scenario():
+        first = await router.route("Добрый день! Сколько стоит?", [], "cache_user_1")
+        again = await router.route("добрый день, сколько стоит", [], "cache_user_1")
+        other = await router.route("Добрый день. Сколько стоит", [], "cache_user_2")
+        return first, again, other
+
+    first, again, other = asyncio.run(scenario())
+
+    assert mock_app.state.mock.stats["router"] == 1
+    assert first["documents"] == again["documents"] == other["documents"] == ["pricing.md"]
+    assert again["original_message"] == "добрый день, сколько стоит"
+    # Учёт приветствий — свой у каждого пользователя, даже при попадании в кеш
+    assert first["social_context"] == "greeting"
+    assert again["social_context"] == "repeated_greeting"
+    assert other["social_context"] == "greeting"
+
+    stats = router.get_stats()["cache"]
+    assert stats["hits"] == 2
+    assert stats["hit_ratio"] == round(2 / 3, 3)
+
+
+def test_router_does_not_cache_fallbacks(mock_app):
+    from router import Router
+
+    router = Router(use_cache=True)
+    mock_app.state.mock.settings.error_rate = 1.0
+
+    asyncio.run(router.route("Сколько стоит курс?", [], "cache_user_3"))
+
+    assert router.get_stats()["cache"]["stores"] == 0
+
+
+def test_router_key_covers_dialogue_memory(mock_app):
+    from router import Router
+
+    router = Router(use_cache=True)
+    recent = [{"role": "user", "content": "Какие курсы есть?"}, {"role": "assistant", "content": "Три курса."}]
+
+    async def scenario():
+        await router.route("Сколько стоит?", recent, "memory_user_1", memory="Ребёнку 8 лет, интересует Юный Оратор")
+        await router.route("Сколько стоит?", recent, "memory_user_2", memory="Ребёнку 13 лет, волнует цена")
+        await router.route("Сколько стоит?", recent, "memory_user_3", memory="Ребёнку 8 лет, интересует Юный Оратор")
+
+    asyncio.run(scenario())
+
+    assert mock_app.state.mock.stats["router"] == 2
+    assert router.get_stats()["cache"]["hits"] == 1
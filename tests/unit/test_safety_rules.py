@@ -0,0 +1,106 @@
+"""Движок правил безопасности юмора: те же решения, что отдельные regex-проходы, кэш вердиктов и настроение."""
+
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+from benchmark_router import load_dialogues
+from zhvanetsky_safety import SafetyChecker, SafetyRuleEngine, TopicClassifier
+
+EXTRA = [
+    "Мой ребёнок заболел гриппом",
+    "После развода всё сложно",
+    "Война это ужасно",
+    "У нас большие долги по кредитам, нет денег",
+    "Вчера была авария на дороге",
+    "Какая погода будет завтра?",
+    "Люблю футбол и пиццу!",
+    "Новый iPhone вышел, а в метро пробки",
+    "Бог с ним, с президентом",
+    "Сосед сошел с ума от ChatGPT",
+    "Это обман и развод для лохов, кошмар",
+    "Спасибо, отлично, всё понравилось",
+    "",
+]
+
+
+def _legacy_is_safe(message: str) -> bool:
+    return not any(re.search(pattern, message.lower(), re.IGNORECASE) for pattern in SafetyChecker.BLACKLIST_PATTERNS)
+
+
+def _legacy_sensitive(message: str) -> bool:
+    return any(re.search(pattern, message.lower(), re.IGNORECASE) for pattern in SafetyChecker.SENSITIVE_TOPICS)
+
+
+def _legacy_topic(message: str) -> str:
+    for category, patterns in TopicClassifier.TOPIC_PATTERNS.items():
+        if any(re.search(pattern, message.lower(), re.IGNORECASE) for pattern in patterns):
+            return category
+    return "general"
+
+
+def _legacy_mood(history) -> str:
+    negative = positive = 0
+    for msg in history[-5:]:
+        if msg.get("role") == "user":
+            text = msg.get("content", "").lower()
+            negative += any(marker in text for marker in SafetyChecker.NEGATIVE_MOOD_MARKERS)
+            positive += any(marker in text for marker in SafetyChecker.POSITIVE_MOOD_MARKERS)
+    return "negative" if negative else "positive" if positive >= 2 else "neutral"
+
+
+@pytest.fixture(scope="module")
+def messages():
+    return [text for _, dialogue in load_dialogues() for text in dialogue] + EXTRA
+
+
+def test_verdicts_match_separate_regex_passes(messages):
+    engine = SafetyRuleEngine()
+    for text in messages:
+        verdict = engine.evaluate(text)
+        assert verdict.is_safe == _legacy_is_safe(text), text
+        assert bool(verdict.sensitive) == _legacy_sensitive(text), text
+        assert verdict.topic == _legacy_topic(text), text
+        assert verdict.negative_content == any(word in text.lower() for word in SafetyChecker.NEGATIVE_CONTENT_WORDS)
+
+
+def test_blacklist_categories_and_hits():
+    verdict = SafetyRuleEngine().evaluate("Ребёнок заболел, а потом была авария")
+
+    assert verdict.blacklist == ("health", "tragedy")
+    assert verdict.blacklist_hits == ("заболел", "авария")
+    assert SafetyRuleEngine().evaluate("Бог с ним").sensitive == ("religion",)
+
+
+def test_mood_matches_and_is_reused_per_user(messages):
+    engine = SafetyRuleEngine()
+    history = []
+    for index, text in enumerate(messages[:120]):
+        history.append({"role": "user", "content": text})
+        history.append({"role": "assistant", "content": "Ответ"})
+        assert engine.dialogue_mood(history, "mood_user") == _legacy_mood(history), index
+        assert engine.dialogue_mood(history, "mood_user") == _legacy_mood(history)
+
+    assert engine.stats["mood_reused"] == 120
+    assert engine.stats["cache_hits"] > 0  # реплики окна оцениваются один раз
+
+
+def test_checker_uses_engine_with_verdict_cache():
+    checker = SafetyChecker()
+    before = checker.engine.stats["cache_hits"]
+    message = "Как вам погода сегодня, не слишком жарко?"
+
+    assert checker.is_safe_topic(message)
+    assert TopicClassifier.classify(message) == "weather"
+    assert checker.engine.stats["cache_hits"] == before + 1
+
+    allowed, context = checker.should_use_humor(
+        "После развода всё сложно", "exploring_only", [], "rules_user", message_count=3
+    )
+    assert not allowed
+    assert context["reason"] == "unsafe_topic"
+    assert context["blacklist"] == ["family"]
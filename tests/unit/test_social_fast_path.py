@@ -0,0 +1,90 @@
+"""Локальный быстрый путь роутера для чистых социальных реплик."""
+
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+import http_pool
+import model_health
+from mock_openrouter import MockSettings, create_app
+from social_intents import SocialIntent, detect_pure_social
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("Привет!", SocialIntent.GREETING),
+    ("Всем привет", SocialIntent.GREETING),
+    ("Спасибо вам большое!", SocialIntent.THANKS),
+    ("До свидания", SocialIntent.FAREWELL),
+    ("Извините", SocialIntent.APOLOGY),
+    ("ок", SocialIntent.ACKNOWLEDGMENT),
+    ("👍", SocialIntent.ACKNOWLEDGMENT),
+])
+def test_pure_social_messages_are_confident(message, intent):
+    detection = detect_pure_social(message)
+
+    assert detection.intent == intent
+    assert detection.confidence >= 0.8
+
+
+@pytest.mark.parametrize("message", [
+    "Привет, сколько стоит курс?",
+    "Спасибо, запишите нас",
+    "Привет, какая сегодня погода?",
+    "Извините, я не понял",
+    "Спасибо, пока",
+    "Сколько стоит курс?",
+])
+def test_mixed_or_business_messages_go_to_gemini(message):
+    assert detect_pure_social(message).confidence < 0.8
+
+
+def test_agreement_after_assistant_question_is_not_an_acknowledgment():
+    assert detect_pure_social("Да", after_question=False).confidence >= 0.8
+    assert detect_pure_social("Да", after_question=True).confidence < 0.8
+    assert detect_pure_social("Понятно", after_question=True).confidence >= 0.8
+
+
+@pytest.fixture
+def mock_app(monkeypatch):
+    app = create_app(MockSettings())
+    monkeypatch.setattr(http_pool, "_http_pool", http_pool.HttpPool(transport=httpx.ASGITransport(app=app)))
+    monkeypatch.setattr(model_health, "_registry", model_health.ModelHealthRegistry())
+    return app
+
+
+def test_router_answers_pure_social_without_gemini(mock_app):
+    from router import Router
+
+    router = Router(use_cache=True)
+    model_health.get_model_health().record_success("router", router.client.model, 1.5)
+
+    result = asyncio.run(router.route("Спасибо большое!", [], "social_user_1"))
+
+    assert mock_app.state.mock.stats["router"] == 0
+    assert result["status"] == "offtopic"
+    assert result["social_context"] == "thanks"
+    assert result["detected_language"] == "ru"
+    stats = router.get_stats()["social_fast_path"]
+    assert stats["hits"] == 1
+    assert stats["hits_by_intent"] == {"thanks": 1}
+    assert stats["latency_saved_seconds"] == 1.5
+
+
+def test_router_sends_agreement_to_gemini_after_a_question(mock_app):
+    from router import Router
+
+    router = Router(use_cache=True)
+    history = [
+        {"role": "user", "content": "Есть пробное занятие?"},
+        {"role": "assistant", "content": "Да, первое занятие бесплатное. Записать вас?"},
+    ]
+
+    asyncio.run(router.route("Да", history, "social_user_2"))
+
+    assert mock_app.state.mock.stats["router"] == 1
+    assert router.get_stats()["social_fast_path"]["hits"] == 0
@@ -0,0 +1,153 @@
+"""Постобработка ответа проходами: поток даёт тот же текст, что и обработка целиком, но раньше."""
+
+import random
+
+import pytest
+
+from postprocess import CHUNK, GLOBAL, LINE, SENTENCE, LinkPass, PostProcessor, cleanup_passes
+
+SENTENCES = [
+    "Юный Оратор стоит 6000 грн в месяц.",
+    "Занятия проходят онлайн через Zoom два раза в неделю.",
+    "В группе до 6 детей, поэтому каждый ребёнок получает внимание!",
+    "Можно записаться на пробное занятие?",
+    "Наши вчителі працюють с детьми 7-14 лет.",
+    "Мы даём feedback после каждого занятия.",
+    "Подробнее на сайте ukido.ua/courses и в Telegram.",
+    "Курс длится 3 месяца, т.д. и т.п. всё включено.",
+    "Это 30-секундное00 упражнение помогает.",
+    "Стоимость 7000 грн, начало в 17:00.",
+    "Преподаватели  — психологи   с опытом.",
+    "Нет данных в документах о летнем лагере.",
+    "Скидка 10% при оплате за три месяца [doc: pricing.md].",
+    "Ссылка: https://ukido.com.ua/trial для записи.",
+]
+LINES = [
+    "1. **Сколько стоит курс?**",
+    "Коротко: курс подходит детям 9-12 лет.",
+    "Важно:",
+    "Если у вас есть дополнительные вопросы, пишите!",
+    "Готова помочь с выбором.",
+    "- Месяц: 6,000 грн",
+    "",
+    "   ",
+]
+ENDINGS = ["", "", " Если захотите, мы", "»", "\r\n"]
+# Обрывки на стыке проходов: "00" рядом с границей, т.д./т.п. перед переводом строки и табуляцией
+FRAGMENTS = ["00", "т.д.", "т.п.", "Курс ок.", "Да", "Да.", " ", "  ", "\t", "\n", "\r\n", "!", "7", "а"]
+
+ANSWER = (
+    "1. **Сколько стоит курс?**\n"
+    "Юный Оратор стоит 6000 грн в месяц [doc: pricing.md]. Занятия проходят онлайн!\n\n"
+    "Коротко: в группе до 6 детей. Юный Оратор стоит 6000 грн в месяц.\n"
+    "Если у вас есть вопросы, пишите на ukido.ua/contacts"
+)
+
+
+def _answer(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(1, 8)):
+        if rng.random() < 0.3:
+            parts.append(rng.choice(LINES) + "\n")
+        else:
+            parts.append(" ".join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 4))) + rng.choice([" ", "\n", "\n\n"]))
+    return "".join(parts) + rng.choice(ENDINGS)
+
+
+def _fragments(rng: random.Random) -> str:
+    return "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 20)))
+
+
+def _pieces(rng: random.Random, text: str):
+    position = 0
+    while position < len(text):
+        size = rng.choice([1, 2, 3, 5, 8, 13, 40])
+        yield text[position:position + size]
+        position += size
+
+
+def test_batch_keeps_behaviour_of_cleanup_chain():
+    processor = PostProcessor(cleanup_passes())
+
+    assert processor.process(ANSWER) == (
+        "Юный Оратор стоит 6000 грн в месяц . Занятия проходят онлайн. в группе до 6 детей. "
+        "Юный Оратор стоит 6000 грн в месяц."
+    )
+    assert processor.process("Workshop по выходным. Пишите на ukido.ua, мы ответим") == (
+        "Мастер-класс по выходным."
+    )
+    assert processor.process("Это 30-секундное00 упражнение. Сайт ukido.ua/trial.") == (
+        "Это 30-секундное упражнение. Сайт ukido.com.ua/trial."
+    )
+    assert processor.process("Юный Оратор стоит 6000 грн в месяц. Юный оратор  стоит 6000 грн в месяц!") == (
+        "Юный Оратор стоит 6000 грн в месяц."
+    )
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_stream_matches_batch_for_any_chunking(seed):
+    processor = PostProcessor(cleanup_passes())
+    links = LinkPass()
+    rng = random.Random(seed)
+    for _ in range(500):
+        text = _answer(rng) if rng.random() < 0.5 else _fragments(rng)
+        expected = links.apply(processor.process(text.strip()))
+        stream = processor.stream(hold_back=rng.choice([0, 1]), extra=[links])
+        shown = "".join(stream.feed(piece) for piece in _pieces(rng, text))
+
+        assert expected.startswith(shown), text
+        assert shown + stream.finish() == expected, text
+        assert stream.text == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Курс ок. т.д. 00 Да.", "Курс ок. т.д. Да."),
+    ("Курс ок. т.д.\nт.д. Да", "Курс ок. т.д. т.д."),
+    ("Курс ок. т.д.\nт.д. Да.", "Курс ок. т.д. т.д. Да."),
+])
+def test_stream_keeps_artifacts_and_abbreviations_of_batch(text, expected):
+    processor = PostProcessor(cleanup_passes())
+
+    assert processor.process(text) == expected
+    for size in (1, 3, len(text)):
+        stream = processor.stream()
+        shown = "".join(stream.feed(text[i:i + size]) for i in range(0, len(text), size))
+        assert shown + stream.finish() == expected
+
+
+def test_text_is_shown_before_the_answer_ends():
+    processor = PostProcessor(cleanup_passes())
+    sentences = [f"Предложение номер {number} о курсах Ukido для детей." for number in range(1, 9)]
+
+    stream = processor.stream()
+    shown = "".join(stream.feed(word + " ") for sentence in sentences for word in sentence.split(" "))
+    tail = stream.finish()
+    assert shown.startswith("Предложение номер 1 о курсах Ukido для детей. Предложение номер 2")
+    assert "Предложение номер 7" in shown and "номер 8" not in shown  # Держится только последнее предложение
+    assert tail.strip() == sentences[-1]
+    assert shown + tail == processor.process(" ".join(sentences))
+
+    stream = processor.stream()
+    shown = "".join(stream.feed(word + " ") for sentence in sentences for word in sentence.split(" "))
+    shown += stream.feed("А это обрыв")
+    assert "номер 8" in shown
+    assert stream.finish() == ""  # Оборванное предложение не показывается
+    assert shown == processor.process(" ".join(sentences) + " А это обрыв")
+
+
+def test_removed_lines_never_reach_the_stream():
+    processor = PostProcessor(cleanup_passes())
+    stream = processor.stream()
+    shown = "".join(stream.feed(char) for char in ANSWER)
+
+    assert "[doc:" not in shown and "Коротко" not in shown and "**" not in shown
+    assert "Если у вас есть" not in shown + stream.finish()
+
+
+def test_every_pass_declares_scope():
+    passes = cleanup_passes()
+    scopes = {text_pass.name: text_pass.scope for text_pass in passes}
+
+    assert set(scopes.values()) == {CHUNK, SENTENCE, LINE, GLOBAL}
+    assert [name for name, scope in scopes.items() if scope == GLOBAL] == ["truncated_tail", "dedup", "paragraphs"]
+    assert PostProcessor(passes).get_stats()["passes"] == scopes
@@ -0,0 +1,166 @@
+"""Streaming router: incremental JSON fields, early offtopic, early dispatch of the generator."""
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+import http_pool
+import model_health
+from early_dispatch import EarlyDispatch
+from json_stream import JsonFieldStream
+from mock_openrouter import MockSettings, create_app
+
+DECISION = {
+    "status": "success",
+    "detected_language": "ru",
+    "documents": ["pricing.md", "pricing.md", "faq.md"],
+    "decomposed_questions": ["Сколько стоит \"Капитан проектов\"?", "Есть ли скидки?"],
+    "user_signal": "price_sensitive",
+    "social_context": None,
+    "score": 0.75,
+    "ok": True,
+}
+
+
+def test_fields_survive_any_chunk_boundary():
+    text = "```json\n" + json.dumps(DECISION, ensure_ascii=False, indent=2) + "\n```"
+    for size in (1, 2, 3, 7, 64):
+        parser = JsonFieldStream()
+        for start in range(0, len(text), size):
+            parser.feed(text[start:start + size])
+        assert parser.done
+        assert parser.fields == DECISION
+
+
+def test_fields_are_reported_before_the_object_closes():
+    parser = JsonFieldStream()
+
+    assert parser.feed('{"status": "offt') == {}
+    assert parser.feed('opic", "detected_language": "uk", ') == {"status": "offtopic", "detected_language": "uk"}
+    assert parser.feed('"documents": ["a.md", ') == {}
+    assert not parser.done
+    assert parser.feed('"b.md"]}') == {"documents": ["a.md", "b.md"]}
+    assert parser.done
+
+
+class FakeGenerator:
+    def __init__(self):
+        self.generated = []
+        self.loaded = []
+
+    async def prefetch_documents(self, docs):
+        self.loaded.append(list(docs))
+        return {doc: f"text of {doc}" for doc in docs}
+
+    async def generate(self, router_result, history, current_message, doc_texts=None):
+        self.generated.append((router_result, doc_texts))
+        await asyncio.sleep(0)
+        return "answer", {"intent": "success"}
+
+
+def payload_from(fields):
+    return ({key: fields.get(key) for key in ("documents", "decomposed_questions", "user_signal", "social_context")}, [], "msg")
+
+
+def test_early_dispatch_reuses_generation_when_decision_matches():
+    generator = FakeGenerator()
+
+    async def scenario():
+        dispatch = EarlyDispatch(generator, payload_from)
+        dispatch.on_partial({"status": "success", "documents": ["pricing.md"]})
+        dispatch.on_partial({"status": "success", "documents": ["pricing.md"], "decomposed_questions": ["Цена?"], "user_signal": "exploring_only"})
+        final = {"status": "success", "documents": ["pricing.md"], "decomposed_questions": ["Цена?"], "user_signal": "exploring_only"}
+        return await dispatch.take_generation(payload_from(final))
+
+    result = asyncio.run(scenario())
+
+    assert result == ("answer", {"intent": "success"})
+    assert generator.loaded == [["pricing.md"]]
+    assert len(generator.generated) == 1
+    assert generator.generated[0][1] == {"pricing.md": "text of pricing.md"}
+
+
+def test_early_dispatch_discards_generation_when_decision_changes():
+    generator = FakeGenerator()
+
+    async def scenario():
+        dispatch = EarlyDispatch(generator, payload_from)
+        dispatch.on_partial({"status": "success", "documents": ["pricing.md"], "decomposed_questions": ["Цена?"], "user_signal": "exploring_only"})
+        final = {"status": "success", "documents": ["pricing.md"], "decomposed_questions": ["Цена?"], "user_signal": "exploring_only", "social_context": "greeting"}
+        taken = await dispatch.take_generation(payload_from(final))
+        prefetched = await dispatch.documents_for(["pricing.md"])
+        return taken, prefetched
+
+    taken, prefetched = asyncio.run(scenario())
+
+    assert taken is None
+    assert prefetched == {"pricing.md": "text of pricing.md"}
+
+
+@pytest.fixture
+def mock_app(monkeypatch):
+    settings = MockSettings(scenario={
+        "router": [
+            {"pattern": "пробн", "response": {
+                "status": "success",
+                "detected_language": "ru",
+                "documents": ["conditions.md", "conditions.md"],
+                "decomposed_questions": ["Как записаться на пробное занятие?"],
+                "user_signal": "ready_to_buy",
+            }},
+            {"pattern": "погод", "response": {
+                "status": "offtopic",
+                "detected_language": "ru",
+                "decomposed_questions": [],
+                "user_signal": "exploring_only",
+                "social_context": "farewell",
+            }},
+        ],
+    })
+    app = create_app(settings)
+    monkeypatch.setattr(http_pool, "_http_pool", http_pool.HttpPool(transport=httpx.ASGITransport(app=app)))
+    monkeypatch.setattr(model_health, "_registry", model_health.ModelHealthRegistry())
+    return app
+
+
+def test_streaming_route_matches_regular_route_and_reports_partials(mock_app):
+    from router import Router
+
+    router = Router(use_cache=True)
+    partials = []
+
+    async def scenario():
+        streamed = await router.route_streaming(
+            "Хочу записать сына на пробное занятие", [], "stream_user_1", on_partial=partials.append
+        )
+        regular = await router.route("Хочу записать сына на пробное занятие", [], "stream_user_2")
+        return streamed, regular
+
+    streamed, regular = asyncio.run(scenario())
+
+    assert streamed == regular
+    assert streamed["documents"] == ["conditions.md"]
+    assert partials[0]["status"] == "success"
+    assert any(partial.get("documents") == ["conditions.md"] for partial in partials)
+    assert router.get_stats()["streaming"]["streamed"] == 1
+    assert router.get_stats()["streaming"]["stream_fallbacks"] == 0
+
+
+def test_streaming_route_returns_offtopic_before_the_rest_of_the_answer(mock_app):
+    from router import Router
+
+    router = Router(use_cache=True)
+
+    result = asyncio.run(router.route_streaming("Привет! Какая сегодня погода?", [], "stream_user_3"))
+
+    assert result["status"] == "offtopic"
+    assert result["message"]
+    # social_context идёт в конце ответа Gemini — для раннего offtopic он определяется локально
+    assert result["social_context"] == "greeting"
+    assert router.get_stats()["streaming"]["early_offtopic"] == 1
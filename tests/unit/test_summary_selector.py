@@ -0,0 +1,73 @@
+"""BM25-предотбор саммари для промпта роутера."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+import router as router_module
+import summary_selector
+from summary_selector import BM25Index, SummarySelector
+from text_tokens import stem, tokenize
+
+ROOT = Path(__file__).parent.parent.parent
+SUMMARIES = json.loads((ROOT / "data" / "summaries.json").read_text(encoding="utf-8"))
+
+
+@pytest.fixture(scope="module")
+def selector():
+    return SummarySelector(SUMMARIES, ROOT / "data" / "documents_compressed")
+
+
+def test_tokenizer_folds_word_forms():
+    assert stem("курсы") == stem("курсов") == stem("курсах") == "курс"
+    assert tokenize("Есть ли СКИДКИ для детей?") == [stem("скидки"), stem("детей")]
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Сколько стоит курс и есть ли скидки?", "pricing.md"),
+    ("Какой опыт у преподавателей?", "teachers_team.md"),
+    ("Безопасно ли у вас ребёнку, не будут обижать?", "safety_and_trust.md"),
+])
+def test_selector_keeps_the_relevant_document(selector, message, expected):
+    selection = selector.select(message)
+
+    assert selection is not None
+    assert expected in selection.documents
+    assert len(selection.documents) <= selector.top_k
+
+
+def test_context_dependent_message_falls_back_to_full_section(selector):
+    assert selector.select("А это?") is None
+    assert selector.stats["no_terms"] >= 1
+
+
+def test_pure_python_scores_match_numpy(monkeypatch):
+    pytest.importorskip("numpy")
+    documents = {"a": ["курс", "цен", "цен"], "b": ["курс", "учител"], "c": ["безопасн"]}
+    query = {"цен": 1.0, "курс": 0.5}
+
+    vectorized = BM25Index(documents).scores(query)
+    monkeypatch.setattr(summary_selector, "NUMPY_AVAILABLE", False)
+    plain = BM25Index(documents).scores(query)
+
+    assert vectorized.keys() == plain.keys()
+    for name in plain:
+        assert vectorized[name] == pytest.approx(plain[name], rel=1e-5)
+
+
+def test_router_sends_only_candidate_summaries_after_a_stable_prefix(monkeypatch):
+    monkeypatch.setattr(router_module.Config, "ROUTER_PRESELECT", True)
+    router = router_module.Router(use_cache=True)
+
+    static_prices, dynamic_prices = router._prefix_cache_prompts("Сколько стоит курс и есть ли скидки?", [])
+    static_teachers, dynamic_teachers = router._prefix_cache_prompts("Какой опыт у преподавателей?", [])
+
+    assert static_prices == static_teachers  # префикс одинаковый — кеш Gemini продолжает работать
+    assert "БАЗА ЗНАНИЙ" not in static_prices
+    assert '"pricing.md"' in dynamic_prices
+    assert len(dynamic_prices) < len(router._segments.get("summaries"))
+    assert router.get_stats()["preselect"]["estimated_tokens_saved"] > 0
+
+    static_full, dynamic_full = router._prefix_cache_prompts("А это?", [])
+    assert static_full == router._build_static_prompt()